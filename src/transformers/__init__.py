@@ -78,6 +78,7 @@ _import_structure = {
     "data.data_collator": [
         "DataCollator",
         "DataCollatorForLanguageModeling",
+        "DataCollatorForMaskedVolumeModeling",
         "DataCollatorForPermutationLanguageModeling",
         "DataCollatorForSeq2Seq",
         "DataCollatorForSOP",
@@ -96,7 +97,7 @@ _import_structure = {
     "feature_extraction_sequence_utils": ["SequenceFeatureExtractor"],
     "feature_extraction_utils": ["BatchFeature", "FeatureExtractionMixin"],
     "file_utils": [],
-    "generation": ["GenerationConfig", "TextIteratorStreamer", "TextStreamer"],
+    "generation": ["GenerationConfig", "RegexFSM", "TextIteratorStreamer", "TextStreamer", "json_schema_to_regex"],
     "hf_argparser": ["HfArgumentParser"],
     "hyperparameter_search": [],
     "image_transforms": [],
@@ -624,6 +625,8 @@ _import_structure = {
         "TranslationPipeline",
         "VideoClassificationPipeline",
         "VisualQuestionAnsweringPipeline",
+        "VolumeClassificationPipeline",
+        "VolumeFeatureExtractionPipeline",
         "ZeroShotAudioClassificationPipeline",
         "ZeroShotClassificationPipeline",
         "ZeroShotImageClassificationPipeline",
@@ -950,6 +953,7 @@ else:
     _import_structure["activations"] = []
     _import_structure["benchmark.benchmark"] = ["PyTorchBenchmark"]
     _import_structure["benchmark.benchmark_args"] = ["PyTorchBenchmarkArguments"]
+    _import_structure["cache_utils"] = ["Cache", "PagedCache", "PrefixCache", "StaticCache"]
     _import_structure["data.datasets"] = [
         "GlueDataset",
         "GlueDataTrainingArguments",
@@ -969,12 +973,15 @@ else:
             "ConstrainedBeamSearchScorer",
             "Constraint",
             "ConstraintListState",
+            "ContinuousBatchingEngine",
             "DisjunctiveConstraint",
             "ForcedBOSTokenLogitsProcessor",
             "ForcedEOSTokenLogitsProcessor",
+            "FusedLogitsWarper",
             "GenerationMixin",
             "HammingDiversityLogitsProcessor",
             "InfNanRemoveLogitsProcessor",
+            "JsonSchemaLogitsProcessor",
             "LogitsProcessor",
             "LogitsProcessorList",
             "LogitsWarper",
@@ -986,6 +993,7 @@ else:
             "NoRepeatNGramLogitsProcessor",
             "PhrasalConstraint",
             "PrefixConstrainedLogitsProcessor",
+            "RegexLogitsProcessor",
             "RepetitionPenaltyLogitsProcessor",
             "SequenceBiasLogitsProcessor",
             "StoppingCriteria",
@@ -994,6 +1002,7 @@ else:
             "TopKLogitsWarper",
             "TopPLogitsWarper",
             "TypicalLogitsWarper",
+            "VectorizedBeamSearchScorer",
             "top_k_top_p_filtering",
         ]
     )
@@ -4004,6 +4013,7 @@ if TYPE_CHECKING:
     from .data.data_collator import (
         DataCollator,
         DataCollatorForLanguageModeling,
+        DataCollatorForMaskedVolumeModeling,
         DataCollatorForPermutationLanguageModeling,
         DataCollatorForSeq2Seq,
         DataCollatorForSOP,
@@ -4019,7 +4029,7 @@ if TYPE_CHECKING:
     from .feature_extraction_utils import BatchFeature, FeatureExtractionMixin
 
     # Generation
-    from .generation import GenerationConfig, TextIteratorStreamer, TextStreamer
+    from .generation import GenerationConfig, RegexFSM, TextIteratorStreamer, TextStreamer, json_schema_to_regex
     from .hf_argparser import HfArgumentParser
 
     # Integrations
@@ -4512,6 +4522,8 @@ if TYPE_CHECKING:
         TranslationPipeline,
         VideoClassificationPipeline,
         VisualQuestionAnsweringPipeline,
+        VolumeClassificationPipeline,
+        VolumeFeatureExtractionPipeline,
         ZeroShotAudioClassificationPipeline,
         ZeroShotClassificationPipeline,
         ZeroShotImageClassificationPipeline,
@@ -4800,6 +4812,7 @@ if TYPE_CHECKING:
         # Benchmarks
         from .benchmark.benchmark import PyTorchBenchmark
         from .benchmark.benchmark_args import PyTorchBenchmarkArguments
+        from .cache_utils import Cache, PagedCache, PrefixCache, StaticCache
         from .data.datasets import (
             GlueDataset,
             GlueDataTrainingArguments,
@@ -4817,12 +4830,15 @@ if TYPE_CHECKING:
             ConstrainedBeamSearchScorer,
             Constraint,
             ConstraintListState,
+            ContinuousBatchingEngine,
             DisjunctiveConstraint,
             ForcedBOSTokenLogitsProcessor,
             ForcedEOSTokenLogitsProcessor,
+            FusedLogitsWarper,
             GenerationMixin,
             HammingDiversityLogitsProcessor,
             InfNanRemoveLogitsProcessor,
+            JsonSchemaLogitsProcessor,
             LogitsProcessor,
             LogitsProcessorList,
             LogitsWarper,
@@ -4834,6 +4850,7 @@ if TYPE_CHECKING:
             NoRepeatNGramLogitsProcessor,
             PhrasalConstraint,
             PrefixConstrainedLogitsProcessor,
+            RegexLogitsProcessor,
             RepetitionPenaltyLogitsProcessor,
             SequenceBiasLogitsProcessor,
             StoppingCriteria,
@@ -4842,6 +4859,7 @@ if TYPE_CHECKING:
             TopKLogitsWarper,
             TopPLogitsWarper,
             TypicalLogitsWarper,
+            VectorizedBeamSearchScorer,
             top_k_top_p_filtering,
         )
         from .modeling_utils import PreTrainedModel
@@ -0,0 +1,572 @@
+# Copyright 2023 The HuggingFace Team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import math
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import torch
+
+from .configuration_utils import PretrainedConfig
+
+
+class Cache:
+    """
+    Base class for the key/value caches that models supporting them accept as `past_key_values`, in place of the
+    tuple-of-tensors format. A cache object is updated in place by the attention layers, layer by layer, and is
+    returned as is in the `past_key_values` of the model outputs.
+    """
+
+    def update(
+        self, key_states: torch.Tensor, value_states: torch.Tensor, layer_idx: int
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Stores the key and value states of the new tokens for the layer `layer_idx`.
+
+        Args:
+            key_states (`torch.Tensor` of shape `(batch_size, num_heads, sequence_length, head_dim)`):
+                The key states of the new tokens.
+            value_states (`torch.Tensor` of shape `(batch_size, num_heads, sequence_length, head_dim)`):
+                The value states of the new tokens.
+            layer_idx (`int`):
+                The index of the layer the states belong to.
+
+        Return:
+            A tuple of the key and value states the new tokens attend to, including the ones of the new tokens.
+        """
+        raise NotImplementedError(f"Make sure to implement `update` in {self.__class__.__name__}.")
+
+    def get_seq_length(self, layer_idx: int = 0) -> int:
+        """Returns the number of tokens stored in the cache for the layer `layer_idx`."""
+        raise NotImplementedError(f"Make sure to implement `get_seq_length` in {self.__class__.__name__}.")
+
+    def get_max_length(self) -> Optional[int]:
+        """
+        Returns the length of the key and value states returned by [`~Cache.update`] if it is fixed, `None` if they
+        grow with the number of tokens stored.
+        """
+        raise NotImplementedError(f"Make sure to implement `get_max_length` in {self.__class__.__name__}.")
+
+    def reorder_cache(self, beam_idx: torch.LongTensor):
+        """Reorders the cache in place along the batch dimension, for beam search."""
+        raise NotImplementedError(f"Make sure to implement `reorder_cache` in {self.__class__.__name__}.")
+
+
+class StaticCache(Cache):
+    """
+    Key/value cache backed by buffers of a fixed size, allocated once for the whole generation. The key and value
+    states of the new tokens are written in place at their position in the buffers, instead of being concatenated to
+    the previous ones, so that the memory traffic of a decoding step does not grow with the length of the sequence.
+
+    The attention layers attend to the whole buffers, whose positions that are not written yet are masked out: the
+    shapes of the tensors are the same at every decoding step, which makes the decoding step `torch.compile`-friendly.
+
+    Args:
+        config (`PretrainedConfig`):
+            The configuration of the model the cache is used with, which defines the number of layers, the number of
+            attention heads and the size of the heads.
+        max_cache_len (`int`):
+            The maximum number of tokens the cache can hold, usually the `max_length` of the generation.
+        max_batch_size (`int`, *optional*):
+            The batch size the cache is used with. If unset, the buffers are allocated when the first key and value
+            states are stored, with their batch size, device and dtype.
+        device (`torch.device`, *optional*):
+            The device of the buffers, when `max_batch_size` is set.
+        dtype (`torch.dtype`, *optional*, defaults to `torch.float32`):
+            The dtype of the buffers, when `max_batch_size` is set.
+
+    Example:
+
+    ```python
+    >>> from transformers import AutoTokenizer, LlamaForCausalLM, StaticCache
+
+    >>> model = LlamaForCausalLM.from_pretrained("path/to/llama-checkpoint")
+    >>> tokenizer = AutoTokenizer.from_pretrained("path/to/llama-checkpoint")
+    >>> inputs = tokenizer("The capital of France is", return_tensors="pt")
+
+    >>> # `generate` allocates a static cache of `max_length` tokens
+    >>> outputs = model.generate(**inputs, max_new_tokens=32, cache_implementation="static")
+
+    >>> # or in a manual decoding loop
+    >>> past_key_values = StaticCache(model.config, max_cache_len=64)
+    >>> outputs = model(**inputs, past_key_values=past_key_values, use_cache=True)
+    >>> next_token = outputs.logits[:, -1:].argmax(-1)
+    >>> outputs = model(next_token, past_key_values=outputs.past_key_values, use_cache=True)
+    ```
+    """
+
+    def __init__(
+        self,
+        config: PretrainedConfig,
+        max_cache_len: int,
+        max_batch_size: Optional[int] = None,
+        device: Optional[torch.device] = None,
+        dtype: Optional[torch.dtype] = None,
+    ):
+        self.max_cache_len = max_cache_len
+        self.num_layers = config.num_hidden_layers
+        self.num_heads = config.num_attention_heads
+        self.head_dim = config.hidden_size // config.num_attention_heads
+
+        self.key_cache: List[torch.Tensor] = []
+        self.value_cache: List[torch.Tensor] = []
+        self._seq_lengths = [0] * self.num_layers
+        if max_batch_size is not None:
+            self._allocate(max_batch_size, device, dtype if dtype is not None else torch.float32)
+
+    def _allocate(self, batch_size: int, device: torch.device, dtype: torch.dtype):
+        cache_shape = (batch_size, self.num_heads, self.max_cache_len, self.head_dim)
+        for _ in range(self.num_layers):
+            self.key_cache.append(torch.zeros(cache_shape, dtype=dtype, device=device))
+            self.value_cache.append(torch.zeros(cache_shape, dtype=dtype, device=device))
+
+    def update(
+        self, key_states: torch.Tensor, value_states: torch.Tensor, layer_idx: int
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        if not self.key_cache:
+            self._allocate(key_states.shape[0], key_states.device, key_states.dtype)
+
+        start = self._seq_lengths[layer_idx]
+        end = start + key_states.shape[-2]
+        if end > self.max_cache_len:
+            raise ValueError(
+                f"Cannot store {end} tokens in a static cache of {self.max_cache_len} tokens, increase its "
+                "`max_cache_len`."
+            )
+
+        key_cache = self.key_cache[layer_idx]
+        value_cache = self.value_cache[layer_idx]
+        key_cache[:, :, start:end] = key_states.to(key_cache.dtype)
+        value_cache[:, :, start:end] = value_states.to(value_cache.dtype)
+        self._seq_lengths[layer_idx] = end
+        return key_cache, value_cache
+
+    def get_seq_length(self, layer_idx: int = 0) -> int:
+        return self._seq_lengths[layer_idx]
+
+    def get_max_length(self) -> Optional[int]:
+        return self.max_cache_len
+
+    def reorder_cache(self, beam_idx: torch.LongTensor):
+        for layer_idx in range(len(self.key_cache)):
+            device = self.key_cache[layer_idx].device
+            self.key_cache[layer_idx].copy_(self.key_cache[layer_idx].index_select(0, beam_idx.to(device)))
+            self.value_cache[layer_idx].copy_(self.value_cache[layer_idx].index_select(0, beam_idx.to(device)))
+
+    def reset(self):
+        """Empties the cache without releasing its buffers, so that it can be reused for another generation."""
+        self._seq_lengths = [0] * self.num_layers
+
+
+class PagedCache(Cache):
+    """
+    Key/value cache storing the states of the tokens in fixed-size blocks taken from a pool shared by all the sequences
+    of the batch. Each sequence owns a block table, the list of the blocks holding its tokens, so that memory is
+    allocated one block at a time as the sequences grow instead of for the longest possible sequence.
+
+    Blocks are reference counted and shared between sequences with a common prefix: reordering the beams of beam
+    search only reorders the block tables, and the copies of a prompt expanded for beam search or parallel sampling
+    (`expand_size > 1`) are stored once. A shared block is copied the first time one of its sequences writes into it
+    (copy-on-write), so sequences only hold a private copy of the block they are writing to.
+
+    Models supporting it, such as LLaMA, attend to the cached states `chunk_size` tokens at a time with
+    [`~PagedCache.attend`], so that the states of the whole sequences are never gathered into a contiguous tensor.
+    [`~PagedCache.update`] returns them gathered, as the other caches do, e.g. when the attention weights are
+    returned. Layers must be updated in order, starting with the first one, at each step.
+
+    Args:
+        config (`PretrainedConfig`):
+            The configuration of the model the cache is used with, which defines the number of layers, the number of
+            attention heads and the size of the heads.
+        block_size (`int`, *optional*, defaults to 16):
+            The number of tokens of a block.
+        num_blocks (`int`, *optional*):
+            The number of blocks of the pool. If unset, the pool grows when it runs out of free blocks, otherwise a
+            `ValueError` is raised.
+        expand_size (`int`, *optional*, defaults to 1):
+            The number of consecutive sequences of the batch that are copies of the same prompt, as expanded by
+            `generate` for beam search or when returning several sequences per prompt. The tokens written by the first
+            update are only stored once per group of copies.
+        chunk_size (`int`, *optional*, defaults to 256):
+            The number of cached tokens attended at once by [`~PagedCache.attend`], rounded down to a multiple of
+            `block_size`.
+
+    Example:
+
+    ```python
+    >>> from transformers import AutoTokenizer, LlamaForCausalLM
+
+    >>> model = LlamaForCausalLM.from_pretrained("path/to/llama-checkpoint")
+    >>> tokenizer = AutoTokenizer.from_pretrained("path/to/llama-checkpoint")
+    >>> inputs = tokenizer("The capital of France is", return_tensors="pt")
+
+    >>> # the beams share the blocks of the prompt and of their common prefix
+    >>> outputs = model.generate(**inputs, max_new_tokens=32, num_beams=4, cache_implementation="paged")
+    ```
+    """
+
+    def __init__(
+        self,
+        config: PretrainedConfig,
+        block_size: int = 16,
+        num_blocks: Optional[int] = None,
+        expand_size: int = 1,
+        chunk_size: int = 256,
+    ):
+        self.block_size = block_size
+        self.num_blocks = num_blocks
+        self.expand_size = expand_size
+        self.chunk_size = chunk_size
+        self.num_layers = config.num_hidden_layers
+        self.num_heads = config.num_attention_heads
+        self.head_dim = config.hidden_size // config.num_attention_heads
+
+        # one pool of `(num_blocks, block_size, num_heads, head_dim)` per layer, indexed by the same block tables
+        self.key_blocks: List[torch.Tensor] = []
+        self.value_blocks: List[torch.Tensor] = []
+        self.block_tables: List[List[int]] = []
+        self._ref_counts: List[int] = []
+        self._free_blocks: List[int] = []
+        self._seq_lengths = [0] * self.num_layers
+        self._write_rows = None
+        self._write_slots = None
+        self._block_table_tensor = None
+
+    @property
+    def num_free_blocks(self) -> int:
+        """The number of blocks of the pool that are not used by any sequence."""
+        return len(self._free_blocks)
+
+    @property
+    def num_used_blocks(self) -> int:
+        """The number of blocks of the pool used by at least one sequence."""
+        return len(self._ref_counts) - len(self._free_blocks)
+
+    def _allocate_block(self) -> int:
+        if not self._free_blocks:
+            capacity = len(self._ref_counts)
+            if self.num_blocks is not None and capacity >= self.num_blocks:
+                raise ValueError(
+                    f"The {self.num_blocks} blocks of the paged cache are all used, increase its `num_blocks`."
+                )
+            new_capacity = max(2 * capacity, 1)
+            if self.num_blocks is not None:
+                new_capacity = min(new_capacity, self.num_blocks)
+            self._grow(new_capacity)
+        block = self._free_blocks.pop()
+        self._ref_counts[block] = 1
+        return block
+
+    def _release_block(self, block: int):
+        self._ref_counts[block] -= 1
+        if self._ref_counts[block] == 0:
+            self._free_blocks.append(block)
+
+    def _grow(self, capacity: int):
+        num_new_blocks = capacity - len(self._ref_counts)
+        for blocks in (self.key_blocks, self.value_blocks):
+            for layer_idx, layer_blocks in enumerate(blocks):
+                new_blocks = layer_blocks.new_zeros((num_new_blocks,) + layer_blocks.shape[1:])
+                blocks[layer_idx] = torch.cat([layer_blocks, new_blocks])
+        # blocks are handed out from the end of the free list, i.e. in increasing order
+        self._free_blocks = list(range(capacity - 1, len(self._ref_counts) - 1, -1)) + self._free_blocks
+        self._ref_counts.extend([0] * num_new_blocks)
+
+    def _copy_block(self, block: int) -> int:
+        new_block = self._allocate_block()
+        for blocks in (self.key_blocks, self.value_blocks):
+            for layer_blocks in blocks:
+                layer_blocks[new_block] = layer_blocks[block]
+        self._release_block(block)
+        return new_block
+
+    def _prepare_write(self, batch_size: int, start: int, end: int, device: torch.device):
+        """Allocates the blocks the tokens `start` to `end` of every sequence are written to, for all the layers."""
+        if not self.block_tables:
+            self.block_tables = [[] for _ in range(batch_size)]
+        elif len(self.block_tables) != batch_size:
+            raise ValueError(
+                f"The paged cache holds {len(self.block_tables)} sequences, but received states for {batch_size}."
+            )
+
+        # the copies of a prompt share its blocks, which are written once
+        write_rows = range(0, batch_size, self.expand_size) if start == 0 else range(batch_size)
+        first_block, last_block = start // self.block_size, (end - 1) // self.block_size
+        for row in write_rows:
+            block_table = self.block_tables[row]
+            if first_block < len(block_table) and self._ref_counts[block_table[first_block]] > 1:
+                block_table[first_block] = self._copy_block(block_table[first_block])
+            while len(block_table) <= last_block:
+                block_table.append(self._allocate_block())
+        if start == 0 and self.expand_size > 1:
+            for row in range(batch_size):
+                if row % self.expand_size != 0:
+                    self.block_tables[row] = list(self.block_tables[row - row % self.expand_size])
+                    for block in self.block_tables[row]:
+                        self._ref_counts[block] += 1
+
+        block_tables = torch.tensor(self.block_tables, dtype=torch.long, device=device)
+        positions = torch.arange(start, end, device=device)
+        write_rows = torch.tensor(write_rows, dtype=torch.long, device=device)
+        slots = (
+            block_tables[write_rows][:, positions // self.block_size] * self.block_size + positions % self.block_size
+        )
+        self._write_rows = write_rows
+        self._write_slots = slots.view(-1)
+        self._block_table_tensor = block_tables
+
+    def write(self, key_states: torch.Tensor, value_states: torch.Tensor, layer_idx: int):
+        """
+        Writes the states of the new tokens of layer `layer_idx` into the blocks of their sequences, without gathering
+        the cached states as [`~PagedCache.update`] does. The cached states are then attended with
+        [`~PagedCache.attend`].
+
+        Parameters:
+            key_states (`torch.Tensor` of shape `(batch_size, num_heads, num_new_tokens, head_dim)`):
+                The key states of the new tokens.
+            value_states (`torch.Tensor` of shape `(batch_size, num_heads, num_new_tokens, head_dim)`):
+                The value states of the new tokens.
+            layer_idx (`int`):
+                The index of the layer the states belong to.
+        """
+        batch_size, _, num_new_tokens, _ = key_states.shape
+        start = self._seq_lengths[layer_idx]
+        end = start + num_new_tokens
+        if layer_idx == 0:
+            self._prepare_write(batch_size, start, end, key_states.device)
+        if len(self.key_blocks) <= layer_idx:
+            pool_shape = (len(self._ref_counts), self.block_size, self.num_heads, self.head_dim)
+            self.key_blocks.append(key_states.new_zeros(pool_shape))
+            self.value_blocks.append(value_states.new_zeros(pool_shape))
+
+        for blocks, new_states in (
+            (self.key_blocks[layer_idx], key_states),
+            (self.value_blocks[layer_idx], value_states),
+        ):
+            # [bsz, nh, t, hd] -> [bsz * t, nh, hd], written at the slot of each token in the flattened pool
+            new_states = new_states.index_select(0, self._write_rows).transpose(1, 2).reshape(-1, *blocks.shape[2:])
+            blocks.view(-1, *blocks.shape[2:]).index_copy_(0, self._write_slots, new_states.to(blocks.dtype))
+        self._seq_lengths[layer_idx] = end
+
+    def _gather(self, blocks: torch.Tensor, first_block: int, num_blocks: int, length: int) -> torch.Tensor:
+        # [bsz, num_blocks, block_size, nh, hd] -> [bsz, nh, length, hd]
+        block_tables = self._block_table_tensor[:, first_block : first_block + num_blocks]
+        return blocks[block_tables].flatten(1, 2)[:, :length].transpose(1, 2)
+
+    def update(
+        self, key_states: torch.Tensor, value_states: torch.Tensor, layer_idx: int
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        self.write(key_states, value_states, layer_idx)
+        # the blocks of each sequence are gathered into a contiguous tensor
+        length = self._seq_lengths[layer_idx]
+        num_blocks = self._block_table_tensor.shape[1]
+        return (
+            self._gather(self.key_blocks[layer_idx], 0, num_blocks, length),
+            self._gather(self.value_blocks[layer_idx], 0, num_blocks, length),
+        )
+
+    def attend(
+        self, query_states: torch.Tensor, attention_mask: Optional[torch.Tensor], layer_idx: int
+    ) -> torch.Tensor:
+        """
+        Computes the attention of `query_states` over the states cached for layer `layer_idx`, `chunk_size` tokens at
+        a time. Only the blocks of one chunk are gathered at once, and the softmax is accumulated across the chunks,
+        so that the memory used by the attention does not grow with the length of the sequences.
+
+        Parameters:
+            query_states (`torch.Tensor` of shape `(batch_size, num_heads, query_length, head_dim)`):
+                The query states of the new tokens, which must already be written with [`~PagedCache.write`].
+            attention_mask (`torch.Tensor` of shape `(batch_size, 1, query_length, sequence_length)`, *optional*):
+                The additive attention mask of the cached tokens.
+            layer_idx (`int`):
+                The index of the layer the states belong to.
+
+        Return:
+            `torch.Tensor` of shape `(batch_size, num_heads, query_length, head_dim)`: The attention output.
+        """
+        length = self._seq_lengths[layer_idx]
+        blocks_per_chunk = max(self.chunk_size // self.block_size, 1)
+        dtype_min = torch.tensor(
+            torch.finfo(query_states.dtype).min, device=query_states.device, dtype=query_states.dtype
+        )
+
+        max_scores, sums, output = None, None, None
+        for first_block in range(0, self._block_table_tensor.shape[1], blocks_per_chunk):
+            start = first_block * self.block_size
+            end = min(start + blocks_per_chunk * self.block_size, length)
+            if start >= end:
+                break
+            key_states = self._gather(self.key_blocks[layer_idx], first_block, blocks_per_chunk, end - start)
+            value_states = self._gather(self.value_blocks[layer_idx], first_block, blocks_per_chunk, end - start)
+
+            scores = torch.matmul(query_states, key_states.transpose(2, 3)) / math.sqrt(self.head_dim)
+            if attention_mask is not None:
+                scores = torch.max(scores + attention_mask[..., start:end], dtype_min)
+            # the softmax is accumulated in fp32, rescaling the previous chunks when the maximum score increases
+            scores = scores.float()
+            chunk_max_scores = scores.amax(dim=-1, keepdim=True)
+            if max_scores is None:
+                max_scores = chunk_max_scores
+                probs = torch.exp(scores - max_scores)
+                sums = probs.sum(dim=-1, keepdim=True)
+                output = torch.matmul(probs, value_states.float())
+            else:
+                new_max_scores = torch.maximum(max_scores, chunk_max_scores)
+                correction = torch.exp(max_scores - new_max_scores)
+                probs = torch.exp(scores - new_max_scores)
+                sums = sums * correction + probs.sum(dim=-1, keepdim=True)
+                output = output * correction + torch.matmul(probs, value_states.float())
+                max_scores = new_max_scores
+        return (output / sums).to(query_states.dtype)
+
+    def get_seq_length(self, layer_idx: int = 0) -> int:
+        return self._seq_lengths[layer_idx]
+
+    def get_max_length(self) -> Optional[int]:
+        return None
+
+    def reorder_cache(self, beam_idx: torch.LongTensor):
+        # the beams take over the block tables of the beams they continue, no states are copied
+        block_tables = [list(self.block_tables[idx]) for idx in beam_idx.tolist()]
+        for block_table in block_tables:
+            for block in block_table:
+                self._ref_counts[block] += 1
+        for block_table in self.block_tables:
+            for block in block_table:
+                self._release_block(block)
+        self.block_tables = block_tables
+        self._block_table_tensor = None
+
+
+class PrefixCache:
+    """
+    Least-recently-used store of the `past_key_values` of prompts, reused across
+    [`~generation.GenerationMixin.generate`] calls. When a prompt starts with tokens whose key/value states are stored,
+    such as a long system prompt or a few-shot template shared by many requests, `generate` only encodes the tokens
+    after the longest stored prefix.
+
+    The states of any prefix of a stored prompt can be reused, since the states of a token of a decoder-only model
+    only depend on the tokens before it: storing the prompt `system + question_1` lets the prompt `system +
+    question_2` start after `system`. The cache holds `past_key_values` in the standard format, one tuple of `(1,
+    num_heads, sequence_length, head_dim)` tensors per layer.
+
+    Args:
+        max_memory (`int`, *optional*, defaults to 1073741824):
+            The maximum size of the stored states, in bytes. The least recently used prompts are evicted when it is
+            exceeded.
+        min_prefix_length (`int`, *optional*, defaults to 1):
+            The minimum number of tokens a stored prefix must share with a prompt to be reused.
+
+    Example:
+
+    ```python
+    >>> from transformers import AutoModelForCausalLM, AutoTokenizer, PrefixCache
+
+    >>> tokenizer = AutoTokenizer.from_pretrained("gpt2")
+    >>> model = AutoModelForCausalLM.from_pretrained("gpt2")
+    >>> prefix_cache = PrefixCache(max_memory=2**30)
+
+    >>> system_prompt = "You are a helpful assistant that answers in a single sentence.\\n"
+    >>> for question in ["What is the capital of France?", "What is the capital of Italy?"]:
+    ...     inputs = tokenizer(system_prompt + question, return_tensors="pt")
+    ...     # the second call only encodes the tokens after the shared system prompt
+    ...     outputs = model.generate(**inputs, max_new_tokens=20, prefix_cache=prefix_cache)
+    ```
+    """
+
+    def __init__(self, max_memory: int = 2**30, min_prefix_length: int = 1):
+        self.max_memory = max_memory
+        self.min_prefix_length = min_prefix_length
+        # maps the tokens of the stored prompts to their states, from the least to the most recently used
+        self._entries = OrderedDict()
+        self._memory = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def memory(self) -> int:
+        """The size of the stored states, in bytes."""
+        return self._memory
+
+    @staticmethod
+    def _get_memory(past_key_values: Tuple[Tuple[torch.Tensor]]) -> int:
+        return sum(state.numel() * state.element_size() for layer in past_key_values for state in layer)
+
+    def lookup(self, input_ids: torch.LongTensor) -> Tuple[int, Optional[Tuple[Tuple[torch.Tensor]]]]:
+        """
+        Finds the stored prompt sharing the longest prefix with `input_ids`.
+
+        Args:
+            input_ids (`torch.LongTensor` of shape `(sequence_length,)`):
+                The tokens of a prompt.
+
+        Return:
+            `Tuple[int, Optional[Tuple[Tuple[torch.Tensor]]]]`: The length of the longest stored prefix of `input_ids`
+            and its `past_key_values`, or `(0, None)` if no stored prefix has at least `min_prefix_length` tokens.
+        """
+        best_length, best_key = 0, None
+        for key, (entry_ids, _) in self._entries.items():
+            length = min(len(entry_ids), len(input_ids))
+            mismatches = (entry_ids[:length] != input_ids[:length].to(entry_ids.device)).nonzero()
+            if len(mismatches) > 0:
+                length = int(mismatches[0, 0])
+            if length > best_length:
+                best_length, best_key = length, key
+
+        if best_key is None or best_length < self.min_prefix_length:
+            return 0, None
+        self._entries.move_to_end(best_key)
+        past_key_values = self._entries[best_key][1]
+        past_key_values = tuple(tuple(state[..., :best_length, :] for state in layer) for layer in past_key_values)
+        return best_length, past_key_values
+
+    def store(self, input_ids: torch.LongTensor, past_key_values: Tuple[Tuple[torch.Tensor]]):
+        """
+        Stores the `past_key_values` of a prompt, evicting the least recently used prompts if the stored states exceed
+        `max_memory`. The prompts that are a prefix of `input_ids` are evicted as well, since their states are a
+        prefix of the new ones.
+
+        Args:
+            input_ids (`torch.LongTensor` of shape `(sequence_length,)`):
+                The tokens of the prompt.
+            past_key_values (`Tuple[Tuple[torch.Tensor]]`):
+                The states of the tokens of the prompt, in the standard format with a batch size of 1.
+        """
+        if any(state.shape[-2] != len(input_ids) for layer in past_key_values for state in layer):
+            raise ValueError(
+                f"`past_key_values` should hold the states of the {len(input_ids)} tokens of `input_ids`, in the "
+                "standard format."
+            )
+        memory = self._get_memory(past_key_values)
+        if memory > self.max_memory:
+            return
+
+        key = tuple(input_ids.tolist())
+        for entry_key in list(self._entries):
+            if entry_key == key[: len(entry_key)]:
+                self._evict(entry_key)
+        while self._entries and self._memory + memory > self.max_memory:
+            self._evict(next(iter(self._entries)))
+
+        self._entries[key] = (input_ids.detach().clone(), past_key_values)
+        self._memory += memory
+
+    def _evict(self, key: Tuple[int, ...]):
+        _, past_key_values = self._entries.pop(key)
+        self._memory -= self._get_memory(past_key_values)
+
+    def clear(self):
+        """Evicts all the stored prompts."""
+        self._entries.clear()
+        self._memory = 0
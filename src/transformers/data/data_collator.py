@@ -1533,3 +1533,120 @@ class DataCollatorForPermutationLanguageModeling(DataCollatorMixin):
             ) & masked_indices[i]
 
         return inputs.astype(np.int64), perm_mask, target_mapping, labels.astype(np.int64)
+
+
+@dataclass
+class DataCollatorForMaskedVolumeModeling(DataCollatorMixin):
+    """
+    Data collator used for masked volume modeling (e.g. [`ViTMAE3DForPreTraining`]). Stacks volumes of shape
+    `(num_channels, depth, height, width)` into a single batch and draws the masking noise on the data loading side,
+    so that mask generation overlaps with the model compute.
+
+    The collator returns `pixel_values` and a `noise` tensor of shape `(batch_size, num_patches)`: the model keeps the
+    patches with the lowest noise, so structured masks are expressed as noise that is constant over each masking unit.
+
+    When the examples are dictionaries with a `"labels"` entry (e.g. label volumes for
+    [`ViTMAE3DForSegmentationPreTraining`]), the labels are stacked into their own `labels` tensor, kept separate from
+    the scans so that both stay contiguous.
+
+    Args:
+        patch_size (`int` or `Tuple[int, int, int]`, *optional*, defaults to 16):
+            The `(depth, height, width)` size of the patches of the model.
+        mask_type (`str`, *optional*, defaults to `"random"`):
+            How patches are masked:
+
+            - `"random"`: every patch is masked independently.
+            - `"tube"`: a patch position is masked across the whole depth of the volume.
+            - `"block"`: aligned blocks of `mask_block_size` patches are masked together.
+        mask_block_size (`Tuple[int, int, int]`, *optional*, defaults to `(2, 2, 2)`):
+            Size (in patches) of the blocks masked together when `mask_type="block"`.
+        pin_memory (`bool`, *optional*, defaults to `False`):
+            Whether to allocate the batch in page-locked memory, for faster (and asynchronous) host to GPU copies.
+            Ignored when CUDA is not available.
+        seed (`int`, *optional*):
+            Seed of the CPU generator drawing the masking noise, for reproducible masks. Each `DataLoader` worker
+            draws from its own stream; use a different seed in each data parallel process.
+        return_tensors (`str`):
+            The type of Tensor to return. Only `"pt"` is supported.
+
+    <Tip>
+
+    Each volume is copied once, straight into the batch tensor allocated for the whole batch. With `pin_memory=True`
+    the batch tensors are pinned and should not be pinned again by the `DataLoader`.
+
+    </Tip>"""
+
+    patch_size: Union[int, Tuple[int, int, int]] = 16
+    mask_type: str = "random"
+    mask_block_size: Tuple[int, int, int] = (2, 2, 2)
+    pin_memory: bool = False
+    seed: Optional[int] = None
+    return_tensors: str = "pt"
+
+    def __post_init__(self):
+        if self.mask_type not in ("random", "tube", "block"):
+            raise ValueError(f"`mask_type` should be one of 'random', 'tube' or 'block', got {self.mask_type}.")
+        if self.return_tensors != "pt":
+            raise ValueError(f"{self.__class__.__name__} only supports `return_tensors='pt'`.")
+        if isinstance(self.patch_size, int):
+            self.patch_size = (self.patch_size,) * 3
+        # generators are created lazily, one per DataLoader worker
+        self._generators = {}
+
+    def torch_call(self, examples: List[Union[Any, Dict[str, Any]]]) -> Dict[str, Any]:
+        import torch
+
+        labels = None
+        if isinstance(examples[0], Mapping):
+            if "labels" in examples[0]:
+                labels = [example["labels"] for example in examples]
+            examples = [example["pixel_values"] for example in examples]
+
+        pin_memory = self.pin_memory and torch.cuda.is_available()
+        pixel_values = self._stack_volumes(examples, pin_memory)
+        batch = {"pixel_values": pixel_values}
+        if labels is not None:
+            batch["labels"] = self._stack_volumes(labels, pin_memory)
+
+        grid_size = [size // patch for size, patch in zip(pixel_values.shape[2:], self.patch_size)]
+        noise = self.generate_noise(len(examples), grid_size)
+        if pin_memory:
+            noise = noise.pin_memory()
+        batch["noise"] = noise
+        return batch
+
+    @staticmethod
+    def _stack_volumes(volumes: List[Any], pin_memory: bool) -> Any:
+        import torch
+
+        first = torch.as_tensor(volumes[0])
+        if first.ndim == 3:
+            # single channel volumes
+            first = first.unsqueeze(0)
+
+        batch = torch.empty((len(volumes), *first.shape), dtype=first.dtype, pin_memory=pin_memory)
+        for i, volume in enumerate(volumes):
+            batch[i].copy_(torch.as_tensor(volume).reshape(first.shape))
+        return batch
+
+    def generate_noise(self, batch_size: int, grid_size: List[int]) -> Any:
+        """
+        Draw the masking noise of shape `(batch_size, num_patches)` for a `(depth, height, width)` patch grid.
+        """
+        from ..models.vit_mae_3d.modeling_vit_mae_3d import generate_mask_noise
+
+        return generate_mask_noise(
+            batch_size, grid_size, self.mask_type, self.mask_block_size, generator=self._get_generator()
+        )
+
+    def _get_generator(self) -> Any:
+        if self.seed is None:
+            return None
+
+        import torch
+
+        worker_info = torch.utils.data.get_worker_info()
+        worker_id = worker_info.id if worker_info is not None else 0
+        if worker_id not in self._generators:
+            self._generators[worker_id] = torch.Generator().manual_seed(self.seed + (worker_id << 32))
+        return self._generators[worker_id]
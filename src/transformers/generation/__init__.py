@@ -19,6 +19,7 @@ from ..utils import OptionalDependencyNotAvailable, _LazyModule, is_flax_availab
 
 _import_structure = {
     "configuration_utils": ["GenerationConfig"],
+    "regex_fsm": ["RegexFSM", "json_schema_to_regex"],
     "streamers": ["TextIteratorStreamer", "TextStreamer"],
 }
 
@@ -39,14 +40,18 @@ else:
         "BeamScorer",
         "BeamSearchScorer",
         "ConstrainedBeamSearchScorer",
+        "VectorizedBeamSearchScorer",
     ]
+    _import_structure["continuous_batching"] = ["ContinuousBatchingEngine", "GenerationRequest"]
     _import_structure["logits_process"] = [
         "EpsilonLogitsWarper",
         "EtaLogitsWarper",
         "ForcedBOSTokenLogitsProcessor",
         "ForcedEOSTokenLogitsProcessor",
+        "FusedLogitsWarper",
         "HammingDiversityLogitsProcessor",
         "InfNanRemoveLogitsProcessor",
+        "JsonSchemaLogitsProcessor",
         "LogitsProcessor",
         "LogitsProcessorList",
         "LogitsWarper",
@@ -55,6 +60,7 @@ else:
         "NoBadWordsLogitsProcessor",
         "NoRepeatNGramLogitsProcessor",
         "PrefixConstrainedLogitsProcessor",
+        "RegexLogitsProcessor",
         "RepetitionPenaltyLogitsProcessor",
         "SequenceBiasLogitsProcessor",
         "EncoderRepetitionPenaltyLogitsProcessor",
@@ -153,6 +159,7 @@ else:
 
 if TYPE_CHECKING:
     from .configuration_utils import GenerationConfig
+    from .regex_fsm import RegexFSM, json_schema_to_regex
     from .streamers import TextIteratorStreamer, TextStreamer
 
     try:
@@ -162,7 +169,14 @@ if TYPE_CHECKING:
         pass
     else:
         from .beam_constraints import Constraint, ConstraintListState, DisjunctiveConstraint, PhrasalConstraint
-        from .beam_search import BeamHypotheses, BeamScorer, BeamSearchScorer, ConstrainedBeamSearchScorer
+        from .beam_search import (
+            BeamHypotheses,
+            BeamScorer,
+            BeamSearchScorer,
+            ConstrainedBeamSearchScorer,
+            VectorizedBeamSearchScorer,
+        )
+        from .continuous_batching import ContinuousBatchingEngine, GenerationRequest
         from .logits_process import (
             EncoderNoRepeatNGramLogitsProcessor,
             EncoderRepetitionPenaltyLogitsProcessor,
@@ -171,8 +185,10 @@ if TYPE_CHECKING:
             ExponentialDecayLengthPenalty,
             ForcedBOSTokenLogitsProcessor,
             ForcedEOSTokenLogitsProcessor,
+            FusedLogitsWarper,
             HammingDiversityLogitsProcessor,
             InfNanRemoveLogitsProcessor,
+            JsonSchemaLogitsProcessor,
             LogitNormalization,
             LogitsProcessor,
             LogitsProcessorList,
@@ -182,6 +198,7 @@ if TYPE_CHECKING:
             NoBadWordsLogitsProcessor,
             NoRepeatNGramLogitsProcessor,
             PrefixConstrainedLogitsProcessor,
+            RegexLogitsProcessor,
             RepetitionPenaltyLogitsProcessor,
             SequenceBiasLogitsProcessor,
             TemperatureLogitsWarper,
@@ -92,6 +92,10 @@ class BeamScorer(ABC):
     """
     Abstract base class for all beam scorers that are used for [`~PreTrainedModel.beam_search`] and
     [`~PreTrainedModel.beam_sample`].
+
+    Beam scorers should set a `batch_size` attribute, the number of batch elements whose beams they score. Scorers
+    without it are expected to keep their beam hypotheses in a `_beam_hyps` list, with one element per batch element
+    and beam group.
     """
 
     @abstractmethod
@@ -170,6 +174,7 @@ class BeamSearchScorer(BeamScorer):
         num_beam_groups: Optional[int] = 1,
         max_length: Optional[int] = None,
     ):
+        self.batch_size = batch_size
         self.num_beams = num_beams
         self.device = device
         self.length_penalty = length_penalty
@@ -406,6 +411,363 @@ class BeamSearchScorer(BeamScorer):
         )
 
 
+class VectorizedBeamSearchScorer(BeamScorer):
+    r"""
+    [`BeamScorer`] implementing standard beam search decoding, with the same outputs as [`BeamSearchScorer`]. Instead
+    of one [`BeamHypotheses`] per batch, the finished hypotheses of all the batches are stored in preallocated
+    tensors, so that [`~VectorizedBeamSearchScorer.process`] neither loops over the batches nor synchronizes with the
+    device for each candidate token.
+
+    Args:
+        batch_size (`int`):
+            Batch Size of `input_ids` for which standard beam search decoding is run in parallel.
+        num_beams (`int`):
+            Number of beams for beam search.
+        device (`torch.device`):
+            Defines the device type (*e.g.*, `"cpu"` or `"cuda"`) on which this instance of
+            `VectorizedBeamSearchScorer` will be allocated.
+        length_penalty (`float`, *optional*, defaults to 1.0):
+            Exponential penalty to the length that is used with beam-based generation. It is applied as an exponent to
+            the sequence length, which in turn is used to divide the score of the sequence. Since the score is the log
+            likelihood of the sequence (i.e. negative), `length_penalty` > 0.0 promotes longer sequences, while
+            `length_penalty` < 0.0 encourages shorter sequences.
+        do_early_stopping (`bool` or `str`, *optional*, defaults to `False`):
+            Controls the stopping condition for beam-based methods, like beam-search. It accepts the following values:
+            `True`, where the generation stops as soon as there are `num_beams` complete candidates; `False`, where an
+            heuristic is applied and the generation stops when is it very unlikely to find better candidates;
+            `"never"`, where the beam search procedure only stops when there cannot be better candidates (canonical
+            beam search algorithm).
+        num_beam_hyps_to_keep (`int`, *optional*, defaults to 1):
+            The number of beam hypotheses that shall be returned upon calling
+            [`~transformer.VectorizedBeamSearchScorer.finalize`].
+        num_beam_groups (`int`):
+            Number of groups to divide `num_beams` into in order to ensure diversity among different groups of beams.
+            See [this paper](https://arxiv.org/pdf/1610.02424.pdf) for more details.
+        max_length (`int`, *optional*):
+            The maximum length of the sequence to be generated.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        num_beams: int,
+        device: torch.device,
+        length_penalty: Optional[float] = 1.0,
+        do_early_stopping: Optional[Union[bool, str]] = False,
+        num_beam_hyps_to_keep: Optional[int] = 1,
+        num_beam_groups: Optional[int] = 1,
+        max_length: Optional[int] = None,
+    ):
+        self.batch_size = batch_size
+        self.num_beams = num_beams
+        self.device = device
+        self.length_penalty = length_penalty
+        self.do_early_stopping = do_early_stopping
+        self.num_beam_hyps_to_keep = num_beam_hyps_to_keep
+        self.num_beam_groups = num_beam_groups
+        self.group_size = self.num_beams // self.num_beam_groups
+        self.max_length = max_length
+
+        if not isinstance(self.do_early_stopping, bool) and self.max_length is None:
+            raise ValueError(
+                "When `do_early_stopping` is set to a string, `max_length` must be defined. Ensure it is passed to the"
+                " BeamScorer class instance at initialization time."
+            )
+
+        if not isinstance(num_beams, int) or num_beams <= 1:
+            raise ValueError(
+                f"`num_beams` has to be an integer strictly greater than 1, but is {num_beams}. For `num_beams` == 1,"
+                " one should make use of `greedy_search` instead."
+            )
+
+        if not isinstance(num_beam_groups, int) or (num_beam_groups > num_beams) or (num_beams % num_beam_groups != 0):
+            raise ValueError(
+                "`num_beam_groups` has to be an integer smaller or equal than `num_beams` and `num_beams` has to be"
+                f" divisible by `num_beam_groups`, but is {num_beam_groups} with `num_beams` being {num_beams}."
+            )
+
+        # Row `i * num_beam_groups + j` holds the (at most `group_size`) hypotheses of the j-th group in the i-th
+        # mini-batch. Their scores are computed in double precision, as the Python floats of `BeamHypotheses`, and the
+        # order in which they were added breaks the ties between equal scores as the lists of `BeamHypotheses` do.
+        num_rows = batch_size * self.num_beam_groups
+        self._num_hyps = torch.zeros(num_rows, dtype=torch.long, device=self.device)
+        self._worst_scores = torch.full((num_rows,), 1e9, dtype=torch.float64, device=self.device)
+        self._hyp_scores = torch.zeros((num_rows, self.group_size), dtype=torch.float64, device=self.device)
+        self._hyp_orders = torch.zeros((num_rows, self.group_size), dtype=torch.long, device=self.device)
+        self._hyp_lengths = torch.zeros((num_rows, self.group_size), dtype=torch.long, device=self.device)
+        # allocated with the first hypothesis, of shape `(num_rows, group_size, max_length)`
+        self._hyp_tokens = None
+        self._hyp_beam_indices = None
+        self._num_additions = 0
+        self._done = torch.zeros(num_rows, dtype=torch.bool, device=self.device)
+
+    @property
+    def is_done(self) -> bool:
+        return self._done.all()
+
+    def process(
+        self,
+        input_ids: torch.LongTensor,
+        next_scores: torch.FloatTensor,
+        next_tokens: torch.LongTensor,
+        next_indices: torch.LongTensor,
+        pad_token_id: Optional[int] = None,
+        eos_token_id: Optional[Union[int, List[int]]] = None,
+        beam_indices: Optional[torch.LongTensor] = None,
+        group_index: Optional[int] = 0,
+    ) -> Dict[str, torch.Tensor]:
+        cur_len = input_ids.shape[-1] + 1  # add up to the length which the next_scores is calculated on
+        batch_size = self.batch_size
+
+        if not (batch_size == (input_ids.shape[0] // self.group_size)):
+            if self.num_beam_groups > 1:
+                raise ValueError(
+                    f"A group beam size of {input_ids.shape[0]} is used as the input, but a group beam "
+                    f"size of {self.group_size} is expected by the beam scorer."
+                )
+            else:
+                raise ValueError(
+                    f"A beam size of {input_ids.shape[0]} is used as the input, but a beam size of "
+                    f"{self.group_size} is expected by the beam scorer."
+                )
+
+        if isinstance(eos_token_id, int):
+            eos_token_id = [eos_token_id]
+
+        device = input_ids.device
+        rows = torch.arange(batch_size, device=self.device) * self.num_beam_groups + group_index
+        done = self._done[rows].to(device)
+        if (eos_token_id is None or pad_token_id is None) and done.any():
+            raise ValueError("Generated beams >= num_beams -> eos_token_id and pad_token have to be defined")
+
+        batch_beam_indices = next_indices + torch.arange(batch_size, device=device)[:, None] * self.group_size
+        if eos_token_id is not None:
+            eos_token_id_tensor = torch.tensor(eos_token_id, device=device)
+            is_eos = (next_tokens[:, :, None] == eos_token_id_tensor).any(dim=-1)
+            # EOS tokens are only added to the hypotheses if they belong to the top `group_size` tokens
+            add_to_hyps = is_eos[:, : self.group_size] & ~done[:, None]
+            is_invalid = ((~is_eos).sum(dim=-1) < self.group_size) & ~done
+            # a single synchronization for both checks
+            has_invalid_batch, has_eos = torch.stack([is_invalid.any(), add_to_hyps.any()]).tolist()
+            if has_invalid_batch:
+                batch_idx = is_invalid.int().argmax().item()
+                raise ValueError(
+                    f"At most {self.group_size} tokens in {next_tokens[batch_idx]} can be equal to `eos_token_id:"
+                    f" {eos_token_id}`. Make sure {next_tokens[batch_idx]} are corrected."
+                )
+        else:
+            is_eos = torch.zeros_like(next_tokens, dtype=torch.bool)
+            has_eos = False
+
+        if has_eos:
+            if beam_indices is not None:
+                beam_indices = _beam_indices_to_tensor(beam_indices, device)
+            # the EOS tokens of a batch are added to its hypotheses in the order of their rank
+            for beam_token_rank in range(self.group_size):
+                batch_beam_idx = batch_beam_indices[:, beam_token_rank]
+                hyp_beam_indices = None
+                if beam_indices is not None:
+                    hyp_beam_indices = torch.cat([beam_indices[batch_beam_idx], batch_beam_idx[:, None]], dim=-1)
+                self._add(
+                    rows,
+                    add_to_hyps[:, beam_token_rank],
+                    input_ids[batch_beam_idx],
+                    next_scores[:, beam_token_rank],
+                    hyp_beam_indices,
+                )
+
+        # the next beams are the `group_size` best tokens that are not EOS tokens, done batches are padded
+        num_candidates = next_tokens.shape[-1]
+        candidate_order = torch.arange(num_candidates, device=device) + is_eos * num_candidates
+        selected = candidate_order.argsort(dim=-1)[:, : self.group_size]
+        next_beam_scores = next_scores.gather(-1, selected).masked_fill(done[:, None], 0)
+        next_beam_tokens = next_tokens.gather(-1, selected).masked_fill(
+            done[:, None], pad_token_id if pad_token_id is not None else 0
+        )
+        next_beam_indices = batch_beam_indices.gather(-1, selected).masked_fill(done[:, None], 0)
+
+        # Check if we are done so that we can save a pad step if all(done)
+        self._done[rows] = self._done[rows] | self._is_done(rows, next_scores.max(dim=-1).values, cur_len)
+
+        return UserDict(
+            {
+                "next_beam_scores": next_beam_scores.view(-1),
+                "next_beam_tokens": next_beam_tokens.view(-1),
+                "next_beam_indices": next_beam_indices.to(next_indices.dtype).view(-1),
+            }
+        )
+
+    def finalize(
+        self,
+        input_ids: torch.LongTensor,
+        final_beam_scores: torch.FloatTensor,
+        final_beam_tokens: torch.LongTensor,
+        final_beam_indices: torch.LongTensor,
+        max_length: int,
+        pad_token_id: Optional[int] = None,
+        eos_token_id: Optional[Union[int, List[int]]] = None,
+        beam_indices: Optional[torch.LongTensor] = None,
+    ) -> Tuple[torch.LongTensor]:
+        batch_size = self.batch_size
+        num_hyps_per_batch = self.num_beam_groups * self.group_size
+
+        if isinstance(eos_token_id, int):
+            eos_token_id = [eos_token_id]
+
+        # finalize all open beam hypotheses and add to generated hypotheses
+        rows = torch.arange(batch_size * self.num_beam_groups, device=self.device)
+        if beam_indices is not None:
+            beam_indices = _beam_indices_to_tensor(beam_indices, input_ids.device)
+        for index_per_group in range(self.group_size):
+            batch_beam_idx = (rows * self.group_size + index_per_group).to(input_ids.device)
+            self._add(
+                rows,
+                ~self._done,
+                input_ids[batch_beam_idx],
+                final_beam_scores[batch_beam_idx],
+                beam_indices[batch_beam_idx] if beam_indices is not None else None,
+            )
+
+        # Select the best hypotheses of each batch, as `BeamSearchScorer.finalize` does with a stable sort on the
+        # scores of the hypotheses of all the groups: equal scores are ranked by group and by order of addition.
+        group_offsets = torch.arange(self.num_beam_groups, device=self.device)[:, None] * (self._num_additions + 1)
+        additions = (self._hyp_orders.view(batch_size, self.num_beam_groups, -1) + group_offsets).view(batch_size, -1)
+        by_addition = additions.argsort(dim=-1, descending=True)
+        _, by_score = (
+            self._hyp_scores.view(batch_size, -1).gather(-1, by_addition).sort(dim=-1, descending=True, stable=True)
+        )
+        best = by_addition.gather(-1, by_score)[:, : self.num_beam_hyps_to_keep]
+        best = (best + torch.arange(batch_size, device=self.device)[:, None] * num_hyps_per_batch).view(-1)
+
+        best_scores = self._hyp_scores.view(-1)[best].float()
+        sent_lengths = self._hyp_lengths.view(-1)[best].to(input_ids.device)
+
+        # prepare for adding eos
+        sent_lengths_max = sent_lengths.max().item() + 1
+        sent_max_len = min(sent_lengths_max, max_length) if max_length is not None else sent_lengths_max
+
+        # shorter batches are padded if needed
+        if sent_lengths.min().item() != sent_lengths.max().item() and pad_token_id is None:
+            raise ValueError("`pad_token_id` has to be defined")
+
+        # fill with hypotheses and eos_token_id if the latter fits in
+        positions = torch.arange(sent_max_len, device=input_ids.device)
+        hyps = self._hyp_tokens.view(-1, self._hyp_tokens.shape[-1])[best].to(input_ids.device)
+        decoded = _pad_to_length(hyps, sent_max_len, 0)
+        decoded = decoded.masked_fill(
+            positions >= sent_lengths[:, None], pad_token_id if pad_token_id is not None else 0
+        )
+        if eos_token_id is not None:
+            # inserting only the first eos_token_id
+            decoded = decoded.masked_fill(positions == sent_lengths[:, None], eos_token_id[0])
+
+        indices = None
+        if beam_indices is not None:
+            indices = self._hyp_beam_indices.view(-1, self._hyp_beam_indices.shape[-1])[best].to(input_ids)
+            indices = _pad_to_length(indices, sent_max_len, -1)
+
+        return UserDict(
+            {
+                "sequences": decoded,
+                "sequence_scores": best_scores,
+                "beam_indices": indices,
+            }
+        )
+
+    def _add(
+        self,
+        rows: torch.LongTensor,
+        mask: torch.BoolTensor,
+        hyps: torch.LongTensor,
+        sum_logprobs: torch.FloatTensor,
+        beam_indices: Optional[torch.LongTensor] = None,
+    ):
+        """
+        Adds the hypotheses `hyps` to the rows `rows` where `mask` is set, as [`BeamHypotheses.add`] does.
+        """
+        self._reserve(hyps, beam_indices)
+        mask = mask.to(self.device)
+        hyps = hyps.to(self.device)
+        hyp_length = hyps.shape[-1]
+        sum_logprobs = sum_logprobs.to(self.device, torch.float64)
+        # divided by a tensor rather than by a Python scalar, which some devices replace by a multiplication with its
+        # inverse, to get the same scores as `BeamHypotheses`
+        scores = sum_logprobs / torch.full_like(sum_logprobs, hyp_length**self.length_penalty)
+
+        num_hyps = self._num_hyps[rows]
+        worst_scores = self._worst_scores[rows]
+        hyp_scores = self._hyp_scores[rows]
+        is_full = num_hyps >= self.group_size
+        mask = mask & (~is_full | (scores > worst_scores))
+
+        # a full row replaces its worst hypothesis, the earliest added one among equal scores
+        is_worst = hyp_scores == hyp_scores.min(dim=-1, keepdim=True).values
+        worst_slot = self._hyp_orders[rows].masked_fill(~is_worst, self._num_additions).argmin(dim=-1)
+        slot = torch.where(is_full, worst_slot, num_hyps.clamp(max=self.group_size - 1))
+
+        self._hyp_scores[rows, slot] = torch.where(mask, scores, self._hyp_scores[rows, slot])
+        self._hyp_orders[rows, slot] = self._hyp_orders[rows, slot].masked_fill(mask, self._num_additions)
+        self._hyp_lengths[rows, slot] = self._hyp_lengths[rows, slot].masked_fill(mask, hyp_length)
+        self._hyp_tokens[rows, slot, :hyp_length] = torch.where(
+            mask[:, None], hyps, self._hyp_tokens[rows, slot, :hyp_length]
+        )
+        if beam_indices is not None:
+            beam_indices = _pad_to_length(beam_indices.to(self.device), self._hyp_beam_indices.shape[-1], -1)
+            self._hyp_beam_indices[rows, slot] = torch.where(
+                mask[:, None], beam_indices, self._hyp_beam_indices[rows, slot]
+            )
+
+        new_worst_scores = torch.where(
+            is_full, self._hyp_scores[rows].min(dim=-1).values, torch.minimum(scores, worst_scores)
+        )
+        self._worst_scores[rows] = torch.where(mask, new_worst_scores, worst_scores)
+        self._num_hyps[rows] = num_hyps + (mask & ~is_full).long()
+        self._num_additions += 1
+
+    def _reserve(self, hyps: torch.LongTensor, beam_indices: Optional[torch.LongTensor] = None):
+        """
+        Allocates the tensors storing the tokens and beam indices of the hypotheses, or grows them to fit `hyps`.
+        """
+        shape = (self.batch_size * self.num_beam_groups, self.group_size)
+        length = hyps.shape[-1]
+        if self._hyp_tokens is None:
+            length = max(length, self.max_length or 0)
+            self._hyp_tokens = torch.zeros(shape + (length,), dtype=hyps.dtype, device=self.device)
+        elif self._hyp_tokens.shape[-1] < length:
+            self._hyp_tokens = _pad_to_length(self._hyp_tokens, max(length, 2 * self._hyp_tokens.shape[-1]), 0)
+
+        if beam_indices is None:
+            return
+        length = beam_indices.shape[-1]
+        if self._hyp_beam_indices is None:
+            length = max(length, self.max_length or 0)
+            self._hyp_beam_indices = torch.full(shape + (length,), -1, dtype=torch.long, device=self.device)
+        elif self._hyp_beam_indices.shape[-1] < length:
+            self._hyp_beam_indices = _pad_to_length(
+                self._hyp_beam_indices, max(length, 2 * self._hyp_beam_indices.shape[-1]), -1
+            )
+
+    def _is_done(self, rows: torch.LongTensor, best_sum_logprobs: torch.FloatTensor, cur_len: int) -> torch.BoolTensor:
+        """
+        Whether the generation of the hypotheses of `rows` is done, as in [`BeamHypotheses.is_done`].
+        """
+        is_full = self._num_hyps[rows] >= self.group_size
+        if self.do_early_stopping is True:
+            return is_full
+
+        # `"never"` with a positive `length_penalty` obtains the best possible score from `max_length`, see
+        # `BeamHypotheses.is_done`
+        if self.do_early_stopping is not False and self.length_penalty > 0.0:
+            length = self.max_length
+        else:
+            length = cur_len
+        best_sum_logprobs = best_sum_logprobs.to(self.device, torch.float64)
+        highest_attainable_score = best_sum_logprobs / torch.full_like(
+            best_sum_logprobs, length**self.length_penalty
+        )
+        return is_full & (self._worst_scores[rows] >= highest_attainable_score)
+
+
 class ConstrainedBeamSearchScorer(BeamScorer):
     r"""
     [`BeamScorer`] implementing constrained beam search decoding.
@@ -942,3 +1304,23 @@ class BeamHypotheses:
                 highest_attainable_score = best_sum_logprobs / cur_len**self.length_penalty
             ret = self.worst_score >= highest_attainable_score
             return ret
+
+
+def _beam_indices_to_tensor(beam_indices, device: torch.device) -> torch.LongTensor:
+    """
+    Converts the tuples of beam indices of the generation methods to a tensor of shape `(batch_size * num_beams,
+    num_steps)`.
+    """
+    if isinstance(beam_indices, torch.Tensor):
+        return beam_indices.to(device)
+    return torch.tensor(beam_indices, dtype=torch.long, device=device)
+
+
+def _pad_to_length(tensor: torch.Tensor, length: int, value: int) -> torch.Tensor:
+    """
+    Pads the last dimension of `tensor` to `length` with `value`, or truncates it if it is longer.
+    """
+    if tensor.shape[-1] >= length:
+        return tensor[..., :length]
+    padding = tensor.new_full(tensor.shape[:-1] + (length - tensor.shape[-1],), value)
+    return torch.cat([tensor, padding], dim=-1)
@@ -35,6 +35,9 @@ from ..utils import (
 
 logger = logging.get_logger(__name__)
 
+# the caches `generate` can set up instead of the default tuple format, see `GenerationConfig.cache_implementation`
+CACHE_IMPLEMENTATIONS = ("static", "paged")
+
 
 class GenerationConfig(PushToHubMixin):
     r"""
@@ -56,7 +59,7 @@ class GenerationConfig(PushToHubMixin):
         - *constrained beam-search decoding* by calling [`~generation.GenerationMixin.constrained_beam_search`], if
             `constraints!=None` or `force_words_ids!=None`
         - *assisted decoding* by calling [`~generation.GenerationMixin.assisted_decoding`], if
-            `assistant_model` is passed to `.generate()`
+            `assistant_model` is passed to `.generate()` or `prompt_lookup_num_tokens` is set
 
     You do not need to call any of the above methods directly. Pass custom parameter values to '.generate()'. To learn
     more about decoding strategies refer to the [text generation strategies guide](../generation_strategies).
@@ -98,6 +101,19 @@ class GenerationConfig(PushToHubMixin):
         use_cache (`bool`, *optional*, defaults to `True`):
             Whether or not the model should use the past last key/values attentions (if applicable to the model) to
             speed up decoding.
+        cache_implementation (`str`, *optional*):
+            The cache the past key/values are stored in, for models that support it. `"static"` preallocates a
+            [`StaticCache`] of `max_length` tokens, written in place at each step instead of growing the cache by
+            concatenation. `"paged"` stores them in the blocks of a [`PagedCache`], shared by the beams and return
+            sequences with a common prefix. It is not supported by contrastive search and assisted decoding.
+        prompt_lookup_num_tokens (`int`, *optional*):
+            The number of candidate tokens proposed at each step of assisted decoding without an assistant model. The
+            candidates are the tokens that followed the last occurrence of the trailing n-gram in the prompt or in the
+            generated text, which speeds up generation when the output repeats parts of the input (e.g.
+            summarization, code editing or extraction).
+        max_matching_ngram_size (`int`, *optional*, defaults to 2):
+            The size of the largest trailing n-gram searched for with `prompt_lookup_num_tokens`. Smaller n-grams are
+            tried when there is no match.
 
         > Parameters for manipulation of the model output logits
 
@@ -244,6 +260,9 @@ class GenerationConfig(PushToHubMixin):
         self.num_beam_groups = kwargs.pop("num_beam_groups", 1)
         self.penalty_alpha = kwargs.pop("penalty_alpha", None)
         self.use_cache = kwargs.pop("use_cache", True)
+        self.cache_implementation = kwargs.pop("cache_implementation", None)
+        self.prompt_lookup_num_tokens = kwargs.pop("prompt_lookup_num_tokens", None)
+        self.max_matching_ngram_size = kwargs.pop("max_matching_ngram_size", 2)
 
         # Parameters for manipulation of the model output logits
         self.temperature = kwargs.pop("temperature", 1.0)
@@ -332,6 +351,18 @@ class GenerationConfig(PushToHubMixin):
         """
         if self.early_stopping not in {True, False, "never"}:
             raise ValueError(f"`early_stopping` must be a boolean or 'never', but is {self.early_stopping}.")
+        if self.cache_implementation is not None and self.cache_implementation not in CACHE_IMPLEMENTATIONS:
+            raise ValueError(
+                f"`cache_implementation` must be one of {CACHE_IMPLEMENTATIONS}, but is {self.cache_implementation}."
+            )
+        if self.prompt_lookup_num_tokens is not None and self.prompt_lookup_num_tokens < 1:
+            raise ValueError(
+                f"`prompt_lookup_num_tokens` must be a positive integer, but is {self.prompt_lookup_num_tokens}."
+            )
+        if self.max_matching_ngram_size < 1:
+            raise ValueError(
+                f"`max_matching_ngram_size` must be a positive integer, but is {self.max_matching_ngram_size}."
+            )
 
     def save_pretrained(
         self,
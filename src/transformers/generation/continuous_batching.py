@@ -0,0 +1,414 @@
+# coding=utf-8
+# Copyright 2023 The HuggingFace Inc. team.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Tuple, Union
+
+import torch
+from torch import nn
+
+from ..utils import logging
+from .configuration_utils import GenerationConfig
+from .logits_process import LogitsProcessorList
+from .stopping_criteria import StoppingCriteriaList
+
+
+if TYPE_CHECKING:
+    from ..modeling_utils import PreTrainedModel
+
+
+logger = logging.get_logger(__name__)
+
+
+@dataclass
+class GenerationRequest:
+    """
+    A prompt submitted to a [`ContinuousBatchingEngine`], along with the state of its generation.
+
+    Args:
+        request_id (`int`):
+            The identifier returned by [`~ContinuousBatchingEngine.add_request`].
+        prompt_length (`int`):
+            The number of tokens of the prompt.
+        output_ids (`torch.LongTensor` of shape `(1, sequence_length)`):
+            The prompt followed by the tokens generated so far.
+        generation_config ([`GenerationConfig`]):
+            The generation parameters of the request.
+        logits_processor ([`LogitsProcessorList`]):
+            The processors applied to the scores of the request at each step.
+        logits_warper ([`LogitsProcessorList`], *optional*):
+            The warpers applied to the scores of the request before sampling, `None` for greedy decoding.
+        stopping_criteria ([`StoppingCriteriaList`]):
+            The criteria that end the generation of the request.
+        finished (`bool`, *optional*, defaults to `False`):
+            Whether the generation of the request is complete.
+    """
+
+    request_id: int
+    prompt_length: int
+    output_ids: torch.LongTensor
+    generation_config: GenerationConfig
+    logits_processor: LogitsProcessorList
+    logits_warper: Optional[LogitsProcessorList]
+    stopping_criteria: StoppingCriteriaList
+    finished: bool = False
+
+    @property
+    def sequence(self) -> torch.LongTensor:
+        """The prompt followed by the generated tokens, as a 1D tensor."""
+        return self.output_ids[0]
+
+    @property
+    def generated_ids(self) -> torch.LongTensor:
+        """The generated tokens, as a 1D tensor."""
+        return self.output_ids[0, self.prompt_length :]
+
+
+class ContinuousBatchingEngine:
+    """
+    Generation engine decoding a changing batch of requests. Instead of running a fixed batch until its longest
+    sequence is complete, as [`~generation.GenerationMixin.generate`] does, the engine evicts each request from the
+    batch as soon as it is finished and admits queued prompts into the free slots at every step, so that the compute
+    of a step is only spent on unfinished sequences.
+
+    Requests are decoded with greedy search or multinomial sampling, using the same logits processors, warpers and
+    stopping criteria as `generate`. They are built per request, so that each request may override generation
+    parameters such as `max_new_tokens`.
+
+    The engine supports decoder-only models whose `past_key_values` follow the standard format, a tuple with one tuple
+    of `(batch_size, num_heads, sequence_length, head_dim)` tensors per layer (e.g. GPT-2, GPT-NeoX, OPT or LLaMA). The
+    sequences of the batch are left-padded to a common length, and the cache is only re-laid out when requests are
+    admitted or evicted.
+
+    Args:
+        model ([`PreTrainedModel`]):
+            The decoder-only model used for generation.
+        generation_config ([`GenerationConfig`], *optional*):
+            The default generation parameters of the requests. Defaults to the `generation_config` of the model.
+        max_batch_size (`int`, *optional*, defaults to 8):
+            The maximum number of requests decoded at once.
+        logits_processor ([`LogitsProcessorList`], *optional*):
+            Custom logits processors applied to every request, in addition to the ones built from the generation
+            parameters.
+        stopping_criteria ([`StoppingCriteriaList`], *optional*):
+            Custom stopping criteria applied to every request, in addition to the ones built from the generation
+            parameters.
+
+    Example:
+
+    ```python
+    >>> from transformers import AutoModelForCausalLM, AutoTokenizer, ContinuousBatchingEngine
+
+    >>> tokenizer = AutoTokenizer.from_pretrained("gpt2")
+    >>> model = AutoModelForCausalLM.from_pretrained("gpt2")
+    >>> engine = ContinuousBatchingEngine(model, max_batch_size=4)
+
+    >>> prompts = ["Hello, my dog is", "The capital of France is", "Once upon a time"]
+    >>> request_ids = [engine.add_request(tokenizer(prompt).input_ids, max_new_tokens=20) for prompt in prompts]
+    >>> while engine.has_unfinished_requests():
+    ...     for request in engine.step():
+    ...         print(request.request_id, tokenizer.decode(request.generated_ids))  # doctest: +SKIP
+    ```
+    """
+
+    def __init__(
+        self,
+        model: "PreTrainedModel",
+        generation_config: Optional[GenerationConfig] = None,
+        max_batch_size: int = 8,
+        logits_processor: Optional[LogitsProcessorList] = None,
+        stopping_criteria: Optional[StoppingCriteriaList] = None,
+    ):
+        if model.config.is_encoder_decoder:
+            raise ValueError("The continuous batching engine only supports decoder-only models.")
+        if hasattr(model, "_convert_to_standard_cache"):
+            raise ValueError(
+                f"{model.__class__.__name__} does not use the standard `past_key_values` format, which the continuous "
+                "batching engine relies on."
+            )
+        if max_batch_size < 1:
+            raise ValueError(f"`max_batch_size` has to be a strictly positive integer, but is {max_batch_size}.")
+
+        self.model = model
+        self.generation_config = generation_config if generation_config is not None else model.generation_config
+        self.max_batch_size = max_batch_size
+        self.logits_processor = logits_processor if logits_processor is not None else LogitsProcessorList()
+        self.stopping_criteria = stopping_criteria if stopping_criteria is not None else StoppingCriteriaList()
+
+        self._queue: Deque[GenerationRequest] = deque()
+        self._running: List[GenerationRequest] = []
+        self._past_key_values: Optional[Tuple[Tuple[torch.Tensor]]] = None
+        self._attention_mask: Optional[torch.LongTensor] = None
+        self._next_request_id = 0
+
+    @property
+    def num_running_requests(self) -> int:
+        """The number of requests in the batch being decoded."""
+        return len(self._running)
+
+    @property
+    def num_queued_requests(self) -> int:
+        """The number of requests waiting for a free slot in the batch."""
+        return len(self._queue)
+
+    def has_unfinished_requests(self) -> bool:
+        """Whether some requests are still queued or being decoded."""
+        return len(self._queue) > 0 or len(self._running) > 0
+
+    def add_request(self, input_ids: Union[List[int], torch.LongTensor], **kwargs) -> int:
+        """
+        Queues a prompt for generation.
+
+        Args:
+            input_ids (`List[int]` or `torch.LongTensor` of shape `(sequence_length,)` or `(1, sequence_length)`):
+                The tokens of the prompt, without padding.
+            kwargs:
+                Generation parameters of this request, overriding the ones of the `generation_config` of the engine,
+                e.g. `max_new_tokens=64` or `do_sample=True`.
+
+        Return:
+            `int`: The identifier of the request, which is also the `request_id` of the [`GenerationRequest`] returned
+            by [`~ContinuousBatchingEngine.step`] when it is finished.
+        """
+        generation_config = copy.deepcopy(self.generation_config)
+        model_kwargs = generation_config.update(**kwargs)
+        if model_kwargs:
+            raise ValueError(f"The following generation parameters are not supported: {list(model_kwargs)}.")
+        generation_config.validate()
+        if generation_config.num_beams != 1 or (
+            generation_config.penalty_alpha is not None and generation_config.penalty_alpha > 0
+        ):
+            raise ValueError("The continuous batching engine only supports greedy search and multinomial sampling.")
+
+        input_ids = torch.as_tensor(input_ids, dtype=torch.long, device=self.model.device)
+        if input_ids.dim() == 2 and input_ids.shape[0] == 1:
+            input_ids = input_ids[0]
+        if input_ids.dim() != 1 or input_ids.shape[0] == 0:
+            raise ValueError("`input_ids` should contain the tokens of a single, non-empty prompt.")
+        input_ids = input_ids[None]
+
+        prompt_length = input_ids.shape[-1]
+        if generation_config.max_new_tokens is not None:
+            generation_config.max_length = generation_config.max_new_tokens + prompt_length
+
+        request = GenerationRequest(
+            request_id=self._next_request_id,
+            prompt_length=prompt_length,
+            output_ids=input_ids,
+            generation_config=generation_config,
+            logits_processor=self.model._get_logits_processor(
+                generation_config=generation_config,
+                input_ids_seq_length=prompt_length,
+                encoder_input_ids=input_ids,
+                prefix_allowed_tokens_fn=None,
+                logits_processor=self.logits_processor,
+            ),
+            logits_warper=self.model._get_logits_warper(generation_config) if generation_config.do_sample else None,
+            stopping_criteria=self.model._get_stopping_criteria(
+                generation_config=generation_config, stopping_criteria=self.stopping_criteria
+            ),
+        )
+        self._next_request_id += 1
+        self._queue.append(request)
+        return request.request_id
+
+    @torch.no_grad()
+    def step(self) -> List[GenerationRequest]:
+        """
+        Runs one decoding step: generates the next token of every request of the batch, admits queued requests into
+        the free slots of the batch (generating their first token), then evicts the finished requests.
+
+        Return:
+            `List[GenerationRequest]`: The requests finished during this step.
+        """
+        finished = []
+        if self._running:
+            next_token_logits = self._decode()
+            finished.extend(self._select_next_tokens(self._running, next_token_logits))
+
+        admitted = []
+        while self._queue and len(self._running) + len(admitted) < self.max_batch_size:
+            admitted.append(self._queue.popleft())
+        if admitted:
+            next_token_logits = self._prefill(admitted)
+            self._running.extend(admitted)
+            finished.extend(self._select_next_tokens(admitted, next_token_logits))
+
+        if finished:
+            self._evict_finished_requests()
+        return finished
+
+    def generate(self, prompts: List[Union[List[int], torch.LongTensor]], **kwargs) -> List[torch.LongTensor]:
+        """
+        Generates a continuation of each prompt, decoding at most `max_batch_size` prompts at once.
+
+        Args:
+            prompts (`List[List[int]]` or `List[torch.LongTensor]`):
+                The tokens of the prompts, without padding.
+            kwargs:
+                Generation parameters of all the prompts, see [`~ContinuousBatchingEngine.add_request`].
+
+        Return:
+            `List[torch.LongTensor]`: The prompts followed by their generated tokens, in the order of `prompts`.
+        """
+        request_ids = [self.add_request(prompt, **kwargs) for prompt in prompts]
+        sequences: Dict[int, torch.LongTensor] = {}
+        while self.has_unfinished_requests():
+            for request in self.step():
+                sequences[request.request_id] = request.sequence
+        return [sequences[request_id] for request_id in request_ids]
+
+    def _forward(self, input_ids, attention_mask, past_key_values):
+        model_inputs = self.model.prepare_inputs_for_generation(
+            input_ids, past_key_values=past_key_values, attention_mask=attention_mask, use_cache=True
+        )
+        outputs = self.model(**model_inputs, return_dict=True)
+        return outputs.logits[:, -1, :], outputs.past_key_values
+
+    def _decode(self) -> torch.FloatTensor:
+        input_ids = torch.cat([request.output_ids[:, -1:] for request in self._running])
+        attention_mask = nn.functional.pad(self._attention_mask, (0, 1), value=1)
+        next_token_logits, self._past_key_values = self._forward(input_ids, attention_mask, self._past_key_values)
+        self._attention_mask = attention_mask
+        return next_token_logits
+
+    def _prefill(self, requests: List[GenerationRequest]) -> torch.FloatTensor:
+        # the prompts are left-padded to the same length, the padding token does not matter since it is masked out
+        length = max(request.prompt_length for request in requests)
+        input_ids = torch.cat(
+            [nn.functional.pad(request.output_ids, (length - request.prompt_length, 0)) for request in requests]
+        )
+        attention_mask = torch.cat(
+            [
+                nn.functional.pad(torch.ones_like(request.output_ids), (length - request.prompt_length, 0))
+                for request in requests
+            ]
+        )
+        next_token_logits, past_key_values = self._forward(input_ids, attention_mask, None)
+
+        if self._past_key_values is None:
+            self._past_key_values, self._attention_mask = past_key_values, attention_mask
+            return next_token_logits
+
+        # the cache of the batch and the one of the new requests are left-padded to the same length and concatenated
+        length = max(self._attention_mask.shape[-1], attention_mask.shape[-1])
+
+        def left_pad(tensor, dim):
+            padding = [0, 0] * (tensor.dim() - dim % tensor.dim() - 1) + [length - tensor.shape[dim], 0]
+            return nn.functional.pad(tensor, padding)
+
+        self._past_key_values = tuple(
+            tuple(
+                torch.cat([left_pad(batch_state, dim=-2), left_pad(new_state, dim=-2)])
+                for batch_state, new_state in zip(batch_layer, new_layer)
+            )
+            for batch_layer, new_layer in zip(self._past_key_values, past_key_values)
+        )
+        self._attention_mask = torch.cat([left_pad(self._attention_mask, -1), left_pad(attention_mask, -1)])
+        return next_token_logits
+
+    def _select_next_tokens(
+        self, requests: List[GenerationRequest], next_token_logits: torch.FloatTensor
+    ) -> List[GenerationRequest]:
+        next_tokens = torch.empty(len(requests), dtype=torch.long, device=next_token_logits.device)
+        next_token_scores = [None] * len(requests)
+
+        # the logits processors expect the tokens of a sequence without padding, so they are applied request by
+        # request. The other requests are grouped by sampling parameters, and the next tokens of each group are
+        # selected with a single `argmax` or `multinomial` call.
+        groups: Dict[Tuple, List[int]] = {}
+        for i, request in enumerate(requests):
+            if len(request.logits_processor) > 0:
+                scores = request.logits_processor(request.output_ids, next_token_logits[i, None])
+                next_tokens[i] = self._sample(scores, request.logits_warper)[0]
+                next_token_scores[i] = scores
+            else:
+                groups.setdefault(_get_sampling_key(request.generation_config), []).append(i)
+
+        for indices in groups.values():
+            # the warpers do not depend on the previous tokens, so the ones of any request of the group are used
+            logits_warper = requests[indices[0]].logits_warper
+            if len(indices) == len(requests):
+                scores = next_token_logits
+                next_tokens = self._sample(scores, logits_warper)
+            else:
+                indices_tensor = torch.tensor(indices, device=next_token_logits.device)
+                scores = next_token_logits.index_select(0, indices_tensor)
+                next_tokens.index_copy_(0, indices_tensor, self._sample(scores, logits_warper))
+            for j, i in enumerate(indices):
+                next_token_scores[i] = scores[j, None]
+
+        # the end of sequence tokens are detected on device, with a single synchronization for the whole batch
+        eos_token_ids = []
+        for request in requests:
+            eos_token_id = request.generation_config.eos_token_id
+            eos_token_ids.append([eos_token_id] if isinstance(eos_token_id, int) else list(eos_token_id or []))
+        num_eos_token_ids = max(len(ids) for ids in eos_token_ids)
+        if num_eos_token_ids > 0:
+            eos_token_ids = torch.tensor(
+                [ids + [-1] * (num_eos_token_ids - len(ids)) for ids in eos_token_ids], device=next_tokens.device
+            )
+            is_eos = (next_tokens[:, None] == eos_token_ids).any(dim=-1).tolist()
+        else:
+            is_eos = [False] * len(requests)
+
+        finished = []
+        for i, request in enumerate(requests):
+            request.output_ids = torch.cat([request.output_ids, next_tokens[i].view(1, 1)], dim=-1)
+            if is_eos[i] or request.stopping_criteria(request.output_ids, next_token_scores[i]):
+                request.finished = True
+                finished.append(request)
+        return finished
+
+    @staticmethod
+    def _sample(scores: torch.FloatTensor, logits_warper: Optional[LogitsProcessorList]) -> torch.LongTensor:
+        if logits_warper is None:
+            return torch.argmax(scores, dim=-1)
+        scores = logits_warper(None, scores)
+        probs = nn.functional.softmax(scores, dim=-1)
+        return torch.multinomial(probs, num_samples=1)[:, 0]
+
+    def _evict_finished_requests(self):
+        keep = [i for i, request in enumerate(self._running) if not request.finished]
+        self._running = [self._running[i] for i in keep]
+        if not keep:
+            self._past_key_values, self._attention_mask = None, None
+            return
+
+        keep = torch.tensor(keep, device=self._attention_mask.device)
+        attention_mask = self._attention_mask.index_select(0, keep)
+        # the leading positions that are padding in all the remaining sequences are dropped
+        num_padding = int(attention_mask.any(dim=0).long().argmax())
+        self._attention_mask = attention_mask[:, num_padding:]
+        self._past_key_values = tuple(
+            tuple(state.index_select(0, keep.to(state.device))[..., num_padding:, :] for state in layer)
+            for layer in self._past_key_values
+        )
+
+
+def _get_sampling_key(generation_config: GenerationConfig) -> Tuple:
+    # the generation parameters that the logits warpers of a request are built from
+    return (
+        generation_config.do_sample,
+        generation_config.temperature,
+        generation_config.top_k,
+        generation_config.top_p,
+        generation_config.typical_p,
+        generation_config.epsilon_cutoff,
+        generation_config.eta_cutoff,
+        generation_config.renormalize_logits,
+    )
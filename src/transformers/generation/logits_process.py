@@ -13,15 +13,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import inspect
 import math
-from typing import Callable, Dict, Iterable, List, Tuple, Union
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import torch
 
 from ..utils import add_start_docstrings
 from ..utils.logging import get_logger
+from .regex_fsm import RegexFSM, json_schema_to_regex
 
 
 logger = get_logger(__name__)
@@ -92,6 +95,23 @@ class LogitsProcessorList(list):
                 scores = processor(input_ids, scores)
         return scores
 
+    def reset(self):
+        """
+        Notifies the processors following the hypotheses across generation steps that a new generation starts.
+        """
+        for processor in self:
+            if hasattr(processor, "reset"):
+                processor.reset()
+
+    def reorder_beams(self, beam_idx: torch.LongTensor):
+        """
+        Notifies the processors following the hypotheses across generation steps that the hypotheses of the next call
+        extend the hypotheses `beam_idx` of the last call, as selected by beam search.
+        """
+        for processor in self:
+            if hasattr(processor, "reorder_beams"):
+                processor.reorder_beams(beam_idx)
+
 
 class MinLengthLogitsProcessor(LogitsProcessor):
     r"""
@@ -305,6 +325,132 @@ class TopKLogitsWarper(LogitsWarper):
         return scores
 
 
+class FusedLogitsWarper(LogitsWarper):
+    r"""
+    [`LogitsWarper`] that applies temperature, top-k and top-p in a single pass. It is equivalent to chaining
+    [`TemperatureLogitsWarper`], [`TopKLogitsWarper`] and [`TopPLogitsWarper`], but the scores are sorted at most once:
+    when `top_k` is set, top-p is computed on the `top_k` largest scores only, found with a partial `torch.topk`.
+    Without `top_k`, the vocabulary is only fully sorted when the `num_top_p_candidates` largest scores do not hold
+    enough probability mass to contain the top-p tokens. Both filters then reduce to a per-row threshold, so that the
+    scores are masked with a single `masked_fill`, unless scores tied with the threshold are only partially filtered or
+    scores tied with the `top_k`-th largest score are left out of the candidates.
+
+    This warper is used by [`~generation.GenerationMixin.generate`] when sampling with these three warpers only.
+
+    Args:
+        temperature (`float`, *optional*):
+            The value used to module the logits distribution. No scaling is applied if not set.
+        top_k (`int`, *optional*):
+            The number of highest probability vocabulary tokens to keep for top-k-filtering. No top-k filtering is
+            applied if not set.
+        top_p (`float`, *optional*):
+            If set to < 1, only the smallest set of most probable tokens with probabilities that add up to `top_p` or
+            higher are kept for generation. No top-p filtering is applied if not set.
+        filter_value (`float`, *optional*, defaults to `-float("Inf")`):
+            All filtered values will be set to this float value.
+        min_tokens_to_keep (`int`, *optional*, defaults to 1):
+            Minimum number of tokens that cannot be filtered.
+    """
+
+    num_top_p_candidates = 1024
+
+    def __init__(
+        self,
+        temperature: Optional[float] = None,
+        top_k: Optional[int] = None,
+        top_p: Optional[float] = None,
+        filter_value: float = -float("Inf"),
+        min_tokens_to_keep: int = 1,
+    ):
+        if temperature is not None and (not isinstance(temperature, float) or not (temperature > 0)):
+            raise ValueError(f"`temperature` has to be a strictly positive float, but is {temperature}")
+        if top_k is not None and (not isinstance(top_k, int) or top_k <= 0):
+            raise ValueError(f"`top_k` has to be a strictly positive integer, but is {top_k}")
+        if top_p is not None:
+            top_p = float(top_p)
+            if top_p < 0 or top_p > 1.0:
+                raise ValueError(f"`top_p` has to be a float > 0 and < 1, but is {top_p}")
+        if not isinstance(min_tokens_to_keep, int) or (min_tokens_to_keep < 1):
+            raise ValueError(f"`min_tokens_to_keep` has to be a positive integer, but is {min_tokens_to_keep}")
+
+        self.temperature = temperature
+        self.top_k = max(top_k, min_tokens_to_keep) if top_k is not None else None
+        self.top_p = top_p
+        self.filter_value = filter_value
+        self.min_tokens_to_keep = min_tokens_to_keep
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        # the scaled scores are a new tensor, that can be masked in place
+        in_place = self.temperature is not None
+        if in_place:
+            scores = scores / self.temperature
+
+        vocab_size = scores.size(-1)
+        top_k = self.top_k if self.top_k is not None and self.top_k < vocab_size else None
+        if top_k is None and self.top_p is None:
+            return scores
+
+        # ascending scores of the candidate tokens, that may not be filtered by top-k
+        if top_k is not None:
+            sorted_logits = torch.topk(scores, top_k)[0].flip(-1)
+            cumulative_probs = sorted_logits.softmax(dim=-1).cumsum(dim=-1) if self.top_p is not None else None
+        else:
+            sorted_logits, cumulative_probs = self._get_top_p_candidates(scores)
+
+        if cumulative_probs is not None:
+            # the filtered candidates are the ones whose cumulative probability is below the threshold, i.e. a prefix
+            # of the sorted candidates, of which the last `min_tokens_to_keep` are always kept
+            num_removed = (cumulative_probs <= (1 - self.top_p)).sum(dim=-1, keepdim=True)
+            num_removed.clamp_(max=max(sorted_logits.size(-1) - self.min_tokens_to_keep, 0))
+            threshold = sorted_logits.gather(-1, num_removed)
+        else:
+            threshold = sorted_logits[..., :1]
+
+        indices_to_remove = scores < threshold
+        if cumulative_probs is not None:
+            # the threshold keeps all the scores tied with it, while top-p may only keep some of them. Top-k also keeps
+            # all the scores tied with the k-th largest one, so that top-p is computed on more than the `top_k`
+            # candidates when some of them are left out.
+            num_kept = sorted_logits.size(-1) - num_removed
+            is_inexact = (~indices_to_remove).sum(dim=-1, keepdim=True) != num_kept
+            if top_k is not None:
+                is_inexact |= (scores >= sorted_logits[..., :1]).sum(dim=-1, keepdim=True) > top_k
+            if is_inexact.any():
+                indices_to_remove = self._get_sorted_indices_to_remove(scores)
+
+        if in_place:
+            return scores.masked_fill_(indices_to_remove, self.filter_value)
+        return scores.masked_fill(indices_to_remove, self.filter_value)
+
+    def _get_sorted_indices_to_remove(self, scores: torch.FloatTensor) -> torch.BoolTensor:
+        # same filtering as `TopKLogitsWarper` followed by `TopPLogitsWarper`, that sorts the whole vocabulary
+        indices_to_remove = torch.zeros_like(scores, dtype=torch.bool)
+        if self.top_k is not None:
+            top_k = min(self.top_k, scores.size(-1))
+            indices_to_remove = scores < torch.topk(scores, top_k)[0][..., -1, None]
+            scores = scores.masked_fill(indices_to_remove, self.filter_value)
+
+        sorted_logits, sorted_indices = torch.sort(scores, descending=False)
+        cumulative_probs = sorted_logits.softmax(dim=-1).cumsum(dim=-1)
+        sorted_indices_to_remove = cumulative_probs <= (1 - self.top_p)
+        sorted_indices_to_remove[..., -self.min_tokens_to_keep :] = 0
+        return indices_to_remove | sorted_indices_to_remove.scatter(1, sorted_indices, sorted_indices_to_remove)
+
+    def _get_top_p_candidates(self, scores: torch.FloatTensor) -> Tuple[torch.FloatTensor, torch.FloatTensor]:
+        # the nucleus is usually much smaller than the vocabulary: when the largest scores hold enough probability mass
+        # for all the other tokens to be filtered, only these are sorted
+        num_candidates = max(self.num_top_p_candidates, self.min_tokens_to_keep)
+        if num_candidates < scores.size(-1):
+            sorted_logits = torch.topk(scores, num_candidates)[0].flip(-1)
+            probs = (sorted_logits - torch.logsumexp(scores, dim=-1, keepdim=True)).exp()
+            remaining_mass = (1 - probs.sum(dim=-1, keepdim=True)).clamp_(min=0)
+            if (remaining_mass <= (1 - self.top_p)).all():
+                return sorted_logits, remaining_mass + probs.cumsum(dim=-1)
+
+        sorted_logits = torch.sort(scores, descending=False)[0]
+        return sorted_logits, sorted_logits.softmax(dim=-1).cumsum(dim=-1)
+
+
 class TypicalLogitsWarper(LogitsWarper):
     r"""
     [`LogitsWarper`] that performs typical decoding. See [Typical Decoding for Natural Language
@@ -455,28 +601,14 @@ def _get_generated_ngrams(banned_ngrams, prev_input_ids, ngram_size, cur_len):
     return banned_ngrams.get(ngram_idx, [])
 
 
-def _calc_banned_ngram_tokens(
-    ngram_size: int, prev_input_ids: torch.Tensor, num_hypos: int, cur_len: int
-) -> List[Iterable[int]]:
-    """Copied from fairseq for no_repeat_ngram in beam_search"""
-    if cur_len + 1 < ngram_size:
-        # return no banned tokens if we haven't generated no_repeat_ngram_size tokens yet
-        return [[] for _ in range(num_hypos)]
-
-    generated_ngrams = _get_ngrams(ngram_size, prev_input_ids, num_hypos)
-
-    banned_tokens = [
-        _get_generated_ngrams(generated_ngrams[hypo_idx], prev_input_ids[hypo_idx], ngram_size, cur_len)
-        for hypo_idx in range(num_hypos)
-    ]
-    return banned_tokens
-
-
 class NoRepeatNGramLogitsProcessor(LogitsProcessor):
     r"""
     [`LogitsProcessor`] that enforces no repetition of n-grams. See
     [Fairseq](https://github.com/pytorch/fairseq/blob/a07cb6f40480928c9e0548b737aadd36ee66ac76/fairseq/sequence_generator.py#L345).
 
+    The n-grams are matched with tensor operations on the device of `input_ids`, without copying the hypotheses to
+    Python lists, so that the processor does not stall generation with long sequences and many beams.
+
     Args:
         ngram_size (`int`):
             All ngrams of size `ngram_size` can only occur once.
@@ -488,12 +620,20 @@ class NoRepeatNGramLogitsProcessor(LogitsProcessor):
         self.ngram_size = ngram_size
 
     def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
-        num_batch_hypotheses = scores.shape[0]
         cur_len = input_ids.shape[-1]
-        banned_batch_tokens = _calc_banned_ngram_tokens(self.ngram_size, input_ids, num_batch_hypotheses, cur_len)
+        if cur_len < self.ngram_size:
+            # no banned tokens if we haven't generated `ngram_size` tokens yet
+            return scores
 
-        for i, banned_tokens in enumerate(banned_batch_tokens):
-            scores[i, banned_tokens] = -float("inf")
+        # all n-grams of the hypotheses, of shape (num_hypos, cur_len - ngram_size + 1, ngram_size)
+        ngrams = input_ids.unfold(1, self.ngram_size, 1)
+        # the n-grams starting with the last `ngram_size - 1` tokens can't be completed again
+        last_tokens = input_ids[:, cur_len - self.ngram_size + 1 :]
+        is_banned = (ngrams[:, :, :-1] == last_tokens[:, None]).all(dim=-1)
+
+        banned_tokens_mask = torch.zeros_like(scores, dtype=torch.long)
+        banned_tokens_mask.scatter_add_(1, ngrams[:, :, -1], is_banned.long())
+        scores.masked_fill_(banned_tokens_mask > 0, -float("inf"))
 
         return scores
 
@@ -560,7 +700,8 @@ class SequenceBiasLogitsProcessor(LogitsProcessor):
             Dictionary that maps a sequence of tokens to its bias term. Positive biases increase the odds of the
             sequence being selected, while negative biases do the opposite. If a sequence has a length of 1, its bias
             will always be applied. Otherwise, the bias will only be applied if the sequence in question is about to be
-            completed (in the token selection step after this processor is applied).
+            completed (in the token selection step after this processor is applied). The biases of all the sequences
+            that a token would complete are summed.
 
     Examples:
 
@@ -607,11 +748,13 @@ class SequenceBiasLogitsProcessor(LogitsProcessor):
 
         # Bias variables that will be populated on the first call (for retrocompatibility purposes, the vocabulary size
         # is infered in the first usage, which inhibits initializing here)
-        self.sequences_length_greater_than_1 = []
         self.length_1_bias = None
-        self.length_greather_than_1_bias = None
         self.prepared_bias_variables = False
 
+        # Sequences with more than one token are compiled into an automaton over their prefixes, so that the cost of
+        # finding the sequences that may be completed does not grow with the number of sequences
+        self._build_prefix_automaton()
+
     def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
         # 1 - Prepares the bias tensors. This is only needed the first time the logit processor is called.
         if not self.prepared_bias_variables:
@@ -623,35 +766,81 @@ class SequenceBiasLogitsProcessor(LogitsProcessor):
         # 3 - include the bias from length = 1
         bias += self.length_1_bias
 
-        # 4 - include the bias from length > 1, after determining which biased sequences may be completed.
-        # `matching_mask` is a (batch_size, vocab_size) boolean mask that is True for all tokens whose corresponding
-        # bias should be applied. The bias is applied on the last token of the sequence, if (and only if) the sequence
-        # may become complete this iteration.
-        matching_mask = torch.zeros_like(scores, dtype=torch.bool)
-        for sequence_ids in self.sequences_length_greater_than_1:
-            if len(sequence_ids) > input_ids.shape[1]:  # the sequence is longer than the context, ignore
-                continue
-            prefix_length = len(sequence_ids) - 1
-            last_token = sequence_ids[-1]
-            matching_rows = torch.eq(
-                input_ids[:, -prefix_length:],
-                torch.tensor(sequence_ids[:-1], dtype=input_ids.dtype, device=input_ids.device),
-            ).prod(dim=1)
-            matching_mask[:, last_token] |= matching_rows.bool()
-        bias += torch.where(
-            matching_mask,
-            self.length_greather_than_1_bias,
-            torch.tensor(0.0, device=self.length_greather_than_1_bias.device),
-        )
+        # 4 - include the bias from length > 1. The bias is applied on the last token of the sequence, if (and only if)
+        # the sequence may become complete this iteration, i.e. if its prefix matches the end of `input_ids`. No prefix
+        # is longer than `max_prefix_length`, so the state of the automaton only depends on the last tokens. Sequences
+        # longer than the context are ignored, hence the first token is never part of a matching prefix.
+        if self.max_prefix_length > 0:
+            context_start = max(input_ids.shape[1] - self.max_prefix_length, 1)
+            rows, tokens, biases = [], [], []
+            for row, token_ids in enumerate(input_ids[:, context_start:].tolist()):
+                completion_tokens, completion_biases = self._completions[self._match_prefixes(token_ids)]
+                rows.extend([row] * len(completion_tokens))
+                tokens.extend(completion_tokens)
+                biases.extend(completion_biases)
+            if len(rows) > 0:
+                bias.index_put_(
+                    (torch.tensor(rows, device=bias.device), torch.tensor(tokens, device=bias.device)),
+                    torch.tensor(biases, dtype=bias.dtype, device=bias.device),
+                    accumulate=True,
+                )
 
         # 5 - apply the bias to the scores
         scores = scores + bias
         return scores
 
+    def _build_prefix_automaton(self):
+        # Trie of the prefixes of the sequences, where `goto[state]` maps a token to the next state (0 is the root).
+        # Each state holds the tokens completing the sequences that have this state as prefix, with their bias.
+        goto = [{}]
+        completions = [{}]
+        for sequence_ids, bias in self.sequence_bias.items():
+            if len(sequence_ids) == 1:
+                continue
+            state = 0
+            for token_id in sequence_ids[:-1]:
+                token_id = int(token_id)
+                if token_id not in goto[state]:
+                    goto[state][token_id] = len(goto)
+                    goto.append({})
+                    completions.append({})
+                state = goto[state][token_id]
+            completions[state][int(sequence_ids[-1])] = bias
+
+        # Aho-Corasick failure links: `fail[state]` is the state of the longest proper suffix of `state` in the trie.
+        # The prefixes matching the end of the context are the state and its failure chain, so each state also holds
+        # the completions of its failure state (which is shallower, hence processed first in breadth-first order).
+        fail = [0] * len(goto)
+        queue = collections.deque(goto[0].values())
+        while len(queue) > 0:
+            state = queue.popleft()
+            for token_id, bias in completions[fail[state]].items():
+                completions[state][token_id] = completions[state].get(token_id, 0.0) + bias
+            for token_id, next_state in goto[state].items():
+                fail_state = fail[state]
+                while fail_state != 0 and token_id not in goto[fail_state]:
+                    fail_state = fail[fail_state]
+                if token_id in goto[fail_state]:
+                    fail[next_state] = goto[fail_state][token_id]
+                queue.append(next_state)
+
+        self._goto = goto
+        self._fail = fail
+        self._completions = [(list(completion), list(completion.values())) for completion in completions]
+        self.max_prefix_length = max((len(sequence_ids) - 1 for sequence_ids in self.sequence_bias), default=0)
+
+    def _match_prefixes(self, token_ids: List[int]) -> int:
+        # Returns the state of the longest suffix of `token_ids` that is the prefix of a sequence
+        state = 0
+        for token_id in token_ids:
+            while state != 0 and token_id not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token_id, 0)
+        return state
+
     def _prepare_bias_variables(self, scores: torch.FloatTensor):
         vocabulary_size = scores.shape[-1]
         sequence_bias = self.sequence_bias
-        tokens_with_bias = []
 
         # Check biased tokens out of bounds
         invalid_biases = []
@@ -665,23 +854,12 @@ class SequenceBiasLogitsProcessor(LogitsProcessor):
                 f"{invalid_biases}"
             )
 
-        # Precompute the bias tensors to be applied. Sequences of length 1 are kept separately, as they can be applied
-        # with simpler logic.
+        # Precompute the bias tensor of the sequences of length 1, which is always applied. The bias of longer
+        # sequences is looked up in the prefix automaton.
         self.length_1_bias = torch.zeros((vocabulary_size,), dtype=torch.float).to(scores.device)
-        self.length_greather_than_1_bias = torch.zeros((vocabulary_size,), dtype=torch.float).to(scores.device)
         for sequence_ids, bias in sequence_bias.items():
             if len(sequence_ids) == 1:
                 self.length_1_bias[sequence_ids[-1]] = bias
-            else:
-                self.sequences_length_greater_than_1.append(sequence_ids)
-                if self.length_greather_than_1_bias[sequence_ids[-1]] != 0.0:
-                    raise ValueError(
-                        "Setting a bias on sequences that share a common token termination is not yet supported. "
-                        "Please open an issue if you see this error message (after checking that it doesn't already "
-                        "exist)."
-                    )
-                self.length_greather_than_1_bias[sequence_ids[-1]] = bias
-            tokens_with_bias.append(sequence_ids[-1])
 
         self.prepared_bias_variables = True
 
@@ -783,6 +961,199 @@ class PrefixConstrainedLogitsProcessor(LogitsProcessor):
         return scores + mask
 
 
+class RegexLogitsProcessor(LogitsProcessor):
+    r"""
+    [`LogitsProcessor`] that constrains the generated text to fully match a regular expression. The regular expression
+    is compiled once into a finite-state machine over the tokens of the vocabulary ([`~generation.RegexFSM`]), cached
+    on disk and in memory, so that each generation step only advances the state of each hypothesis by its last token
+    and masks the tokens this state does not allow. The *end-of-sequence* token is only allowed when the generated text
+    matches the regular expression.
+
+    The constrained text is the text generated after the `input_ids` of the first call of the processor in a
+    generation, i.e. after the prompt for decoder-only models and after the decoder start token for encoder-decoder
+    models. Once a hypothesis has generated an *end-of-sequence* token, or a token the constraint does not allow (e.g.
+    forced by another processor), its next tokens are no longer constrained. [`~generation.GenerationMixin.generate`]
+    starts each generation by calling [`~RegexLogitsProcessor.reset`], which has to be called between generations
+    when the processor is used on its own.
+
+    Args:
+        regex (`str`):
+            The regular expression the generated text has to match, see [`~generation.RegexFSM.compile`] for the
+            supported syntax.
+        tokenizer ([`PreTrainedTokenizerBase`]):
+            The tokenizer of the model, whose tokens are generated.
+        eos_token_id (`Union[int, List[int]]`, *optional*):
+            The id of the *end-of-sequence* token. Optionally, use a list to set multiple *end-of-sequence* tokens.
+            Defaults to the *end-of-sequence* token of `tokenizer`.
+        cache_dir (`str` or `os.PathLike`, *optional*):
+            The directory in which the compiled finite-state machines are cached. Defaults to the `REGEX_FSM_CACHE`
+            environment variable, or `~/.cache/huggingface/regex_fsm`.
+
+    Examples:
+
+    ```python
+    >>> from transformers import AutoModelForCausalLM, AutoTokenizer, LogitsProcessorList, RegexLogitsProcessor
+
+    >>> model = AutoModelForCausalLM.from_pretrained("gpt2")
+    >>> tokenizer = AutoTokenizer.from_pretrained("gpt2")
+    >>> inputs = tokenizer(["The first man on the moon landed in the year"], return_tensors="pt")
+
+    >>> # the generated text is a year followed by a period, then generation ends
+    >>> regex_processor = RegexLogitsProcessor(r" (19|20)[0-9]{2}\.", tokenizer)
+    >>> outputs = model.generate(**inputs, logits_processor=LogitsProcessorList([regex_processor]), max_new_tokens=10)
+    ```
+    """
+
+    def __init__(
+        self,
+        regex: str,
+        tokenizer,
+        eos_token_id: Optional[Union[int, List[int]]] = None,
+        cache_dir: Optional[Union[str, os.PathLike]] = None,
+    ):
+        if eos_token_id is None:
+            eos_token_id = tokenizer.eos_token_id
+        if eos_token_id is None:
+            raise ValueError("`eos_token_id` has to be set when the tokenizer has no end-of-sequence token.")
+        if isinstance(eos_token_id, int):
+            eos_token_id = [eos_token_id]
+        self.eos_token_id = eos_token_id
+        self.fsm = RegexFSM.from_tokenizer(regex, tokenizer, cache_dir=cache_dir)
+
+        self.reset()
+        # boolean masks of the tokens allowed in each visited state, `-1` being the state of unconstrained hypotheses
+        self._allowed_tokens_masks = {}
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        allowed_tokens_mask = torch.stack(
+            [self._get_allowed_tokens_mask(state, scores) for state in self._get_states(input_ids)]
+        )
+        return scores.masked_fill(~allowed_tokens_mask, -float("inf"))
+
+    def reset(self):
+        """
+        Forgets the hypotheses of the previous calls, so that the next call starts a new generation from the prompts
+        in its `input_ids`. It is called by [`~generation.GenerationMixin.generate`] at the start of each generation.
+        """
+        # the length of the prompts of the current generation, the hypotheses of the previous call and their states,
+        # and the beams they were reordered by
+        self._prompt_length = None
+        self._input_ids = None
+        self._states = None
+        self._beam_idx = None
+
+    def reorder_beams(self, beam_idx: torch.LongTensor):
+        """
+        Records that the hypotheses of the next call extend the hypotheses `beam_idx` of the last call, so that their
+        states follow the beams reordered by beam search.
+        """
+        self._beam_idx = beam_idx
+
+    def _get_states(self, input_ids: torch.LongTensor) -> List[int]:
+        previous_input_ids, previous_states, beam_idx = self._input_ids, self._states, self._beam_idx
+        self._input_ids, self._beam_idx = input_ids, None
+        if previous_input_ids is not None and input_ids.shape[-1] == previous_input_ids.shape[-1] + 1:
+            if beam_idx is not None and beam_idx.shape[0] == input_ids.shape[0]:
+                previous_input_ids = previous_input_ids[beam_idx]
+                previous_states = [previous_states[row] for row in beam_idx.tolist()]
+            if previous_input_ids.shape[0] == input_ids.shape[0] and torch.equal(
+                input_ids[:, :-1], previous_input_ids
+            ):
+                # each hypothesis was extended by one token since the previous call, only this token is read
+                self._states = [
+                    self._next_state(state, token_id)
+                    for state, token_id in zip(previous_states, input_ids[:, -1].tolist())
+                ]
+                return self._states
+
+        if self._prompt_length is None:
+            # a new generation starts, from the prompts in `input_ids`
+            self._prompt_length = input_ids.shape[-1]
+            states = [self.fsm.initial_state] * input_ids.shape[0]
+        else:
+            # the hypotheses were rolled back (e.g. by assisted generation) or regrouped (e.g. by group beam search),
+            # their states are recomputed from the prompt
+            states = []
+            for hypothesis in input_ids[:, self._prompt_length :].tolist():
+                state = self.fsm.initial_state
+                for token_id in hypothesis:
+                    state = self._next_state(state, token_id)
+                states.append(state)
+        self._states = states
+        return states
+
+    def _next_state(self, state: int, token_id: int) -> int:
+        if state == -1:
+            return -1
+        next_state = self.fsm.next_state(state, token_id)
+        return next_state if next_state is not None else -1
+
+    def _get_allowed_tokens_mask(self, state: int, scores: torch.FloatTensor) -> torch.BoolTensor:
+        if state not in self._allowed_tokens_masks:
+            vocab_size = scores.shape[-1]
+            if state == -1:
+                mask = torch.ones(vocab_size, dtype=torch.bool)
+            else:
+                mask = torch.zeros(vocab_size, dtype=torch.bool)
+                allowed_token_ids = self.fsm.allowed_token_ids(state)
+                mask[torch.from_numpy(allowed_token_ids[allowed_token_ids < vocab_size])] = True
+                if self.fsm.is_final[state]:
+                    mask[self.eos_token_id] = True
+            self._allowed_tokens_masks[state] = mask.to(scores.device)
+        return self._allowed_tokens_masks[state]
+
+
+class JsonSchemaLogitsProcessor(RegexLogitsProcessor):
+    r"""
+    [`RegexLogitsProcessor`] that constrains the generated text to be a JSON document valid against a JSON schema. The
+    schema is converted into a regular expression with [`~generation.json_schema_to_regex`], which lists the supported
+    keywords.
+
+    Args:
+        schema (`str` or `Dict[str, Any]`):
+            The JSON schema, or its serialization.
+        tokenizer ([`PreTrainedTokenizerBase`]):
+            The tokenizer of the model, whose tokens are generated.
+        eos_token_id (`Union[int, List[int]]`, *optional*):
+            The id of the *end-of-sequence* token. Optionally, use a list to set multiple *end-of-sequence* tokens.
+            Defaults to the *end-of-sequence* token of `tokenizer`.
+        whitespace_pattern (`str`, *optional*, defaults to `"[ ]?"`):
+            The regular expression matching the whitespace allowed between the elements of the JSON document.
+        cache_dir (`str` or `os.PathLike`, *optional*):
+            The directory in which the compiled finite-state machines are cached. Defaults to the `REGEX_FSM_CACHE`
+            environment variable, or `~/.cache/huggingface/regex_fsm`.
+
+    Examples:
+
+    ```python
+    >>> from transformers import AutoModelForCausalLM, AutoTokenizer, JsonSchemaLogitsProcessor, LogitsProcessorList
+
+    >>> model = AutoModelForCausalLM.from_pretrained("gpt2")
+    >>> tokenizer = AutoTokenizer.from_pretrained("gpt2")
+    >>> inputs = tokenizer(["A character of a fantasy novel, in JSON:"], return_tensors="pt")
+
+    >>> schema = {
+    ...     "type": "object",
+    ...     "properties": {"name": {"type": "string", "maxLength": 20}, "age": {"type": "integer"}},
+    ...     "required": ["name", "age"],
+    ... }
+    >>> json_processor = JsonSchemaLogitsProcessor(schema, tokenizer)
+    >>> outputs = model.generate(**inputs, logits_processor=LogitsProcessorList([json_processor]), max_new_tokens=30)
+    ```
+    """
+
+    def __init__(
+        self,
+        schema: Union[str, Dict[str, Any]],
+        tokenizer,
+        eos_token_id: Optional[Union[int, List[int]]] = None,
+        whitespace_pattern: Optional[str] = None,
+        cache_dir: Optional[Union[str, os.PathLike]] = None,
+    ):
+        regex = json_schema_to_regex(schema, whitespace_pattern=whitespace_pattern)
+        super().__init__(regex, tokenizer, eos_token_id=eos_token_id, cache_dir=cache_dir)
+
+
 class HammingDiversityLogitsProcessor(LogitsProcessor):
     r"""
     [`LogitsProcessor`] that enforces diverse beam search. Note that this logits processor is only effective for
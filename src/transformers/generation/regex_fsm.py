@@ -0,0 +1,723 @@
+# coding=utf-8
+# Copyright 2023 The HuggingFace Inc. team.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compilation of regular expressions and JSON schemas into finite-state machines over the tokens of a vocabulary."""
+
+import collections
+import hashlib
+import json
+import os
+import re
+import weakref
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from ..utils import SPIECE_UNDERLINE, logging
+from ..utils.hub import hf_cache_home
+
+
+logger = logging.get_logger(__name__)
+
+REGEX_FSM_CACHE = os.getenv("REGEX_FSM_CACHE", os.path.join(hf_cache_home, "regex_fsm"))
+
+# Bumped when the compilation changes, to invalidate the FSMs cached on disk
+_REGEX_FSM_FORMAT_VERSION = 2
+
+# FSMs compiled or loaded in this process, by cache key
+_compiled_fsms = {}
+
+# The text of the tokens of each tokenizer and their hash, with the size of the vocabulary they were computed for
+_tokenizer_vocabularies = weakref.WeakKeyDictionary()
+
+
+class _CharSet:
+    """A set of characters, or the complement of a set of characters when `negated` is `True`."""
+
+    def __init__(self, chars, negated=False):
+        self.chars = frozenset(chars)
+        self.negated = negated
+
+    def __contains__(self, char):
+        return (char in self.chars) != self.negated
+
+    def __or__(self, other):
+        if not self.negated and not other.negated:
+            return _CharSet(self.chars | other.chars)
+        if self.negated and other.negated:
+            return _CharSet(self.chars & other.chars, negated=True)
+        negated, positive = (self, other) if self.negated else (other, self)
+        return _CharSet(negated.chars - positive.chars, negated=True)
+
+    def __invert__(self):
+        return _CharSet(self.chars, negated=not self.negated)
+
+
+_DIGITS = _CharSet("0123456789")
+_WORD_CHARS = _CharSet("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
+_SPACES = _CharSet(" \t\n\r\f\v")
+_ESCAPED_SETS = {"d": _DIGITS, "D": ~_DIGITS, "w": _WORD_CHARS, "W": ~_WORD_CHARS, "s": _SPACES, "S": ~_SPACES}
+_ESCAPED_CHARS = {"n": "\n", "t": "\t", "r": "\r", "f": "\f", "v": "\v", "0": "\0"}
+_REPETITION_BOUNDS_RE = re.compile(r"\{(\d*)(,?)(\d*)\}")
+
+
+class _RegexParser:
+    """
+    Parses a regular expression into a tree of `("set", charset)`, `("concat", nodes)`, `("alt", nodes)` and
+    `("repeat", node, min_repeats, max_repeats)` nodes. Only the constructs that describe a regular language are
+    supported: groups can't be referenced and lookarounds are not supported.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.pos = 0
+
+    def parse(self):
+        node = self._parse_alternation()
+        if self.pos < len(self.pattern):
+            raise ValueError(f"Unbalanced parenthesis at position {self.pos} of the regular expression {self.pattern}")
+        return node
+
+    def _peek(self):
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else None
+
+    def _next(self):
+        if self.pos >= len(self.pattern):
+            raise ValueError(f"Unexpected end of the regular expression {self.pattern}")
+        char = self.pattern[self.pos]
+        self.pos += 1
+        return char
+
+    def _parse_alternation(self):
+        branches = [self._parse_concatenation()]
+        while self._peek() == "|":
+            self.pos += 1
+            branches.append(self._parse_concatenation())
+        return branches[0] if len(branches) == 1 else ("alt", branches)
+
+    def _parse_concatenation(self):
+        nodes = []
+        while self._peek() is not None and self._peek() not in "|)":
+            nodes.append(self._parse_repetition())
+        return ("concat", nodes)
+
+    def _parse_repetition(self):
+        node = self._parse_atom()
+        while True:
+            char = self._peek()
+            if char in ("*", "+", "?"):
+                self.pos += 1
+                min_repeats, max_repeats = {"*": (0, None), "+": (1, None), "?": (0, 1)}[char]
+            elif char == "{" and self._parse_repetition_bounds() is not None:
+                min_repeats, max_repeats = self._parse_repetition_bounds()
+                self.pos = _REPETITION_BOUNDS_RE.match(self.pattern, self.pos).end()
+            else:
+                return node
+            if max_repeats is not None and max_repeats < min_repeats:
+                raise ValueError(f"Invalid repetition bounds in the regular expression {self.pattern}")
+            # lazy quantifiers match the same strings as greedy ones
+            if self._peek() == "?":
+                self.pos += 1
+            node = ("repeat", node, min_repeats, max_repeats)
+
+    def _parse_repetition_bounds(self) -> Optional[Tuple[int, Optional[int]]]:
+        match = _REPETITION_BOUNDS_RE.match(self.pattern, self.pos)
+        if match is None or (match.group(1) == "" and match.group(3) == ""):
+            # as in `re`, braces that don't delimit repetition bounds are literals
+            return None
+        min_repeats = int(match.group(1) or 0)
+        if match.group(2) == "":
+            return min_repeats, min_repeats
+        return min_repeats, int(match.group(3)) if match.group(3) else None
+
+    def _parse_atom(self):
+        start = self.pos
+        char = self._next()
+        if char == "(":
+            if self.pattern.startswith("?:", self.pos):
+                self.pos += 2
+            elif self.pattern.startswith("?P<", self.pos):
+                self.pos = self.pattern.index(">", self.pos) + 1
+            elif self._peek() == "?":
+                raise ValueError(f"Unsupported group at position {start} of the regular expression {self.pattern}")
+            node = self._parse_alternation()
+            if self._peek() != ")":
+                raise ValueError(f"Missing ) in the regular expression {self.pattern}")
+            self.pos += 1
+            return node
+        if char == "[":
+            return ("set", self._parse_class())
+        if char == ".":
+            return ("set", _CharSet("\n", negated=True))
+        if char == "\\":
+            return ("set", self._parse_escape())
+        if (char == "^" and start == 0) or (char == "$" and self.pos == len(self.pattern)):
+            # the regular expression has to match the whole generated text anyway
+            return ("concat", [])
+        if char in "^$":
+            raise ValueError(
+                f"Anchors are only supported at the start and end of the regular expression {self.pattern}"
+            )
+        if char in "*+?":
+            raise ValueError(f"Nothing to repeat at position {start} of the regular expression {self.pattern}")
+        return ("set", _CharSet(char))
+
+    def _parse_escape(self) -> _CharSet:
+        char = self._next()
+        if char in _ESCAPED_SETS:
+            return _ESCAPED_SETS[char]
+        if char in _ESCAPED_CHARS:
+            return _CharSet(_ESCAPED_CHARS[char])
+        if char in ("x", "u", "U"):
+            num_digits = {"x": 2, "u": 4, "U": 8}[char]
+            digits = self.pattern[self.pos : self.pos + num_digits]
+            self.pos += num_digits
+            return _CharSet(chr(int(digits, 16)))
+        if char.isalnum():
+            raise ValueError(f"Unsupported escape \\{char} in the regular expression {self.pattern}")
+        return _CharSet(char)
+
+    def _parse_class(self) -> _CharSet:
+        negated = self._peek() == "^"
+        if negated:
+            self.pos += 1
+        charset = _CharSet("")
+        first = True
+        while self._peek() != "]" or first:
+            first = False
+            char = self._next()
+            item = self._parse_escape() if char == "\\" else _CharSet(char)
+            if self._peek() == "-" and self.pattern[self.pos + 1 : self.pos + 2] not in ("]", ""):
+                self.pos += 1
+                end = self._next()
+                end = self._parse_escape() if end == "\\" else _CharSet(end)
+                if item.negated or end.negated or len(item.chars) != 1 or len(end.chars) != 1:
+                    raise ValueError(f"Invalid range in the regular expression {self.pattern}")
+                start, end = ord(next(iter(item.chars))), ord(next(iter(end.chars)))
+                item = _CharSet(chr(code) for code in range(start, end + 1))
+            charset = charset | item
+        self.pos += 1
+        return ~charset if negated else charset
+
+
+class _NFA:
+    """Thompson construction of a non-deterministic automaton with epsilon transitions."""
+
+    def __init__(self):
+        self.epsilons = []
+        self.edges = []
+
+    def add_state(self) -> int:
+        self.epsilons.append([])
+        self.edges.append([])
+        return len(self.edges) - 1
+
+    def add_fragment(self, node) -> Tuple[int, int]:
+        kind = node[0]
+        if kind == "set":
+            start, end = self.add_state(), self.add_state()
+            self.edges[start].append((node[1], end))
+            return start, end
+        if kind == "alt":
+            start, end = self.add_state(), self.add_state()
+            for branch in node[1]:
+                branch_start, branch_end = self.add_fragment(branch)
+                self.epsilons[start].append(branch_start)
+                self.epsilons[branch_end].append(end)
+            return start, end
+        if kind == "concat":
+            fragments = [self.add_fragment(child) for child in node[1]]
+        else:
+            _, child, min_repeats, max_repeats = node
+            fragments = [self.add_fragment(child) for _ in range(min_repeats)]
+            if max_repeats is None:
+                fragments.append(self.add_optional_fragment(child, loop=True))
+            for _ in range(min_repeats, max_repeats or min_repeats):
+                fragments.append(self.add_optional_fragment(child))
+        if len(fragments) == 0:
+            state = self.add_state()
+            return state, state
+        for (_, previous_end), (next_start, _) in zip(fragments[:-1], fragments[1:]):
+            self.epsilons[previous_end].append(next_start)
+        return fragments[0][0], fragments[-1][1]
+
+    def add_optional_fragment(self, node, loop: bool = False) -> Tuple[int, int]:
+        # The fragment of `node` is wrapped in new boundary states, since its own start state may be the target of the
+        # back edge of an inner loop: skipping from it to the end would accept partial matches of `node`.
+        start, end = self.add_state(), self.add_state()
+        child_start, child_end = self.add_fragment(node)
+        self.epsilons[start].extend([child_start, end])
+        self.epsilons[child_end].append(end)
+        if loop:
+            self.epsilons[child_end].append(child_start)
+        return start, end
+
+    def closure(self, states) -> frozenset:
+        closure = set(states)
+        stack = list(states)
+        while len(stack) > 0:
+            for next_state in self.epsilons[stack.pop()]:
+                if next_state not in closure:
+                    closure.add(next_state)
+                    stack.append(next_state)
+        return frozenset(closure)
+
+
+def _compile_char_dfa(regex: str, alphabet) -> Tuple[Dict[str, int], List[Dict[int, int]], List[bool]]:
+    """
+    Compiles `regex` into a deterministic automaton over the characters of `alphabet`. The characters are grouped in
+    classes of characters that the regular expression can't distinguish, and the automaton transitions on classes.
+
+    Returns the class of each character of `alphabet` (characters that can never be matched are left out), the
+    transitions of each state (0 is the initial state) on each class and whether each state is final. States from which
+    no final state can be reached are pruned.
+    """
+    nfa = _NFA()
+    start, end = nfa.add_fragment(_RegexParser(regex).parse())
+
+    charsets = list({id(charset): charset for edges in nfa.edges for charset, _ in edges}.values())
+    charset_indices = {id(charset): i for i, charset in enumerate(charsets)}
+    edges = [[(charset_indices[id(charset)], target) for charset, target in state_edges] for state_edges in nfa.edges]
+    signatures = {}
+    char_classes = {}
+    for char in alphabet:
+        signature = tuple(char in charset for charset in charsets)
+        if any(signature):
+            char_classes[char] = signatures.setdefault(signature, len(signatures))
+    class_signatures = list(signatures)
+
+    # subset construction
+    initial = nfa.closure([start])
+    dfa_states = {initial: 0}
+    transitions = [{}]
+    queue = collections.deque([initial])
+    while len(queue) > 0:
+        nfa_states = queue.popleft()
+        state = dfa_states[nfa_states]
+        for char_class, signature in enumerate(class_signatures):
+            targets = [
+                target for nfa_state in nfa_states for charset, target in edges[nfa_state] if signature[charset]
+            ]
+            if len(targets) == 0:
+                continue
+            next_nfa_states = nfa.closure(targets)
+            if next_nfa_states not in dfa_states:
+                dfa_states[next_nfa_states] = len(transitions)
+                transitions.append({})
+                queue.append(next_nfa_states)
+            transitions[state][char_class] = dfa_states[next_nfa_states]
+    is_final = [False] * len(transitions)
+    for nfa_states, state in dfa_states.items():
+        is_final[state] = end in nfa_states
+
+    live = _coreachable_states(transitions, is_final)
+    transitions = [
+        {char_class: next_state for char_class, next_state in state_transitions.items() if next_state in live}
+        for state_transitions in transitions
+    ]
+    return char_classes, transitions, is_final
+
+
+def _coreachable_states(transitions, is_final) -> set:
+    """Returns the states from which a final state can be reached."""
+    predecessors = [[] for _ in transitions]
+    for state, state_transitions in enumerate(transitions):
+        for next_state in state_transitions.values():
+            predecessors[next_state].append(state)
+    live = {state for state, final in enumerate(is_final) if final}
+    stack = list(live)
+    while len(stack) > 0:
+        for previous_state in predecessors[stack.pop()]:
+            if previous_state not in live:
+                live.add(previous_state)
+                stack.append(previous_state)
+    return live
+
+
+def get_token_strings(tokenizer) -> Dict[int, str]:
+    """
+    Returns the text of each token of the vocabulary of `tokenizer`, as it appears in the decoded text. Special tokens,
+    tokens decoding to an empty string and tokens that are not valid UTF-8 on their own (parts of multi-byte characters
+    of byte-level tokenizers) are left out.
+    """
+    special_ids = set(tokenizer.all_special_ids)
+    token_strings = {}
+    for token, token_id in tokenizer.get_vocab().items():
+        if token_id in special_ids:
+            continue
+        string = tokenizer.convert_tokens_to_string([token])
+        # sentencepiece tokenizers drop the leading space of the decoded text
+        if (token.startswith(SPIECE_UNDERLINE) or token == "<0x20>") and not string.startswith(" "):
+            string = " " + string
+        if len(string) == 0 or "\ufffd" in string:
+            continue
+        token_strings[token_id] = string
+    return token_strings
+
+
+class RegexFSM:
+    r"""
+    Finite-state machine over the tokens of a vocabulary, whose accepted token sequences are the ones decoding to a
+    text fully matching a regular expression. It is compiled once from the regular expression and the text of the
+    tokens, and is used by [`RegexLogitsProcessor`] to look up the tokens allowed after each generated token.
+
+    The transitions are stored as sorted token ids per state, the state `0` being the initial state.
+
+    Args:
+        offsets (`np.ndarray` of shape `(num_states + 1,)`):
+            The transitions of state `i` are stored at positions `offsets[i]` to `offsets[i + 1]` of `token_ids` and
+            `next_states`.
+        token_ids (`np.ndarray`):
+            The tokens allowed in each state.
+        next_states (`np.ndarray`):
+            The state reached with each of `token_ids`.
+        is_final (`np.ndarray` of shape `(num_states,)`):
+            Whether the text generated when reaching each state matches the regular expression.
+    """
+
+    initial_state = 0
+
+    def __init__(self, offsets: np.ndarray, token_ids: np.ndarray, next_states: np.ndarray, is_final: np.ndarray):
+        self.offsets = offsets
+        self.token_ids = token_ids
+        self.next_states = next_states
+        self.is_final = is_final
+        # transitions of the visited states as dictionaries, built on the first visit
+        self._transitions = {}
+
+    @property
+    def num_states(self) -> int:
+        return len(self.is_final)
+
+    def allowed_token_ids(self, state: int) -> np.ndarray:
+        """Returns the ids of the tokens allowed in `state`, in increasing order."""
+        return self.token_ids[self.offsets[state] : self.offsets[state + 1]]
+
+    def next_state(self, state: int, token_id: int) -> Optional[int]:
+        """Returns the state reached with `token_id` from `state`, or `None` if `token_id` is not allowed there."""
+        transitions = self._transitions.get(state)
+        if transitions is None:
+            start, end = self.offsets[state], self.offsets[state + 1]
+            transitions = dict(zip(self.token_ids[start:end].tolist(), self.next_states[start:end].tolist()))
+            self._transitions[state] = transitions
+        return transitions.get(token_id)
+
+    @classmethod
+    def compile(cls, regex: str, token_strings: Dict[int, str]) -> "RegexFSM":
+        r"""
+        Compiles `regex` into a [`RegexFSM`] over a vocabulary.
+
+        Args:
+            regex (`str`):
+                The regular expression the decoded text has to fully match. Its syntax is the one of the `re` module,
+                without the constructs that don't describe a regular language (backreferences, lookarounds, anchors in
+                the middle of the expression). Character classes such as `\w` or `\d` only contain ASCII characters.
+            token_strings (`Dict[int, str]`):
+                The text of each token that can be generated, see [`~generation.regex_fsm.get_token_strings`].
+        """
+        alphabet = {char for string in token_strings.values() for char in string}
+        char_classes, char_transitions, char_is_final = _compile_char_dfa(regex, alphabet)
+
+        # Trie of the tokens over the character classes: tokens that the regular expression can't distinguish share
+        # their path, and the tokens of the vocabulary are matched from each state with a single traversal.
+        trie_children = [{}]
+        trie_tokens = [[]]
+        for token_id, string in token_strings.items():
+            if any(char not in char_classes for char in string):
+                continue
+            node = 0
+            for char in string:
+                char_class = char_classes[char]
+                if char_class not in trie_children[node]:
+                    trie_children[node][char_class] = len(trie_children)
+                    trie_children.append({})
+                    trie_tokens.append([])
+                node = trie_children[node][char_class]
+            trie_tokens[node].append(token_id)
+
+        def token_transitions(char_state):
+            transitions = {}
+            stack = [(0, char_state)]
+            while len(stack) > 0:
+                node, state = stack.pop()
+                for char_class, child in trie_children[node].items():
+                    next_state = char_transitions[state].get(char_class)
+                    if next_state is not None:
+                        transitions.update((token_id, next_state) for token_id in trie_tokens[child])
+                        stack.append((child, next_state))
+            return transitions
+
+        # only the states reachable with tokens from the initial state are kept
+        transitions = {0: token_transitions(0)}
+        queue = collections.deque([0])
+        while len(queue) > 0:
+            for next_state in set(transitions[queue.popleft()].values()):
+                if next_state not in transitions:
+                    transitions[next_state] = token_transitions(next_state)
+                    queue.append(next_state)
+
+        # Some states may not lead to a match with the tokens of the vocabulary (e.g. if a character can only be
+        # generated as part of a longer token), in which case the tokens reaching them are not allowed either
+        char_states = list(transitions)
+        state_ids = {char_state: i for i, char_state in enumerate(char_states)}
+        live = _coreachable_states(
+            [
+                {token_id: state_ids[s] for token_id, s in transitions[char_state].items()}
+                for char_state in char_states
+            ],
+            [char_is_final[char_state] for char_state in char_states],
+        )
+        if state_ids[0] not in live:
+            raise ValueError(f"No sequence of tokens of the vocabulary can match the regular expression {regex}")
+        live_char_states = [char_state for char_state in char_states if state_ids[char_state] in live]
+        state_ids = {char_state: i for i, char_state in enumerate(live_char_states)}
+
+        offsets, token_ids, next_states = [0], [], []
+        for char_state in live_char_states:
+            state_transitions = sorted(
+                (token_id, state_ids[next_state])
+                for token_id, next_state in transitions[char_state].items()
+                if next_state in state_ids
+            )
+            token_ids.extend(token_id for token_id, _ in state_transitions)
+            next_states.extend(next_state for _, next_state in state_transitions)
+            offsets.append(len(token_ids))
+        return cls(
+            offsets=np.array(offsets, dtype=np.int64),
+            token_ids=np.array(token_ids, dtype=np.int64),
+            next_states=np.array(next_states, dtype=np.int64),
+            is_final=np.array([char_is_final[char_state] for char_state in live_char_states], dtype=bool),
+        )
+
+    @classmethod
+    def from_tokenizer(cls, regex: str, tokenizer, cache_dir: Optional[Union[str, os.PathLike]] = None) -> "RegexFSM":
+        """
+        Compiles `regex` into a [`RegexFSM`] over the vocabulary of `tokenizer`, or loads it from the cache. The cache
+        is keyed by the regular expression and the text of the tokens of the vocabulary, so that a compiled FSM is
+        reused by all the tokenizers sharing the same vocabulary.
+
+        Args:
+            regex (`str`):
+                The regular expression the decoded text has to fully match, see [`~RegexFSM.compile`].
+            tokenizer ([`PreTrainedTokenizerBase`]):
+                The tokenizer whose tokens are generated.
+            cache_dir (`str` or `os.PathLike`, *optional*):
+                The directory in which compiled FSMs are cached. Defaults to the `REGEX_FSM_CACHE` environment
+                variable, or `~/.cache/huggingface/regex_fsm`.
+        """
+        vocab_size, token_strings, vocabulary_hash = _tokenizer_vocabularies.get(tokenizer, (None, None, None))
+        if vocab_size != len(tokenizer):
+            # the vocabulary is only decoded and hashed again when tokens were added to the tokenizer
+            token_strings = get_token_strings(tokenizer)
+            vocabulary_hash = hashlib.sha256(json.dumps(sorted(token_strings.items())).encode("utf-8")).hexdigest()
+            _tokenizer_vocabularies[tokenizer] = (len(tokenizer), token_strings, vocabulary_hash)
+        cache_key = hashlib.sha256(
+            json.dumps([_REGEX_FSM_FORMAT_VERSION, regex, vocabulary_hash]).encode("utf-8")
+        ).hexdigest()
+        if cache_key in _compiled_fsms:
+            return _compiled_fsms[cache_key]
+
+        cache_file = os.path.join(cache_dir if cache_dir is not None else REGEX_FSM_CACHE, f"{cache_key}.npz")
+        if os.path.isfile(cache_file):
+            fsm = cls.load(cache_file)
+        else:
+            logger.info(f"Compiling the regular expression {regex} into a finite-state machine over the vocabulary.")
+            fsm = cls.compile(regex, token_strings)
+            try:
+                fsm.save(cache_file)
+            except OSError as e:
+                logger.warning(f"The compiled finite-state machine could not be cached in {cache_file}: {e}")
+        _compiled_fsms[cache_key] = fsm
+        return fsm
+
+    def save(self, path: Union[str, os.PathLike]):
+        """Saves the FSM to the `.npz` file `path`."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # the file is replaced atomically, so that concurrent processes never load a partially written FSM
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(
+                f, offsets=self.offsets, token_ids=self.token_ids, next_states=self.next_states, is_final=self.is_final
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: Union[str, os.PathLike]) -> "RegexFSM":
+        """Loads a FSM saved with [`~RegexFSM.save`]."""
+        with np.load(path) as arrays:
+            return cls(
+                offsets=arrays["offsets"],
+                token_ids=arrays["token_ids"],
+                next_states=arrays["next_states"],
+                is_final=arrays["is_final"],
+            )
+
+
+_JSON_STRING_CHAR = r'([^"\\\x00-\x1f]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})'
+_JSON_TYPE_REGEXES = {
+    "string": f'"{_JSON_STRING_CHAR}*"',
+    "integer": r"-?(0|[1-9][0-9]*)",
+    "number": r"-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?",
+    "boolean": r"(true|false)",
+    "null": r"null",
+}
+_JSON_VALUE_REGEX = "(" + "|".join(_JSON_TYPE_REGEXES.values()) + ")"
+_JSON_DATE = r"[0-9]{4}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])"
+_JSON_TIME = r"([01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9](\.[0-9]+)?(Z|[+-]([01][0-9]|2[0-3]):[0-5][0-9])?"
+_JSON_STRING_FORMAT_REGEXES = {
+    "date": f'"{_JSON_DATE}"',
+    "time": f'"{_JSON_TIME}"',
+    "date-time": f'"{_JSON_DATE}T{_JSON_TIME}"',
+    "uuid": r'"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"',
+}
+
+
+def _escape_regex(text: str) -> str:
+    return "".join("\\" + char if char in "\\.^$*+?{}[]|()-" else char for char in text)
+
+
+def json_schema_to_regex(schema: Union[str, Dict[str, Any]], whitespace_pattern: Optional[str] = None) -> str:
+    """
+    Converts a JSON schema into a regular expression matching the JSON documents valid against it, to be compiled into
+    a [`RegexFSM`].
+
+    The supported keywords are `type` (including lists of types), `properties` and `required` for objects, `items`,
+    `minItems` and `maxItems` for arrays, `minLength`, `maxLength`, `pattern` and `format` (`"date"`, `"time"`,
+    `"date-time"` and `"uuid"`) for strings, `enum`, `const`, `anyOf`, `oneOf`, `allOf` with a single schema and local
+    `$ref` references to `#/$defs` or `#/definitions`. The properties of objects are generated in the order of the
+    schema, and objects without `properties` can only contain values of primitive types. Recursive references, which
+    can't be described by a regular expression, are not supported.
+
+    Args:
+        schema (`str` or `Dict[str, Any]`):
+            The JSON schema, or its serialization.
+        whitespace_pattern (`str`, *optional*, defaults to `"[ ]?"`):
+            The regular expression matching the whitespace allowed between the elements of the JSON documents.
+    """
+    if isinstance(schema, str):
+        schema = json.loads(schema)
+    whitespace_pattern = whitespace_pattern if whitespace_pattern is not None else r"[ ]?"
+    return _JsonSchemaConverter(schema, whitespace_pattern).to_regex(schema)
+
+
+class _JsonSchemaConverter:
+    def __init__(self, root_schema: Dict[str, Any], whitespace_pattern: str):
+        self.root_schema = root_schema
+        self.whitespace_pattern = whitespace_pattern
+        self.references = []
+
+    def to_regex(self, schema: Dict[str, Any]) -> str:
+        if "$ref" in schema:
+            return self._reference_to_regex(schema["$ref"])
+        if "const" in schema:
+            return _escape_regex(json.dumps(schema["const"]))
+        if "enum" in schema:
+            return "(" + "|".join(_escape_regex(json.dumps(value)) for value in schema["enum"]) + ")"
+        for keyword in ("anyOf", "oneOf"):
+            if keyword in schema:
+                return "(" + "|".join(self.to_regex(subschema) for subschema in schema[keyword]) + ")"
+        if "allOf" in schema:
+            if len(schema["allOf"]) != 1:
+                raise ValueError("`allOf` is only supported with a single schema.")
+            return self.to_regex(schema["allOf"][0])
+
+        schema_type = schema.get("type")
+        if isinstance(schema_type, list):
+            return "(" + "|".join(self.to_regex({**schema, "type": item_type}) for item_type in schema_type) + ")"
+        if schema_type is None:
+            if "properties" in schema:
+                schema_type = "object"
+            elif "items" in schema:
+                schema_type = "array"
+            else:
+                return _JSON_VALUE_REGEX
+
+        if schema_type == "object":
+            return self._object_to_regex(schema)
+        if schema_type == "array":
+            return self._array_to_regex(schema)
+        if schema_type == "string":
+            return self._string_to_regex(schema)
+        if schema_type in _JSON_TYPE_REGEXES:
+            return _JSON_TYPE_REGEXES[schema_type]
+        raise ValueError(f"Unsupported type {schema_type} in the JSON schema.")
+
+    def _reference_to_regex(self, reference: str) -> str:
+        if not reference.startswith("#/"):
+            raise ValueError(f"Only local references are supported in the JSON schema, got {reference}.")
+        if reference in self.references:
+            raise ValueError(f"The JSON schema reference {reference} is recursive, which is not supported.")
+        schema = self.root_schema
+        for key in reference[2:].split("/"):
+            schema = schema[key.replace("~1", "/").replace("~0", "~")]
+        self.references.append(reference)
+        regex = self.to_regex(schema)
+        self.references.pop()
+        return regex
+
+    def _object_to_regex(self, schema: Dict[str, Any]) -> str:
+        whitespace = self.whitespace_pattern
+        separator = f"{whitespace},{whitespace}"
+        properties = schema.get("properties")
+        if not properties:
+            item = f"{_JSON_TYPE_REGEXES['string']}{whitespace}:{whitespace}{_JSON_VALUE_REGEX}"
+            return rf"\{{{whitespace}({item}({separator}{item})*)?{whitespace}\}}"
+
+        required = set(schema.get("required", []))
+        items = [
+            f"{_escape_regex(json.dumps(name))}{whitespace}:{whitespace}{self.to_regex(subschema)}"
+            for name, subschema in properties.items()
+        ]
+        is_required = [name in required for name in properties]
+        # one alternative per property that can be the first one of the object, as only the next ones are preceded by
+        # a comma
+        alternatives = []
+        for i, item in enumerate(items):
+            next_items = "".join(
+                f"{separator}{next_item}" if is_required[j] else f"({separator}{next_item})?"
+                for j, next_item in enumerate(items[i + 1 :], start=i + 1)
+            )
+            alternatives.append(item + next_items)
+            if is_required[i]:
+                break
+        members = "(" + "|".join(alternatives) + ")"
+        if not any(is_required):
+            members += "?"
+        return rf"\{{{whitespace}{members}{whitespace}\}}"
+
+    def _array_to_regex(self, schema: Dict[str, Any]) -> str:
+        whitespace = self.whitespace_pattern
+        item = self.to_regex(schema.get("items") or {})
+        min_items, max_items = schema.get("minItems", 0), schema.get("maxItems")
+        if max_items == 0:
+            return rf"\[{whitespace}\]"
+        max_next_items = "" if max_items is None else max_items - 1
+        elements = f"{item}({whitespace},{whitespace}{item}){{{max(min_items - 1, 0)},{max_next_items}}}"
+        if min_items == 0:
+            elements = f"({elements})?"
+        return rf"\[{whitespace}{elements}{whitespace}\]"
+
+    def _string_to_regex(self, schema: Dict[str, Any]) -> str:
+        if "pattern" in schema:
+            pattern = schema["pattern"]
+            pattern = pattern[1:] if pattern.startswith("^") else pattern
+            pattern = pattern[:-1] if pattern.endswith("$") and not pattern.endswith("\\$") else pattern
+            return f'"({pattern})"'
+        if "format" in schema:
+            if schema["format"] not in _JSON_STRING_FORMAT_REGEXES:
+                raise ValueError(f"Unsupported string format {schema['format']} in the JSON schema.")
+            return _JSON_STRING_FORMAT_REGEXES[schema["format"]]
+        if "minLength" in schema or "maxLength" in schema:
+            max_length = schema.get("maxLength", "")
+            return f'"{_JSON_STRING_CHAR}{{{schema.get("minLength", 0)},{max_length}}}"'
+        return _JSON_TYPE_REGEXES["string"]
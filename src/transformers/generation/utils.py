@@ -24,6 +24,7 @@ import torch
 import torch.distributed as dist
 from torch import nn
 
+from ..cache_utils import PagedCache, PrefixCache, StaticCache
 from ..deepspeed import is_deepspeed_zero3_enabled
 from ..modeling_outputs import CausalLMOutputWithPast, Seq2SeqLMOutput
 from ..models.auto import (
@@ -35,7 +36,7 @@ from ..models.auto import (
 )
 from ..utils import ModelOutput, logging
 from .beam_constraints import DisjunctiveConstraint, PhrasalConstraint
-from .beam_search import BeamScorer, BeamSearchScorer, ConstrainedBeamSearchScorer
+from .beam_search import BeamScorer, ConstrainedBeamSearchScorer, VectorizedBeamSearchScorer
 from .configuration_utils import GenerationConfig
 from .logits_process import (
     ClassifierFreeGuidanceLogitsProcessor,
@@ -47,6 +48,7 @@ from .logits_process import (
     ForcedBOSTokenLogitsProcessor,
     ForcedEOSTokenLogitsProcessor,
     ForceTokensLogitsProcessor,
+    FusedLogitsWarper,
     HammingDiversityLogitsProcessor,
     InfNanRemoveLogitsProcessor,
     LogitNormalization,
@@ -785,6 +787,29 @@ class GenerationMixin:
 
         return model_kwargs
 
+    def _get_past_from_prefix_cache(
+        self, prefix_cache: PrefixCache, input_ids: torch.LongTensor, expand_size: int
+    ) -> Tuple[Tuple[torch.Tensor]]:
+        # the last token of the prompt is left to the decoding loop, which computes the scores of the first new token
+        prompt_ids = input_ids[0, :-1]
+        prefix_length, past_key_values = prefix_cache.lookup(prompt_ids)
+        if prefix_length < len(prompt_ids):
+            # only the tokens after the longest stored prefix are encoded
+            outputs = self(
+                input_ids=input_ids[:, prefix_length:-1],
+                past_key_values=past_key_values,
+                use_cache=True,
+                return_dict=True,
+            )
+            past_key_values = outputs.past_key_values
+            prefix_cache.store(prompt_ids, past_key_values)
+
+        if expand_size > 1:
+            past_key_values = tuple(
+                tuple(state.repeat_interleave(expand_size, dim=0) for state in layer) for layer in past_key_values
+            )
+        return past_key_values
+
     def _reorder_cache(self, past_key_values, beam_idx):
         raise NotImplementedError(
             f"Make sure that a `_reorder_cache` function is correctly implemented in {self.__class__.__module__} to"
@@ -805,25 +830,40 @@ class GenerationMixin:
 
         # the following idea is largely copied from this PR: https://github.com/huggingface/transformers/pull/5420/files
         # all samplers can be found in `generation_utils_samplers.py`
-        if generation_config.temperature is not None and generation_config.temperature != 1.0:
-            warpers.append(TemperatureLogitsWarper(generation_config.temperature))
+        temperature = generation_config.temperature if generation_config.temperature != 1.0 else None
+        top_k = generation_config.top_k if generation_config.top_k != 0 else None
+        top_p = generation_config.top_p
+        if top_p is not None and top_p >= 1.0:
+            top_p = None
+        typical_p = generation_config.typical_p
+        use_typical_p = typical_p is not None and typical_p < 1.0
+        epsilon_cutoff = generation_config.epsilon_cutoff
+        use_epsilon_cutoff = epsilon_cutoff is not None and 0.0 < epsilon_cutoff < 1.0
+        eta_cutoff = generation_config.eta_cutoff
+        use_eta_cutoff = eta_cutoff is not None and 0.0 < eta_cutoff < 1.0
         min_tokens_to_keep = 2 if generation_config.num_beams > 1 else 1
-        if generation_config.top_k is not None and generation_config.top_k != 0:
-            warpers.append(TopKLogitsWarper(top_k=generation_config.top_k, min_tokens_to_keep=min_tokens_to_keep))
-        if generation_config.top_p is not None and generation_config.top_p < 1.0:
-            warpers.append(TopPLogitsWarper(top_p=generation_config.top_p, min_tokens_to_keep=min_tokens_to_keep))
-        if generation_config.typical_p is not None and generation_config.typical_p < 1.0:
-            warpers.append(
-                TypicalLogitsWarper(mass=generation_config.typical_p, min_tokens_to_keep=min_tokens_to_keep)
-            )
-        if generation_config.epsilon_cutoff is not None and 0.0 < generation_config.epsilon_cutoff < 1.0:
-            warpers.append(
-                EpsilonLogitsWarper(epsilon=generation_config.epsilon_cutoff, min_tokens_to_keep=min_tokens_to_keep)
-            )
-        if generation_config.eta_cutoff is not None and 0.0 < generation_config.eta_cutoff < 1.0:
-            warpers.append(
-                EtaLogitsWarper(epsilon=generation_config.eta_cutoff, min_tokens_to_keep=min_tokens_to_keep)
-            )
+
+        if not (use_typical_p or use_epsilon_cutoff or use_eta_cutoff):
+            # temperature, top-k and top-p are applied by a single warper, that sorts the scores at most once
+            if temperature is not None or top_k is not None or top_p is not None:
+                warpers.append(
+                    FusedLogitsWarper(
+                        temperature=temperature, top_k=top_k, top_p=top_p, min_tokens_to_keep=min_tokens_to_keep
+                    )
+                )
+        else:
+            if temperature is not None:
+                warpers.append(TemperatureLogitsWarper(temperature))
+            if top_k is not None:
+                warpers.append(TopKLogitsWarper(top_k=top_k, min_tokens_to_keep=min_tokens_to_keep))
+            if top_p is not None:
+                warpers.append(TopPLogitsWarper(top_p=top_p, min_tokens_to_keep=min_tokens_to_keep))
+            if use_typical_p:
+                warpers.append(TypicalLogitsWarper(mass=typical_p, min_tokens_to_keep=min_tokens_to_keep))
+            if use_epsilon_cutoff:
+                warpers.append(EpsilonLogitsWarper(epsilon=epsilon_cutoff, min_tokens_to_keep=min_tokens_to_keep))
+            if use_eta_cutoff:
+                warpers.append(EtaLogitsWarper(epsilon=eta_cutoff, min_tokens_to_keep=min_tokens_to_keep))
         # `LogitNormalization` should always be the last logit processor, when present
         if generation_config.renormalize_logits is True:
             warpers.append(LogitNormalization())
@@ -1168,6 +1208,7 @@ class GenerationMixin:
         synced_gpus: Optional[bool] = None,
         assistant_model: Optional["PreTrainedModel"] = None,
         streamer: Optional["BaseStreamer"] = None,
+        prefix_cache: Optional[PrefixCache] = None,
         **kwargs,
     ) -> Union[GenerateOutput, torch.LongTensor]:
         r"""
@@ -1225,6 +1266,10 @@ class GenerationMixin:
             streamer (`BaseStreamer`, *optional*):
                 Streamer object that will be used to stream the generated sequences. Generated tokens are passed
                 through `streamer.put(token_ids)` and the streamer is responsible for any further processing.
+            prefix_cache (`PrefixCache`, *optional*):
+                Store of the past key/values of previous prompts. Generation from a single prompt starts after the
+                longest prefix of the prompt found in the store, and the past key/values of the prompt are added to
+                it. Only supported by decoder-only models, and not by contrastive search and assisted decoding.
             kwargs:
                 Ad hoc parametrization of `generate_config` and/or additional model-specific kwargs that will be
                 forwarded to the `forward` function of the model. If the model is an encoder-decoder model, encoder
@@ -1444,11 +1489,16 @@ class GenerationMixin:
             and not is_contrastive_search_gen_mode
         )
         is_assisted_gen_mode = False
-        if assistant_model is not None:
+        if assistant_model is not None and generation_config.prompt_lookup_num_tokens is not None:
+            raise ValueError(
+                "`assistant_model` and `prompt_lookup_num_tokens` are two alternative sources of candidate tokens for "
+                "assisted generate, only one of them can be set."
+            )
+        if assistant_model is not None or generation_config.prompt_lookup_num_tokens is not None:
             if not (is_greedy_gen_mode or is_sample_gen_mode):
                 raise ValueError(
-                    "You've set `assistant_model`, which triggers assisted generate. Currently, assisted generate "
-                    "is only supported with Greedy Search and Sample."
+                    "You've set `assistant_model` or `prompt_lookup_num_tokens`, which triggers assisted generate. "
+                    "Currently, assisted generate is only supported with Greedy Search and Sample."
                 )
             is_assisted_gen_mode = True
 
@@ -1464,6 +1514,59 @@ class GenerationMixin:
                 "`streamer` cannot be used with beam search (yet!). Make sure that `num_beams` is set to 1."
             )
 
+        # the number of copies of each input run by the decoding method, e.g. one per beam
+        expand_size = generation_config.num_beams
+        if generation_config.do_sample:
+            expand_size *= generation_config.num_return_sequences
+
+        if generation_config.cache_implementation is not None and model_kwargs.get("past_key_values") is None:
+            if not getattr(self, f"_supports_{generation_config.cache_implementation}_cache", False):
+                raise ValueError(
+                    f"{self.__class__.__name__} does not support `cache_implementation="
+                    f"'{generation_config.cache_implementation}'`."
+                )
+            if is_contrastive_search_gen_mode or is_assisted_gen_mode:
+                raise ValueError(
+                    "`cache_implementation` is not supported by contrastive search and assisted decoding, which "
+                    "manipulate the past key/values as tuples."
+                )
+            if not model_kwargs["use_cache"]:
+                raise ValueError(
+                    f"`cache_implementation='{generation_config.cache_implementation}'` requires `use_cache=True`."
+                )
+            if generation_config.cache_implementation == "static":
+                # the buffers of the cache are allocated by the first forward pass, with the batch size of the
+                # expanded inputs (e.g. `batch_size * num_beams`)
+                model_kwargs["past_key_values"] = StaticCache(self.config, max_cache_len=generation_config.max_length)
+            else:
+                # the copies of each prompt expanded for beam search or multiple return sequences share their blocks
+                model_kwargs["past_key_values"] = PagedCache(self.config, expand_size=expand_size)
+
+        if prefix_cache is not None and model_kwargs.get("past_key_values") is None:
+            if self.config.is_encoder_decoder or hasattr(self, "_convert_to_standard_cache"):
+                raise ValueError(
+                    f"{self.__class__.__name__} does not support `prefix_cache`, which requires a decoder-only model "
+                    "with `past_key_values` in the standard format."
+                )
+            if is_contrastive_search_gen_mode or is_assisted_gen_mode or generation_config.cache_implementation:
+                raise ValueError(
+                    "`prefix_cache` is not supported by contrastive search, assisted decoding and "
+                    "`cache_implementation`."
+                )
+            if not model_kwargs["use_cache"]:
+                raise ValueError("`prefix_cache` requires `use_cache=True`.")
+            attention_mask = model_kwargs.get("attention_mask")
+            if (
+                model_input_name != "input_ids"
+                or batch_size != 1
+                or (attention_mask is not None and not attention_mask.all())
+            ):
+                logger.warning_once("`prefix_cache` is only used to generate from a single prompt without padding.")
+            elif input_ids.shape[-1] > 1:
+                model_kwargs["past_key_values"] = self._get_past_from_prefix_cache(
+                    prefix_cache, input_ids, expand_size
+                )
+
         if self.device.type != input_ids.device.type:
             warnings.warn(
                 "You are calling .generate() with the `input_ids` being on a device type different"
@@ -1483,6 +1586,7 @@ class GenerationMixin:
             prefix_allowed_tokens_fn=prefix_allowed_tokens_fn,
             logits_processor=logits_processor,
         )
+        logits_processor.reset()
 
         # 9. prepare stopping criteria
         stopping_criteria = self._get_stopping_criteria(
@@ -1501,7 +1605,7 @@ class GenerationMixin:
                 raise ValueError("assisted generate requires `use_cache=True`")
 
             # 11. If the assistant model is an encoder-decoder, prepare its encoder outputs
-            if assistant_model.config.is_encoder_decoder:
+            if assistant_model is not None and assistant_model.config.is_encoder_decoder:
                 assistant_model_kwargs = copy.deepcopy(model_kwargs)
                 inputs_tensor, model_input_name, assistant_model_kwargs = assistant_model._prepare_model_inputs(
                     inputs_tensor, assistant_model.generation_config.bos_token_id, assistant_model_kwargs
@@ -1515,6 +1619,8 @@ class GenerationMixin:
             return self.assisted_decoding(
                 input_ids,
                 assistant_model=assistant_model,
+                prompt_lookup_num_tokens=generation_config.prompt_lookup_num_tokens,
+                max_matching_ngram_size=generation_config.max_matching_ngram_size,
                 do_sample=generation_config.do_sample,
                 logits_processor=logits_processor,
                 logits_warper=self._get_logits_warper(generation_config) if generation_config.do_sample else None,
@@ -1607,7 +1713,7 @@ class GenerationMixin:
                 raise ValueError("`max_length` needs to be a stopping_criteria for now.")
 
             # 11. prepare beam search scorer
-            beam_scorer = BeamSearchScorer(
+            beam_scorer = VectorizedBeamSearchScorer(
                 batch_size=batch_size,
                 num_beams=generation_config.num_beams,
                 device=inputs_tensor.device,
@@ -1644,7 +1750,7 @@ class GenerationMixin:
             if stopping_criteria.max_length is None:
                 raise ValueError("`max_length` needs to be a stopping_criteria for now.")
             # 12. prepare beam search scorer
-            beam_scorer = BeamSearchScorer(
+            beam_scorer = VectorizedBeamSearchScorer(
                 batch_size=batch_size * generation_config.num_return_sequences,
                 num_beams=generation_config.num_beams,
                 device=inputs_tensor.device,
@@ -1696,7 +1802,7 @@ class GenerationMixin:
                 raise ValueError("Decoder argument `typical_p` is not supported with beam groups.")
 
             # 11. prepare beam search scorer
-            beam_scorer = BeamSearchScorer(
+            beam_scorer = VectorizedBeamSearchScorer(
                 batch_size=batch_size,
                 num_beams=generation_config.num_beams,
                 device=inputs_tensor.device,
@@ -2883,8 +2989,8 @@ class GenerationMixin:
             else self.generation_config.return_dict_in_generate
         )
 
-        batch_size = len(beam_scorer._beam_hyps)
         num_beams = beam_scorer.num_beams
+        batch_size = _get_beam_scorer_batch_size(beam_scorer)
 
         batch_beam_size, cur_len = input_ids.shape
 
@@ -2997,6 +3103,7 @@ class GenerationMixin:
             beam_idx = beam_outputs["next_beam_indices"]
 
             input_ids = torch.cat([input_ids[beam_idx, :], beam_next_tokens.unsqueeze(-1)], dim=-1)
+            logits_processor.reorder_beams(beam_idx)
 
             model_kwargs = self._update_model_kwargs_for_generation(
                 outputs, model_kwargs, is_encoder_decoder=self.config.is_encoder_decoder
@@ -3217,8 +3324,8 @@ class GenerationMixin:
             else self.generation_config.return_dict_in_generate
         )
 
-        batch_size = len(beam_scorer._beam_hyps)
         num_beams = beam_scorer.num_beams
+        batch_size = _get_beam_scorer_batch_size(beam_scorer)
 
         batch_beam_size, cur_len = input_ids.shape
 
@@ -3330,6 +3437,7 @@ class GenerationMixin:
             beam_idx = beam_outputs["next_beam_indices"]
 
             input_ids = torch.cat([input_ids[beam_idx, :], beam_next_tokens.unsqueeze(-1)], dim=-1)
+            logits_processor.reorder_beams(beam_idx)
 
             model_kwargs = self._update_model_kwargs_for_generation(
                 outputs, model_kwargs, is_encoder_decoder=self.config.is_encoder_decoder
@@ -3546,7 +3654,7 @@ class GenerationMixin:
         num_beams = beam_scorer.num_beams
         num_beam_groups = beam_scorer.num_beam_groups
         num_sub_beams = num_beams // num_beam_groups
-        batch_size = len(beam_scorer._beam_hyps) // num_beam_groups
+        batch_size = _get_beam_scorer_batch_size(beam_scorer, num_beam_groups)
         device = input_ids.device
 
         batch_beam_size, cur_len = input_ids.shape
@@ -4044,6 +4152,7 @@ class GenerationMixin:
             beam_idx = beam_outputs["next_beam_indices"]
 
             input_ids = torch.cat([input_ids[beam_idx, :], beam_next_tokens.unsqueeze(-1)], dim=-1)
+            logits_processor.reorder_beams(beam_idx)
             model_kwargs = self._update_model_kwargs_for_generation(
                 outputs, model_kwargs, is_encoder_decoder=self.config.is_encoder_decoder
             )
@@ -4097,7 +4206,9 @@ class GenerationMixin:
     def assisted_decoding(
         self,
         input_ids: torch.LongTensor,
-        assistant_model: "PreTrainedModel",
+        assistant_model: Optional["PreTrainedModel"] = None,
+        prompt_lookup_num_tokens: Optional[int] = None,
+        max_matching_ngram_size: int = 2,
         do_sample: bool = False,
         logits_processor: Optional[LogitsProcessorList] = None,
         logits_warper: Optional[LogitsProcessorList] = None,
@@ -4114,8 +4225,8 @@ class GenerationMixin:
     ):
         r"""
         Generates sequences of token ids for models with a language modeling head using **greedy decoding** or
-        **sample** (depending on `do_sample`), assisted by a smaller model. Can be used for text-decoder, text-to-text,
-        speech-to-text, and vision-to-text models.
+        **sample** (depending on `do_sample`), assisted by a smaller model or by candidate tokens looked up in the
+        prompt. Can be used for text-decoder, text-to-text, speech-to-text, and vision-to-text models.
 
         <Tip warning={true}>
 
@@ -4133,6 +4244,14 @@ class GenerationMixin:
                 same tokenizer. The acceleration is achieved when forecasting candidate tokens with the assistent model
                 is much faster than running generation with the model you're calling generate from. As such, the
                 assistant model should be much smaller.
+            prompt_lookup_num_tokens (`int`, *optional*):
+                Replaces `assistant_model` as the source of candidate tokens: at each step, the tokens that followed
+                the last occurrence of the trailing n-gram of the sequence (in the prompt or in the generated text)
+                are proposed as the next `prompt_lookup_num_tokens` candidates. Exactly one of `assistant_model` and
+                `prompt_lookup_num_tokens` must be set.
+            max_matching_ngram_size (`int`, *optional*, defaults to 2):
+                The size of the largest trailing n-gram searched for with `prompt_lookup_num_tokens`. Smaller n-grams
+                are tried when there is no match.
             do_sample (`bool`, *optional*, defaults to `False`):
                 Whether or not to use sampling ; use greedy decoding otherwise.
             logits_processor (`LogitsProcessorList`, *optional*):
@@ -4211,7 +4330,9 @@ class GenerationMixin:
         ["It might be possible to get a better understanding of the nature of the problem, but it's not"]
         ```"""
         # Assistant: initialize assistant-related variables
-        if not hasattr(assistant_model, "max_assistant_tokens"):
+        if (assistant_model is None) == (prompt_lookup_num_tokens is None):
+            raise ValueError("Exactly one of `assistant_model` and `prompt_lookup_num_tokens` must be set.")
+        if assistant_model is not None and not hasattr(assistant_model, "max_assistant_tokens"):
             assistant_model.max_assistant_tokens = 5  # this value, which will be updated, persists across calls
 
         # init values
@@ -4258,10 +4379,13 @@ class GenerationMixin:
         max_len = stopping_criteria[0].max_length
         assistant_kv_indexing = (
             1
-            if "bloom" in assistant_model.__class__.__name__.lower()
-            or (
-                assistant_model.config.architectures is not None
-                and "bloom" in assistant_model.config.architectures[0].lower()
+            if assistant_model is not None
+            and (
+                "bloom" in assistant_model.__class__.__name__.lower()
+                or (
+                    assistant_model.config.architectures is not None
+                    and "bloom" in assistant_model.config.architectures[0].lower()
+                )
             )
             else 0
         )
@@ -4281,60 +4405,71 @@ class GenerationMixin:
             # Assistant: main logic start
             cur_len = input_ids.shape[-1]
 
-            #  1. Forecast next N tokens using the assistant model. This `for` block can be replaced with a
-            # `.generate()` call if we decide to add `past_key_values` as a possible output of generate, as we
-            # need access to the assistant cache to secure strong speedups.
-            candidate_input_ids = input_ids
-            for _ in range(int(assistant_model.max_assistant_tokens)):
-                # 1.1. use the assistant model to obtain the next candidate logits
-                if "assistant_past_key_values" in model_kwargs:
-                    prev_seq_len = model_kwargs["assistant_past_key_values"][0][assistant_kv_indexing].shape[-2]
-                    # `new_token_len` can be 1 or 2 (next token in assistant + last token picked by the larger model)
-                    new_token_len = candidate_input_ids.shape[1] - prev_seq_len
-                    assist_inputs = candidate_input_ids[:, -new_token_len:]
-                    assist_attn = torch.ones_like(candidate_input_ids)
-                    # TODO (joao): make it compatible with models that use unconventional fwd pass logic, like blip2
-                    if assistant_model.config.is_encoder_decoder:
-                        assistant_model_outputs = assistant_model(
-                            decoder_input_ids=assist_inputs,
-                            decoder_attention_mask=assist_attn,
-                            past_key_values=model_kwargs["assistant_past_key_values"],
-                            encoder_outputs=model_kwargs["assistant_encoder_outputs"],
-                        )
+            #  1. Forecast next N tokens, by looking them up in the sequence or with the assistant model.
+            if assistant_model is None:
+                # 1.1. copy the tokens that followed a previous occurrence of the trailing n-gram
+                candidate_input_ids, last_assistant_token_is_eos = _prompt_lookup_candidates(
+                    input_ids,
+                    num_candidate_tokens=min(prompt_lookup_num_tokens, max_len - cur_len - 1),
+                    max_matching_ngram_size=max_matching_ngram_size,
+                    eos_token_id_tensor=eos_token_id_tensor,
+                )
+            else:
+                # This `for` block can be replaced with a `.generate()` call if we decide to add `past_key_values` as
+                # a possible output of generate, as we need access to the assistant cache to secure strong speedups.
+                candidate_input_ids = input_ids
+                for _ in range(int(assistant_model.max_assistant_tokens)):
+                    # 1.1. use the assistant model to obtain the next candidate logits
+                    if "assistant_past_key_values" in model_kwargs:
+                        prev_seq_len = model_kwargs["assistant_past_key_values"][0][assistant_kv_indexing].shape[-2]
+                        # `new_token_len` can be 1 or 2 (next token in assistant + last token picked by the larger
+                        # model)
+                        new_token_len = candidate_input_ids.shape[1] - prev_seq_len
+                        assist_inputs = candidate_input_ids[:, -new_token_len:]
+                        assist_attn = torch.ones_like(candidate_input_ids)
+                        # TODO (joao): make it compatible with models that use unconventional fwd pass logic, like
+                        # blip2
+                        if assistant_model.config.is_encoder_decoder:
+                            assistant_model_outputs = assistant_model(
+                                decoder_input_ids=assist_inputs,
+                                decoder_attention_mask=assist_attn,
+                                past_key_values=model_kwargs["assistant_past_key_values"],
+                                encoder_outputs=model_kwargs["assistant_encoder_outputs"],
+                            )
+                        else:
+                            assistant_model_outputs = assistant_model(
+                                assist_inputs,
+                                attention_mask=assist_attn,
+                                past_key_values=model_kwargs["assistant_past_key_values"],
+                            )
                     else:
-                        assistant_model_outputs = assistant_model(
-                            assist_inputs,
-                            attention_mask=assist_attn,
-                            past_key_values=model_kwargs["assistant_past_key_values"],
+                        if assistant_model.config.is_encoder_decoder:
+                            assistant_model_outputs = assistant_model(
+                                decoder_input_ids=candidate_input_ids,
+                                encoder_outputs=model_kwargs["assistant_encoder_outputs"],
+                            )
+                        else:
+                            assistant_model_outputs = assistant_model(candidate_input_ids)
+
+                    # 1.2. greedily select the next candidate token
+                    model_kwargs["assistant_past_key_values"] = assistant_model_outputs.past_key_values
+                    if len(logits_processor) > 0:
+                        assistant_model_outputs.logits[:, -1, :] = logits_processor(
+                            candidate_input_ids, assistant_model_outputs.logits[:, -1, :]
                         )
-                else:
-                    if assistant_model.config.is_encoder_decoder:
-                        assistant_model_outputs = assistant_model(
-                            decoder_input_ids=candidate_input_ids,
-                            encoder_outputs=model_kwargs["assistant_encoder_outputs"],
+                    new_token = assistant_model_outputs.logits[:, -1, :].argmax(dim=-1)
+                    candidate_input_ids = torch.cat((candidate_input_ids, new_token[:, None]), dim=-1)
+
+                    # 1.3. stop assistant generation on EOS
+                    if eos_token_id_tensor is not None:
+                        last_assistant_token_is_eos = new_token.tile(eos_token_id_tensor.shape[0], 1)
+                        last_assistant_token_is_eos = (
+                            ~last_assistant_token_is_eos.ne(eos_token_id_tensor.unsqueeze(1)).prod(dim=0).bool()
                         )
+                        if last_assistant_token_is_eos:
+                            break
                     else:
-                        assistant_model_outputs = assistant_model(candidate_input_ids)
-
-                # 1.2. greedily select the next candidate token
-                model_kwargs["assistant_past_key_values"] = assistant_model_outputs.past_key_values
-                if len(logits_processor) > 0:
-                    assistant_model_outputs.logits[:, -1, :] = logits_processor(
-                        candidate_input_ids, assistant_model_outputs.logits[:, -1, :]
-                    )
-                new_token = assistant_model_outputs.logits[:, -1, :].argmax(dim=-1)
-                candidate_input_ids = torch.cat((candidate_input_ids, new_token[:, None]), dim=-1)
-
-                # 1.3. stop assistant generation on EOS
-                if eos_token_id_tensor is not None:
-                    last_assistant_token_is_eos = new_token.tile(eos_token_id_tensor.shape[0], 1)
-                    last_assistant_token_is_eos = (
-                        ~last_assistant_token_is_eos.ne(eos_token_id_tensor.unsqueeze(1)).prod(dim=0).bool()
-                    )
-                    if last_assistant_token_is_eos:
-                        break
-                else:
-                    last_assistant_token_is_eos = False
+                        last_assistant_token_is_eos = False
 
             candidate_length = candidate_input_ids.shape[1] - input_ids.shape[1]
 
@@ -4385,10 +4520,10 @@ class GenerationMixin:
             # 2.2. Process the new logits
             new_logits = outputs.logits[:, -candidate_length - 1 :]  # excludes the input prompt if present
             if len(logits_processor) > 0:
-                for i in range(candidate_length):
+                for i in range(candidate_length + 1):
                     new_logits[:, i, :] = logits_processor(candidate_input_ids[:, : cur_len + i], new_logits[:, i, :])
             if len(logits_warper) > 0:
-                for i in range(candidate_length):
+                for i in range(candidate_length + 1):
                     new_logits[:, i, :] = logits_warper(candidate_input_ids[:, : cur_len + i], new_logits[:, i, :])
 
             # 3. Obtain the next tokens from the original model logits.
@@ -4400,7 +4535,7 @@ class GenerationMixin:
 
             # 4. Compare the argmax from the original model logits with the assistant forecasted tokens. We can keep
             # the assistant forecasted tokens until the first mismatch, or until the max length is reached.
-            candidate_new_tokens = candidate_input_ids[:, -candidate_length:]
+            candidate_new_tokens = candidate_input_ids[:, cur_len:]  # may be empty, when no candidate is found
             n_matches = ((~(candidate_new_tokens == selected_tokens[:, :-1])).cumsum(dim=-1) < 1).sum()
 
             # 5. Update variables according to the number of matching assistant tokens. Remember: the token generated
@@ -4423,17 +4558,18 @@ class GenerationMixin:
             # 5.3. Discard past key values relative to unused assistant tokens
             new_cache_size = new_cur_len - 1
             outputs.past_key_values = _crop_past_key_values(self, outputs.past_key_values, new_cache_size)
-            model_kwargs["assistant_past_key_values"] = _crop_past_key_values(
-                assistant_model, model_kwargs["assistant_past_key_values"], new_cache_size - 1
-            )  # the assistant does not have the token after the last match, hence the -1
-
-            # 6. Adjust the max number of assistant tokens to use in the next iteration. This is a simple heuristic,
-            # probably can be improved -- we want to balance the benefits of getting assistant tokens correct with the
-            # cost of forecasting incorrect assistant tokens.
-            if n_matches == int(assistant_model.max_assistant_tokens):
-                assistant_model.max_assistant_tokens += 2.0
-            else:
-                assistant_model.max_assistant_tokens = max(1.0, assistant_model.max_assistant_tokens - 1.0)
+            if assistant_model is not None:
+                model_kwargs["assistant_past_key_values"] = _crop_past_key_values(
+                    assistant_model, model_kwargs["assistant_past_key_values"], new_cache_size - 1
+                )  # the assistant does not have the token after the last match, hence the -1
+
+                # 6. Adjust the max number of assistant tokens to use in the next iteration. This is a simple
+                # heuristic, probably can be improved -- we want to balance the benefits of getting assistant tokens
+                # correct with the cost of forecasting incorrect assistant tokens.
+                if n_matches == int(assistant_model.max_assistant_tokens):
+                    assistant_model.max_assistant_tokens += 2.0
+                else:
+                    assistant_model.max_assistant_tokens = max(1.0, assistant_model.max_assistant_tokens - 1.0)
 
             # Assistant: main logic end
 
@@ -4530,6 +4666,44 @@ class GenerationMixin:
             return input_ids
 
 
+def _prompt_lookup_candidates(input_ids, num_candidate_tokens, max_matching_ngram_size, eos_token_id_tensor=None):
+    """
+    Proposes candidate tokens for assisted decoding without an assistant model: the trailing n-gram of `input_ids`
+    (batch size 1) is searched for in the rest of the sequence, from `max_matching_ngram_size` tokens down to a single
+    token, and the tokens that followed its last occurrence are returned as candidates. The candidates stop after the
+    first EOS token, in which case the returned flag is `True`. No candidate is added when no n-gram matches.
+    """
+    cur_len = input_ids.shape[-1]
+    candidates = input_ids.new_empty((0,))
+    if num_candidate_tokens > 0:
+        for ngram_size in range(min(max_matching_ngram_size, cur_len - 1), 0, -1):
+            # windows of `ngram_size` tokens, excluding the trailing n-gram itself
+            windows = input_ids[0, :-1].unfold(0, ngram_size, 1)
+            matches = (windows == input_ids[0, -ngram_size:]).all(dim=-1).nonzero()
+            if len(matches) > 0:
+                start = matches[-1].item() + ngram_size
+                candidates = input_ids[0, start : start + num_candidate_tokens]
+                break
+
+    is_eos = False
+    if eos_token_id_tensor is not None and len(candidates) > 0:
+        eos_positions = (candidates[:, None] == eos_token_id_tensor).any(dim=-1).nonzero()
+        if len(eos_positions) > 0:
+            candidates = candidates[: eos_positions[0].item() + 1]
+            is_eos = True
+    return torch.cat((input_ids, candidates[None, :]), dim=-1), is_eos
+
+
+def _get_beam_scorer_batch_size(beam_scorer, num_beam_groups=1):
+    """
+    Returns the batch size of `beam_scorer`. Beam scorers that don't define a `batch_size` attribute keep their beam
+    hypotheses in a `_beam_hyps` list, with one element per batch element and beam group.
+    """
+    if hasattr(beam_scorer, "batch_size"):
+        return beam_scorer.batch_size
+    return len(beam_scorer._beam_hyps) // num_beam_groups
+
+
 def _crop_past_key_values(model, past_key_values, maximum_length):
     """Crops the past key values up to a certain maximum length."""
     new_past = []
@@ -73,6 +73,22 @@ class Vit3dConfig(PretrainedConfig):
             Whether to add a bias to the queries, keys and values.
         encoder_stride (`int`, `optional`, defaults to 16):
            Factor to increase the spatial resolution by in the decoder head for masked image modeling.
+        pos_encoding_cache_size (`int`, *optional*, defaults to 8):
+            Number of interpolated position embedding tables (one per patch grid shape) kept in memory when
+            `interpolate_pos_encoding` is used at inference. The least recently used table is evicted first. Set to 0
+            to disable the cache.
+        attention_type (`str`, *optional*, defaults to `"eager"`):
+            Implementation of the self-attention. Can be one of:
+
+            - `"eager"`: computes the full attention matrix explicitly.
+            - `"sdpa"`: uses `torch.nn.functional.scaled_dot_product_attention` (requires PyTorch >= 2.0), which
+              dispatches to memory-efficient or flash kernels when available.
+            - `"chunked"`: computes the attention by blocks of `attention_chunk_size` queries, so that only a
+              `(attention_chunk_size, sequence_length)` slice of the attention matrix is kept in memory at once.
+
+            The eager implementation is always used when `output_attentions=True` or a `head_mask` is passed.
+        attention_chunk_size (`int`, *optional*, defaults to 1024):
+            Number of queries per block when `attention_type="chunked"`.
 
     Example:
 
@@ -106,6 +122,9 @@ class Vit3dConfig(PretrainedConfig):
         num_channels=3,
         qkv_bias=True,
         encoder_stride=16,
+        pos_encoding_cache_size=8,
+        attention_type="eager",
+        attention_chunk_size=1024,
         **kwargs,
     ):
         super().__init__(**kwargs)
@@ -124,6 +143,12 @@ class Vit3dConfig(PretrainedConfig):
         self.num_channels = num_channels
         self.qkv_bias = qkv_bias
         self.encoder_stride = encoder_stride
+        self.pos_encoding_cache_size = pos_encoding_cache_size
+
+        if attention_type not in ["eager", "sdpa", "chunked"]:
+            raise ValueError(f"`attention_type` should be one of 'eager', 'sdpa' or 'chunked', got {attention_type}.")
+        self.attention_type = attention_type
+        self.attention_chunk_size = attention_chunk_size
 
 
 class Vit3dOnnxConfig(OnnxConfig):
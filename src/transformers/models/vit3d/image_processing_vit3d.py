@@ -14,42 +14,582 @@
 # limitations under the License.
 """Image processor class for Vit3d."""
 
-from typing import Dict, List, Optional, Union
+import os
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 import numpy as np
 
 from ...image_processing_utils import BaseImageProcessor, BatchFeature, get_size_dict
-from ...image_transforms import normalize, rescale, resize, to_channel_dimension_format
+from ...image_transforms import center_crop, normalize, rescale, resize, to_channel_dimension_format
 from ...image_utils import (
     IMAGENET_STANDARD_MEAN,
     IMAGENET_STANDARD_STD,
     ChannelDimension,
     ImageInput,
     PILImageResampling,
-    make_list_of_images,
+    is_valid_image,
     to_numpy_array,
-    valid_images,
 )
-from ...utils import TensorType, logging
+from ...utils import TensorType, is_torch_available, is_torch_tensor, logging
+
+
+if is_torch_available():
+    import torch
 
 
 logger = logging.get_logger(__name__)
 
+MAX_VOLUME_CHANNELS = 4
+
+# Number of elements processed at once by `rescale_and_normalize_volume`, small enough for a slab to stay in cache
+# between the multiply and the add
+_SLAB_NUM_ELEMENTS = 2**18
+
+
+def make_list_of_volumes(volumes) -> List[ImageInput]:
+    """
+    Ensure that the input is a list of volumes. A single volume is either a `(num_channels, depth, height, width)` or
+    a `(depth, height, width, num_channels)` array, a batch of volumes has an additional leading batch dimension.
+    Paths to volume files and lazy array handles (see [`is_lazy_volume`]) are accepted as single volumes. For
+    backwards compatibility, single 2D images (PIL images or 3-dimensional arrays) are also accepted.
+    """
+    if isinstance(volumes, (list, tuple)) and len(volumes) > 0 and is_valid_volume(volumes[0]):
+        return list(volumes)
+
+    if isinstance(volumes, (str, os.PathLike)) or (is_lazy_volume(volumes) and len(volumes.shape) == 4):
+        return [volumes]
+
+    if is_valid_image(volumes):
+        if not hasattr(volumes, "ndim") or volumes.ndim in (3, 4):
+            return [volumes]
+        if volumes.ndim == 5:
+            return list(volumes)
+        raise ValueError(
+            f"Invalid volume shape. Expected either 4 or 5 dimensions, but got {volumes.ndim} dimensions."
+        )
+    raise ValueError(
+        "Invalid volume type. Expected either numpy.ndarray, torch.Tensor, tf.Tensor or jax.ndarray, but got "
+        f"{type(volumes)}."
+    )
+
+
+def is_valid_volume(volume) -> bool:
+    return is_valid_image(volume) or is_lazy_volume(volume) or isinstance(volume, (str, os.PathLike))
+
+
+def get_volume_size_dict(size: Union[int, Iterable[int], Dict[str, int]] = None, param_name="size") -> dict:
+    """
+    Extends [`~image_processing_utils.get_size_dict`] with an optional `"depth"` key. A 3-element tuple is interpreted
+    as `(depth, height, width)`. When no depth is given, the depth of the volumes is left untouched.
+    """
+    if isinstance(size, dict) and "depth" in size:
+        spatial_size = get_size_dict({k: v for k, v in size.items() if k != "depth"}, param_name=param_name)
+        return {"depth": size["depth"], **spatial_size}
+    if isinstance(size, (list, tuple)) and len(size) == 3:
+        return {"depth": size[0], "height": size[1], "width": size[2]}
+    return get_size_dict(size, param_name=param_name)
+
+
+def infer_volume_channel_dimension_format(volume) -> ChannelDimension:
+    """
+    Infers the channel dimension format of a volume of shape `([batch_size,] num_channels, depth, height, width)` or
+    `([batch_size,] depth, height, width, num_channels)`. Volumes can have up to `MAX_VOLUME_CHANNELS` channels (e.g.
+    multi-sequence MRI or a scan stacked with its label map).
+    """
+    if volume.ndim == 4:
+        first_dim = 0
+    elif volume.ndim == 5:
+        first_dim = 1
+    else:
+        raise ValueError(f"Unsupported number of volume dimensions: {volume.ndim}")
+
+    if volume.shape[first_dim] <= min(MAX_VOLUME_CHANNELS, volume.shape[-1]):
+        return ChannelDimension.FIRST
+    elif volume.shape[-1] <= MAX_VOLUME_CHANNELS:
+        return ChannelDimension.LAST
+    raise ValueError("Unable to infer channel dimension format")
+
+
+def to_volume_channel_dimension_format(
+    volume,
+    channel_dim: Union[ChannelDimension, str],
+    input_channel_dim: Optional[Union[ChannelDimension, str]] = None,
+):
+    """
+    Converts `volume` (a numpy array or torch tensor, optionally batched) to the channel dimension format specified
+    by `channel_dim`. No data is copied: the result is a transposed view of the input.
+    """
+    if input_channel_dim is None:
+        input_channel_dim = infer_volume_channel_dimension_format(volume)
+
+    target_channel_dim = ChannelDimension(channel_dim)
+    if ChannelDimension(input_channel_dim) == target_channel_dim:
+        return volume
+
+    leading = tuple(range(volume.ndim - 4))
+    first = len(leading)
+    if target_channel_dim == ChannelDimension.FIRST:
+        axes = leading + (first + 3, first, first + 1, first + 2)
+    elif target_channel_dim == ChannelDimension.LAST:
+        axes = leading + (first + 1, first + 2, first + 3, first)
+    else:
+        raise ValueError("Unsupported channel dimension format: {}".format(channel_dim))
+
+    return volume.permute(axes) if is_torch_tensor(volume) else volume.transpose(axes)
+
+
+def _get_resample_indices(
+    input_size: int,
+    output_size: int,
+    resample: PILImageResampling,
+    start: int = 0,
+    stop: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """
+    Computes, for the output positions `start:stop` of an axis resized from `input_size` to `output_size`, the lower
+    and upper source indices and the interpolation weight (`None` for nearest neighbour), with the same conventions as
+    `torch.nn.functional.interpolate` with `align_corners=False`.
+    """
+    stop = output_size if stop is None else stop
+    positions = np.arange(start, stop)
+    if input_size == output_size:
+        return positions, positions, None
+
+    scale = input_size / output_size
+    if resample == PILImageResampling.NEAREST:
+        indices = np.minimum(np.floor(positions * scale).astype(np.int64), input_size - 1)
+        return indices, indices, None
+
+    source = np.maximum((positions.astype(np.float32) + 0.5) * scale - 0.5, 0)
+    lower_index = np.minimum(source.astype(np.int64), input_size - 1)
+    upper_index = np.minimum(lower_index + 1, input_size - 1)
+    return lower_index, upper_index, source - lower_index
+
+
+def _interpolate_axis(
+    volume: np.ndarray, lower_index: np.ndarray, upper_index: np.ndarray, weight: Optional[np.ndarray], axis: int
+) -> np.ndarray:
+    """
+    Gathers (and, if `weight` is given, linearly interpolates) `volume` along `axis` at the given source indices.
+    """
+    if weight is None:
+        if len(lower_index) == volume.shape[axis] and np.array_equal(lower_index, np.arange(volume.shape[axis])):
+            return volume
+        return np.take(volume, lower_index, axis=axis)
+
+    weight_shape = [1] * volume.ndim
+    weight_shape[axis] = len(weight)
+    weight = weight.astype(volume.dtype).reshape(weight_shape)
+
+    lower = np.take(volume, lower_index, axis=axis)
+    upper = np.take(volume, upper_index, axis=axis)
+    upper -= lower
+    upper *= weight
+    lower += upper
+    return lower
+
+
+def _cast_resampled(resampled: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    if resampled.dtype == dtype:
+        return resampled
+    info = np.iinfo(dtype)
+    return np.clip(np.rint(resampled), info.min, info.max).astype(dtype)
+
+
+def resize_volume(
+    volume,
+    size: Tuple[int, int, int],
+    resample: PILImageResampling = PILImageResampling.BILINEAR,
+    data_format: Optional[Union[str, ChannelDimension]] = None,
+):
+    """
+    Resizes the `(depth, height, width)` dimensions of `volume` to `size` in a single vectorized call.
+
+    Supported filters are `PILImageResampling.BILINEAR` (trilinear interpolation) and `PILImageResampling.NEAREST`.
+    Both match `torch.nn.functional.interpolate` with `align_corners=False`. Numpy arrays are resized with numpy,
+    torch tensors with `torch.nn.functional.interpolate`. A batch of volumes can be resized at once by passing an
+    array with an extra leading batch dimension.
+
+    Args:
+        volume (`np.ndarray` or `torch.Tensor`):
+            Volume of shape `([batch_size,] num_channels, depth, height, width)` or `([batch_size,] depth, height,
+            width, num_channels)`.
+        size (`Tuple[int, int, int]`):
+            The target `(depth, height, width)`.
+        resample (`PILImageResampling`, *optional*, defaults to `PILImageResampling.BILINEAR`):
+            The filter to use for resampling.
+        data_format (`ChannelDimension`, *optional*):
+            The channel dimension format of the output volume. If unset, will use the inferred format from the input.
+
+    Returns:
+        The resized volume, of the same type (and for integer inputs, of the same dtype) as `volume`.
+    """
+    if len(size) != 3:
+        raise ValueError("size must have 3 elements representing the depth, height and width of the output volume")
+    if resample not in (PILImageResampling.BILINEAR, PILImageResampling.NEAREST):
+        raise ValueError(f"Only BILINEAR and NEAREST resampling are supported for volumes, got {resample}")
+
+    input_data_format = infer_volume_channel_dimension_format(volume)
+    data_format = input_data_format if data_format is None else data_format
+    volume = to_volume_channel_dimension_format(volume, ChannelDimension.FIRST, input_data_format)
+    size = tuple(int(s) for s in size)
+
+    if is_torch_tensor(volume):
+        batched = volume.ndim == 5
+        resized = volume if batched else volume.unsqueeze(0)
+        dtype = resized.dtype
+        if not resized.is_floating_point():
+            resized = resized.float()
+        if resample == PILImageResampling.NEAREST:
+            resized = torch.nn.functional.interpolate(resized, size=size, mode="nearest")
+        else:
+            resized = torch.nn.functional.interpolate(resized, size=size, mode="trilinear", align_corners=False)
+        if resized.dtype != dtype:
+            resized = resized.round().to(dtype)
+        resized = resized if batched else resized.squeeze(0)
+        return to_volume_channel_dimension_format(resized, data_format, ChannelDimension.FIRST)
+
+    volume = np.asarray(volume)
+    spatial_axes = (volume.ndim - 3, volume.ndim - 2, volume.ndim - 1)
+    indices = [_get_resample_indices(volume.shape[axis], out, resample) for axis, out in zip(spatial_axes, size)]
+    if resample == PILImageResampling.NEAREST:
+        # A single gather over the three spatial axes
+        resized = volume[(Ellipsis,) + np.ix_(*[lower_index for lower_index, _, _ in indices])]
+    else:
+        dtype = volume.dtype
+        resized = volume if np.issubdtype(dtype, np.floating) else volume.astype(np.float32)
+        # Trilinear interpolation is separable: resample one axis at a time, starting with the axis that shrinks the
+        # most so that the following passes touch as little data as possible.
+        order = sorted(zip(spatial_axes, size), key=lambda axis_size: axis_size[1] / volume.shape[axis_size[0]])
+        for axis, _ in order:
+            resized = _interpolate_axis(resized, *indices[axis - spatial_axes[0]], axis=axis)
+        resized = volume.copy() if resized is volume else _cast_resampled(resized, dtype)
+
+    return to_volume_channel_dimension_format(resized, data_format, ChannelDimension.FIRST)
+
+
+def center_crop_volume(
+    volume: np.ndarray,
+    size: Tuple[int, int, int],
+    data_format: Optional[Union[str, ChannelDimension]] = None,
+) -> np.ndarray:
+    """
+    Crops the `(depth, height, width)` dimensions of `volume` to `size` using a center crop. If the volume is smaller
+    than `size` along an axis, it is padded with zeros so that the result is always of size `size`. When no padding is
+    needed, the result is a view of the input.
+
+    Args:
+        volume (`np.ndarray`):
+            Volume of shape `([batch_size,] num_channels, depth, height, width)` or `([batch_size,] depth, height,
+            width, num_channels)`.
+        size (`Tuple[int, int, int]`):
+            The target `(depth, height, width)`.
+        data_format (`ChannelDimension`, *optional*):
+            The channel dimension format of the output volume. If unset, will use the inferred format from the input.
+
+    Returns:
+        `np.ndarray`: The cropped volume.
+    """
+    if len(size) != 3:
+        raise ValueError("size must have 3 elements representing the depth, height and width of the output volume")
+
+    input_data_format = infer_volume_channel_dimension_format(volume)
+    data_format = input_data_format if data_format is None else data_format
+    volume = to_volume_channel_dimension_format(volume, ChannelDimension.FIRST, input_data_format)
+
+    original_size = volume.shape[-3:]
+    crop_size = tuple(int(s) for s in size)
+    starts = [(orig - crop) // 2 for orig, crop in zip(original_size, crop_size)]
+
+    if all(start >= 0 for start in starts):
+        slices = tuple(slice(start, start + crop) for start, crop in zip(starts, crop_size))
+        cropped = volume[(Ellipsis,) + slices]
+    else:
+        # The volume is too small along at least one axis: copy the overlapping region into a zero-padded buffer
+        cropped = np.zeros_like(volume, shape=volume.shape[:-3] + crop_size)
+        source_slices, target_slices = [], []
+        for start, orig, crop in zip(starts, original_size, crop_size):
+            length = min(orig, crop)
+            source_start, target_start = max(start, 0), max(-start, 0)
+            source_slices.append(slice(source_start, source_start + length))
+            target_slices.append(slice(target_start, target_start + length))
+        cropped[(Ellipsis,) + tuple(target_slices)] = volume[(Ellipsis,) + tuple(source_slices)]
+
+    return to_volume_channel_dimension_format(cropped, data_format, ChannelDimension.FIRST)
+
+
+def is_lazy_volume(volume) -> bool:
+    """
+    Whether `volume` is a lazily loaded array: a memory-mapped numpy array, or an array handle exposing `shape`,
+    `dtype` and numpy-style slicing without holding the data in memory (e.g. an `h5py.Dataset` or a `zarr.Array`).
+    """
+    if isinstance(volume, np.memmap):
+        return True
+    if isinstance(volume, np.ndarray) or is_valid_image(volume):
+        return False
+    return all(hasattr(volume, attribute) for attribute in ("shape", "dtype", "__getitem__"))
+
+
+def load_volume(
+    path: Union[str, os.PathLike],
+    shape: Optional[Tuple[int, ...]] = None,
+    dtype: Optional[Union[str, np.dtype]] = None,
+    offset: int = 0,
+) -> np.memmap:
+    """
+    Memory-maps a volume stored on disk, without reading it. `.npy` files carry their own shape and dtype; raw volume
+    files need `shape` and `dtype` to be specified (and `offset`, the size of their header in bytes, if any).
+
+    Args:
+        path (`str` or `os.PathLike`):
+            Path to the `.npy` or raw volume file.
+        shape (`Tuple[int, ...]`, *optional*):
+            Shape of the volume in a raw file.
+        dtype (`str` or `np.dtype`, *optional*):
+            Data type of the volume in a raw file.
+        offset (`int`, *optional*, defaults to 0):
+            Offset of the volume data in a raw file, in bytes.
+
+    Returns:
+        `np.memmap`: A read-only memory-mapped view of the volume.
+    """
+    if str(path).endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    if shape is None or dtype is None:
+        raise ValueError(f"`shape` and `dtype` must be specified to load the raw volume file {path}")
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=tuple(shape))
+
+
+def read_volume(
+    volume,
+    size: Optional[Tuple[Optional[int], int, int]] = None,
+    crop_size: Optional[Tuple[Optional[int], int, int]] = None,
+    resample: PILImageResampling = PILImageResampling.BILINEAR,
+) -> np.ndarray:
+    """
+    Reads `volume`, resized to `size` and then center cropped to `crop_size`, in channels first format.
+
+    Resizing and cropping are fused with the read: only the region of `volume` that contributes to the cropped output
+    is loaded, which makes this suited to memory-mapped files and lazy array handles (see [`is_lazy_volume`]). The
+    result is the same as calling [`resize_volume`] followed by [`center_crop_volume`].
+
+    Args:
+        volume (`np.ndarray`, `np.memmap` or lazy array handle):
+            Volume of shape `(num_channels, depth, height, width)` or `(depth, height, width, num_channels)`.
+        size (`Tuple[int, int, int]`, *optional*):
+            The `(depth, height, width)` to resize to. A `None` depth keeps the depth of the volume. If unset, the
+            volume isn't resized.
+        crop_size (`Tuple[int, int, int]`, *optional*):
+            The `(depth, height, width)` to center crop to. A `None` depth keeps the depth of the resized volume. If
+            unset, the volume isn't cropped.
+        resample (`PILImageResampling`, *optional*, defaults to `PILImageResampling.BILINEAR`):
+            The filter to use for resampling, `PILImageResampling.BILINEAR` or `PILImageResampling.NEAREST`.
+
+    Returns:
+        `np.ndarray`: The resized and cropped volume, of shape `(num_channels, depth, height, width)`.
+    """
+    if resample not in (PILImageResampling.BILINEAR, PILImageResampling.NEAREST):
+        raise ValueError(f"Only BILINEAR and NEAREST resampling are supported for volumes, got {resample}")
+
+    input_data_format = infer_volume_channel_dimension_format(volume)
+    spatial_axes = (1, 2, 3) if input_data_format == ChannelDimension.FIRST else (0, 1, 2)
+    input_size = tuple(volume.shape[axis] for axis in spatial_axes)
+    output_size = tuple(int(out) if out is not None else orig for out, orig in zip(size or (None,) * 3, input_size))
+    crop_size = tuple(
+        int(crop) if crop is not None else out for crop, out in zip(crop_size or (None,) * 3, output_size)
+    )
+
+    read_slices, target_slices, indices = [], [], []
+    for orig, out, crop in zip(input_size, output_size, crop_size):
+        # Range of the resized axis covered by the crop, and where it lands in the (possibly padded) output
+        start = (out - crop) // 2
+        valid_start, valid_stop = max(start, 0), min(start + crop, out)
+        target_slices.append(slice(valid_start - start, valid_stop - start))
+
+        # Range of the source axis needed to compute it
+        lower_index, upper_index, weight = _get_resample_indices(orig, out, resample, valid_start, valid_stop)
+        read_start, read_stop = int(lower_index[0]), int(upper_index[-1]) + 1
+        read_slices.append(slice(read_start, read_stop))
+        indices.append((lower_index - read_start, upper_index - read_start, weight))
+
+    if input_data_format == ChannelDimension.FIRST:
+        read_slices = (slice(None),) + tuple(read_slices)
+    else:
+        read_slices = tuple(read_slices) + (slice(None),)
+    region = np.asarray(volume[read_slices])
+    region = to_volume_channel_dimension_format(region, ChannelDimension.FIRST, input_data_format)
+
+    dtype = region.dtype
+    if resample == PILImageResampling.BILINEAR and not np.issubdtype(dtype, np.floating):
+        region = region.astype(np.float32)
+    # Resample one axis at a time, starting with the axis that shrinks the most
+    for axis in sorted((1, 2, 3), key=lambda axis: output_size[axis - 1] / input_size[axis - 1]):
+        region = _interpolate_axis(region, *indices[axis - 1], axis=axis)
+    region = _cast_resampled(region, dtype)
+
+    if region.shape[1:] != crop_size:
+        padded = np.zeros_like(region, shape=region.shape[:1] + crop_size)
+        padded[(slice(None),) + tuple(target_slices)] = region
+        region = padded
+    elif isinstance(volume, np.ndarray) and np.may_share_memory(region, volume):
+        # Only the cropped region is read from memory-mapped files, into an array that doesn't point into the file
+        region = np.array(region)
+    return region
+
+
+def normalize_volume(
+    volume: np.ndarray,
+    mean: Union[float, Iterable[float]],
+    std: Union[float, Iterable[float]],
+    data_format: Optional[Union[str, ChannelDimension]] = None,
+) -> np.ndarray:
+    """
+    Normalizes a volume of shape `([batch_size,] num_channels, depth, height, width)` or `([batch_size,] depth,
+    height, width, num_channels)` using `mean` and `std`: volume = (volume - mean) / std.
+    """
+    input_data_format = infer_volume_channel_dimension_format(volume)
+    channel_axis = volume.ndim - 4 if input_data_format == ChannelDimension.FIRST else volume.ndim - 1
+    num_channels = volume.shape[channel_axis]
+
+    if isinstance(mean, Iterable):
+        if len(mean) != num_channels:
+            raise ValueError(f"mean must have {num_channels} elements if it is an iterable, got {len(mean)}")
+    else:
+        mean = [mean] * num_channels
+
+    if isinstance(std, Iterable):
+        if len(std) != num_channels:
+            raise ValueError(f"std must have {num_channels} elements if it is an iterable, got {len(std)}")
+    else:
+        std = [std] * num_channels
+
+    dtype = volume.dtype if np.issubdtype(volume.dtype, np.floating) else np.float32
+    broadcast_shape = [1] * (volume.ndim - channel_axis)
+    broadcast_shape[0] = num_channels
+    mean = np.array(mean, dtype=dtype).reshape(broadcast_shape)
+    std = np.array(std, dtype=dtype).reshape(broadcast_shape)
+    volume = (volume - mean) / std
+
+    if data_format is not None:
+        volume = to_volume_channel_dimension_format(volume, data_format, input_data_format)
+    return volume
+
+
+def rescale_and_normalize_volume(
+    volume: np.ndarray,
+    scale: Optional[float] = None,
+    mean: Optional[Union[float, Iterable[float]]] = None,
+    std: Optional[Union[float, Iterable[float]]] = None,
+    dtype: Union[str, np.dtype] = np.float32,
+    data_format: Optional[Union[str, ChannelDimension]] = None,
+    inplace: bool = False,
+) -> np.ndarray:
+    """
+    Rescales and normalizes a volume in a single pass: volume = (volume * scale - mean) / std, folded into one
+    multiply-add per channel. The conversion to `dtype` and to the channel dimension format `data_format` are done in
+    the same pass, by writing directly into an output buffer of the requested layout. The volume is processed in
+    cache-sized slabs, so the intermediate result is never written to memory at full size.
+
+    Args:
+        volume (`np.ndarray`):
+            Volume of shape `([batch_size,] num_channels, depth, height, width)` or `([batch_size,] depth, height,
+            width, num_channels)`.
+        scale (`float`, *optional*):
+            The scale to rescale the volume by. If unset, the volume isn't rescaled.
+        mean (`float` or `Iterable[float]`, *optional*):
+            The mean to use for normalization. If unset, the volume isn't normalized.
+        std (`float` or `Iterable[float]`, *optional*):
+            The standard deviation to use for normalization. Must be set if `mean` is.
+        dtype (`str` or `np.dtype`, *optional*, defaults to `np.float32`):
+            The floating point dtype of the output volume, e.g. `np.float16` to halve its size. Computations are done
+            in (at least) float32.
+        data_format (`ChannelDimension`, *optional*):
+            The channel dimension format of the output volume. If unset, will use the inferred format from the input.
+        inplace (`bool`, *optional*, defaults to `False`):
+            Whether the output may be written into `volume`, which is possible when it already has the requested
+            dtype and channel dimension format.
+
+    Returns:
+        `np.ndarray`: The rescaled and normalized volume.
+    """
+    input_data_format = infer_volume_channel_dimension_format(volume)
+    data_format = input_data_format if data_format is None else ChannelDimension(data_format)
+    volume_channels_first = to_volume_channel_dimension_format(volume, ChannelDimension.FIRST, input_data_format)
+    num_channels = volume_channels_first.shape[-4]
+
+    multiplier = np.full(num_channels, 1.0 if scale is None else scale, dtype=np.float64)
+    offset = np.zeros(num_channels, dtype=np.float64)
+    if mean is not None:
+        if std is None:
+            raise ValueError("std must be specified if mean is")
+        if isinstance(mean, Iterable) and len(mean) != num_channels:
+            raise ValueError(f"mean must have {num_channels} elements if it is an iterable, got {len(mean)}")
+        if isinstance(std, Iterable) and len(std) != num_channels:
+            raise ValueError(f"std must have {num_channels} elements if it is an iterable, got {len(std)}")
+        mean = np.broadcast_to(np.asarray(mean, dtype=np.float64), (num_channels,))
+        std = np.broadcast_to(np.asarray(std, dtype=np.float64), (num_channels,))
+        multiplier /= std
+        offset -= mean / std
+
+    dtype = np.dtype(dtype)
+    if not np.issubdtype(dtype, np.floating):
+        raise ValueError(f"dtype must be a floating point type, got {dtype}")
+    compute_dtype = np.promote_types(dtype, np.float32)
+    multiplier, offset = multiplier.astype(compute_dtype), offset.astype(compute_dtype)
+
+    if inplace and volume.dtype == dtype and data_format == input_data_format and volume.flags.writeable:
+        output = volume
+    else:
+        output_shape = volume_channels_first.shape
+        if data_format == ChannelDimension.LAST:
+            output_shape = output_shape[:-4] + output_shape[-3:] + output_shape[-4:-3]
+        output = np.empty(output_shape, dtype=dtype)
+    output_channels_first = to_volume_channel_dimension_format(output, ChannelDimension.FIRST, data_format)
+
+    depth, height, width = volume_channels_first.shape[-3:]
+    slab_depth = max(1, _SLAB_NUM_ELEMENTS // (height * width))
+    buffer = None if compute_dtype == dtype else np.empty((slab_depth, height, width), dtype=compute_dtype)
+    for index in np.ndindex(volume_channels_first.shape[:-3]):
+        channel = index[-1]
+        source, target = volume_channels_first[index], output_channels_first[index]
+        for start in range(0, depth, slab_depth):
+            source_slab = source[start : start + slab_depth]
+            target_slab = target[start : start + slab_depth]
+            slab = target_slab if buffer is None else buffer[: len(source_slab)]
+            np.multiply(source_slab, multiplier[channel], out=slab, dtype=compute_dtype, casting="unsafe")
+            if offset[channel] != 0:
+                slab += offset[channel]
+            if buffer is not None:
+                target_slab[...] = slab
+    return output
+
 
 class Vit3dImageProcessor(BaseImageProcessor):
     r"""
     Constructs a Vit3d image processor.
 
+    Volumes of shape `(num_channels, depth, height, width)` or `(depth, height, width, num_channels)` are resized and
+    cropped natively over their `(depth, height, width)` dimensions. 2D images are still accepted for backwards
+    compatibility.
+
     Args:
         do_resize (`bool`, *optional*, defaults to `True`):
             Whether to resize the image's (height, width) dimensions to the specified `(size["height"],
-            size["width"])`. Can be overridden by the `do_resize` parameter in the `preprocess` method.
+            size["width"])`, and the volume's depth to `size["depth"]` if given. Can be overridden by the `do_resize`
+            parameter in the `preprocess` method.
         size (`dict`, *optional*, defaults to `{"height": 224, "width": 224}`):
-            Size of the output image after resizing. Can be overridden by the `size` parameter in the `preprocess`
-            method.
+            Size of the output image after resizing. May contain a `"depth"` key for volumes; if it doesn't, the depth
+            of the volumes is kept. Can be overridden by the `size` parameter in the `preprocess` method.
         resample (`PILImageResampling`, *optional*, defaults to `PILImageResampling.BILINEAR`):
-            Resampling filter to use if resizing the image. Can be overridden by the `resample` parameter in the
-            `preprocess` method.
+            Resampling filter to use if resizing the image. Volumes support `PILImageResampling.BILINEAR` (trilinear)
+            and `PILImageResampling.NEAREST`. Can be overridden by the `resample` parameter in the `preprocess`
+            method.
+        do_center_crop (`bool`, *optional*, defaults to `False`):
+            Whether to center crop the image to the specified `crop_size`. Can be overridden by the `do_center_crop`
+            parameter in the `preprocess` method.
+        crop_size (`Dict[str, int]`, *optional*, defaults to `{"height": 224, "width": 224}`):
+            Size of the image after applying the center crop. May contain a `"depth"` key for volumes. Can be
+            overridden by the `crop_size` parameter in the `preprocess` method.
         do_rescale (`bool`, *optional*, defaults to `True`):
             Whether to rescale the image by the specified scale `rescale_factor`. Can be overridden by the `do_rescale`
             parameter in the `preprocess` method.
@@ -65,6 +605,9 @@ class Vit3dImageProcessor(BaseImageProcessor):
         image_std (`float` or `List[float]`, *optional*, defaults to `IMAGENET_STANDARD_STD`):
             Standard deviation to use if normalizing the image. This is a float or list of floats the length of the
             number of channels in the image. Can be overridden by the `image_std` parameter in the `preprocess` method.
+        output_dtype (`str`, *optional*, defaults to `"float32"`):
+            Floating point dtype of the rescaled and/or normalized volumes, e.g. `"float16"` to halve their size. Only
+            applies to volumes. Can be overridden by the `output_dtype` parameter in the `preprocess` method.
     """
 
     model_input_names = ["pixel_values"]
@@ -74,17 +617,24 @@ class Vit3dImageProcessor(BaseImageProcessor):
         do_resize: bool = True,
         size: Optional[Dict[str, int]] = None,
         resample: PILImageResampling = PILImageResampling.BILINEAR,
+        do_center_crop: bool = False,
+        crop_size: Optional[Dict[str, int]] = None,
         do_rescale: bool = True,
         rescale_factor: Union[int, float] = 1 / 255,
         do_normalize: bool = True,
         image_mean: Optional[Union[float, List[float]]] = None,
         image_std: Optional[Union[float, List[float]]] = None,
+        output_dtype: str = "float32",
         **kwargs,
     ) -> None:
         super().__init__(**kwargs)
         size = size if size is not None else {"height": 224, "width": 224}
-        size = get_size_dict(size)
+        size = get_volume_size_dict(size)
+        crop_size = crop_size if crop_size is not None else {"height": 224, "width": 224}
+        crop_size = get_volume_size_dict(crop_size, param_name="crop_size")
         self.do_resize = do_resize
+        self.do_center_crop = do_center_crop
+        self.crop_size = crop_size
         self.do_rescale = do_rescale
         self.do_normalize = do_normalize
         self.size = size
@@ -92,6 +642,7 @@ class Vit3dImageProcessor(BaseImageProcessor):
         self.rescale_factor = rescale_factor
         self.image_mean = image_mean if image_mean is not None else IMAGENET_STANDARD_MEAN
         self.image_std = image_std if image_std is not None else IMAGENET_STANDARD_STD
+        self.output_dtype = output_dtype
 
     def resize(
         self,
@@ -102,13 +653,16 @@ class Vit3dImageProcessor(BaseImageProcessor):
         **kwargs,
     ) -> np.ndarray:
         """
-        Resize an image to `(size["height"], size["width"])`.
+        Resize an image to `(size["height"], size["width"])`, or a volume to `(size["depth"], size["height"],
+        size["width"])`. Volumes (and batches of volumes of the same shape) are resized in a single vectorized call,
+        see [`resize_volume`].
 
         Args:
             image (`np.ndarray`):
-                Image to resize.
+                Image or volume to resize.
             size (`Dict[str, int]`):
-                Dictionary in the format `{"height": int, "width": int}` specifying the size of the output image.
+                Dictionary in the format `{"height": int, "width": int}` specifying the size of the output image. May
+                contain a `"depth"` key for volumes; if it doesn't, the depth of the volume is kept.
             resample:
                 `PILImageResampling` filter to use when resizing the image e.g. `PILImageResampling.BILINEAR`.
             data_format (`ChannelDimension` or `str`, *optional*):
@@ -120,13 +674,54 @@ class Vit3dImageProcessor(BaseImageProcessor):
         Returns:
             `np.ndarray`: The resized image.
         """
-        size = get_size_dict(size)
+        size = get_volume_size_dict(size)
         if "height" not in size or "width" not in size:
             raise ValueError(f"The `size` dictionary must contain the keys `height` and `width`. Got {size.keys()}")
+        if image.ndim >= 4:
+            if "depth" in size:
+                depth = size["depth"]
+            else:
+                channel_dim = infer_volume_channel_dimension_format(image)
+                depth = image.shape[-4] if channel_dim == ChannelDimension.LAST else image.shape[-3]
+            return resize_volume(
+                image, size=(depth, size["height"], size["width"]), resample=resample, data_format=data_format
+            )
         return resize(
             image, size=(size["height"], size["width"]), resample=resample, data_format=data_format, **kwargs
         )
 
+    def center_crop(
+        self,
+        image: np.ndarray,
+        size: Dict[str, int],
+        data_format: Optional[Union[str, ChannelDimension]] = None,
+        **kwargs,
+    ) -> np.ndarray:
+        """
+        Center crop an image to `(size["height"], size["width"])`, or a volume to `(size["depth"], size["height"],
+        size["width"])`. If the input size is smaller than `size` along any edge, it is padded with zeros.
+
+        Args:
+            image (`np.ndarray`):
+                Image or volume to center crop.
+            size (`Dict[str, int]`):
+                Size of the output image. May contain a `"depth"` key for volumes; if it doesn't, the depth of the
+                volume is kept.
+            data_format (`str` or `ChannelDimension`, *optional*):
+                The channel dimension format of the image. If not provided, it will be the same as the input image.
+        """
+        size = get_volume_size_dict(size, param_name="crop_size")
+        if "height" not in size or "width" not in size:
+            raise ValueError(f"The `size` dictionary must contain the keys `height` and `width`. Got {size.keys()}")
+        if image.ndim >= 4:
+            if "depth" in size:
+                depth = size["depth"]
+            else:
+                channel_dim = infer_volume_channel_dimension_format(image)
+                depth = image.shape[-4] if channel_dim == ChannelDimension.LAST else image.shape[-3]
+            return center_crop_volume(image, size=(depth, size["height"], size["width"]), data_format=data_format)
+        return center_crop(image, size=(size["height"], size["width"]), data_format=data_format, **kwargs)
+
     def rescale(
         self, image: np.ndarray, scale: float, data_format: Optional[Union[str, ChannelDimension]] = None, **kwargs
     ) -> np.ndarray:
@@ -176,6 +771,8 @@ class Vit3dImageProcessor(BaseImageProcessor):
         Returns:
             `np.ndarray`: The normalized image.
         """
+        if image.ndim >= 4:
+            return normalize_volume(image, mean=mean, std=std, data_format=data_format)
         return normalize(image, mean=mean, std=std, data_format=data_format, **kwargs)
 
     def preprocess(
@@ -184,29 +781,37 @@ class Vit3dImageProcessor(BaseImageProcessor):
         do_resize: Optional[bool] = None,
         size: Dict[str, int] = None,
         resample: PILImageResampling = None,
+        do_center_crop: Optional[bool] = None,
+        crop_size: Dict[str, int] = None,
         do_rescale: Optional[bool] = None,
         rescale_factor: Optional[float] = None,
         do_normalize: Optional[bool] = None,
         image_mean: Optional[Union[float, List[float]]] = None,
         image_std: Optional[Union[float, List[float]]] = None,
+        output_dtype: Optional[str] = None,
         return_tensors: Optional[Union[str, TensorType]] = None,
         data_format: Union[str, ChannelDimension] = ChannelDimension.FIRST,
         **kwargs,
     ):
         """
-        Preprocess an image or batch of images.
+        Preprocess a volume or batch of volumes (or, for backwards compatibility, an image or batch of images).
 
         Args:
             images (`ImageInput`):
-                Image to preprocess.
+                Volume of shape `(num_channels, depth, height, width)` or `(depth, height, width, num_channels)`,
+                batch of volumes, or image(s) to preprocess.
             do_resize (`bool`, *optional*, defaults to `self.do_resize`):
                 Whether to resize the image.
             size (`Dict[str, int]`, *optional*, defaults to `self.size`):
-                Dictionary in the format `{"height": h, "width": w}` specifying the size of the output image after
-                resizing.
+                Dictionary in the format `{"depth": d, "height": h, "width": w}` specifying the size of the output
+                volume after resizing. `"depth"` is optional.
             resample (`PILImageResampling` filter, *optional*, defaults to `self.resample`):
                 `PILImageResampling` filter to use if resizing the image e.g. `PILImageResampling.BILINEAR`. Only has
                 an effect if `do_resize` is set to `True`.
+            do_center_crop (`bool`, *optional*, defaults to `self.do_center_crop`):
+                Whether to center crop the image.
+            crop_size (`Dict[str, int]`, *optional*, defaults to `self.crop_size`):
+                Size of the volume after center crop. `"depth"` is optional.
             do_rescale (`bool`, *optional*, defaults to `self.do_rescale`):
                 Whether to rescale the image values between [0 - 1].
             rescale_factor (`float`, *optional*, defaults to `self.rescale_factor`):
@@ -217,6 +822,8 @@ class Vit3dImageProcessor(BaseImageProcessor):
                 Image mean to use if `do_normalize` is set to `True`.
             image_std (`float` or `List[float]`, *optional*, defaults to `self.image_std`):
                 Image standard deviation to use if `do_normalize` is set to `True`.
+            output_dtype (`str`, *optional*, defaults to `self.output_dtype`):
+                Floating point dtype of the volumes if `do_rescale` or `do_normalize` is set to `True`.
             return_tensors (`str` or `TensorType`, *optional*):
                 The type of tensors to return. Can be one of:
                 - Unset: Return a list of `np.ndarray`.
@@ -231,43 +838,120 @@ class Vit3dImageProcessor(BaseImageProcessor):
                 - Unset: Use the channel dimension format of the input image.
         """
         do_resize = do_resize if do_resize is not None else self.do_resize
+        do_center_crop = do_center_crop if do_center_crop is not None else self.do_center_crop
         do_rescale = do_rescale if do_rescale is not None else self.do_rescale
         do_normalize = do_normalize if do_normalize is not None else self.do_normalize
         resample = resample if resample is not None else self.resample
         rescale_factor = rescale_factor if rescale_factor is not None else self.rescale_factor
         image_mean = image_mean if image_mean is not None else self.image_mean
         image_std = image_std if image_std is not None else self.image_std
+        output_dtype = output_dtype if output_dtype is not None else self.output_dtype
 
         size = size if size is not None else self.size
-        size_dict = get_size_dict(size)
+        size_dict = get_volume_size_dict(size)
+        crop_size = crop_size if crop_size is not None else self.crop_size
+        crop_size = get_volume_size_dict(crop_size, param_name="crop_size")
 
-        images = make_list_of_images(images)
+        images = make_list_of_volumes(images)
 
-        if not valid_images(images):
+        if not all(is_valid_volume(image) for image in images):
             raise ValueError(
-                "Invalid image type. Must be of type PIL.Image.Image, numpy.ndarray, "
-                "torch.Tensor, tf.Tensor or jax.ndarray."
+                "Invalid image type. Must be of type PIL.Image.Image, numpy.ndarray, torch.Tensor, tf.Tensor, "
+                "jax.ndarray, a path to a volume file or a lazy array handle."
             )
 
         if do_resize and size is None:
             raise ValueError("Size must be specified if do_resize is True.")
 
+        if do_center_crop and crop_size is None:
+            raise ValueError("Crop size must be specified if do_center_crop is True.")
+
         if do_rescale and rescale_factor is None:
             raise ValueError("Rescale factor must be specified if do_rescale is True.")
 
-        # All transformations expect numpy arrays.
-        images = [to_numpy_array(image) for image in images]
-
-        if do_resize:
-            images = [self.resize(image=image, size=size_dict, resample=resample) for image in images]
-
-        if do_rescale:
-            images = [self.rescale(image=image, scale=rescale_factor) for image in images]
-
-        if do_normalize:
-            images = [self.normalize(image=image, mean=image_mean, std=image_std) for image in images]
-
-        images = [to_channel_dimension_format(image, data_format) for image in images]
+        # Volume files are memory-mapped rather than read
+        images = [load_volume(image) if isinstance(image, (str, os.PathLike)) else image for image in images]
+
+        # All transformations expect numpy arrays. Lazy volumes are left as is until they are read.
+        images = [image if is_lazy_volume(image) else to_numpy_array(image) for image in images]
+
+        if all(len(image.shape) == 4 for image in images):
+            inputs = images
+
+            if any(is_lazy_volume(image) for image in images) or (do_resize and do_center_crop):
+                # Resizing and cropping are fused with the read, so that only the region of each volume covered by
+                # the cropped output is loaded (and interpolated)
+                volume_size = (size_dict.get("depth"), size_dict["height"], size_dict["width"]) if do_resize else None
+                volume_crop_size = (
+                    (crop_size.get("depth"), crop_size["height"], crop_size["width"]) if do_center_crop else None
+                )
+                images = [
+                    read_volume(image, size=volume_size, crop_size=volume_crop_size, resample=resample)
+                    for image in images
+                ]
+                do_resize = do_center_crop = False
+
+            # Volumes are processed channels first, so that every transform works on the trailing
+            # (depth, height, width) axes
+            images = [to_volume_channel_dimension_format(image, ChannelDimension.FIRST) for image in images]
+
+            if do_resize:
+                if len(images) > 1 and len({image.shape for image in images}) == 1:
+                    # Volumes of the same shape are resized as one batch in a single call
+                    images = list(
+                        self.resize(
+                            image=np.stack(images),
+                            size=size_dict,
+                            resample=resample,
+                            data_format=ChannelDimension.FIRST,
+                        )
+                    )
+                else:
+                    images = [
+                        self.resize(image=image, size=size_dict, resample=resample, data_format=ChannelDimension.FIRST)
+                        for image in images
+                    ]
+
+            if do_center_crop:
+                images = [
+                    self.center_crop(image=image, size=crop_size, data_format=ChannelDimension.FIRST)
+                    for image in images
+                ]
+
+            if do_rescale or do_normalize:
+                # Rescaling, normalization, the cast to `output_dtype` and the conversion to `data_format` are done in
+                # a single pass, in place when the volume is a buffer allocated by one of the previous transforms. Input
+                # arrays, memory-mapped files included, are never written to.
+                images = [
+                    rescale_and_normalize_volume(
+                        image,
+                        scale=rescale_factor if do_rescale else None,
+                        mean=image_mean if do_normalize else None,
+                        std=image_std if do_normalize else None,
+                        dtype=output_dtype,
+                        data_format=data_format,
+                        inplace=not isinstance(original, np.ndarray) or not np.may_share_memory(image, original),
+                    )
+                    for image, original in zip(images, inputs)
+                ]
+            else:
+                images = [
+                    to_volume_channel_dimension_format(image, data_format, ChannelDimension.FIRST) for image in images
+                ]
+        else:
+            if do_resize:
+                images = [self.resize(image=image, size=size_dict, resample=resample) for image in images]
+
+            if do_center_crop:
+                images = [self.center_crop(image=image, size=crop_size) for image in images]
+
+            if do_rescale:
+                images = [self.rescale(image=image, scale=rescale_factor) for image in images]
+
+            if do_normalize:
+                images = [self.normalize(image=image, mean=image_mean, std=image_std) for image in images]
+
+            images = [to_channel_dimension_format(image, data_format) for image in images]
 
         data = {"pixel_values": images}
         return BatchFeature(data=data, tensor_type=return_tensors)
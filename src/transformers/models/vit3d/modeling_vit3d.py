@@ -16,6 +16,7 @@
 
 
 import collections.abc
+import itertools
 import math
 from typing import Dict, List, Optional, Set, Tuple, Union
 
@@ -32,8 +33,13 @@ from ...modeling_outputs import (
     MaskedImageModelingOutput,
 )
 from ...modeling_utils import PreTrainedModel
-from ...pytorch_utils import find_pruneable_heads_and_indices, prune_linear_layer
+from ...pytorch_utils import (
+    find_pruneable_heads_and_indices,
+    is_torch_greater_or_equal_than_2_0,
+    prune_linear_layer,
+)
 from ...utils import (
+    ModelOutput,
     add_code_sample_docstrings,
     add_start_docstrings,
     add_start_docstrings_to_model_forward,
@@ -79,40 +85,60 @@ class Vit3dEmbeddings(nn.Module):
         self.position_embeddings = nn.Parameter(torch.randn(1, num_patches + 1, config.hidden_size))
         self.dropout = nn.Dropout(config.hidden_dropout_prob)
         self.config = config
+        self.grid_size = tuple(
+            size // patch for size, patch in zip(self.patch_embeddings.image_size, self.patch_embeddings.patch_size)
+        )
+        self._pos_encoding_cache = collections.OrderedDict()
 
     def interpolate_pos_encoding(self, embeddings: torch.Tensor, depth: int, height: int, width: int) -> torch.Tensor:
         """
         This method allows to interpolate the pre-trained position encodings, to be able to use the model on higher
-        resolution images.
+        resolution volumes.
+
+        When no gradient flows to the position embeddings, the interpolated tables are cached per patch grid shape (see
+        `config.pos_encoding_cache_size`), so that serving a few resolutions does not interpolate on every forward.
 
         Source:
         https://github.com/facebookresearch/dino/blob/de9ee3df6cf39fac952ab558447af1fa1365362a/vision_transformer.py#L174
         """
-
-        num_patches = embeddings.shape[1] - 1
-        num_positions = self.position_embeddings.shape[1] - 1
-        if num_patches == num_positions and height == width:
+        patch_size = self.patch_embeddings.patch_size
+        grid_size = (depth // patch_size[0], height // patch_size[1], width // patch_size[2])
+        if grid_size == self.grid_size:
             return self.position_embeddings
-        class_pos_embed = self.position_embeddings[:, 0]
-        patch_pos_embed = self.position_embeddings[:, 1:]
+
+        position_embeddings = self.position_embeddings
+        use_cache = self.config.pos_encoding_cache_size > 0 and not (
+            torch.is_grad_enabled() and position_embeddings.requires_grad
+        )
+        # the version counter changes whenever the weights are updated in place (optimizer step, `load_state_dict`)
+        cache_key = (
+            grid_size,
+            position_embeddings.device,
+            position_embeddings.dtype,
+            position_embeddings.data_ptr(),
+            position_embeddings._version,
+        )
+        if use_cache and cache_key in self._pos_encoding_cache:
+            self._pos_encoding_cache.move_to_end(cache_key)
+            return self._pos_encoding_cache[cache_key]
+
+        class_pos_embed = position_embeddings[:, :1]
         dim = embeddings.shape[-1]
-        d0 = depth // self.config.patch_size
-        h0 = height // self.config.patch_size
-        w0 = width // self.config.patch_size
-        # we add a small number to avoid floating point error in the interpolation
-        # see discussion at https://github.com/facebookresearch/dino/issues/8
-        d0, h0, w0 = d0 + 0.1, h0 + 0.1, w0 + 0.1
-        patch_pos_embed = patch_pos_embed.reshape(1, int(num_positions**(1/3.0)), int(num_positions**(1/3.0)), dim)
-        patch_pos_embed = patch_pos_embed.permute(0, 4, 1, 2, 3)
+        patch_pos_embed = position_embeddings[:, 1:].reshape(1, *self.grid_size, dim).permute(0, 4, 1, 2, 3)
         patch_pos_embed = nn.functional.interpolate(
-            patch_pos_embed,
-            scale_factor=(h0 / (num_positions**(1/3.0)), w0 / (num_positions**(1/3.0))),
-            mode="trilinear",
-            align_corners=False,
-        )
-        assert int(d0) == patch_pos_embed[-3] and int(h0) == patch_pos_embed.shape[-2] and int(w0) == patch_pos_embed.shape[-1]
-        patch_pos_embed = patch_pos_embed.permute(0, 2, 3, 4, 1).view(1, -1, dim)
-        return torch.cat((class_pos_embed.unsqueeze(0), patch_pos_embed), dim=1)
+            patch_pos_embed.to(torch.float32), size=grid_size, mode="trilinear", align_corners=False
+        ).to(position_embeddings.dtype)
+        patch_pos_embed = patch_pos_embed.permute(0, 2, 3, 4, 1).reshape(1, -1, dim)
+        interpolated = torch.cat((class_pos_embed, patch_pos_embed), dim=1)
+
+        if use_cache:
+            # tables computed from outdated weights can never be hit again
+            for key in [key for key in self._pos_encoding_cache if key[1:] != cache_key[1:]]:
+                del self._pos_encoding_cache[key]
+            self._pos_encoding_cache[cache_key] = interpolated
+            if len(self._pos_encoding_cache) > self.config.pos_encoding_cache_size:
+                self._pos_encoding_cache.popitem(last=False)
+        return interpolated
 
     def forward(
         self,
@@ -136,7 +162,7 @@ class Vit3dEmbeddings(nn.Module):
 
         # add positional encoding to each token
         if interpolate_pos_encoding:
-            embeddings = embeddings + self.interpolate_pos_encoding(embeddings, height, width)
+            embeddings = embeddings + self.interpolate_pos_encoding(embeddings, depth, height, width)
         else:
             embeddings = embeddings + self.position_embeddings
 
@@ -203,6 +229,11 @@ class Vit3dSelfAttention(nn.Module):
 
         self.dropout = nn.Dropout(config.attention_probs_dropout_prob)
 
+        self.attention_type = config.attention_type
+        self.attention_chunk_size = config.attention_chunk_size
+        if self.attention_type == "sdpa" and not is_torch_greater_or_equal_than_2_0:
+            raise ValueError("`attention_type='sdpa'` requires PyTorch >= 2.0.")
+
     def transpose_for_scores(self, x: torch.Tensor) -> torch.Tensor:
         new_x_shape = x.size()[:-1] + (self.num_attention_heads, self.attention_head_size)
         x = x.view(new_x_shape)
@@ -217,6 +248,38 @@ class Vit3dSelfAttention(nn.Module):
         value_layer = self.transpose_for_scores(self.value(hidden_states))
         query_layer = self.transpose_for_scores(mixed_query_layer)
 
+        attention_probs = None
+        if output_attentions or head_mask is not None or self.attention_type == "eager":
+            context_layer, attention_probs = self._eager_attention(query_layer, key_layer, value_layer, head_mask)
+        elif self.attention_type == "sdpa":
+            context_layer = nn.functional.scaled_dot_product_attention(
+                query_layer, key_layer, value_layer, dropout_p=self.dropout.p if self.training else 0.0
+            )
+        else:
+            # only a (chunk_size, seq_length) slice of the attention matrix is materialized at once
+            context_layer = torch.cat(
+                [
+                    self._eager_attention(query_chunk, key_layer, value_layer)[0]
+                    for query_chunk in query_layer.split(self.attention_chunk_size, dim=2)
+                ],
+                dim=2,
+            )
+
+        context_layer = context_layer.permute(0, 2, 1, 3).contiguous()
+        new_context_layer_shape = context_layer.size()[:-2] + (self.all_head_size,)
+        context_layer = context_layer.view(new_context_layer_shape)
+
+        outputs = (context_layer, attention_probs) if output_attentions else (context_layer,)
+
+        return outputs
+
+    def _eager_attention(
+        self,
+        query_layer: torch.Tensor,
+        key_layer: torch.Tensor,
+        value_layer: torch.Tensor,
+        head_mask: Optional[torch.Tensor] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
         # Take the dot product between "query" and "key" to get the raw attention scores.
         attention_scores = torch.matmul(query_layer, key_layer.transpose(-1, -2))
 
@@ -234,14 +297,7 @@ class Vit3dSelfAttention(nn.Module):
             attention_probs = attention_probs * head_mask
 
         context_layer = torch.matmul(attention_probs, value_layer)
-
-        context_layer = context_layer.permute(0, 2, 1, 3).contiguous()
-        new_context_layer_shape = context_layer.size()[:-2] + (self.all_head_size,)
-        context_layer = context_layer.view(new_context_layer_shape)
-
-        outputs = (context_layer, attention_probs) if output_attentions else (context_layer,)
-
-        return outputs
+        return context_layer, attention_probs
 
 
 class Vit3dSelfOutput(nn.Module):
@@ -473,6 +529,157 @@ class Vit3dPreTrainedModel(PreTrainedModel):
         if isinstance(module, Vit3dEncoder):
             module.gradient_checkpointing = value
 
+    # Outputs stitched by `sliding_window_forward`, mapped to their layout: "tokens" for a [CLS] token followed by the
+    # patch grid, "voxels" for a volume at input resolution and "global" for one vector per volume.
+    _sliding_window_outputs = {}
+
+    @torch.no_grad()
+    def sliding_window_forward(
+        self,
+        pixel_values: torch.Tensor,
+        tile_overlap: float = 0.25,
+        tile_batch_size: int = 4,
+        sigma_scale: float = 0.125,
+        output_device: Optional[Union[str, torch.device]] = None,
+    ) -> ModelOutput:
+        r"""
+        Runs inference on volumes of any size by splitting them into overlapping tiles of `config.image_size`,
+        batching the tiles through the model and stitching the outputs back together.
+
+        Patch features and reconstructions of overlapping tiles are blended with a Gaussian importance map so that
+        tile borders do not show in the result, volume-level outputs (pooled features, classification logits) are
+        averaged over all tiles. Only `tile_batch_size` tiles live on the model device at once, the stitched outputs
+        are accumulated on `output_device`, so the peak memory does not depend on the size of the volume.
+
+        Args:
+            pixel_values (`torch.FloatTensor` of shape `(batch_size, num_channels, depth, height, width)`):
+                Pixel values. Volumes smaller than `config.image_size` or not divisible by `config.patch_size` are
+                zero-padded at the end.
+            tile_overlap (`float`, *optional*, defaults to 0.25):
+                Fraction of a tile shared with its neighbours along each axis. The stride between tiles is rounded
+                down to a multiple of the patch size so that all tiles share the same patch grid.
+            tile_batch_size (`int`, *optional*, defaults to 4):
+                Number of tile positions run through the model in a single forward pass.
+            sigma_scale (`float`, *optional*, defaults to 0.125):
+                Standard deviation of the Gaussian importance map, relative to the tile size.
+            output_device (`str` or `torch.device`, *optional*):
+                Device on which the stitched outputs are accumulated. Defaults to the device of `pixel_values`.
+
+        Returns:
+            The output class of the model's forward, holding the stitched outputs. `last_hidden_state` holds the
+            [CLS] token followed by the patch features of the whole (padded) volume, `reconstruction` has the same
+            spatial size as `pixel_values`.
+        """
+        if not self._sliding_window_outputs:
+            raise ValueError(f"{self.__class__.__name__} does not support sliding window inference.")
+        if not 0 <= tile_overlap < 1:
+            raise ValueError(f"`tile_overlap` should be in [0, 1), got {tile_overlap}.")
+
+        patch_embeddings = self.get_input_embeddings()
+        tile_size, patch_size = patch_embeddings.image_size, patch_embeddings.patch_size
+        batch_size = pixel_values.shape[0]
+        volume_size = pixel_values.shape[-3:]
+        output_device = pixel_values.device if output_device is None else torch.device(output_device)
+        model_device = patch_embeddings.projection.weight.device
+
+        # pad so that every axis holds at least one tile and a whole number of patches
+        padded_size = [
+            max(tile, math.ceil(size / patch) * patch) for size, tile, patch in zip(volume_size, tile_size, patch_size)
+        ]
+        padding = [padded - size for padded, size in zip(padded_size, volume_size)]
+        if any(padding):
+            pixel_values = nn.functional.pad(pixel_values, (0, padding[2], 0, padding[1], 0, padding[0]))
+
+        tile_starts = []
+        for size, tile, patch in zip(padded_size, tile_size, patch_size):
+            stride = max(patch, int(tile * (1 - tile_overlap)) // patch * patch)
+            starts = list(range(0, size - tile + 1, stride))
+            if starts[-1] != size - tile:
+                starts.append(size - tile)
+            tile_starts.append(starts)
+        tile_starts = list(itertools.product(*tile_starts))
+
+        grid_size = [tile // patch for tile, patch in zip(tile_size, patch_size)]
+        voxel_centers = [torch.arange(tile) + 0.5 for tile in tile_size]
+        patch_centers = [(torch.arange(grid) + 0.5) * patch for grid, patch in zip(grid_size, patch_size)]
+        importance_maps = {
+            "voxels": _gaussian_importance_map(voxel_centers, tile_size, sigma_scale),
+            "tokens": _gaussian_importance_map(patch_centers, tile_size, sigma_scale),
+        }
+        importance_maps = {kind: weight.to(output_device) for kind, weight in importance_maps.items()}
+        scales = {"voxels": (1, 1, 1), "tokens": patch_size}
+
+        sums, weights, counts = {}, {}, 0
+        for index in range(0, len(tile_starts), tile_batch_size):
+            starts = tile_starts[index : index + tile_batch_size]
+            tiles = torch.stack(
+                [
+                    pixel_values[:, :, z : z + tile_size[0], y : y + tile_size[1], x : x + tile_size[2]]
+                    for z, y, x in starts
+                ]
+            )
+            outputs = self(pixel_values=tiles.flatten(0, 1).to(model_device), return_dict=True)
+            counts += len(starts)
+
+            for name, kind in self._sliding_window_outputs.items():
+                value = outputs[name]
+                if value is None:
+                    continue
+                value = value.to(output_device, torch.float32)
+                value = value.reshape(len(starts), batch_size, *value.shape[1:])
+                if kind == "tokens":
+                    sums[f"{name}_cls"] = sums.get(f"{name}_cls", 0) + value[:, :, 0].sum(0)
+                    # (tiles, batch_size, grid_depth, grid_height, grid_width, hidden_size) -> channels first
+                    value = value[:, :, 1:].reshape(len(starts), batch_size, *grid_size, -1)
+                    value = value.permute(0, 1, 5, 2, 3, 4)
+                if kind == "global":
+                    sums[name] = sums.get(name, 0) + value.sum(0)
+                    continue
+
+                scale = scales[kind]
+                if name not in sums:
+                    size = [padded // step for padded, step in zip(padded_size, scale)]
+                    sums[name] = torch.zeros(batch_size, value.shape[2], *size, device=output_device)
+                    weights[name] = torch.zeros(size, device=output_device)
+                weight = importance_maps[kind]
+                for (z, y, x), tile_value in zip(starts, value):
+                    z, y, x = z // scale[0], y // scale[1], x // scale[2]
+                    window = tuple(slice(start, start + size) for start, size in zip((z, y, x), weight.shape))
+                    sums[name][(Ellipsis,) + window] += tile_value * weight
+                    weights[name][window] += weight
+
+        stitched = {}
+        for name, kind in self._sliding_window_outputs.items():
+            if name not in sums:
+                continue
+            dtype = pixel_values.dtype if kind == "voxels" else patch_embeddings.projection.weight.dtype
+            if kind == "global":
+                stitched[name] = (sums[name] / counts).to(dtype)
+                continue
+            value = sums[name] / weights[name]
+            if kind == "voxels":
+                value = value[..., : volume_size[0], : volume_size[1], : volume_size[2]]
+            else:
+                # (batch_size, hidden_size, depth, height, width) -> (batch_size, 1 + num_patches, hidden_size)
+                value = torch.cat([(sums[f"{name}_cls"] / counts).unsqueeze(1), value.flatten(2).transpose(1, 2)], 1)
+            stitched[name] = value.to(dtype)
+
+        return outputs.__class__(**stitched)
+
+
+def _gaussian_importance_map(
+    coordinates: List[torch.Tensor], tile_size: Tuple[int, int, int], sigma_scale: float
+) -> torch.Tensor:
+    """
+    Separable Gaussian weights centered on the tile, evaluated at the given per-axis `coordinates` (in voxels).
+    """
+    weight = None
+    for axis_coordinates, size in zip(coordinates, tile_size):
+        sigma = max(sigma_scale * size, 1e-3)
+        axis_weight = torch.exp(-((axis_coordinates - size / 2) ** 2) / (2 * sigma**2))
+        weight = axis_weight if weight is None else weight[..., None] * axis_weight
+    return weight / weight.max()
+
 
 VIT3D_START_DOCSTRING = r"""
     This model is a PyTorch [torch.nn.Module](https://pytorch.org/docs/stable/nn.html#torch.nn.Module) subclass. Use it
@@ -515,6 +722,8 @@ VIT3D_INPUTS_DOCSTRING = r"""
     VIT3D_START_DOCSTRING,
 )
 class Vit3dModel(Vit3dPreTrainedModel):
+    _sliding_window_outputs = {"last_hidden_state": "tokens", "pooler_output": "global"}
+
     def __init__(self, config: Vit3dConfig, add_pooling_layer: bool = True, use_mask_token: bool = False):
         super().__init__(config)
         self.config = config
@@ -609,6 +818,25 @@ class Vit3dModel(Vit3dPreTrainedModel):
         )
 
 
+class Vit3dPixelShuffle(nn.Module):
+    """
+    Volumetric counterpart of `nn.PixelShuffle`: rearranges a tensor of shape `(batch_size, num_channels * r**3,
+    depth, height, width)` into `(batch_size, num_channels, depth * r, height * r, width * r)`.
+    """
+
+    def __init__(self, upscale_factor: int) -> None:
+        super().__init__()
+        self.upscale_factor = upscale_factor
+
+    def forward(self, hidden_states: torch.Tensor) -> torch.Tensor:
+        batch_size, num_channels, depth, height, width = hidden_states.shape
+        factor = self.upscale_factor
+        num_channels = num_channels // factor**3
+        hidden_states = hidden_states.reshape(batch_size, num_channels, factor, factor, factor, depth, height, width)
+        hidden_states = hidden_states.permute(0, 1, 5, 2, 6, 3, 7, 4)
+        return hidden_states.reshape(batch_size, num_channels, depth * factor, height * factor, width * factor)
+
+
 class Vit3dPooler(nn.Module):
     def __init__(self, config: Vit3dConfig):
         super().__init__()
@@ -637,6 +865,8 @@ class Vit3dPooler(nn.Module):
     VIT3D_START_DOCSTRING,
 )
 class Vit3dForMaskedImageModeling(Vit3dPreTrainedModel):
+    _sliding_window_outputs = {"reconstruction": "voxels"}
+
     def __init__(self, config: Vit3dConfig) -> None:
         super().__init__(config)
 
@@ -648,7 +878,7 @@ class Vit3dForMaskedImageModeling(Vit3dPreTrainedModel):
                 out_channels=config.encoder_stride**3 * config.num_channels,
                 kernel_size=1,
             ),
-            nn.PixelShuffle(config.encoder_stride),
+            Vit3dPixelShuffle(config.encoder_stride),
         )
 
         # Initialize weights and apply final processing
@@ -719,7 +949,8 @@ class Vit3dForMaskedImageModeling(Vit3dPreTrainedModel):
         # Reshape to (batch_size, num_channels, depth, height, width)
         sequence_output = sequence_output[:, 1:]
         batch_size, sequence_length, num_channels = sequence_output.shape
-        depth = height = width = math.floor(sequence_length**(1/3.0))
+        patch_size = self.vit3d.embeddings.patch_embeddings.patch_size
+        depth, height, width = [size // patch for size, patch in zip(pixel_values.shape[-3:], patch_size)]
         sequence_output = sequence_output.permute(0, 2, 1).reshape(batch_size, num_channels, depth, height, width)
 
         # Reconstruct pixel values
@@ -727,8 +958,7 @@ class Vit3dForMaskedImageModeling(Vit3dPreTrainedModel):
 
         masked_im_loss = None
         if bool_masked_pos is not None:
-            size = self.config.image_size // self.config.patch_size
-            bool_masked_pos = bool_masked_pos.reshape(-1, size, size, size)
+            bool_masked_pos = bool_masked_pos.reshape(-1, depth, height, width)
             mask = (
                 bool_masked_pos.repeat_interleave(self.config.patch_size, 1)
                 .repeat_interleave(self.config.patch_size, 2)
@@ -767,6 +997,8 @@ class Vit3dForMaskedImageModeling(Vit3dPreTrainedModel):
     VIT3D_START_DOCSTRING,
 )
 class Vit3dForImageClassification(Vit3dPreTrainedModel):
+    _sliding_window_outputs = {"logits": "global"}
+
     def __init__(self, config: Vit3dConfig) -> None:
         super().__init__(config)
 
@@ -78,6 +78,28 @@ class ViTMAE3DConfig(PretrainedConfig):
         norm_pix_loss (`bool`, *optional*, defaults to `False`):
             Whether or not to train with normalized pixels (see Table 3 in the paper). Using normalized pixels improved
             representation quality in the experiments of the authors.
+        predict_masked_only (`bool`, *optional*, defaults to `False`):
+            Whether the decoder head of [`ViTMAE3DForPreTraining`] only predicts the masked patches, in which case only
+            those patches are gathered from the target to compute the loss. The predicted `logits` then have shape
+            `(batch_size, num_masked_patches, ...)`, ordered like the masked patches in the volume.
+        mask_type (`str`, *optional*, defaults to `"random"`):
+            How the patches are masked during pre-training when no `noise` is passed to the model: `"random"` masks
+            every patch independently, `"tube"` masks a patch position across the whole depth of the volume and
+            `"block"` masks aligned blocks of `mask_block_size` patches together.
+        mask_block_size (`List[int]`, *optional*, defaults to `[2, 2, 2]`):
+            The `(depth, height, width)` size, in patches, of the blocks masked together when `mask_type="block"`.
+        attention_type (`str`, *optional*, defaults to `"eager"`):
+            Implementation of the self-attention. Can be one of:
+
+            - `"eager"`: computes the full attention matrix explicitly.
+            - `"sdpa"`: uses `torch.nn.functional.scaled_dot_product_attention` (requires PyTorch >= 2.0), which
+              dispatches to memory-efficient or flash kernels when available.
+            - `"chunked"`: computes the attention by blocks of `attention_chunk_size` queries, so that only a
+              `(attention_chunk_size, sequence_length)` slice of the attention matrix is kept in memory at once.
+
+            The eager implementation is always used when `output_attentions=True` or a `head_mask` is passed.
+        attention_chunk_size (`int`, *optional*, defaults to 1024):
+            Number of queries per block when `attention_type="chunked"`.
 
     Example:
 
@@ -116,6 +138,11 @@ class ViTMAE3DConfig(PretrainedConfig):
         decoder_intermediate_size=1536,
         mask_ratio=0.75,
         norm_pix_loss=False,
+        predict_masked_only=False,
+        mask_type="random",
+        mask_block_size=[2, 2, 2],
+        attention_type="eager",
+        attention_chunk_size=1024,
         **kwargs,
     ):
         super().__init__(**kwargs)
@@ -139,3 +166,14 @@ class ViTMAE3DConfig(PretrainedConfig):
         self.decoder_intermediate_size = decoder_intermediate_size
         self.mask_ratio = mask_ratio
         self.norm_pix_loss = norm_pix_loss
+        self.predict_masked_only = predict_masked_only
+
+        if mask_type not in ["random", "tube", "block"]:
+            raise ValueError(f"`mask_type` should be one of 'random', 'tube' or 'block', got {mask_type}.")
+        self.mask_type = mask_type
+        self.mask_block_size = mask_block_size
+
+        if attention_type not in ["eager", "sdpa", "chunked"]:
+            raise ValueError(f"`attention_type` should be one of 'eager', 'sdpa' or 'chunked', got {attention_type}.")
+        self.attention_type = attention_type
+        self.attention_chunk_size = attention_chunk_size
@@ -19,6 +19,7 @@ import collections.abc
 import math
 from copy import deepcopy
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional, Set, Tuple, Union
 
 import numpy as np
@@ -29,7 +30,11 @@ from torch import nn
 from ...activations import ACT2FN
 from ...modeling_outputs import BaseModelOutput
 from ...modeling_utils import PreTrainedModel
-from ...pytorch_utils import find_pruneable_heads_and_indices, prune_linear_layer
+from ...pytorch_utils import (
+    find_pruneable_heads_and_indices,
+    is_torch_greater_or_equal_than_2_0,
+    prune_linear_layer,
+)
 from ...utils import (
     ModelOutput,
     add_start_docstrings,
@@ -117,8 +122,9 @@ class ViTMAE3DForPreTrainingOutput(ModelOutput):
     Args:
         loss (`torch.FloatTensor` of shape `(1,)`):
             Pixel reconstruction loss.
-        logits (`torch.FloatTensor` of shape `(batch_size, sequence_length, patch_size ** 2 * num_channels)`):
-            Pixel reconstruction logits.
+        logits (`torch.FloatTensor` of shape `(batch_size, sequence_length, patch_size ** 3 * num_channels)`):
+            Pixel reconstruction logits. Only the masked patches are predicted when `config.predict_masked_only` is
+            set, the sequence length is then the number of masked patches.
         mask (`torch.FloatTensor` of shape `(batch_size, sequence_length)`):
             Tensor indicating which patches are masked (1) and which are not (0).
         ids_restore (`torch.LongTensor` of shape `(batch_size, sequence_length)`):
@@ -141,48 +147,59 @@ class ViTMAE3DForPreTrainingOutput(ModelOutput):
     attentions: Optional[Tuple[torch.FloatTensor]] = None
 
 # MLIU: Done
-def get_3d_sincos_pos_embed(embed_dim, grid_size, add_cls_token=False):
+def get_3d_sincos_pos_embed(embed_dim, grid_size, add_cls_token=False, device=None):
     """
     Create 3D sin/cos positional embeddings.
 
     Args:
         embed_dim (`int`):
             Embedding dimension.
-        grid_size (`int`):
-            The grid depth, height and width.
+        grid_size (`int` or `Tuple[int, int, int]`):
+            The grid depth, height and width. An `int` is used for all three axes.
         add_cls_token (`bool`, *optional*, defaults to `False`):
             Whether or not to add a classification (CLS) token.
+        device (`torch.device`, *optional*):
+            Device on which the embeddings are created. Defaults to the CPU.
 
     Returns:
-        (`torch.FloatTensor` of shape (grid_size*grid_size*grid_size, embed_dim) or (1+grid_size*grid_size*grid_size, embed_dim): the
-        position embeddings (with or without classification token)
+        (`torch.FloatTensor` of shape (depth*height*width, embed_dim) or (1+depth*height*width, embed_dim): the
+        position embeddings (with or without classification token). Tables are memoized per arguments, so the returned
+        tensor is shared and must not be modified in place.
     """
-    grid_d = np.arange(grid_size, dtype=np.float32)
-    grid_h = np.arange(grid_size, dtype=np.float32)
-    grid_w = np.arange(grid_size, dtype=np.float32)
-    # grid = np.meshgrid(grid_w, grid_h)  # here w goes first
-    grid = np.meshgrid(grid_w, grid_h, grid_d)
-    grid = np.stack(grid, axis=0)
-
-    grid = grid.reshape([3, 1, grid_size, grid_size, grid_size])
+    if isinstance(grid_size, int):
+        grid_size = (grid_size, grid_size, grid_size)
+    device = torch.device("cpu") if device is None else torch.device(device)
+    return _get_3d_sincos_pos_embed(embed_dim, tuple(grid_size), add_cls_token, device)
+
+
+@lru_cache(maxsize=32)
+def _get_3d_sincos_pos_embed(embed_dim, grid_size, add_cls_token, device):
+    grid_d, grid_h, grid_w = [torch.arange(size, dtype=torch.float32, device=device) for size in grid_size]
+    grid_d, grid_h, grid_w = torch.meshgrid(grid_d, grid_h, grid_w, indexing="ij")
+    # patches are flattened in (depth, height, width) order, the thirds of the embedding encode the height, depth and
+    # width coordinates, which is the layout of the original `np.meshgrid` based tables
+    grid = torch.stack([grid_h, grid_d, grid_w], dim=0)
+
     pos_embed = get_3d_sincos_pos_embed_from_grid(embed_dim, grid)
     if add_cls_token:
-        pos_embed = np.concatenate([np.zeros([1, embed_dim]), pos_embed], axis=0)
+        pos_embed = torch.cat([pos_embed.new_zeros(1, embed_dim), pos_embed], dim=0)
     return pos_embed
 
+
 # MLIU: Done
 def get_3d_sincos_pos_embed_from_grid(embed_dim, grid):
     if embed_dim % 6 != 0:
         raise ValueError("embed_dim must be divisible by 6")
 
-    # use a third of dimensions to encode grid_h
+    # use a third of dimensions to encode each axis of the grid
     emb_d = get_1d_sincos_pos_embed_from_grid(embed_dim // 3, grid[0])  # (D*H*W, d/3)
     emb_h = get_1d_sincos_pos_embed_from_grid(embed_dim // 3, grid[1])  # (D*H*W, d/3)
     emb_w = get_1d_sincos_pos_embed_from_grid(embed_dim // 3, grid[2])  # (D*H*W, d/3)
 
-    emb = np.concatenate([emb_d, emb_h, emb_w], axis=1)  # (D*H*W, d)
+    emb = torch.cat([emb_d, emb_h, emb_w], dim=1)  # (D*H*W, d)
     return emb
 
+
 # MLIU: Done
 def get_1d_sincos_pos_embed_from_grid(embed_dim, pos):
     """
@@ -191,20 +208,64 @@ def get_1d_sincos_pos_embed_from_grid(embed_dim, pos):
     if embed_dim % 2 != 0:
         raise ValueError("embed_dim must be even")
 
-    omega = np.arange(embed_dim // 2, dtype=float)
+    omega = torch.arange(embed_dim // 2, dtype=torch.float32, device=pos.device)
     omega /= embed_dim / 2.0
     omega = 1.0 / 10000**omega  # (D/2,)
 
     pos = pos.reshape(-1)  # (M,)
-    out = np.einsum("m,d->md", pos, omega)  # (M, D/2), outer product
+    out = torch.outer(pos, omega)  # (M, D/2), outer product
 
-    emb_sin = np.sin(out)  # (M, D/2)
-    emb_cos = np.cos(out)  # (M, D/2)
+    emb_sin = torch.sin(out)  # (M, D/2)
+    emb_cos = torch.cos(out)  # (M, D/2)
 
-    emb = np.concatenate([emb_sin, emb_cos], axis=1)  # (M, D)
+    emb = torch.cat([emb_sin, emb_cos], dim=1)  # (M, D)
     return emb
 
 
+def generate_mask_noise(
+    batch_size, grid_size, mask_type="random", mask_block_size=(2, 2, 2), generator=None, device=None
+):
+    """
+    Draw the masking noise of shape `(batch_size, num_patches)` for a `(depth, height, width)` patch grid. The patches
+    with the lowest noise are kept, so structured masks are expressed as noise that is constant over each masking unit.
+
+    Args:
+        batch_size (`int`):
+            Number of samples.
+        grid_size (`Tuple[int, int, int]`):
+            The `(depth, height, width)` number of patches.
+        mask_type (`str`, *optional*, defaults to `"random"`):
+            `"random"` masks every patch independently, `"tube"` masks a patch position across the whole depth and
+            `"block"` masks aligned blocks of `mask_block_size` patches together.
+        mask_block_size (`Tuple[int, int, int]`, *optional*, defaults to `(2, 2, 2)`):
+            Size (in patches) of the blocks masked together when `mask_type="block"`.
+        generator (`torch.Generator`, *optional*):
+            Generator used to draw the noise, on its own device, e.g. a seeded CPU generator for masks that do not
+            depend on the device the model runs on.
+        device (`torch.device`, *optional*):
+            Device of the returned noise.
+    """
+    grid_size = tuple(grid_size)
+    if mask_type == "random":
+        unit_size = (1, 1, 1)
+    elif mask_type == "tube":
+        unit_size = (grid_size[0], 1, 1)
+    elif mask_type == "block":
+        unit_size = tuple(mask_block_size)
+    else:
+        raise ValueError(f"`mask_type` should be one of 'random', 'tube' or 'block', got {mask_type}.")
+
+    # one noise value per masking unit, repeated over the patches of the unit
+    unit_grid = [-(-grid // unit) for grid, unit in zip(grid_size, unit_size)]
+    noise_device = generator.device if generator is not None else device
+    noise = torch.rand(batch_size, *unit_grid, generator=generator, device=noise_device)
+    for axis, unit in enumerate(unit_size, start=1):
+        if unit > 1:
+            noise = noise.repeat_interleave(unit, dim=axis)
+    noise = noise[:, : grid_size[0], : grid_size[1], : grid_size[2]]
+    return noise.reshape(batch_size, -1).to(device)
+
+
 # MLIU: WIP
 # Copied from transformers.models.vit_mae.modeling_vit_mae.ViTMAEEmbeddings with ViTMAE->ViTMAE3D
 class ViTMAE3DEmbeddings(nn.Module):
@@ -229,58 +290,95 @@ class ViTMAE3DEmbeddings(nn.Module):
     def initialize_weights(self):
         # initialize (and freeze) position embeddings by sin-cos embedding
         pos_embed = get_3d_sincos_pos_embed(
-            self.position_embeddings.shape[-1], int(np.rint(np.cbrt(self.patch_embeddings.num_patches))), add_cls_token=True
+            self.position_embeddings.shape[-1],
+            self.patch_embeddings.grid_size,
+            add_cls_token=True,
+            device=self.position_embeddings.device,
         )
-        self.position_embeddings.data.copy_(torch.from_numpy(pos_embed).float().unsqueeze(0))
+        self.position_embeddings.data.copy_(pos_embed.unsqueeze(0))
 
-        # initialize patch_embeddings like nn.Linear (instead of nn.Conv2d)
+        # initialize patch_embeddings like nn.Linear (instead of nn.Conv3d)
         w = self.patch_embeddings.projection.weight.data
         torch.nn.init.xavier_uniform_(w.view([w.shape[0], -1]))
 
         # timm's trunc_normal_(std=.02) is effectively normal_(std=0.02) as cutoff is too big (2.)
         torch.nn.init.normal_(self.cls_token, std=self.config.initializer_range)
 
-    def random_masking(self, sequence, noise=None):
+    def random_masking_indices(self, batch_size, seq_length, noise=None, device=None, generator=None):
         """
-        Perform per-sample random masking by per-sample shuffling. Per-sample shuffling is done by argsort random
-        noise.
+        Draw the per-sample random masking as indices, without touching the patch embeddings. Unless `noise` is
+        provided, the patches are masked according to `config.mask_type`.
 
         Args:
-            sequence (`torch.LongTensor` of shape `(batch_size, sequence_length, dim)`)
+            batch_size (`int`):
+                Number of samples.
+            seq_length (`int`):
+                Number of patches per sample.
             noise (`torch.FloatTensor` of shape `(batch_size, sequence_length)`, *optional*) which is
                 mainly used for testing purposes to control randomness and maintain the reproducibility
+            device (`torch.device`, *optional*):
+                Device on which the noise is drawn when `noise` is not provided.
+            generator (`torch.Generator`, *optional*):
+                Generator used to draw the noise when `noise` is not provided (see [`generate_mask_noise`]).
+
+        Returns:
+            `tuple(torch.LongTensor, torch.FloatTensor, torch.LongTensor)`: the indices of the kept patches of shape
+            `(batch_size, len_keep)`, the binary mask (0 is keep, 1 is remove) and `ids_restore`, both of shape
+            `(batch_size, sequence_length)`.
         """
-        batch_size, seq_length, dim = sequence.shape
         len_keep = int(seq_length * (1 - self.config.mask_ratio))
 
         if noise is None:
-            noise = torch.rand(batch_size, seq_length, device=sequence.device)  # noise in [0, 1]
+            if self.config.mask_type == "random":
+                grid_size = (1, 1, seq_length)
+            else:
+                grid_size = self.patch_embeddings.grid_size
+            noise = generate_mask_noise(
+                batch_size, grid_size, self.config.mask_type, self.config.mask_block_size, generator, device
+            )
 
-        # sort noise for each sample
-        ids_shuffle = torch.argsort(noise, dim=1)  # ascend: small is keep, large is remove
-        ids_restore = torch.argsort(ids_shuffle, dim=1)
+        # only the kept patches need to be ranked: small is keep, large is remove
+        ids_keep = torch.topk(noise, len_keep, dim=1, largest=False).indices
 
-        # keep the first subset
-        ids_keep = ids_shuffle[:, :len_keep]
-        sequence_unmasked = torch.gather(sequence, dim=1, index=ids_keep.unsqueeze(-1).repeat(1, 1, dim))
+        # generate the binary mask: 0 is keep, 1 is remove, in the original patch order
+        mask = torch.ones_like(noise).scatter_(1, ids_keep, 0.0)
+
+        # the kept patches come first in the order of `ids_keep`, followed by the removed patches in their original
+        # order, whose rank is given by a cumulative sum rather than a second sort
+        ids_restore = (mask.long().cumsum(dim=1) + (len_keep - 1)).scatter_(
+            1, ids_keep, torch.arange(len_keep, device=noise.device).expand(batch_size, -1)
+        )
 
-        # generate the binary mask: 0 is keep, 1 is remove
-        mask = torch.ones([batch_size, seq_length], device=sequence.device)
-        mask[:, :len_keep] = 0
-        # unshuffle to get the binary mask
-        mask = torch.gather(mask, dim=1, index=ids_restore)
+        return ids_keep, mask, ids_restore
+
+    def random_masking(self, sequence, noise=None):
+        """
+        Perform per-sample random masking by per-sample shuffling. Per-sample shuffling is done by argsort random
+        noise.
+
+        Args:
+            sequence (`torch.LongTensor` of shape `(batch_size, sequence_length, dim)`)
+            noise (`torch.FloatTensor` of shape `(batch_size, sequence_length)`, *optional*) which is
+                mainly used for testing purposes to control randomness and maintain the reproducibility
+        """
+        batch_size, seq_length, dim = sequence.shape
+        ids_keep, mask, ids_restore = self.random_masking_indices(batch_size, seq_length, noise, sequence.device)
+        sequence_unmasked = torch.gather(sequence, dim=1, index=ids_keep.unsqueeze(-1).repeat(1, 1, dim))
 
         return sequence_unmasked, mask, ids_restore
 
     def forward(self, pixel_values, noise=None):
-        batch_size, num_channels, depth, height, width = pixel_values.shape
-        embeddings = self.patch_embeddings(pixel_values)
+        batch_size = pixel_values.shape[0]
+        ids_keep, mask, ids_restore = self.random_masking_indices(
+            batch_size, self.num_patches, noise, pixel_values.device
+        )
 
-        # add position embeddings w/o cls token
-        embeddings = embeddings + self.position_embeddings[:, 1:, :]
+        # masking: length -> length * config.mask_ratio, only the kept patches are projected
+        embeddings = self.patch_embeddings(pixel_values, ids_keep=ids_keep)
 
-        # masking: length -> length * config.mask_ratio
-        embeddings, mask, ids_restore = self.random_masking(embeddings, noise)
+        # add position embeddings w/o cls token
+        position_embeddings = self.position_embeddings[0, 1:, :]
+        embeddings = embeddings + position_embeddings[ids_keep]
 
         # append cls token
         cls_token = self.cls_token + self.position_embeddings[:, :1, :]
@@ -309,10 +407,11 @@ class ViTMAE3DPatchEmbeddings(nn.Module):
         self.patch_size = patch_size
         self.num_channels = num_channels
         self.num_patches = num_patches
+        self.grid_size = tuple(size // patch for size, patch in zip(image_size, patch_size))
 
         self.projection = nn.Conv3d(num_channels, hidden_size, kernel_size=patch_size, stride=patch_size)
 
-    def forward(self, pixel_values):
+    def forward(self, pixel_values, ids_keep=None):
         batch_size, num_channels, depth, height, width = pixel_values.shape
         if num_channels != self.num_channels:
             raise ValueError(
@@ -322,12 +421,46 @@ class ViTMAE3DPatchEmbeddings(nn.Module):
             raise ValueError(
                 f"Input image size ({depth}*{height}*{width}) doesn't match model ({self.image_size[0]}*{self.image_size[1]}*{self.image_size[2]})."
             )
-        x = self.projection(pixel_values).flatten(2).transpose(1, 2)
-        return x
+        if ids_keep is None or ids_keep.shape[1] == self.num_patches:
+            x = self.projection(pixel_values).flatten(2).transpose(1, 2)
+            return x if ids_keep is None else torch.gather(x, 1, ids_keep.unsqueeze(-1).expand(-1, -1, x.shape[-1]))
+
+        # the convolution has stride == kernel size, so it is a matmul over the flattened patches: only gather and
+        # project the kept ones, skipping the FLOPs and activations of the masked patches
+        patches = self.gather_patches(pixel_values, ids_keep)
+        return nn.functional.linear(patches, self.projection.weight.flatten(1), self.projection.bias)
+
+    def gather_patches(self, pixel_values, ids_keep):
+        """
+        Gather the patches at `ids_keep` (indices in the flattened `(depth, height, width)` patch grid) as a tensor of
+        shape `(batch_size, len_keep, num_channels * patch_depth * patch_height * patch_width)`. Only the gathered
+        patches are copied, the rest of the volume is never read.
+        """
+        batch_size, num_channels = pixel_values.shape[:2]
+        grid_size = self.grid_size
+        depth, height, width = [grid * patch for grid, patch in zip(grid_size, self.patch_size)]
+        pixel_values = pixel_values[..., :depth, :height, :width]
+        # (batch_size, grid_depth, grid_height, grid_width, num_channels, patch_depth, patch_height, patch_width) view
+        patches = pixel_values.reshape(
+            batch_size,
+            num_channels,
+            grid_size[0],
+            self.patch_size[0],
+            grid_size[1],
+            self.patch_size[1],
+            grid_size[2],
+            self.patch_size[2],
+        ).permute(0, 2, 4, 6, 1, 3, 5, 7)
+
+        batch_index = torch.arange(batch_size, device=ids_keep.device).unsqueeze(-1)
+        depth_index = ids_keep // (grid_size[1] * grid_size[2])
+        height_index = ids_keep // grid_size[2] % grid_size[1]
+        width_index = ids_keep % grid_size[2]
+        return patches[batch_index, depth_index, height_index, width_index].flatten(2)
 
 
 # MLIU: Done
-# Copied from transformers.models.vit.modeling_vit.ViTSelfAttention ViT->ViTMAE3D
+# Copied from transformers.models.vit3d.modeling_vit3d.Vit3dSelfAttention with Vit3d->ViTMAE3D
 class ViTMAE3DSelfAttention(nn.Module):
     def __init__(self, config: ViTMAE3DConfig) -> None:
         super().__init__()
@@ -347,6 +480,11 @@ class ViTMAE3DSelfAttention(nn.Module):
 
         self.dropout = nn.Dropout(config.attention_probs_dropout_prob)
 
+        self.attention_type = config.attention_type
+        self.attention_chunk_size = config.attention_chunk_size
+        if self.attention_type == "sdpa" and not is_torch_greater_or_equal_than_2_0:
+            raise ValueError("`attention_type='sdpa'` requires PyTorch >= 2.0.")
+
     def transpose_for_scores(self, x: torch.Tensor) -> torch.Tensor:
         new_x_shape = x.size()[:-1] + (self.num_attention_heads, self.attention_head_size)
         x = x.view(new_x_shape)
@@ -361,6 +499,38 @@ class ViTMAE3DSelfAttention(nn.Module):
         value_layer = self.transpose_for_scores(self.value(hidden_states))
         query_layer = self.transpose_for_scores(mixed_query_layer)
 
+        attention_probs = None
+        if output_attentions or head_mask is not None or self.attention_type == "eager":
+            context_layer, attention_probs = self._eager_attention(query_layer, key_layer, value_layer, head_mask)
+        elif self.attention_type == "sdpa":
+            context_layer = nn.functional.scaled_dot_product_attention(
+                query_layer, key_layer, value_layer, dropout_p=self.dropout.p if self.training else 0.0
+            )
+        else:
+            # only a (chunk_size, seq_length) slice of the attention matrix is materialized at once
+            context_layer = torch.cat(
+                [
+                    self._eager_attention(query_chunk, key_layer, value_layer)[0]
+                    for query_chunk in query_layer.split(self.attention_chunk_size, dim=2)
+                ],
+                dim=2,
+            )
+
+        context_layer = context_layer.permute(0, 2, 1, 3).contiguous()
+        new_context_layer_shape = context_layer.size()[:-2] + (self.all_head_size,)
+        context_layer = context_layer.view(new_context_layer_shape)
+
+        outputs = (context_layer, attention_probs) if output_attentions else (context_layer,)
+
+        return outputs
+
+    def _eager_attention(
+        self,
+        query_layer: torch.Tensor,
+        key_layer: torch.Tensor,
+        value_layer: torch.Tensor,
+        head_mask: Optional[torch.Tensor] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
         # Take the dot product between "query" and "key" to get the raw attention scores.
         attention_scores = torch.matmul(query_layer, key_layer.transpose(-1, -2))
 
@@ -378,14 +548,7 @@ class ViTMAE3DSelfAttention(nn.Module):
             attention_probs = attention_probs * head_mask
 
         context_layer = torch.matmul(attention_probs, value_layer)
-
-        context_layer = context_layer.permute(0, 2, 1, 3).contiguous()
-        new_context_layer_shape = context_layer.size()[:-2] + (self.all_head_size,)
-        context_layer = context_layer.view(new_context_layer_shape)
-
-        outputs = (context_layer, attention_probs) if output_attentions else (context_layer,)
-
-        return outputs
+        return context_layer, attention_probs
 
 
 # Copied from transformers.models.vit.modeling_vit.ViTSelfOutput with ViT->ViTMAE3D
@@ -595,7 +758,7 @@ class ViTMAE3DPreTrainedModel(PreTrainedModel):
 
     def _init_weights(self, module):
         """Initialize the weights"""
-        if isinstance(module, (nn.Linear, nn.Conv2d)):
+        if isinstance(module, (nn.Linear, nn.Conv3d)):
             # Slightly different from the TF version which uses truncated_normal for initialization
             # cf https://github.com/pytorch/pytorch/pull/5617
             module.weight.data.normal_(mean=0.0, std=self.config.initializer_range)
@@ -747,7 +910,7 @@ class ViTMAE3DModel(ViTMAE3DPreTrainedModel):
 # MLIU: WIP
 # Copied from transformers.models.vit_mae.modeling_vit_mae.ViTMAEDecoder with ViTMAE->ViTMAE3D
 class ViTMAE3DDecoder(nn.Module):
-    def __init__(self, config, num_patches):
+    def __init__(self, config, num_patches, grid_size=None):
         super().__init__()
         self.decoder_embed = nn.Linear(config.hidden_size, config.decoder_hidden_size, bias=True)
         self.mask_token = nn.Parameter(torch.zeros(1, 1, config.decoder_hidden_size))
@@ -765,19 +928,23 @@ class ViTMAE3DDecoder(nn.Module):
         )
 
         self.decoder_norm = nn.LayerNorm(config.decoder_hidden_size, eps=config.layer_norm_eps)
+        patch_size = config.patch_size
+        patch_size = patch_size if isinstance(patch_size, collections.abc.Iterable) else (patch_size,) * 3
         self.decoder_pred = nn.Linear(
-            config.decoder_hidden_size, config.patch_size**3 * config.num_channels, bias=True
+            config.decoder_hidden_size, math.prod(patch_size) * config.num_channels, bias=True
         )  # encoder to decoder
         self.gradient_checkpointing = False
         self.config = config
-        self.initialize_weights(num_patches)
+        self.initialize_weights(num_patches, grid_size)
 
-    def initialize_weights(self, num_patches):
-        # initialize (and freeze) position embeddings by sin-cos embedding
+    def initialize_weights(self, num_patches, grid_size=None):
+        # initialize (and freeze) position embeddings by sin-cos embedding, a cubic grid is assumed if not given
+        if grid_size is None:
+            grid_size = int(np.rint(np.cbrt(num_patches)))
         decoder_pos_embed = get_3d_sincos_pos_embed(
-            self.decoder_pos_embed.shape[-1], int(np.rint(np.cbrt(num_patches))), add_cls_token=True
+            self.decoder_pos_embed.shape[-1], grid_size, add_cls_token=True, device=self.decoder_pos_embed.device
         )
-        self.decoder_pos_embed.data.copy_(torch.from_numpy(decoder_pos_embed).float().unsqueeze(0))
+        self.decoder_pos_embed.data.copy_(decoder_pos_embed.unsqueeze(0))
 
         # timm's trunc_normal_(std=.02) is effectively normal_(std=0.02) as cutoff is too big (2.)
         torch.nn.init.normal_(self.mask_token, std=self.config.initializer_range)
@@ -789,6 +956,7 @@ class ViTMAE3DDecoder(nn.Module):
         output_attentions=False,
         output_hidden_states=False,
         return_dict=True,
+        ids_masked=None,
     ):
         # embed tokens
         x = self.decoder_embed(hidden_states)
@@ -833,14 +1001,18 @@ class ViTMAE3DDecoder(nn.Module):
         if output_hidden_states:
             all_hidden_states = all_hidden_states + (hidden_states,)
 
+        # remove cls token, and only predict the requested patches
+        hidden_states = hidden_states[:, 1:, :]
+        if ids_masked is not None:
+            hidden_states = torch.gather(
+                hidden_states, 1, ids_masked.unsqueeze(-1).expand(-1, -1, hidden_states.shape[-1])
+            )
+
         hidden_states = self.decoder_norm(hidden_states)
 
         # predictor projection
         logits = self.decoder_pred(hidden_states)
 
-        # remove cls token
-        logits = logits[:, 1:, :]
-
         if not return_dict:
             return tuple(v for v in [logits, all_hidden_states, all_self_attentions] if v is not None)
         return ViTMAE3DDecoderOutput(
@@ -871,7 +1043,11 @@ class ViTMAE3DForPreTraining(ViTMAE3DPreTrainedModel):
         self.config = config
 
         self.vit = ViTMAE3DModel(config)
-        self.decoder = ViTMAE3DDecoder(config, num_patches=self.vit.embeddings.num_patches)
+        self.decoder = ViTMAE3DDecoder(
+            config,
+            num_patches=self.vit.embeddings.num_patches,
+            grid_size=self.vit.embeddings.patch_embeddings.grid_size,
+        )
 
         # Initialize weights and apply final processing
         self.post_init()
@@ -887,101 +1063,161 @@ class ViTMAE3DForPreTraining(ViTMAE3DPreTrainedModel):
         for layer, heads in heads_to_prune.items():
             self.encoder.layer[layer].attention.prune_heads(heads)
 
-    def patchify(self, pixel_values):
+    def patch_view(self, pixel_values):
         """
         Args:
             pixel_values (`torch.FloatTensor` of shape `(batch_size, num_channels, depth, height, width)`):
                 Pixel values.
 
         Returns:
-            `torch.FloatTensor` of shape `(batch_size, num_patches, patch_size**3 * num_channels)`:
-                Patchified pixel values.
+            `torch.FloatTensor` of shape `(batch_size, grid_depth, grid_height, grid_width, patch_depth, patch_height,
+            patch_width, num_channels)`: The pixel values split into patches, as a strided view (no copy) for contiguous
+            inputs.
         """
-        patch_size, num_channels = self.config.patch_size, self.config.num_channels
+        patch_size, num_channels = self.vit.embeddings.patch_embeddings.patch_size, self.config.num_channels
         # sanity checks
-        if (pixel_values.shape[2] != pixel_values.shape[3]) or \
-            (pixel_values.shape[3] != pixel_values.shape[4]) or \
-            (pixel_values.shape[2] % patch_size != 0):
-            raise ValueError("Make sure the pixel values have a cubed size that is divisible by the patch size")
+        if any(size % patch != 0 for size, patch in zip(pixel_values.shape[2:], patch_size)):
+            raise ValueError(
+                "Make sure the pixel values have a size that is divisible by the patch size along each axis"
+            )
         if pixel_values.shape[1] != num_channels:
             raise ValueError(
                 "Make sure the number of channels of the pixel values is equal to the one set in the configuration"
             )
 
-        # patchify
-        batch_size = pixel_values.shape[0]
-        num_patches_one_direction = pixel_values.shape[2] // patch_size
-        patchified_pixel_values = pixel_values.reshape(
-            batch_size, num_channels, num_patches_one_direction, patch_size, num_patches_one_direction, patch_size, num_patches_one_direction, patch_size
-        )
-        patchified_pixel_values = torch.einsum("ncdrhpwq->ndhwrpqc", patchified_pixel_values)
-        patchified_pixel_values = patchified_pixel_values.reshape(
-            batch_size, num_patches_one_direction**3 , patch_size**3 * num_channels
+        batch_size, _, depth, height, width = pixel_values.shape
+        grid_depth, grid_height, grid_width = depth // patch_size[0], height // patch_size[1], width // patch_size[2]
+        patches = pixel_values.reshape(
+            batch_size, num_channels, grid_depth, patch_size[0], grid_height, patch_size[1], grid_width, patch_size[2]
         )
-        return patchified_pixel_values
+        return patches.permute(0, 2, 4, 6, 3, 5, 7, 1)
 
-    def unpatchify(self, patchified_pixel_values):
+    def patchify(self, pixel_values):
+        """
+        Args:
+            pixel_values (`torch.FloatTensor` of shape `(batch_size, num_channels, depth, height, width)`):
+                Pixel values.
+
+        Returns:
+            `torch.FloatTensor` of shape `(batch_size, num_patches, patch_depth * patch_height * patch_width *
+            num_channels)`:
+                Patchified pixel values.
+        """
+        patches = self.patch_view(pixel_values)
+        return patches.reshape(patches.shape[0], -1, patches.shape[4:].numel())
+
+    def unpatchify(self, patchified_pixel_values, original_volume_size=None):
         """
         Args:
-            patchified_pixel_values (`torch.FloatTensor` of shape `(batch_size, num_patches, patch_size**3 * num_channels)`:
+            patchified_pixel_values (`torch.FloatTensor` of shape `(batch_size, num_patches, patch_depth * patch_height * patch_width * num_channels)`:
                 Patchified pixel values.
+            original_volume_size (`Tuple[int, int, int]`, *optional*):
+                Original `(depth, height, width)` of the volume. Defaults to `config.image_size`.
 
         Returns:
             `torch.FloatTensor` of shape `(batch_size, num_channels, depth, height, width)`:
                 Pixel values.
         """
-        patch_size, num_channels = self.config.patch_size, self.config.num_channels
-        num_patches_one_direction = int(np.rint(np.cbrt(patchified_pixel_values.shape[1])))
+        patch_size, num_channels = self.vit.embeddings.patch_embeddings.patch_size, self.config.num_channels
+        if original_volume_size is None:
+            original_volume_size = self.vit.embeddings.patch_embeddings.image_size
+        grid_size = [size // patch for size, patch in zip(original_volume_size, patch_size)]
         # sanity check
-        if num_patches_one_direction**3 != patchified_pixel_values.shape[1]:
-            raise ValueError("Make sure that the number of patches can be cubed")
+        if grid_size[0] * grid_size[1] * grid_size[2] != patchified_pixel_values.shape[1]:
+            raise ValueError(
+                f"The number of patches in the patchified pixel values ({patchified_pixel_values.shape[1]}) does not "
+                f"match the patch grid {grid_size} of a volume of size {tuple(original_volume_size)}"
+            )
 
         # unpatchify
         batch_size = patchified_pixel_values.shape[0]
-        patchified_pixel_values = patchified_pixel_values.reshape(
-            batch_size,
-            num_patches_one_direction,
-            num_patches_one_direction,
-            num_patches_one_direction,
-            patch_size,
-            patch_size,
-            patch_size,
-            num_channels,
-        )
-        patchified_pixel_values = torch.einsum("ndhwpqrc->ncdphqwr", patchified_pixel_values)
+        patchified_pixel_values = patchified_pixel_values.reshape(batch_size, *grid_size, *patch_size, num_channels)
+        patchified_pixel_values = patchified_pixel_values.permute(0, 7, 1, 4, 2, 5, 3, 6)
         pixel_values = patchified_pixel_values.reshape(
             batch_size,
             num_channels,
-            num_patches_one_direction * patch_size,
-            num_patches_one_direction * patch_size,
-            num_patches_one_direction * patch_size,
+            grid_size[0] * patch_size[0],
+            grid_size[1] * patch_size[1],
+            grid_size[2] * patch_size[2],
         )
         return pixel_values
 
-    def forward_loss(self, pixel_values, pred, mask):
+    def masked_patch_indices(self, ids_restore, len_keep):
+        """
+        Args:
+            ids_restore (`torch.LongTensor` of shape `(batch_size, sequence_length)`):
+                Tensor containing the original index of the (shuffled) masked patches.
+            len_keep (`int`):
+                Number of patches kept by the masking.
+
+        Returns:
+            `torch.LongTensor` of shape `(batch_size, num_masked_patches)`: The indices of the masked patches, in
+            increasing order.
+        """
+        # a patch is masked when its position in the shuffled sequence is past the kept ones
+        ids_shuffle = torch.empty_like(ids_restore).scatter_(
+            1, ids_restore, torch.arange(ids_restore.shape[1], device=ids_restore.device).expand_as(ids_restore)
+        )
+        return ids_shuffle[:, len_keep:].sort(dim=1).values
+
+    def gather_patches(self, pixel_values, ids):
+        """
+        Args:
+            pixel_values (`torch.FloatTensor` of shape `(batch_size, num_channels, depth, height, width)`):
+                Pixel values.
+            ids (`torch.LongTensor` of shape `(batch_size, num_selected_patches)`):
+                Indices of the patches to gather.
+
+        Returns:
+            `torch.FloatTensor` of shape `(batch_size, num_selected_patches, patch_depth * patch_height * patch_width *
+            num_channels)`: The selected patches, laid out like `patchify`. Only those patches are copied.
+        """
+        patches = self.patch_view(pixel_values)
+        grid_height, grid_width = patches.shape[2:4]
+        batch_index = torch.arange(patches.shape[0], device=ids.device).unsqueeze(-1)
+        depth_index = ids // (grid_height * grid_width)
+        height_index = ids // grid_width % grid_height
+        width_index = ids % grid_width
+        return patches[batch_index, depth_index, height_index, width_index].flatten(2)
+
+    def forward_loss(self, pixel_values, pred, mask, ids_masked=None):
         """
         Args:
-            pixel_values (`torch.FloatTensor` of shape `(batch_size, num_channels, height, width)`):
+            pixel_values (`torch.FloatTensor` of shape `(batch_size, num_channels, depth, height, width)`):
                 Pixel values.
-            pred (`torch.FloatTensor` of shape `(batch_size, num_patches, patch_size**2 * num_channels)`:
+            pred (`torch.FloatTensor` of shape `(batch_size, num_patches, patch_depth * patch_height * patch_width * num_channels)`:
                 Predicted pixel values.
             mask (`torch.FloatTensor` of shape `(batch_size, sequence_length)`):
                 Tensor indicating which patches are masked (1) and which are not (0).
+            ids_masked (`torch.LongTensor` of shape `(batch_size, num_masked_patches)`, *optional*):
+                Indices of the masked patches. When given, `pred` only holds the predictions of those patches and the
+                loss is computed on them alone, without reading the visible patches of the target.
 
         Returns:
             `torch.FloatTensor`: Pixel reconstruction loss.
         """
-        target = self.patchify(pixel_values)
+        if ids_masked is not None:
+            target = self.gather_patches(pixel_values, ids_masked)
+            if self.config.norm_pix_loss:
+                mean = target.mean(dim=-1, keepdim=True)
+                var = target.var(dim=-1, keepdim=True)
+                target = (target - mean) / (var + 1.0e-6) ** 0.5
+            # every predicted patch is masked, so this is the mean loss on removed patches
+            return ((pred - target) ** 2).mean()
+
+        # compare in the patch view of the volume, neither the target nor the prediction is rearranged in memory
+        target = self.patch_view(pixel_values)
+        pred = pred.reshape(target.shape)
+        patch_dims = (4, 5, 6, 7)
         if self.config.norm_pix_loss:
-            mean = target.mean(dim=-1, keepdim=True)
-            var = target.var(dim=-1, keepdim=True)
+            mean = target.mean(dim=patch_dims, keepdim=True)
+            var = target.var(dim=patch_dims, keepdim=True)
             target = (target - mean) / (var + 1.0e-6) ** 0.5
 
         loss = (pred - target) ** 2
-        loss = loss.mean(dim=-1)  # [N, L], mean loss per patch
+        loss = loss.mean(dim=patch_dims).flatten(1)  # [N, L], mean loss per patch
 
         loss = (loss * mask).sum() / mask.sum()  # mean loss on removed patches
-        # loss = loss.mean()
         return loss
 
     @add_start_docstrings_to_model_forward(VITMAE3D_INPUTS_DOCSTRING)
@@ -1032,10 +1268,14 @@ class ViTMAE3DForPreTraining(ViTMAE3DPreTrainedModel):
         ids_restore = outputs.ids_restore
         mask = outputs.mask
 
-        decoder_outputs = self.decoder(latent, ids_restore)
-        logits = decoder_outputs.logits  # shape (batch_size, num_patches, patch_size*patch_size*num_channels)
+        ids_masked = None
+        if self.config.predict_masked_only:
+            ids_masked = self.masked_patch_indices(ids_restore, latent.shape[1] - 1)
 
-        loss = self.forward_loss(pixel_values, logits, mask)
+        decoder_outputs = self.decoder(latent, ids_restore, ids_masked=ids_masked)
+        logits = decoder_outputs.logits  # shape (batch_size, num_patches, prod(patch_size) * num_channels)
+
+        loss = self.forward_loss(pixel_values, logits, mask, ids_masked=ids_masked)
 
         if not return_dict:
             output = (logits, mask, ids_restore) + outputs[2:]
@@ -1051,132 +1291,19 @@ class ViTMAE3DForPreTraining(ViTMAE3DPreTrainedModel):
         )
 
 
-###########################################################################################
-# Modded for segmentation training
-
-class ViTMAE3DForSegmentationPreTraining(ViTMAE3DPreTrainedModel):
-    def __init__(self, config):
-        super().__init__(config)
-        self.config = config
-
-        self.vit = ViTMAE3DModel(config)
-        self.decoder = ViTMAE3DDecoder(config, num_patches=self.vit.embeddings.num_patches)
-
-        # Initialize weights and apply final processing
-        self.post_init()
-
-    def get_input_embeddings(self):
-        return self.vit.embeddings.patch_embeddings
-
-    def _prune_heads(self, heads_to_prune):
-        """
-        Prunes heads of the model. heads_to_prune: dict of {layer_num: list of heads to prune in this layer} See base
-        class PreTrainedModel
-        """
-        for layer, heads in heads_to_prune.items():
-            self.encoder.layer[layer].attention.prune_heads(heads)
-
-    def patchify(self, pixel_values):
-        """
-        Args:
-            pixel_values (`torch.FloatTensor` of shape `(batch_size, num_channels, depth, height, width)`):
-                Pixel values.
-
-        Returns:
-            `torch.FloatTensor` of shape `(batch_size, num_patches, patch_size**3 * num_channels)`:
-                Patchified pixel values.
-        """
-        patch_size, num_channels = self.config.patch_size, self.config.num_channels
-        # sanity checks
-        if (pixel_values.shape[2] != pixel_values.shape[3]) or \
-            (pixel_values.shape[3] != pixel_values.shape[4]) or \
-            (pixel_values.shape[2] % patch_size != 0):
-            raise ValueError("Make sure the pixel values have a cubed size that is divisible by the patch size")
-        if pixel_values.shape[1] != num_channels:
-            raise ValueError(
-                "Make sure the number of channels of the pixel values is equal to the one set in the configuration"
-            )
-
-        # patchify
-        batch_size = pixel_values.shape[0]
-        num_patches_one_direction = pixel_values.shape[2] // patch_size
-        patchified_pixel_values = pixel_values.reshape(
-            batch_size, num_channels, num_patches_one_direction, patch_size, num_patches_one_direction, patch_size, num_patches_one_direction, patch_size
-        )
-        patchified_pixel_values = torch.einsum("ncdrhpwq->ndhwrpqc", patchified_pixel_values)
-        patchified_pixel_values = patchified_pixel_values.reshape(
-            batch_size, num_patches_one_direction**3 , patch_size**3 * num_channels
-        )
-        return patchified_pixel_values
-
-    def unpatchify(self, patchified_pixel_values):
-        """
-        Args:
-            patchified_pixel_values (`torch.FloatTensor` of shape `(batch_size, num_patches, patch_size**3 * num_channels)`:
-                Patchified pixel values.
-
-        Returns:
-            `torch.FloatTensor` of shape `(batch_size, num_channels, depth, height, width)`:
-                Pixel values.
-        """
-        patch_size, num_channels = self.config.patch_size, self.config.num_channels
-        num_patches_one_direction = int(np.rint(np.cbrt(patchified_pixel_values.shape[1])))
-        # sanity check
-        if num_patches_one_direction**3 != patchified_pixel_values.shape[1]:
-            raise ValueError("Make sure that the number of patches can be cubed")
-
-        # unpatchify
-        batch_size = patchified_pixel_values.shape[0]
-        patchified_pixel_values = patchified_pixel_values.reshape(
-            batch_size,
-            num_patches_one_direction,
-            num_patches_one_direction,
-            num_patches_one_direction,
-            patch_size,
-            patch_size,
-            patch_size,
-            num_channels,
-        )
-        patchified_pixel_values = torch.einsum("ndhwpqrc->ncdphqwr", patchified_pixel_values)
-        pixel_values = patchified_pixel_values.reshape(
-            batch_size,
-            num_channels,
-            num_patches_one_direction * patch_size,
-            num_patches_one_direction * patch_size,
-            num_patches_one_direction * patch_size,
-        )
-        return pixel_values
-
-    def forward_loss(self, pixel_values, pred, mask):
-        """
-        Args:
-            pixel_values (`torch.FloatTensor` of shape `(batch_size, num_channels, height, width)`):
-                Pixel values.
-            pred (`torch.FloatTensor` of shape `(batch_size, num_patches, patch_size**2 * num_channels)`:
-                Predicted pixel values.
-            mask (`torch.FloatTensor` of shape `(batch_size, sequence_length)`):
-                Tensor indicating which patches are masked (1) and which are not (0).
-
-        Returns:
-            `torch.FloatTensor`: Pixel reconstruction loss.
-        """
-        target = self.patchify(pixel_values)
-        if self.config.norm_pix_loss:
-            mean = target.mean(dim=-1, keepdim=True)
-            var = target.var(dim=-1, keepdim=True)
-            target = (target - mean) / (var + 1.0e-6) ** 0.5
-
-        loss = (pred - target) ** 2
-        loss = loss.mean(dim=-1)  # [N, L], mean loss per patch
-
-        loss = (loss * mask).sum() / mask.sum()  # mean loss on removed patches
-        return loss
-
+@add_start_docstrings(
+    """The ViTMAE3D Model transformer with the decoder on top for segmentation-aware pre-training: the visible patches
+    of a scan are encoded and the decoder reconstructs the masked patches of the matching label volume.
+    """,
+    VITMAE3D_START_DOCSTRING,
+)
+class ViTMAE3DForSegmentationPreTraining(ViTMAE3DForPreTraining):
     @add_start_docstrings_to_model_forward(VITMAE3D_INPUTS_DOCSTRING)
     @replace_return_docstrings(output_type=ViTMAE3DForPreTrainingOutput, config_class=_CONFIG_FOR_DOC)
     def forward(
         self,
         pixel_values: Optional[torch.FloatTensor] = None,
+        labels: Optional[torch.Tensor] = None,
         noise: Optional[torch.FloatTensor] = None,
         head_mask: Optional[torch.FloatTensor] = None,
         output_attentions: Optional[bool] = None,
@@ -1184,53 +1311,43 @@ class ViTMAE3DForSegmentationPreTraining(ViTMAE3DPreTrainedModel):
         return_dict: Optional[bool] = None,
     ) -> Union[Tuple, ViTMAE3DForPreTrainingOutput]:
         r"""
+        labels (`torch.Tensor` of shape `(batch_size, num_channels, depth, height, width)`, *optional*):
+            Label volumes matching `pixel_values`, reconstructed by the decoder to compute the loss. Single channel
+            label volumes can also be passed without a channel axis, as `(batch_size, depth, height, width)`. For
+            backward compatibility, when `labels` is not provided and `pixel_values` has twice `config.num_channels` channels,
+            the first half of the channels is used as the scan and the second half as the labels.
+
         Returns:
 
         Examples:
 
         ```python
-        >>> from transformers import AutoImageProcessor, ViTMAE3DForPreTraining
-        >>> from PIL import Image
-        >>> import requests
-
-        >>> url = "http://images.cocodataset.org/val2017/000000039769.jpg"
-        >>> image = Image.open(requests.get(url, stream=True).raw)
+        >>> from transformers import DataCollatorForMaskedVolumeModeling, ViTMAE3DForSegmentationPreTraining
+        >>> import torch
 
-        >>> image_processor = AutoImageProcessor.from_pretrained("")
-        >>> model = ViTMAE3DForPreTraining.from_pretrained("")
+        >>> model = ViTMAE3DForSegmentationPreTraining.from_pretrained("")
+        >>> data_collator = DataCollatorForMaskedVolumeModeling(patch_size=model.config.patch_size)
 
-        >>> inputs = image_processor(images=image, return_tensors="pt")
-        >>> outputs = model(**inputs)
+        >>> size = (model.config.image_size,) * 3
+        >>> features = [{"pixel_values": torch.rand(1, *size), "labels": torch.randint(0, 2, size)}]
+        >>> outputs = model(**data_collator(features))
         >>> loss = outputs.loss
-        >>> mask = outputs.mask
-        >>> ids_restore = outputs.ids_restore
         ```"""
-
-        print("BLARGH!!!!!!!!")
-        print("type(pixel_values): " + str(type(pixel_values)))
-        print("pixel_values.shape: " + str(pixel_values.shape))
-        pixel_values_scan = pixel_values[:,0,:,:,:]
-        pixel_values_scan = torch.unsqueeze(pixel_values_scan, 1)
-
-        pixel_values_label = pixel_values[:,1,:,:,:]
-        pixel_values_label = torch.unsqueeze(pixel_values_label, 1)
-
-        # print("pixel_values.shape: " + str(pixel_values.shape))
-
         return_dict = return_dict if return_dict is not None else self.config.use_return_dict
 
-        # outputs = self.vit(
-        #     pixel_values,
-        #     noise=noise,
-        #     head_mask=head_mask,
-        #     output_attentions=output_attentions,
-        #     output_hidden_states=output_hidden_states,
-        #     return_dict=return_dict,
-        # )
+        if pixel_values is None:
+            raise ValueError("You have to specify pixel_values")
 
+        num_channels = self.config.num_channels
+        if labels is None and pixel_values.shape[1] == 2 * num_channels:
+            logger.warning_once(
+                "Passing the scan and label volumes packed in the channels of `pixel_values` is deprecated, pass the "
+                "label volumes as `labels` instead."
+            )
+            pixel_values, labels = pixel_values[:, :num_channels], pixel_values[:, num_channels:]
 
         outputs = self.vit(
-            pixel_values_scan,
+            pixel_values,
             noise=noise,
             head_mask=head_mask,
             output_attentions=output_attentions,
@@ -1238,18 +1355,25 @@ class ViTMAE3DForSegmentationPreTraining(ViTMAE3DPreTrainedModel):
             return_dict=return_dict,
         )
 
-        latent = outputs.last_hidden_state
-        ids_restore = outputs.ids_restore
-        mask = outputs.mask
+        latent = outputs[0]
+        mask = outputs[1]
+        ids_restore = outputs[2]
 
-        decoder_outputs = self.decoder(latent, ids_restore)
-        logits = decoder_outputs.logits  # shape (batch_size, num_patches, patch_size*patch_size*num_channels)
+        ids_masked = None
+        if self.config.predict_masked_only:
+            ids_masked = self.masked_patch_indices(ids_restore, latent.shape[1] - 1)
 
-        # loss = self.forward_loss(pixel_values, logits, mask)
-        loss = self.forward_loss(pixel_values_label, logits, mask)
+        decoder_outputs = self.decoder(latent, ids_restore, ids_masked=ids_masked)
+        logits = decoder_outputs.logits  # shape (batch_size, num_patches, prod(patch_size) * num_channels)
+
+        loss = None
+        if labels is not None:
+            if labels.ndim == pixel_values.ndim - 1:
+                labels = labels.unsqueeze(1)
+            loss = self.forward_loss(labels.to(logits.dtype), logits, mask, ids_masked=ids_masked)
 
         if not return_dict:
-            output = (logits, mask, ids_restore) + outputs[2:]
+            output = (logits, mask, ids_restore) + outputs[3:]
             return ((loss,) + output) if loss is not None else output
 
         return ViTMAE3DForPreTrainingOutput(
@@ -1260,4 +1384,3 @@ class ViTMAE3DForSegmentationPreTraining(ViTMAE3DPreTrainedModel):
             hidden_states=outputs.hidden_states,
             attentions=outputs.attentions,
         )
-
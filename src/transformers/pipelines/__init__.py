@@ -78,6 +78,8 @@ from .token_classification import (
 )
 from .video_classification import VideoClassificationPipeline
 from .visual_question_answering import VisualQuestionAnsweringPipeline
+from .volume_classification import VolumeClassificationPipeline
+from .volume_feature_extraction import VolumeFeatureExtractionPipeline
 from .zero_shot_audio_classification import ZeroShotAudioClassificationPipeline
 from .zero_shot_classification import ZeroShotClassificationArgumentHandler, ZeroShotClassificationPipeline
 from .zero_shot_image_classification import ZeroShotImageClassificationPipeline
@@ -386,6 +388,18 @@ SUPPORTED_TASKS = {
         "default": {"model": {"pt": ("MCG-NJU/videomae-base-finetuned-kinetics", "4800870")}},
         "type": "video",
     },
+    "volume-classification": {
+        "impl": VolumeClassificationPipeline,
+        "tf": (),
+        "pt": (AutoModelForImageClassification,) if is_torch_available() else (),
+        "type": "image",
+    },
+    "volume-feature-extraction": {
+        "impl": VolumeFeatureExtractionPipeline,
+        "tf": (),
+        "pt": (AutoModel,) if is_torch_available() else (),
+        "type": "image",
+    },
     "mask-generation": {
         "impl": MaskGenerationPipeline,
         "tf": (),
@@ -473,6 +487,8 @@ def check_task(task: str) -> Tuple[str, Dict, Any]:
             - `"translation_xx_to_yy"`
             - `"video-classification"`
             - `"visual-question-answering"`
+            - `"volume-classification"`
+            - `"volume-feature-extraction"`
             - `"zero-shot-classification"`
             - `"zero-shot-image-classification"`
             - `"zero-shot-object-detection"`
@@ -559,6 +575,8 @@ def pipeline(
             - `"translation_xx_to_yy"`: will return a [`TranslationPipeline`].
             - `"video-classification"`: will return a [`VideoClassificationPipeline`].
             - `"visual-question-answering"`: will return a [`VisualQuestionAnsweringPipeline`].
+            - `"volume-classification"`: will return a [`VolumeClassificationPipeline`].
+            - `"volume-feature-extraction"`: will return a [`VolumeFeatureExtractionPipeline`].
             - `"zero-shot-classification"`: will return a [`ZeroShotClassificationPipeline`].
             - `"zero-shot-image-classification"`: will return a [`ZeroShotImageClassificationPipeline`].
             - `"zero-shot-audio-classification"`: will return a [`ZeroShotAudioClassificationPipeline`].
@@ -381,6 +381,9 @@ def get_default_model_and_revision(
     elif is_tf_available() and not is_torch_available():
         framework = "tf"
 
+    if "default" not in targeted_task:
+        raise ValueError("The task does not provide any default model, please specify one with `model`.")
+
     defaults = targeted_task["default"]
     if task_options:
         if task_options not in defaults:
@@ -0,0 +1,145 @@
+import os
+from typing import Any, List, Union
+
+from ..utils import add_end_docstrings, is_torch_available, logging
+from .base import PIPELINE_INIT_ARGS, Pipeline
+
+
+if is_torch_available():
+    from ..models.auto.modeling_auto import MODEL_FOR_IMAGE_CLASSIFICATION_MAPPING
+
+logger = logging.get_logger(__name__)
+
+
+def list_volume_files(volumes: Any) -> Any:
+    """
+    Expands `volumes`, if it is a path to a directory, into the sorted list of the `.npy` volume files it contains.
+    Any other input is returned as is.
+    """
+    if isinstance(volumes, (str, os.PathLike)) and os.path.isdir(volumes):
+        return sorted(
+            os.path.join(volumes, file_name) for file_name in os.listdir(volumes) if file_name.endswith(".npy")
+        )
+    return volumes
+
+
+class VolumePipeline(Pipeline):
+    """
+    Base class of the volume pipelines. The volumes are either resized to the input size of the model, or, with
+    `tiled=True`, run through the model's `sliding_window_forward` at their native resolution.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if self.framework != "pt":
+            raise ValueError(f"The {self.__class__} is only available in PyTorch.")
+
+    def _sanitize_tile_parameters(self, tiled=None, tile_overlap=None, tile_batch_size=None):
+        preprocess_params = {}
+        forward_params = {}
+        if tiled is not None:
+            if tiled and not hasattr(self.model, "sliding_window_forward"):
+                raise ValueError(f"{self.model.__class__.__name__} does not support tiled inference.")
+            preprocess_params["tiled"] = tiled
+            forward_params["tiled"] = tiled
+        if tile_overlap is not None:
+            forward_params["tile_overlap"] = tile_overlap
+        if tile_batch_size is not None:
+            forward_params["tile_batch_size"] = tile_batch_size
+        return preprocess_params, forward_params
+
+    def preprocess(self, volume, tiled=False):
+        if tiled:
+            # tiles are taken from the volume at its native resolution
+            return self.image_processor(volume, do_resize=False, do_center_crop=False, return_tensors=self.framework)
+        return self.image_processor(volume, return_tensors=self.framework)
+
+    def _forward(self, model_inputs, tiled=False, **tile_kwargs):
+        if tiled:
+            return self.model.sliding_window_forward(model_inputs["pixel_values"], **tile_kwargs)
+        return self.model(**model_inputs)
+
+
+@add_end_docstrings(PIPELINE_INIT_ARGS)
+class VolumeClassificationPipeline(VolumePipeline):
+    """
+    Volume classification pipeline using any `AutoModelForImageClassification` taking volumes as inputs, such as
+    [`Vit3dForImageClassification`]. This pipeline predicts the class of a scan.
+
+    Example:
+
+    ```python
+    >>> from transformers import pipeline
+
+    >>> classifier = pipeline("volume-classification", model="path/to/vit3d-checkpoint")
+    >>> # scores every `.npy` scan of the directory, preprocessing them in 4 background workers
+    >>> predictions = classifier("path/to/scans", batch_size=8, num_workers=4)
+    ```
+
+    Learn more about the basics of using a pipeline in the [pipeline tutorial](../pipeline_tutorial)
+
+    This volume classification pipeline can currently be loaded from [`pipeline`] using the following task
+    identifier: `"volume-classification"`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.check_model_type(MODEL_FOR_IMAGE_CLASSIFICATION_MAPPING)
+
+    def _sanitize_parameters(self, top_k=None, tiled=None, tile_overlap=None, tile_batch_size=None):
+        preprocess_params, forward_params = self._sanitize_tile_parameters(tiled, tile_overlap, tile_batch_size)
+
+        postprocess_params = {}
+        if top_k is not None:
+            postprocess_params["top_k"] = top_k
+        return preprocess_params, forward_params, postprocess_params
+
+    def __call__(self, volumes: Union[str, List[str], Any, List[Any]], **kwargs):
+        """
+        Assign labels to the volume(s) passed as inputs.
+
+        Args:
+            volumes (`str`, `List[str]`, `np.ndarray`, `torch.Tensor` or a list of those):
+                The pipeline handles three types of volumes:
+
+                - A string containing a local path to a `.npy` volume file, which is memory-mapped
+                - A string containing a local path to a directory, in which case every `.npy` volume file of the
+                  directory is classified, in sorted file name order
+                - A volume of shape `(num_channels, depth, height, width)` or `(depth, height, width, num_channels)`
+
+                Lists of volumes are preprocessed in a `torch.utils.data.DataLoader`: pass `num_workers` to load and
+                preprocess the next volumes in background processes while the model runs, and `batch_size` to
+                classify several volumes at once.
+            top_k (`int`, *optional*, defaults to 5):
+                The number of top labels that will be returned by the pipeline. If the provided number is higher than
+                the number of labels available in the model configuration, it will default to the number of labels.
+            tiled (`bool`, *optional*, defaults to `False`):
+                Whether to classify the volumes at their native resolution with the model's `sliding_window_forward`
+                instead of resizing them to the input size of the model. Volumes of different sizes must then be
+                classified with `batch_size=1`.
+            tile_overlap (`float`, *optional*, defaults to 0.25):
+                Fraction of the tile size by which neighbouring tiles overlap when `tiled=True`.
+            tile_batch_size (`int`, *optional*, defaults to 4):
+                Number of tiles run through the model at once when `tiled=True`.
+
+        Return:
+            A list of dictionaries, or a list of such lists if several volumes are passed.
+
+            The dictionaries contain the following keys:
+
+            - **label** (`str`) -- The label identified by the model.
+            - **score** (`float`) -- The score attributed by the model for that label.
+        """
+        return super().__call__(list_volume_files(volumes), **kwargs)
+
+    def postprocess(self, model_outputs, top_k=5):
+        if top_k > self.model.config.num_labels:
+            top_k = self.model.config.num_labels
+
+        probs = model_outputs.logits.softmax(-1)[0]
+        scores, ids = probs.topk(top_k)
+
+        scores = scores.tolist()
+        ids = ids.tolist()
+        return [{"score": score, "label": self.model.config.id2label[_id]} for score, _id in zip(scores, ids)]
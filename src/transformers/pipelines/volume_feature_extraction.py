@@ -0,0 +1,257 @@
+import json
+import math
+import os
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from ..utils import add_end_docstrings, is_safetensors_available, logging
+from .base import PIPELINE_INIT_ARGS
+from .volume_classification import VolumePipeline, list_volume_files
+
+
+if is_safetensors_available():
+    from safetensors.numpy import save_file as safe_save_file
+
+logger = logging.get_logger(__name__)
+
+FEATURES_INDEX_NAME = "features.index.json"
+
+
+@add_end_docstrings(PIPELINE_INIT_ARGS)
+class VolumeFeatureExtractionPipeline(VolumePipeline):
+    """
+    Volume feature extraction pipeline using no model head, such as [`Vit3dModel`]. This pipeline extracts the hidden
+    states of the base transformer for a scan, which can be used as features in downstream tasks.
+
+    Example:
+
+    ```python
+    >>> from transformers import pipeline
+
+    >>> extractor = pipeline("volume-feature-extraction", model="path/to/vit3d-checkpoint")
+    >>> # one embedding per `.npy` scan of the directory, preprocessed in 4 background workers
+    >>> embeddings = extractor("path/to/scans", pooling="cls", batch_size=8, num_workers=4)
+
+    >>> # streams the embeddings of a large archive to `.npy` shards on disk instead
+    >>> index = extractor.export_features("path/to/scans", "path/to/features", pooling="cls", num_workers=4)
+    ```
+
+    Learn more about the basics of using a pipeline in the [pipeline tutorial](../pipeline_tutorial)
+
+    This volume feature extraction pipeline can currently be loaded from [`pipeline`] using the following task
+    identifier: `"volume-feature-extraction"`.
+    """
+
+    def _sanitize_parameters(
+        self, pooling=None, return_tensors=None, tiled=None, tile_overlap=None, tile_batch_size=None
+    ):
+        preprocess_params, forward_params = self._sanitize_tile_parameters(tiled, tile_overlap, tile_batch_size)
+
+        postprocess_params = {}
+        if pooling is not None:
+            if pooling not in ("cls", "mean", "pooler"):
+                raise ValueError(f"`pooling` should be one of 'cls', 'mean' or 'pooler', got {pooling}.")
+            postprocess_params["pooling"] = pooling
+        if return_tensors is not None:
+            postprocess_params["return_tensors"] = return_tensors
+        return preprocess_params, forward_params, postprocess_params
+
+    def __call__(self, volumes: Union[str, List[str], Any, List[Any]], **kwargs):
+        """
+        Extract the features of the volume(s) passed as inputs.
+
+        Args:
+            volumes (`str`, `List[str]`, `np.ndarray`, `torch.Tensor` or a list of those):
+                The pipeline handles three types of volumes:
+
+                - A string containing a local path to a `.npy` volume file, which is memory-mapped
+                - A string containing a local path to a directory, in which case the features of every `.npy` volume
+                  file of the directory are extracted, in sorted file name order
+                - A volume of shape `(num_channels, depth, height, width)` or `(depth, height, width, num_channels)`
+
+                Lists of volumes are preprocessed in a `torch.utils.data.DataLoader`: pass `num_workers` to load and
+                preprocess the next volumes in background processes while the model runs, and `batch_size` to
+                process several volumes at once.
+            pooling (`str`, *optional*):
+                How to pool the hidden states of the patches into a single feature vector per volume: `"cls"` keeps
+                the hidden state of the [CLS] token, `"mean"` averages the hidden states of all tokens and `"pooler"`
+                returns the `pooler_output` of the model. If unset, the hidden states of all tokens are returned.
+            return_tensors (`bool`, *optional*, defaults to `False`):
+                If `True`, returns a tensor, otherwise returns a nested list of `float`.
+            tiled (`bool`, *optional*, defaults to `False`):
+                Whether to process the volumes at their native resolution with the model's `sliding_window_forward`
+                instead of resizing them to the input size of the model. Volumes of different sizes must then be
+                processed with `batch_size=1`.
+            tile_overlap (`float`, *optional*, defaults to 0.25):
+                Fraction of the tile size by which neighbouring tiles overlap when `tiled=True`.
+            tile_batch_size (`int`, *optional*, defaults to 4):
+                Number of tiles run through the model at once when `tiled=True`.
+
+        Return:
+            The features computed by the model, of shape `(1, sequence_length, hidden_size)`, or `(1, hidden_size)`
+            with `pooling`, as a tensor or a nested list of `float`. A list of those is returned if several volumes
+            are passed.
+        """
+        return super().__call__(list_volume_files(volumes), **kwargs)
+
+    def postprocess(self, model_outputs, pooling=None, return_tensors=False):
+        features = model_outputs.last_hidden_state
+        if pooling == "pooler":
+            if model_outputs.get("pooler_output") is None:
+                raise ValueError(f"{self.model.__class__.__name__} does not return a `pooler_output`.")
+            features = model_outputs.pooler_output
+        elif pooling == "cls":
+            features = features[:, 0]
+        elif pooling == "mean":
+            features = features.mean(dim=1)
+
+        if return_tensors:
+            return features
+        return features.tolist()
+
+    def export_features(
+        self,
+        volumes: Union[str, List[Any]],
+        output_dir: Union[str, os.PathLike],
+        pooling: Optional[str] = "cls",
+        shard_size: int = 4096,
+        file_format: str = "npy",
+        batch_size: Optional[int] = None,
+        num_workers: Optional[int] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """
+        Extracts the features of `volumes` and streams them to shards in `output_dir`, so that the features of an
+        archive of scans never have to fit in memory at once. The shards are described by an index file
+        (`features.index.json`), written each time a shard is complete. Calling this method again with the same
+        inputs and `output_dir` resumes after the last complete shard.
+
+        Args:
+            volumes (`str` or `List`):
+                A path to a directory of `.npy` volume files, or a list of volumes as accepted by
+                [`~VolumeFeatureExtractionPipeline.__call__`]. Volumes given as paths are recorded by path in the index,
+                other volumes by their position in the list.
+            output_dir (`str` or `os.PathLike`):
+                Directory the shards and their index are written to.
+            pooling (`str`, *optional*, defaults to `"cls"`):
+                How to pool the hidden states of each volume, see [`~VolumeFeatureExtractionPipeline.__call__`]. Set
+                to `None` to store the hidden states of all tokens, which requires all volumes to have the same number
+                of tokens.
+            shard_size (`int`, *optional*, defaults to 4096):
+                Number of volumes per shard.
+            file_format (`str`, *optional*, defaults to `"npy"`):
+                Format of the shards: `"npy"` shards are memory-mapped files filled as the features are computed,
+                `"safetensors"` shards are buffered in memory and written once complete.
+            batch_size (`int`, *optional*):
+                Number of volumes processed at once by the model.
+            num_workers (`int`, *optional*):
+                Number of `DataLoader` workers loading and preprocessing the volumes.
+            kwargs (additional keyword arguments, *optional*):
+                Passed along to the pipeline, e.g. `tiled=True`.
+
+        Returns:
+            `Dict[str, Any]`: The content of the index file: the `"metadata"` of the export (shape and dtype of the
+            features of a volume, number of volumes, ...), the `"volumes"` in the order of the features and the
+            `"shards"`, each with its `"file"`, the position of its first volume (`"start"`) and its `"length"`.
+        """
+        if file_format not in ("npy", "safetensors"):
+            raise ValueError(f"`file_format` should be one of 'npy' or 'safetensors', got {file_format}.")
+        if file_format == "safetensors" and not is_safetensors_available():
+            raise ImportError("Exporting features to safetensors shards requires the safetensors library.")
+
+        volumes = list_volume_files(volumes)
+        if not isinstance(volumes, list):
+            volumes = [volumes]
+        names = [str(volume) if isinstance(volume, (str, os.PathLike)) else str(i) for i, volume in enumerate(volumes)]
+        num_shards = math.ceil(len(volumes) / shard_size)
+
+        os.makedirs(output_dir, exist_ok=True)
+        index_file = os.path.join(output_dir, FEATURES_INDEX_NAME)
+        if os.path.isfile(index_file):
+            with open(index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            metadata = index["metadata"]
+            if (
+                index["volumes"] != names
+                or metadata["pooling"] != pooling
+                or metadata["shard_size"] != shard_size
+                or metadata["file_format"] != file_format
+            ):
+                raise ValueError(
+                    f"{output_dir} contains the features of a different export, use a new `output_dir` to start a "
+                    "new one."
+                )
+            logger.info(f"Resuming the export of the features after {len(index['shards'])} complete shards.")
+        else:
+            index = {
+                "metadata": {"pooling": pooling, "shard_size": shard_size, "file_format": file_format},
+                "volumes": names,
+                "shards": [],
+            }
+
+        start = len(index["shards"]) * shard_size
+        if start >= len(volumes):
+            return index
+
+        preprocess_params, forward_params, postprocess_params = self._sanitize_parameters(
+            pooling=pooling, return_tensors=True, **kwargs
+        )
+        preprocess_params = {**self._preprocess_params, **preprocess_params}
+        forward_params = {**self._forward_params, **forward_params}
+        postprocess_params = {**self._postprocess_params, **postprocess_params}
+        num_workers = num_workers if num_workers is not None else (self._num_workers or 0)
+        batch_size = batch_size if batch_size is not None else (self._batch_size or 1)
+        features_iterator = self.get_iterator(
+            volumes[start:], num_workers, batch_size, preprocess_params, forward_params, postprocess_params
+        )
+
+        shard, shard_file = None, None
+        for i, features in enumerate(features_iterator, start=start):
+            features = features[0].float().cpu().numpy()
+            if "shape" not in index["metadata"]:
+                index["metadata"].update(
+                    {"shape": list(features.shape), "dtype": str(features.dtype), "num_volumes": len(volumes)}
+                )
+            elif list(features.shape) != index["metadata"]["shape"]:
+                raise ValueError(
+                    f"The features of {names[i]} have shape {features.shape}, but the features of the previous "
+                    f"volumes have shape {tuple(index['metadata']['shape'])}."
+                )
+
+            if shard is None:
+                shard_start = i
+                shard_length = min(shard_size, len(volumes) - shard_start)
+                shard_index = shard_start // shard_size
+                shard_file = f"features-{shard_index + 1:05d}-of-{num_shards:05d}.{file_format}"
+                shard_shape = (shard_length,) + features.shape
+                if file_format == "npy":
+                    shard = np.lib.format.open_memmap(
+                        os.path.join(output_dir, shard_file + ".tmp"),
+                        mode="w+",
+                        dtype=features.dtype,
+                        shape=shard_shape,
+                    )
+                else:
+                    shard = np.empty(shard_shape, dtype=features.dtype)
+
+            shard[i - shard_start] = features
+
+            if i - shard_start + 1 == shard_length:
+                if file_format == "npy":
+                    shard.flush()
+                    del shard
+                    os.replace(os.path.join(output_dir, shard_file + ".tmp"), os.path.join(output_dir, shard_file))
+                else:
+                    safe_save_file(
+                        {"features": shard}, os.path.join(output_dir, shard_file), metadata={"format": "np"}
+                    )
+                shard = None
+
+                index["shards"].append({"file": shard_file, "start": shard_start, "length": shard_length})
+                # the index is replaced atomically, so that an interrupted export resumes from a consistent state
+                with open(index_file + ".tmp", "w", encoding="utf-8") as f:
+                    f.write(json.dumps(index, indent=2, sort_keys=True) + "\n")
+                os.replace(index_file + ".tmp", index_file)
+
+        return index
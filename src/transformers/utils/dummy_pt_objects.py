@@ -16,6 +16,34 @@ class PyTorchBenchmarkArguments(metaclass=DummyObject):
         requires_backends(self, ["torch"])
 
 
+class Cache(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
+class PagedCache(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
+class PrefixCache(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
+class StaticCache(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
 class GlueDataset(metaclass=DummyObject):
     _backends = ["torch"]
 
@@ -114,6 +142,13 @@ class ConstraintListState(metaclass=DummyObject):
         requires_backends(self, ["torch"])
 
 
+class ContinuousBatchingEngine(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
 class DisjunctiveConstraint(metaclass=DummyObject):
     _backends = ["torch"]
 
@@ -135,6 +170,13 @@ class ForcedEOSTokenLogitsProcessor(metaclass=DummyObject):
         requires_backends(self, ["torch"])
 
 
+class FusedLogitsWarper(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
 class GenerationMixin(metaclass=DummyObject):
     _backends = ["torch"]
 
@@ -156,6 +198,13 @@ class InfNanRemoveLogitsProcessor(metaclass=DummyObject):
         requires_backends(self, ["torch"])
 
 
+class JsonSchemaLogitsProcessor(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
 class LogitsProcessor(metaclass=DummyObject):
     _backends = ["torch"]
 
@@ -233,6 +282,13 @@ class PrefixConstrainedLogitsProcessor(metaclass=DummyObject):
         requires_backends(self, ["torch"])
 
 
+class RegexLogitsProcessor(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
 class RepetitionPenaltyLogitsProcessor(metaclass=DummyObject):
     _backends = ["torch"]
 
@@ -289,6 +345,13 @@ class TypicalLogitsWarper(metaclass=DummyObject):
         requires_backends(self, ["torch"])
 
 
+class VectorizedBeamSearchScorer(metaclass=DummyObject):
+    _backends = ["torch"]
+
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
 def top_k_top_p_filtering(*args, **kwargs):
     requires_backends(top_k_top_p_filtering, ["torch"])
 
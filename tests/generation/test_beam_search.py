@@ -25,12 +25,17 @@ from ..test_modeling_common import floats_tensor, ids_tensor
 if is_torch_available():
     import torch
 
+    from transformers import GPT2Config, GPT2LMHeadModel
     from transformers.generation import (
         BeamHypotheses,
         BeamSearchScorer,
         ConstrainedBeamSearchScorer,
         DisjunctiveConstraint,
+        LogitsProcessorList,
+        MaxLengthCriteria,
         PhrasalConstraint,
+        StoppingCriteriaList,
+        VectorizedBeamSearchScorer,
     )
 
 
@@ -62,14 +67,17 @@ class BeamSearchTester:
         # cannot be randomly generated
         self.eos_token_id = vocab_size + 1
 
-    def prepare_beam_scorer(self, **kwargs):
-        return BeamSearchScorer(
+    def prepare_beam_scorer(self, vectorized=False, **kwargs):
+        beam_scorer_class = VectorizedBeamSearchScorer if vectorized else BeamSearchScorer
+        return beam_scorer_class(
             batch_size=kwargs.get("batch_size", self.batch_size),
             num_beams=kwargs.get("num_beams", self.num_beams),
             device=torch_device,
             length_penalty=kwargs.get("length_penalty", self.length_penalty),
             do_early_stopping=kwargs.get("do_early_stopping", self.do_early_stopping),
             num_beam_hyps_to_keep=kwargs.get("num_beam_hyps_to_keep", self.num_beam_hyps_to_keep),
+            num_beam_groups=kwargs.get("num_beam_groups", 1),
+            max_length=kwargs.get("max_length", self.max_length),
         )
 
     def prepare_inputs(self):
@@ -250,6 +258,87 @@ class BeamSearchTester:
         self.parent.assertListEqual(list(sequences.shape), [self.num_beams * self.batch_size, max_length])
         self.parent.assertListEqual(list(sequence_scores.shape), [self.num_beams * self.batch_size])
 
+    def check_vectorized_beam_scorer(self, input_ids, next_tokens, next_indices, next_scores):
+        # check too many eos tokens
+        beam_scorer = self.prepare_beam_scorer(vectorized=True)
+
+        tokens = next_tokens.clone()
+        tokens[0, :] = self.eos_token_id
+
+        with self.parent.assertRaises(ValueError):
+            beam_scorer.process(input_ids, next_scores, tokens, next_indices, eos_token_id=self.eos_token_id)
+
+        # the vectorized beam scorer returns the same outputs as the beam scorer, including for equal scores
+        max_length = self.sequence_length + 4
+        for do_early_stopping in (True, False, "never"):
+            for num_beam_groups in (1, 2):
+                kwargs = {
+                    "do_early_stopping": do_early_stopping,
+                    "num_beam_groups": num_beam_groups,
+                    "num_beam_hyps_to_keep": 3,
+                    "max_length": max_length,
+                }
+                beam_scorer = self.prepare_beam_scorer(**kwargs)
+                vectorized_beam_scorer = self.prepare_beam_scorer(vectorized=True, **kwargs)
+                group_size = self.num_beams // num_beam_groups
+
+                sequences = input_ids
+                beam_indices = tuple(() for _ in range(self.batch_size * self.num_beams))
+                for _ in range(max_length - self.sequence_length):
+                    next_sequences, next_beam_indices = [], []
+                    for group_index in range(num_beam_groups):
+                        group_sequences = sequences.view(self.batch_size, num_beam_groups, group_size, -1)
+                        group_sequences = group_sequences[:, group_index].reshape(self.batch_size * group_size, -1)
+                        # half of the best tokens are EOS tokens, the others are enough to continue the beams
+                        tokens = ids_tensor((self.batch_size, 2 * group_size), 4) + self.vocab_size - 2
+                        tokens[:, group_size:] = ids_tensor((self.batch_size, group_size), self.vocab_size - 1)
+                        indices = ids_tensor((self.batch_size, 2 * group_size), group_size)
+                        scores = -ids_tensor((self.batch_size, 2 * group_size), 4).float()
+                        scores, _ = scores.sort(descending=True)
+                        inputs = (group_sequences, scores, tokens, indices)
+                        process_kwargs = {
+                            "pad_token_id": self.pad_token_id,
+                            "eos_token_id": [self.eos_token_id, self.vocab_size],
+                            "beam_indices": beam_indices,
+                            "group_index": group_index,
+                        }
+
+                        beam_outputs = beam_scorer.process(*inputs, **process_kwargs)
+                        vectorized_beam_outputs = vectorized_beam_scorer.process(*inputs, **process_kwargs)
+                        for key in ("next_beam_scores", "next_beam_tokens", "next_beam_indices"):
+                            self.parent.assertListEqual(
+                                beam_outputs[key].tolist(), vectorized_beam_outputs[key].tolist()
+                            )
+                        self.parent.assertEqual(beam_scorer.is_done, vectorized_beam_scorer.is_done)
+
+                        beam_idx = beam_outputs["next_beam_indices"]
+                        next_sequences.append(
+                            torch.cat([group_sequences[beam_idx], beam_outputs["next_beam_tokens"][:, None]], dim=-1)
+                        )
+                        next_beam_indices.append([beam_indices[idx] + (idx,) for idx in beam_idx.tolist()])
+                    next_scores = beam_outputs["next_beam_scores"]
+                    sequences = torch.stack(next_sequences, dim=1).view(self.batch_size * self.num_beams, -1)
+                    beam_indices = tuple(
+                        next_beam_indices[group_index][batch_idx * group_size + beam_idx]
+                        for batch_idx in range(self.batch_size)
+                        for group_index in range(num_beam_groups)
+                        for beam_idx in range(group_size)
+                    )
+
+                finalize_inputs = (sequences, torch.zeros(sequences.shape[0]), None, None)
+                finalize_kwargs = {
+                    "max_length": max_length,
+                    "pad_token_id": self.pad_token_id,
+                    "eos_token_id": [self.eos_token_id, self.vocab_size],
+                    "beam_indices": beam_indices,
+                }
+                sequence_outputs = beam_scorer.finalize(*finalize_inputs, **finalize_kwargs)
+                vectorized_sequence_outputs = vectorized_beam_scorer.finalize(*finalize_inputs, **finalize_kwargs)
+                for key in ("sequences", "sequence_scores", "beam_indices"):
+                    self.parent.assertListEqual(
+                        sequence_outputs[key].tolist(), vectorized_sequence_outputs[key].tolist()
+                    )
+
 
 class ConstrainedBeamSearchTester:
     def __init__(
@@ -558,6 +647,36 @@ class BeamSearchTest(unittest.TestCase):
         inputs = self.beam_search_tester.prepare_inputs()
         self.beam_search_tester.check_beam_scores_finalize(*inputs)
 
+    def test_vectorized_beam_scorer(self):
+        inputs = self.beam_search_tester.prepare_inputs()
+        self.beam_search_tester.check_vectorized_beam_scorer(*inputs)
+
+    def test_beam_search_with_scorer_without_batch_size(self):
+        class LegacyBeamSearchScorer(BeamSearchScorer):
+            # user-defined scorers may predate the `batch_size` attribute
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                del self.batch_size
+
+        torch.manual_seed(0)
+        model = GPT2LMHeadModel(GPT2Config(vocab_size=99, n_embd=32, n_layer=2, n_head=4)).to(torch_device).eval()
+        input_ids = ids_tensor((2, 4), 99).repeat_interleave(4, dim=0)
+        kwargs = {
+            "logits_processor": LogitsProcessorList(),
+            "stopping_criteria": StoppingCriteriaList([MaxLengthCriteria(max_length=8)]),
+            "pad_token_id": 0,
+        }
+        for num_beam_groups, decoding_method in ((1, model.beam_search), (2, model.group_beam_search)):
+            outputs = [
+                decoding_method(
+                    input_ids,
+                    beam_scorer_class(batch_size=2, num_beams=4, device=torch_device, num_beam_groups=num_beam_groups),
+                    **kwargs,
+                )
+                for beam_scorer_class in (BeamSearchScorer, LegacyBeamSearchScorer)
+            ]
+            self.assertListEqual(outputs[0].tolist(), outputs[1].tolist())
+
 
 @require_torch
 class ConstrainedBeamSearchTest(unittest.TestCase):
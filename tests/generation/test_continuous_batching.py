@@ -0,0 +1,136 @@
+# coding=utf-8
+# Copyright 2023 The HuggingFace Team Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a clone of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from transformers import is_torch_available
+from transformers.testing_utils import require_torch, torch_device
+
+from ..models.gpt2.test_modeling_gpt2 import GPT2ModelTester
+from ..models.llama.test_modeling_llama import LlamaModelTester
+from ..test_modeling_common import ids_tensor
+
+
+if is_torch_available():
+    import torch
+
+    from transformers import ContinuousBatchingEngine, GPT2LMHeadModel, LlamaForCausalLM, StoppingCriteriaList
+    from transformers.generation import StoppingCriteria
+
+
+@require_torch
+class ContinuousBatchingEngineTest(unittest.TestCase):
+    def get_models(self):
+        torch.manual_seed(0)
+        models = []
+        for model_class, model_tester in ((GPT2LMHeadModel, GPT2ModelTester), (LlamaForCausalLM, LlamaModelTester)):
+            config = model_tester(self).get_config()
+            # generations are not stopped early, and prompts are never masked as padding
+            config.pad_token_id = config.eos_token_id = -1
+            models.append(model_class(config).to(torch_device).eval())
+        return models
+
+    def test_matches_generate(self):
+        prompt_lengths = [5, 3, 8, 2, 6]
+        max_new_tokens = [4, 9, 2, 6, 5]
+        for model in self.get_models():
+            prompts = [ids_tensor((1, length), model.config.vocab_size)[0] for length in prompt_lengths]
+            engine = ContinuousBatchingEngine(model, max_batch_size=2)
+            request_ids = [
+                engine.add_request(prompt, max_new_tokens=num_tokens)
+                for prompt, num_tokens in zip(prompts, max_new_tokens)
+            ]
+            self.assertEqual(engine.num_queued_requests, 5)
+
+            finished = {}
+            while engine.has_unfinished_requests():
+                for request in engine.step():
+                    finished[request.request_id] = request
+                self.assertLessEqual(engine.num_running_requests, 2)
+
+            for request_id, prompt, num_tokens in zip(request_ids, prompts, max_new_tokens):
+                expected = model.generate(prompt[None], max_new_tokens=num_tokens, do_sample=False)
+                self.assertListEqual(finished[request_id].sequence.tolist(), expected[0].tolist())
+                self.assertEqual(len(finished[request_id].generated_ids), num_tokens)
+
+    def test_generate(self):
+        model = self.get_models()[1]
+        prompts = [[1, 2, 3], [4, 5], [6, 7, 8, 9]]
+        engine = ContinuousBatchingEngine(model, max_batch_size=2)
+        sequences = engine.generate(prompts, max_new_tokens=3)
+        for prompt, sequence in zip(prompts, sequences):
+            expected = model.generate(torch.tensor([prompt], device=torch_device), max_new_tokens=3)
+            self.assertListEqual(sequence.tolist(), expected[0].tolist())
+        self.assertFalse(engine.has_unfinished_requests())
+
+    def test_eviction(self):
+        model = self.get_models()[0]
+
+        class StopAtLength(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                return input_ids.shape[-1] == 5
+
+        engine = ContinuousBatchingEngine(
+            model, max_batch_size=2, stopping_criteria=StoppingCriteriaList([StopAtLength()])
+        )
+        prompt = ids_tensor((1, 4), model.config.vocab_size)[0]
+        engine.add_request(prompt, max_new_tokens=10)
+        engine.add_request(ids_tensor((1, 7), model.config.vocab_size)[0], max_new_tokens=10)
+        engine.add_request(ids_tensor((1, 6), model.config.vocab_size)[0], max_new_tokens=10)
+
+        # the first request stops at its first token and its slot is given to the third request at the next step
+        finished = engine.step()
+        self.assertEqual([request.request_id for request in finished], [0])
+        self.assertEqual(engine.num_running_requests, 1)
+        engine.step()
+        self.assertEqual(engine.num_running_requests + len(finished), 3)
+        self.assertEqual(engine.num_queued_requests, 0)
+
+    def test_sampling(self):
+        model = self.get_models()[0]
+        engine = ContinuousBatchingEngine(model, max_batch_size=3)
+        prompts = [ids_tensor((1, length), model.config.vocab_size)[0] for length in (3, 5)]
+        sequences = engine.generate(prompts, do_sample=True, top_k=5, max_new_tokens=4)
+        for prompt, sequence in zip(prompts, sequences):
+            self.assertEqual(len(sequence), len(prompt) + 4)
+            self.assertListEqual(sequence[: len(prompt)].tolist(), prompt.tolist())
+
+    def test_mixed_generation_parameters(self):
+        model = self.get_models()[0]
+        prompts = [ids_tensor((1, length), model.config.vocab_size)[0] for length in (3, 5, 4, 6)]
+        # requests with logits processors are decoded one by one, the others by groups of sampling parameters
+        request_kwargs = [{}, {"repetition_penalty": 1.5}, {"do_sample": True, "top_k": 5}, {}]
+        engine = ContinuousBatchingEngine(model, max_batch_size=4)
+        request_ids = [
+            engine.add_request(prompt, max_new_tokens=5, **kwargs) for prompt, kwargs in zip(prompts, request_kwargs)
+        ]
+        finished = {}
+        while engine.has_unfinished_requests():
+            for request in engine.step():
+                finished[request.request_id] = request
+
+        for request_id, prompt, kwargs in zip(request_ids, prompts, request_kwargs):
+            self.assertEqual(len(finished[request_id].generated_ids), 5)
+            if not kwargs.get("do_sample"):
+                expected = model.generate(prompt[None], max_new_tokens=5, **kwargs)
+                self.assertListEqual(finished[request_id].sequence.tolist(), expected[0].tolist())
+
+    def test_unsupported_generation_parameters(self):
+        model = self.get_models()[0]
+        engine = ContinuousBatchingEngine(model)
+        with self.assertRaises(ValueError):
+            engine.add_request([1, 2, 3], num_beams=2)
+        with self.assertRaises(ValueError):
+            engine.add_request([1, 2, 3], attention_mask=[1, 1, 1])
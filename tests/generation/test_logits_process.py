@@ -36,6 +36,7 @@ if is_torch_available():
         ExponentialDecayLengthPenalty,
         ForcedBOSTokenLogitsProcessor,
         ForcedEOSTokenLogitsProcessor,
+        FusedLogitsWarper,
         HammingDiversityLogitsProcessor,
         InfNanRemoveLogitsProcessor,
         LogitNormalization,
@@ -286,6 +287,62 @@ class LogitsProcessorTest(unittest.TestCase):
         # first batch should keep three tokens, second batch would keep only 1, but due to `min_tokens_to_keep=2` keeps 2.
         self.assertListEqual((filtered_dist != 0.0).to(torch.long).sum(dim=-1).tolist(), [3, 2])
 
+    def test_fused_dist_warper(self):
+        input_ids = None
+        vocab_size = 1000
+        batch_size = 4
+
+        torch.manual_seed(0)
+        logits = torch.randn((batch_size, vocab_size), device=torch_device) * 3
+        # some tokens may already be filtered out by the logits processors
+        logits[0, 10:] = -float("inf")
+        # tied scores are filtered depending on their position in the sorted scores
+        logits[1] = 0.0
+        logits[2] = logits[2].round()
+        logits_copy = logits.clone()
+
+        for temperature, top_k, top_p, min_tokens_to_keep in [
+            (0.7, 50, 0.9, 1),
+            (None, 50, 0.5, 1),
+            (1.5, None, 0.95, 1),
+            (None, 20, None, 1),
+            (0.5, None, None, 1),
+            (0.7, 10, 0.01, 2),
+            (None, 2000, 0.8, 1),
+        ]:
+            warpers = []
+            if temperature is not None:
+                warpers.append(TemperatureLogitsWarper(temperature))
+            if top_k is not None:
+                warpers.append(TopKLogitsWarper(top_k, min_tokens_to_keep=min_tokens_to_keep))
+            if top_p is not None:
+                warpers.append(TopPLogitsWarper(top_p, min_tokens_to_keep=min_tokens_to_keep))
+            expected_scores = LogitsProcessorList(warpers)(input_ids, logits)
+
+            # without top-k, top-p is computed on the largest scores only when they hold enough probability mass
+            for num_top_p_candidates in [1024, 100, 5]:
+                fused_warp = FusedLogitsWarper(
+                    temperature=temperature, top_k=top_k, top_p=top_p, min_tokens_to_keep=min_tokens_to_keep
+                )
+                fused_warp.num_top_p_candidates = num_top_p_candidates
+                scores = fused_warp(input_ids, logits)
+                self.assertTrue(torch.equal(scores, expected_scores), (temperature, top_k, top_p))
+                # the input scores are not modified in place
+                self.assertTrue(torch.equal(logits, logits_copy))
+
+        # top-k keeps all the scores tied with the k-th largest score, that top-p is then computed on
+        tied_logits = torch.tensor([[0.0, 2.0, 2.0, -1.0, 0.0]], device=torch_device)
+        warpers = [TemperatureLogitsWarper(0.7), TopKLogitsWarper(3), TopPLogitsWarper(0.95)]
+        expected_scores = LogitsProcessorList(warpers)(input_ids, tied_logits)
+        scores = FusedLogitsWarper(temperature=0.7, top_k=3, top_p=0.95)(input_ids, tied_logits)
+        self.assertTrue(torch.equal(scores, expected_scores))
+        self.assertTrue(torch.isfinite(scores[0, 4]))
+
+        # at least `min_tokens_to_keep` tokens are kept
+        fused_warp = FusedLogitsWarper(top_k=1, top_p=0.1, min_tokens_to_keep=3, filter_value=0.0)
+        ramp_logits = torch.arange(5, device=torch_device, dtype=torch.float).unsqueeze(0).repeat(batch_size, 1) * 10
+        self.assertListEqual((fused_warp(input_ids, ramp_logits) != 0.0).sum(dim=-1).tolist(), [3] * batch_size)
+
     def test_typical_dist_warper(self):
         input_ids = None
         vocab_size = 10
@@ -426,6 +483,27 @@ class LogitsProcessorTest(unittest.TestCase):
             torch.isinf(filtered_scores_3_gram).tolist(), [[False, False, False], [True, False, False]]
         )
 
+    def test_no_repeat_ngram_dist_processor_matches_reference(self):
+        vocab_size = 5
+        input_ids = ids_tensor((6, 20), vocab_size=vocab_size)
+
+        for ngram_size in range(1, 5):
+            no_repeat_proc = NoRepeatNGramLogitsProcessor(ngram_size)
+            for cur_len in range(1, input_ids.shape[-1] + 1):
+                filtered_scores = no_repeat_proc(input_ids[:, :cur_len], self._get_uniform_logits(6, vocab_size))
+
+                # a token is banned if it completes an n-gram that has already been generated
+                for hypo, hypo_scores in zip(input_ids[:, :cur_len].tolist(), filtered_scores):
+                    prefix = hypo[len(hypo) - ngram_size + 1 :] if ngram_size > 1 else []
+                    banned_tokens = {
+                        hypo[i + ngram_size - 1]
+                        for i in range(len(hypo) - ngram_size + 1)
+                        if hypo[i : i + ngram_size - 1] == prefix
+                    }
+                    self.assertListEqual(
+                        torch.isinf(hypo_scores).tolist(), [token in banned_tokens for token in range(vocab_size)]
+                    )
+
     def test_encoder_no_repeat_ngram_dist_processor(self):
         vocab_size = 3
         num_beams = 2
@@ -534,6 +612,38 @@ class LogitsProcessorTest(unittest.TestCase):
             filtered_scores.tolist(), [[-100.0, 100.0, 0.0, -100.0, 100.0], [-100.0, 100.0, -100.0, 0.0, 100.0]]
         )
 
+    def test_bias_dist_processor_overlapping_sequences(self):
+        vocab_size = 5
+
+        input_ids = torch.tensor([[2, 0, 1, 2], [3, 1, 2, 3], [1, 2, 1, 2]], device=torch_device, dtype=torch.long)
+        # (0, 1, 2, 4) and (1, 2, 4) share their termination, (1, 2, 3) matches through the suffix of (0, 1, 2) and
+        # (1, 2, 1, 2, 0) is longer than the context, so it is ignored
+        sequence_bias = {
+            (0, 1, 2, 4): -10.0,
+            (1, 2, 4): -1.0,
+            (1, 2, 3): 2.0,
+            (2, 3, 0): 5.0,
+            (1, 2, 1, 2, 0): 100.0,
+            (4,): 1.0,
+        }
+        scores = torch.zeros((3, vocab_size), dtype=torch.float, device=torch_device)
+
+        bias_dist_proc = SequenceBiasLogitsProcessor(sequence_bias=sequence_bias)
+        filtered_scores = bias_dist_proc(input_ids, scores.clone())
+
+        self.assertListEqual(
+            filtered_scores.tolist(),
+            [[0.0, 0.0, 0.0, 2.0, -10.0], [5.0, 0.0, 0.0, 0.0, 1.0], [0.0, 0.0, 0.0, 2.0, 0.0]],
+        )
+
+        # sequences sharing their termination can also be forbidden
+        no_bad_words_dist_proc = NoBadWordsLogitsProcessor(bad_words_ids=[[0, 1, 2, 4], [3, 2, 4]], eos_token_id=None)
+        filtered_scores = no_bad_words_dist_proc(input_ids, scores.clone())
+        self.assertListEqual(
+            torch.isinf(filtered_scores).tolist(),
+            [[False, False, False, False, True], [False, False, False, False, False], [False] * vocab_size],
+        )
+
     def test_processor_list(self):
         batch_size = 4
         sequence_length = 10
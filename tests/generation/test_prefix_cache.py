@@ -0,0 +1,132 @@
+# coding=utf-8
+# Copyright 2023 The HuggingFace Team Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a clone of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import mock
+
+from transformers import is_torch_available
+from transformers.testing_utils import require_torch, torch_device
+
+from ..models.gpt2.test_modeling_gpt2 import GPT2ModelTester
+from ..models.llama.test_modeling_llama import LlamaModelTester
+from ..test_modeling_common import ids_tensor
+
+
+if is_torch_available():
+    import torch
+
+    from transformers import GPT2LMHeadModel, LlamaForCausalLM, PrefixCache
+
+
+@require_torch
+class PrefixCacheTest(unittest.TestCase):
+    def get_models(self):
+        torch.manual_seed(0)
+        models = []
+        for model_class, model_tester in ((GPT2LMHeadModel, GPT2ModelTester), (LlamaForCausalLM, LlamaModelTester)):
+            config = model_tester(self).get_config()
+            # generations are not stopped early, and prompts are never masked as padding
+            config.pad_token_id = config.eos_token_id = -1
+            models.append(model_class(config).to(torch_device).eval())
+        return models
+
+    def get_past_key_values(self, num_tokens, num_layers=2):
+        return tuple((torch.rand(1, 2, num_tokens, 4), torch.rand(1, 2, num_tokens, 4)) for _ in range(num_layers))
+
+    def test_lookup(self):
+        prefix_cache = PrefixCache(min_prefix_length=2)
+        self.assertEqual(prefix_cache.lookup(torch.tensor([1, 2, 3])), (0, None))
+
+        past_key_values = self.get_past_key_values(4)
+        prefix_cache.store(torch.tensor([1, 2, 3, 4]), past_key_values)
+        self.assertEqual(len(prefix_cache), 1)
+
+        # any prefix of a stored prompt can be reused
+        prefix_length, prefix_past = prefix_cache.lookup(torch.tensor([1, 2, 3, 7, 8]))
+        self.assertEqual(prefix_length, 3)
+        self.assertTrue(torch.equal(prefix_past[1][0], past_key_values[1][0][:, :, :3]))
+        prefix_length, prefix_past = prefix_cache.lookup(torch.tensor([1, 2]))
+        self.assertEqual(prefix_length, 2)
+        self.assertEqual(prefix_past[0][1].shape, (1, 2, 2, 4))
+
+        # shorter than `min_prefix_length`
+        self.assertEqual(prefix_cache.lookup(torch.tensor([1, 5, 3])), (0, None))
+
+        # the longest prefix wins
+        prefix_cache.store(torch.tensor([1, 2, 5]), self.get_past_key_values(3))
+        self.assertEqual(prefix_cache.lookup(torch.tensor([1, 2, 5, 6]))[0], 3)
+        self.assertEqual(prefix_cache.lookup(torch.tensor([1, 2, 3, 4, 5]))[0], 4)
+
+        with self.assertRaises(ValueError):
+            prefix_cache.store(torch.tensor([1, 2]), self.get_past_key_values(3))
+
+    def test_eviction(self):
+        entry_memory = 2 * 2 * (2 * 3 * 4) * 4
+        prefix_cache = PrefixCache(max_memory=2 * entry_memory)
+        prefix_cache.store(torch.tensor([1, 2, 3]), self.get_past_key_values(3))
+        prefix_cache.store(torch.tensor([4, 5, 6]), self.get_past_key_values(3))
+        self.assertEqual(prefix_cache.memory, 2 * entry_memory)
+
+        # the least recently used prompt is evicted
+        prefix_cache.lookup(torch.tensor([1, 2, 3]))
+        prefix_cache.store(torch.tensor([7, 8, 9]), self.get_past_key_values(3))
+        self.assertEqual(len(prefix_cache), 2)
+        self.assertEqual(prefix_cache.lookup(torch.tensor([4, 5, 6])), (0, None))
+        self.assertEqual(prefix_cache.lookup(torch.tensor([1, 2, 3]))[0], 3)
+
+        # prompts that are a prefix of a new prompt are replaced by it
+        prefix_cache.store(torch.tensor([1, 2]), self.get_past_key_values(2))
+        prefix_cache.store(torch.tensor([1, 2, 3, 4]), self.get_past_key_values(4))
+        self.assertEqual(len(prefix_cache), 1)
+
+        # states larger than `max_memory` are not stored
+        prefix_cache.store(torch.tensor(list(range(10))), self.get_past_key_values(10))
+        self.assertEqual(prefix_cache.lookup(torch.tensor(list(range(10)))), (0, None))
+
+        prefix_cache.clear()
+        self.assertEqual((len(prefix_cache), prefix_cache.memory), (0, 0))
+
+    def test_generate_with_prefix_cache(self):
+        for model in self.get_models():
+            prefix_cache = PrefixCache()
+            system_prompt = ids_tensor((1, 10), model.config.vocab_size)
+            for generation_kwargs in ({}, {"num_beams": 2}, {"do_sample": True, "num_return_sequences": 2}):
+                question = ids_tensor((1, 4), model.config.vocab_size)
+                input_ids = torch.cat([system_prompt, question], dim=-1)
+
+                torch.manual_seed(0)
+                expected_output = model.generate(input_ids, max_new_tokens=5, **generation_kwargs)
+                with mock.patch.object(model, "forward", wraps=model.forward) as forward:
+                    torch.manual_seed(0)
+                    output = model.generate(
+                        input_ids, max_new_tokens=5, prefix_cache=prefix_cache, **generation_kwargs
+                    )
+                    encoded_ids = forward.call_args_list[0].kwargs["input_ids"]
+                self.assertListEqual(output.tolist(), expected_output.tolist())
+                if generation_kwargs:
+                    # only the tokens of the question are encoded, except its last one
+                    self.assertListEqual(encoded_ids.tolist(), question[:, :-1].tolist())
+
+    def test_generate_with_padding(self):
+        model = self.get_models()[1]
+        prefix_cache = PrefixCache()
+        input_ids = ids_tensor((2, 6), model.config.vocab_size)
+        attention_mask = torch.ones_like(input_ids)
+        attention_mask[0, :2] = 0
+
+        expected_output = model.generate(input_ids, attention_mask=attention_mask, max_new_tokens=3)
+        output = model.generate(input_ids, attention_mask=attention_mask, max_new_tokens=3, prefix_cache=prefix_cache)
+        self.assertListEqual(output.tolist(), expected_output.tolist())
+        self.assertEqual(len(prefix_cache), 0)
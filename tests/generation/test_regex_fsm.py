@@ -0,0 +1,299 @@
+# coding=utf-8
+# Copyright 2023 The HuggingFace Team Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a clone of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from transformers import GPT2Config, GPT2Tokenizer, is_torch_available
+from transformers.generation import RegexFSM, json_schema_to_regex, regex_fsm
+from transformers.generation.regex_fsm import _JSON_TYPE_REGEXES, get_token_strings
+from transformers.testing_utils import require_torch, torch_device
+
+
+if is_torch_available():
+    import torch
+
+    from transformers import GPT2LMHeadModel, JsonSchemaLogitsProcessor, LogitsProcessorList, RegexLogitsProcessor
+
+
+def get_tokenizer(tmpdirname):
+    # "Ġ" is the space of the byte-level vocabulary
+    vocab = list('0123456789abcxyz{}[]":,.-') + ["Ġ", "12", "Ġ1", "ab", '{"', '":', '",', "true", "false"]
+    vocab += ["<|endoftext|>"]
+    vocab_file = os.path.join(tmpdirname, "vocab.json")
+    merges_file = os.path.join(tmpdirname, "merges.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        f.write(json.dumps({token: i for i, token in enumerate(vocab)}) + "\n")
+    with open(merges_file, "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+    return GPT2Tokenizer(vocab_file, merges_file)
+
+
+class RegexFSMTest(unittest.TestCase):
+    def accepts(self, fsm, token_ids):
+        state = fsm.initial_state
+        for token_id in token_ids:
+            state = fsm.next_state(state, token_id)
+            if state is None:
+                return False
+        return bool(fsm.is_final[state])
+
+    def assert_fsm_matches_re(self, regex, texts):
+        # each character is a token
+        token_strings = dict(enumerate(sorted({char for text in texts for char in text})))
+        token_ids = {string: token_id for token_id, string in token_strings.items()}
+        fsm = RegexFSM.compile(regex, token_strings)
+        for text in texts:
+            accepted = self.accepts(fsm, [token_ids[char] for char in text])
+            self.assertEqual(accepted, re.fullmatch(regex, text) is not None, (regex, text))
+
+    def test_compile(self):
+        token_strings = dict(enumerate(["a", "b", "c", "1", "-", ".", " ", '"', "ab", "a1", "1.", " a", '"a', "--"]))
+        patterns = [
+            r"a*b",
+            r"(ab|a1)+",
+            r"[a-b]{2,3}\.?",
+            r"-?[0-9]+(\.[0-9]+)?",
+            r'"[^"]*"',
+            r"a{3}",
+            r"(?:a|b)*?1",
+            r"a|",
+            r"[\d.]+ ?",
+            r"\w\W\w",
+            r"a{,2}b",
+            r".{2}",
+            r"[-a]b\-",
+            r"(a*b)?",
+            r"(ab+)?c",
+            r"(a*b)*c",
+            r"((a|b)*-)?a",
+        ]
+        for pattern in patterns:
+            fsm = RegexFSM.compile(pattern, token_strings)
+            for length in range(4):
+                for token_ids in itertools.product(token_strings, repeat=length):
+                    text = "".join(token_strings[token_id] for token_id in token_ids)
+                    self.assertEqual(
+                        self.accepts(fsm, token_ids), re.fullmatch(pattern, text) is not None, (pattern, text)
+                    )
+
+    def test_compile_unreachable_states(self):
+        # "c" can only be generated after "a", so "b" can't be generated first
+        fsm = RegexFSM.compile("(a|b)c", {0: "a", 1: "b", 2: "ac", 3: "bc"})
+        self.assertListEqual(fsm.allowed_token_ids(fsm.initial_state).tolist(), [2, 3])
+
+        with self.assertRaises(ValueError):
+            RegexFSM.compile("c", {0: "a", 1: "ac"})
+
+    def test_unsupported_regex(self):
+        for pattern in [r"(a)\1", r"(?=a)a", r"(a", r"a)", r"a^b", r"*a", r"\bab"]:
+            with self.assertRaises(ValueError):
+                RegexFSM.compile(pattern, {0: "a", 1: "b"})
+
+    def test_from_tokenizer(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            tokenizer = get_tokenizer(tmpdirname)
+            token_strings = get_token_strings(tokenizer)
+            self.assertNotIn(tokenizer.eos_token_id, token_strings)
+            self.assertEqual(token_strings[tokenizer.convert_tokens_to_ids("Ġ1")], " 1")
+
+            cache_dir = os.path.join(tmpdirname, "cache")
+            fsm = RegexFSM.from_tokenizer(r" ?[0-9]+", tokenizer, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            self.assertIs(RegexFSM.from_tokenizer(r" ?[0-9]+", tokenizer, cache_dir=cache_dir), fsm)
+
+            # in a new process, the FSM is loaded from the disk cache instead of being compiled again
+            with mock.patch.dict(regex_fsm._compiled_fsms, clear=True), mock.patch.object(
+                RegexFSM, "compile", side_effect=AssertionError
+            ):
+                loaded_fsm = RegexFSM.from_tokenizer(r" ?[0-9]+", tokenizer, cache_dir=cache_dir)
+            self.assertIsNot(loaded_fsm, fsm)
+            for name in ["offsets", "token_ids", "next_states", "is_final"]:
+                self.assertTrue(np.array_equal(getattr(loaded_fsm, name), getattr(fsm, name)))
+
+            # the vocabulary is only decoded again once tokens are added to the tokenizer
+            with mock.patch.dict(regex_fsm._compiled_fsms, clear=True), mock.patch.object(
+                regex_fsm, "get_token_strings", side_effect=AssertionError
+            ):
+                RegexFSM.from_tokenizer(r"[0-9]+", tokenizer, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            tokenizer.add_tokens(["123"])
+            self.assertIsNot(RegexFSM.from_tokenizer(r"[0-9]+", tokenizer, cache_dir=cache_dir), fsm)
+            self.assertEqual(len(os.listdir(cache_dir)), 3)
+
+    def test_json_schema_to_regex(self):
+        schema = {
+            "$defs": {"color": {"enum": ["red", "green"]}},
+            "type": "object",
+            "properties": {
+                "name": {"type": "string", "maxLength": 5},
+                "age": {"type": "integer"},
+                "scores": {"type": "array", "items": {"type": "number"}, "minItems": 1, "maxItems": 2},
+                "color": {"$ref": "#/$defs/color"},
+                "alive": {"type": ["boolean", "null"]},
+            },
+            "required": ["age", "color"],
+        }
+        regex = json_schema_to_regex(json.dumps(schema))
+
+        valid_documents = [
+            '{"age":12,"color":"red"}',
+            '{ "name": "Bob", "age": -3, "scores": [1.5, 2e3], "color": "green", "alive": null }',
+            '{"age":0,"scores":[-0.5],"color":"red","alive":true}',
+        ]
+        invalid_documents = [
+            '{"color":"red"}',
+            '{"age":12,"color":"blue"}',
+            '{"age":12,"name":"Bob","color":"red"}',
+            '{"name":"Robert","age":12,"color":"red"}',
+            '{"age":12,"scores":[],"color":"red"}',
+            '{"age":012,"color":"red"}',
+            '{"age":12  ,"color":"red"}',
+        ]
+        for document in valid_documents:
+            self.assertIsNotNone(re.fullmatch(regex, document), document)
+        for document in invalid_documents:
+            self.assertIsNone(re.fullmatch(regex, document), document)
+        # the compiled FSM accepts the same documents
+        self.assert_fsm_matches_re(regex, valid_documents + invalid_documents)
+
+        numbers = ["0", "05", "007", "05e1", "-0", "-01", "12", "1.5", "1.", "0.05", "1E+5", "2e-0", "1e", "--1"]
+        self.assert_fsm_matches_re(_JSON_TYPE_REGEXES["number"], numbers)
+        number_array_regex = json_schema_to_regex({"type": "array", "items": {"type": "number"}})
+        self.assert_fsm_matches_re(number_array_regex, ["[05]", "[0,5]", "[0.5, 12]", "[]", "[1,]", "[-0.0e0]"])
+
+        self.assertIsNotNone(re.fullmatch(json_schema_to_regex({"type": "object"}), '{"a": 1, "b": "c"}'))
+        self.assertIsNotNone(re.fullmatch(json_schema_to_regex({"format": "date", "type": "string"}), '"2023-07-14"'))
+
+        with self.assertRaises(ValueError):
+            json_schema_to_regex({"$defs": {"node": {"items": {"$ref": "#/$defs/node"}}}, "$ref": "#/$defs/node"})
+
+
+@require_torch
+class RegexLogitsProcessorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdirname = tempfile.mkdtemp()
+        self.tokenizer = get_tokenizer(self.tmpdirname)
+        self.cache_dir = os.path.join(self.tmpdirname, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdirname, ignore_errors=True)
+
+    def test_processor(self):
+        processor = RegexLogitsProcessor(r"1(2|x)+", self.tokenizer, cache_dir=self.cache_dir)
+        vocab_size = len(self.tokenizer)
+        eos_token_id = self.tokenizer.eos_token_id
+        token_1, token_2, token_x, token_12 = self.tokenizer.convert_tokens_to_ids(["1", "2", "x", "12"])
+
+        def allowed_tokens(input_ids):
+            scores = processor(torch.tensor(input_ids, device=torch_device), torch.zeros((len(input_ids), vocab_size)))
+            return [torch.isfinite(row).nonzero()[:, 0].tolist() for row in scores]
+
+        prompt = [eos_token_id, 0]
+        self.assertListEqual(allowed_tokens([prompt, prompt]), [[token_1, token_12]] * 2)
+        self.assertListEqual(allowed_tokens([prompt + [token_1]] * 2), [[token_2, token_x]] * 2)
+        # the hypotheses are reordered and extended
+        input_ids = [prompt + [token_1, token_x], prompt + [token_1, token_2]]
+        self.assertListEqual(allowed_tokens(input_ids), [sorted([token_2, token_x, eos_token_id])] * 2)
+        input_ids = [input_ids[1] + [eos_token_id], input_ids[1] + [token_2]]
+        self.assertListEqual(
+            allowed_tokens(input_ids), [list(range(vocab_size)), sorted([token_2, token_x, eos_token_id])]
+        )
+        # the beams reordered by beam search are followed by only reading the last token of each hypothesis
+        processor.reorder_beams(torch.tensor([1, 1], device=torch_device))
+        input_ids = [input_ids[1] + [token_x], input_ids[1] + [eos_token_id]]
+        with mock.patch.object(processor.fsm, "next_state", wraps=processor.fsm.next_state) as next_state:
+            self.assertListEqual(
+                allowed_tokens(input_ids), [sorted([token_2, token_x, eos_token_id]), list(range(vocab_size))]
+            )
+        self.assertEqual(next_state.call_count, len(input_ids))
+
+        # hypotheses rolled back to a previous length
+        self.assertListEqual(allowed_tokens([prompt + [token_1]]), [[token_2, token_x]])
+        # a new generation, even when its prompt continues the previous hypotheses
+        processor.reset()
+        self.assertListEqual(allowed_tokens([prompt + [token_1, token_2]]), [[token_1, token_12]])
+        self.assertListEqual(allowed_tokens([prompt + [token_1, token_2, token_1]]), [[token_2, token_x]])
+
+    def test_generate(self):
+        torch.manual_seed(0)
+        vocab_size = len(self.tokenizer)
+        model = GPT2LMHeadModel(GPT2Config(vocab_size=vocab_size, n_embd=32, n_layer=2, n_head=4)).to(torch_device)
+        model.eval()
+        input_ids = torch.tensor([[3, 5, 7]], device=torch_device)
+
+        regex = r" ?(1|2){2,4}x"
+        processor = RegexLogitsProcessor(regex, self.tokenizer, cache_dir=self.cache_dir)
+        for generation_kwargs in [{}, {"do_sample": True, "num_return_sequences": 3}, {"num_beams": 3}]:
+            outputs = model.generate(
+                input_ids,
+                logits_processor=LogitsProcessorList([processor]),
+                max_new_tokens=10,
+                pad_token_id=self.tokenizer.eos_token_id,
+                eos_token_id=self.tokenizer.eos_token_id,
+                **generation_kwargs,
+            )
+            for output in outputs:
+                self.assertEqual(output[-1].item(), self.tokenizer.eos_token_id)
+                text = self.tokenizer.decode(output[input_ids.shape[-1] :], skip_special_tokens=True)
+                self.assertIsNotNone(re.fullmatch(regex, text), text)
+
+        # the processor is reused across the turns of a conversation, whose prompts grow with each answer
+        prompt_ids = input_ids
+        for turn_ids in [[], [4, 6], [8]]:
+            prompt_ids = torch.cat([prompt_ids, torch.tensor([turn_ids], dtype=torch.long, device=torch_device)], -1)
+            outputs = [
+                model.generate(
+                    prompt_ids,
+                    logits_processor=LogitsProcessorList([logits_processor]),
+                    max_new_tokens=10,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    eos_token_id=self.tokenizer.eos_token_id,
+                )
+                for logits_processor in [
+                    processor,
+                    RegexLogitsProcessor(regex, self.tokenizer, cache_dir=self.cache_dir),
+                ]
+            ]
+            self.assertListEqual(outputs[0].tolist(), outputs[1].tolist())
+            text = self.tokenizer.decode(outputs[0][0, prompt_ids.shape[-1] :], skip_special_tokens=True)
+            self.assertIsNotNone(re.fullmatch(regex, text), text)
+            prompt_ids = outputs[0]
+
+        schema = {
+            "type": "object",
+            "properties": {"ab": {"type": "string", "maxLength": 3}, "c": {"type": "boolean"}},
+            "required": ["ab", "c"],
+        }
+        processor = JsonSchemaLogitsProcessor(schema, self.tokenizer, cache_dir=self.cache_dir)
+        outputs = model.generate(
+            input_ids,
+            logits_processor=LogitsProcessorList([processor]),
+            max_new_tokens=40,
+            pad_token_id=self.tokenizer.eos_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+        )
+        document = json.loads(self.tokenizer.decode(outputs[0, input_ids.shape[-1] :], skip_special_tokens=True))
+        self.assertListEqual(list(document), ["ab", "c"])
+        self.assertLessEqual(len(document["ab"]), 3)
+        self.assertIsInstance(document["c"], bool)
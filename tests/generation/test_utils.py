@@ -37,6 +37,7 @@ if is_torch_available():
         AutoTokenizer,
         BartForConditionalGeneration,
         BartTokenizer,
+        GPT2Config,
         GPT2LMHeadModel,
         GPT2Tokenizer,
         ImageGPTForCausalImageModeling,
@@ -72,6 +73,7 @@ if is_torch_available():
         TopKLogitsWarper,
         TopPLogitsWarper,
     )
+    from transformers.generation.utils import _prompt_lookup_candidates
 
 
 class GenerationTesterMixin:
@@ -1569,6 +1571,71 @@ class GenerationTesterMixin:
 
             self._check_outputs(output_assisted, input_ids, model.config, use_cache=True)
 
+    def test_prompt_lookup_decoding_matches_greedy_search(self):
+        # Candidate tokens looked up in the prompt are verified by the model, hence the same output as greedy search
+        # whether they are correct or not. See `test_assisted_decoding_matches_greedy_search` for the skipped models.
+
+        for model_class in self.all_generative_model_classes:
+            # won't fix: FSMT and Reformer have a different cache variable type (and format).
+            if any(model_name in model_class.__name__.lower() for model_name in ["fsmt", "reformer"]):
+                return
+            # may fix in the future: the following models fail with assisted decoding, and need model-specific fixes
+            if any(
+                model_name in model_class.__name__.lower()
+                for model_name in ["bigbirdpegasus", "led", "mega", "speech2text", "git", "prophetnet"]
+            ):
+                return
+
+            # This for loop is a naive and temporary effort to make the test less flaky.
+            failed = 0
+            for i in range(10):
+                config, input_ids, attention_mask, max_length = self._get_input_ids_and_config(batch_size=1)
+
+                # NOTE: assisted generation only works with cache on at the moment.
+                if not hasattr(config, "use_cache"):
+                    return
+
+                config.use_cache = True
+                config.is_decoder = True
+                model = model_class(config).to(torch_device).eval()
+                output_greedy = model.generate(
+                    input_ids,
+                    attention_mask=attention_mask,
+                    max_length=max_length,
+                    num_beams=1,
+                    do_sample=False,
+                    output_scores=True,
+                    output_hidden_states=True,
+                    output_attentions=True,
+                    return_dict_in_generate=True,
+                )
+                output_prompt_lookup = model.generate(
+                    input_ids,
+                    attention_mask=attention_mask,
+                    max_length=max_length,
+                    num_beams=1,
+                    do_sample=False,
+                    prompt_lookup_num_tokens=2,  # triggers assisted decoding without an assistant model
+                    max_matching_ngram_size=2,
+                    output_scores=True,
+                    output_hidden_states=True,
+                    output_attentions=True,
+                    return_dict_in_generate=True,
+                )
+
+                try:
+                    self.assertListEqual(output_greedy.sequences.tolist(), output_prompt_lookup.sequences.tolist())
+
+                    for output in (output_greedy, output_prompt_lookup):
+                        self._check_outputs(output, input_ids, model.config, use_cache=True)
+                except AssertionError:
+                    failed += 1
+                    if failed > 1:
+                        self.assertListEqual(output_greedy.sequences.tolist(), output_prompt_lookup.sequences.tolist())
+
+                        for output in (output_greedy, output_prompt_lookup):
+                            self._check_outputs(output, input_ids, model.config, use_cache=True)
+
     def test_generate_with_head_masking(self):
         """Test designed for encoder-decoder models to ensure the attention head masking is used."""
         attention_names = ["encoder_attentions", "decoder_attentions", "cross_attentions"]
@@ -2779,3 +2846,51 @@ class GenerationIntegrationTests(unittest.TestCase, GenerationIntegrationTestsMi
         with self.assertRaises(TypeError):
             # FakeEncoder.forward() accepts **kwargs -> no filtering -> type error due to unexpected input "foo"
             bart_model.generate(input_ids, foo="bar")
+
+    def test_prompt_lookup_candidates(self):
+        input_ids = torch.tensor([[5, 6, 7, 8, 9, 5, 6, 7, 3, 5, 6]], device=torch_device)
+        eos_token_id_tensor = torch.tensor([4, 9], device=torch_device)
+
+        # the trailing bigram `5 6` last occurred before `7 3`
+        candidate_ids, is_eos = _prompt_lookup_candidates(input_ids, 3, 2)
+        self.assertListEqual(candidate_ids[0, input_ids.shape[-1] :].tolist(), [7, 3, 5])
+        self.assertFalse(is_eos)
+
+        # when the trailing n-gram does not occur, smaller n-grams are tried
+        input_ids = torch.tensor([[5, 6, 7, 8, 9, 3, 6]], device=torch_device)
+        candidate_ids, is_eos = _prompt_lookup_candidates(input_ids, 4, 2, eos_token_id_tensor)
+        self.assertListEqual(candidate_ids[0, input_ids.shape[-1] :].tolist(), [7, 8, 9])
+        self.assertTrue(is_eos)
+
+        candidate_ids, is_eos = _prompt_lookup_candidates(torch.tensor([[1, 2, 3]], device=torch_device), 4, 2)
+        self.assertListEqual(candidate_ids.tolist(), [[1, 2, 3]])
+        self.assertFalse(is_eos)
+
+    def test_prompt_lookup_decoding(self):
+        torch.manual_seed(0)
+        # the padding token does not occur in the inputs, which would otherwise be masked
+        config = GPT2Config(vocab_size=99, n_embd=32, n_layer=2, n_head=4, eos_token_id=-1, pad_token_id=-1)
+        model = GPT2LMHeadModel(config).to(torch_device).eval()
+        prompt = ids_tensor((1, 8), model.config.vocab_size)
+        greedy_ids = model.generate(prompt, max_new_tokens=12, do_sample=False)
+        # a prompt that contains the continuation it will be completed with
+        input_ids = torch.cat((greedy_ids, prompt), dim=-1)
+        expected_ids = model.generate(input_ids, max_new_tokens=12, do_sample=False)
+
+        num_forward_calls = 0
+        forward = model.forward
+
+        def counting_forward(*args, **kwargs):
+            nonlocal num_forward_calls
+            num_forward_calls += 1
+            return forward(*args, **kwargs)
+
+        model.forward = counting_forward
+        output_ids = model.generate(input_ids, max_new_tokens=12, do_sample=False, prompt_lookup_num_tokens=4)
+        self.assertListEqual(output_ids.tolist(), expected_ids.tolist())
+        self.assertLessEqual(num_forward_calls, 12)
+
+        with self.assertRaises(ValueError):
+            model.generate(input_ids, max_new_tokens=2, prompt_lookup_num_tokens=4, assistant_model=model)
+        with self.assertRaises(ValueError):
+            model.generate(input_ids, max_new_tokens=2, prompt_lookup_num_tokens=4, num_beams=2)
@@ -29,7 +29,7 @@ from ...test_pipeline_mixin import PipelineTesterMixin
 if is_torch_available():
     import torch
 
-    from transformers import LlamaForCausalLM, LlamaForSequenceClassification, LlamaModel
+    from transformers import LlamaForCausalLM, LlamaForSequenceClassification, LlamaModel, PagedCache, StaticCache
 
 
 class LlamaModelTester:
@@ -329,6 +329,125 @@ class LlamaModelTest(ModelTesterMixin, GenerationTesterMixin, PipelineTesterMixi
         result = model(input_ids, attention_mask=attention_mask, labels=sequence_labels)
         self.assertEqual(result.logits.shape, (self.model_tester.batch_size, self.model_tester.num_labels))
 
+    def test_static_cache(self):
+        config, input_ids, _, input_mask, *_ = self.model_tester.prepare_config_and_inputs()
+        model = LlamaForCausalLM(config).to(torch_device).eval()
+        next_tokens = ids_tensor((self.model_tester.batch_size, 3), config.vocab_size)
+
+        outputs = model(input_ids, attention_mask=input_mask, use_cache=True)
+        expected_logits = model(
+            next_tokens,
+            attention_mask=torch.cat([input_mask, torch.ones_like(next_tokens)], dim=-1),
+            past_key_values=outputs.past_key_values,
+        ).logits
+
+        max_cache_len = input_ids.shape[1] + 10
+        past_key_values = StaticCache(config, max_cache_len=max_cache_len)
+        outputs = model(input_ids, attention_mask=input_mask, past_key_values=past_key_values, use_cache=True)
+        self.assertIs(outputs.past_key_values, past_key_values)
+        self.assertEqual(past_key_values.get_seq_length(), input_ids.shape[1])
+        key_buffer = past_key_values.key_cache[0]
+
+        logits = model(
+            next_tokens,
+            attention_mask=torch.cat([input_mask, torch.ones_like(next_tokens)], dim=-1),
+            past_key_values=outputs.past_key_values,
+        ).logits
+        self.assertTrue(torch.allclose(logits, expected_logits, atol=1e-5))
+        # the new key/values are written in place in the preallocated buffers
+        self.assertEqual(past_key_values.get_seq_length(), input_ids.shape[1] + 3)
+        self.assertIs(past_key_values.key_cache[0], key_buffer)
+        self.assertEqual(key_buffer.shape[2], max_cache_len)
+
+        with self.assertRaises(ValueError):
+            model(ids_tensor((self.model_tester.batch_size, 8), config.vocab_size), past_key_values=past_key_values)
+
+    def test_generate_with_static_cache(self):
+        config, input_ids, _, input_mask, *_ = self.model_tester.prepare_config_and_inputs()
+        config.pad_token_id = config.eos_token_id = -1
+        model = LlamaForCausalLM(config).to(torch_device).eval()
+        # left padding
+        input_mask[0, :3] = 0
+
+        for generation_kwargs in ({}, {"num_beams": 2, "num_return_sequences": 2}):
+            expected_output = model.generate(
+                input_ids, attention_mask=input_mask, max_new_tokens=8, do_sample=False, **generation_kwargs
+            )
+            output = model.generate(
+                input_ids,
+                attention_mask=input_mask,
+                max_new_tokens=8,
+                do_sample=False,
+                cache_implementation="static",
+                **generation_kwargs,
+            )
+            self.assertListEqual(output.tolist(), expected_output.tolist())
+
+        with self.assertRaises(ValueError):
+            model.generate(input_ids, max_new_tokens=2, penalty_alpha=0.6, top_k=4, cache_implementation="static")
+
+    def test_paged_cache(self):
+        config, input_ids, _, input_mask, *_ = self.model_tester.prepare_config_and_inputs()
+        model = LlamaForCausalLM(config).to(torch_device).eval()
+        batch_size, seq_length = input_ids.shape
+        next_tokens = ids_tensor((batch_size, 3), config.vocab_size)
+        attention_mask = torch.cat([input_mask, torch.ones_like(next_tokens)], dim=-1)
+
+        outputs = model(input_ids, attention_mask=input_mask, use_cache=True)
+        expected_logits = model(
+            next_tokens, attention_mask=attention_mask, past_key_values=outputs.past_key_values
+        ).logits
+
+        # the cached states are attended two blocks at a time
+        past_key_values = PagedCache(config, block_size=4, chunk_size=8)
+        outputs = model(input_ids, attention_mask=input_mask, past_key_values=past_key_values, use_cache=True)
+        self.assertIs(outputs.past_key_values, past_key_values)
+        # blocks are allocated as the sequences grow
+        num_blocks = (seq_length + 3) // 4
+        self.assertEqual(past_key_values.num_used_blocks, batch_size * num_blocks)
+
+        logits = model(next_tokens, attention_mask=attention_mask, past_key_values=past_key_values).logits
+        self.assertTrue(torch.allclose(logits, expected_logits, atol=1e-5))
+        self.assertEqual(past_key_values.get_seq_length(), seq_length + 3)
+
+        # reordering the sequences shares their blocks, the shared block being written to is copied on write
+        past_key_values.reorder_cache(torch.zeros(batch_size, dtype=torch.long, device=torch_device))
+        num_full_blocks, has_partial_block = divmod(seq_length + 3, 4)
+        self.assertTrue(has_partial_block)
+        self.assertEqual(past_key_values.num_used_blocks, num_full_blocks + 1)
+        model(next_tokens[:1].expand(batch_size, -1), past_key_values=past_key_values)
+        # the full blocks stay shared, each sequence has its own copy of the partial block and a new block
+        self.assertEqual(past_key_values.num_used_blocks, num_full_blocks + 2 * batch_size)
+
+        with self.assertRaises(ValueError):
+            model(input_ids, past_key_values=PagedCache(config, block_size=4, num_blocks=2))
+
+    def test_generate_with_paged_cache(self):
+        config, input_ids, _, input_mask, *_ = self.model_tester.prepare_config_and_inputs()
+        config.pad_token_id = config.eos_token_id = -1
+        model = LlamaForCausalLM(config).to(torch_device).eval()
+        # left padding
+        input_mask[0, :3] = 0
+
+        for generation_kwargs in (
+            {"do_sample": False},
+            {"do_sample": False, "num_beams": 3, "num_return_sequences": 2},
+            {"do_sample": True, "num_return_sequences": 3},
+        ):
+            torch.manual_seed(0)
+            expected_output = model.generate(
+                input_ids, attention_mask=input_mask, max_new_tokens=8, **generation_kwargs
+            )
+            torch.manual_seed(0)
+            output = model.generate(
+                input_ids,
+                attention_mask=input_mask,
+                max_new_tokens=8,
+                cache_implementation="paged",
+                **generation_kwargs,
+            )
+            self.assertListEqual(output.tolist(), expected_output.tolist())
+
     @unittest.skip("LLaMA buffers include complex numbers, which breaks this test")
     def test_save_load_fast_init_from_base(self):
         pass
@@ -14,6 +14,8 @@
 # limitations under the License.
 
 
+import os
+import tempfile
 import unittest
 
 import numpy as np
@@ -31,6 +33,15 @@ if is_vision_available():
     from PIL import Image
 
     from transformers import Vit3dImageProcessor
+    from transformers.image_utils import PILImageResampling
+    from transformers.models.vit3d.image_processing_vit3d import (
+        center_crop_volume,
+        load_volume,
+        normalize_volume,
+        read_volume,
+        rescale_and_normalize_volume,
+        resize_volume,
+    )
 
 
 class Vit3dImageProcessingTester(unittest.TestCase):
@@ -196,3 +207,143 @@ class Vit3dImageProcessingTest(ImageProcessingSavingTestMixin, unittest.TestCase
                 self.image_processor_tester.size["width"],
             ),
         )
+
+    def test_call_numpy_volumes(self):
+        image_processing = self.image_processing_class(
+            **self.image_processor_dict, do_center_crop=True, crop_size={"depth": 6, "height": 16, "width": 16}
+        )
+        size = {"depth": 8, **self.image_processor_tester.size}
+        num_channels = self.image_processor_tester.num_channels
+        volumes = [np.random.randint(0, 256, (num_channels, 10, 30, 40), dtype=np.uint8) for _ in range(3)]
+
+        # Test not batched input
+        encoded_volumes = image_processing(volumes[0], size=size, return_tensors="pt").pixel_values
+        self.assertEqual(encoded_volumes.shape, (1, num_channels, 6, 16, 16))
+
+        # Test batched, volumes of the same shape are resized together
+        encoded_volumes = image_processing(volumes, size=size, return_tensors="pt").pixel_values
+        self.assertEqual(encoded_volumes.shape, (3, num_channels, 6, 16, 16))
+
+        # Test batched, channels last and of different shapes
+        volumes = [volumes[0][:, :7].transpose(1, 2, 3, 0)] + [volume.transpose(1, 2, 3, 0) for volume in volumes[1:]]
+        encoded_volumes = image_processing(volumes, size=size, return_tensors="pt").pixel_values
+        self.assertEqual(encoded_volumes.shape, (3, num_channels, 6, 16, 16))
+
+    def test_resize_volume_matches_torch_interpolate(self):
+        volume = np.random.rand(2, 9, 13, 7).astype(np.float32)
+        for size in [(4, 20, 7), (18, 6, 3)]:
+            expected = torch.nn.functional.interpolate(
+                torch.from_numpy(volume)[None], size=size, mode="trilinear", align_corners=False
+            )[0].numpy()
+            self.assertTrue(np.allclose(resize_volume(volume, size), expected, atol=1e-6))
+
+            expected = torch.nn.functional.interpolate(torch.from_numpy(volume)[None], size=size, mode="nearest")[0]
+            resized = resize_volume(volume, size, resample=PILImageResampling.NEAREST)
+            self.assertTrue(np.array_equal(resized, expected.numpy()))
+
+        # channels last and batched inputs
+        resized = resize_volume(volume.transpose(1, 2, 3, 0), (4, 5, 6))
+        self.assertEqual(resized.shape, (4, 5, 6, 2))
+        resized = resize_volume(np.stack([volume, volume]), (4, 5, 6))
+        self.assertEqual(resized.shape, (2, 2, 4, 5, 6))
+
+    def test_center_crop_volume(self):
+        volume = np.arange(2 * 6 * 8 * 10).reshape(2, 6, 8, 10)
+
+        cropped = center_crop_volume(volume, (4, 4, 4))
+        self.assertTrue(np.array_equal(cropped, volume[:, 1:5, 2:6, 3:7]))
+
+        # too small along depth: zero padded
+        cropped = center_crop_volume(volume, (8, 4, 4))
+        self.assertEqual(cropped.shape, (2, 8, 4, 4))
+        self.assertTrue(np.array_equal(cropped[:, 1:7], volume[:, :, 2:6, 3:7]))
+        self.assertEqual(cropped[:, 0].sum(), 0)
+        self.assertEqual(cropped[:, 7].sum(), 0)
+
+    def test_read_volume_matches_resize_and_crop(self):
+        volume = np.random.rand(2, 20, 30, 25).astype(np.float32)
+        for resample in (PILImageResampling.BILINEAR, PILImageResampling.NEAREST):
+            for size, crop_size in [((10, 16, 16), (8, 12, 20)), (None, (4, 10, 40)), ((16, 20, 20), None)]:
+                expected = volume if size is None else resize_volume(volume, size, resample=resample)
+                expected = expected if crop_size is None else center_crop_volume(expected, crop_size)
+
+                read = read_volume(volume, size=size, crop_size=crop_size, resample=resample)
+                self.assertTrue(np.allclose(read, expected))
+                read = read_volume(volume.transpose(1, 2, 3, 0), size=size, crop_size=crop_size, resample=resample)
+                self.assertTrue(np.allclose(read, expected))
+
+        # the region read from a memory-mapped file doesn't point into the file
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            npy_file = os.path.join(tmpdirname, "volume.npy")
+            np.save(npy_file, volume)
+            mapped_volume = np.load(npy_file, mmap_mode="r")
+            read = read_volume(mapped_volume, crop_size=(4, 10, 20))
+            self.assertTrue(np.array_equal(read, center_crop_volume(volume, (4, 10, 20))))
+            self.assertFalse(np.may_share_memory(read, mapped_volume))
+            del mapped_volume, read
+
+    def test_call_volume_files(self):
+        image_processing = self.image_processing_class(
+            **self.image_processor_dict, do_center_crop=True, crop_size={"depth": 6, "height": 16, "width": 16}
+        )
+        size = {"depth": 8, **self.image_processor_tester.size}
+        num_channels = self.image_processor_tester.num_channels
+        volume = np.random.randint(0, 256, (num_channels, 10, 30, 40), dtype=np.uint8)
+        expected = image_processing(volume, size=size, return_tensors="np").pixel_values
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            npy_file = os.path.join(tmpdirname, "volume.npy")
+            np.save(npy_file, volume)
+            raw_file = os.path.join(tmpdirname, "volume.raw")
+            volume.tofile(raw_file)
+
+            encoded_volumes = image_processing(npy_file, size=size, return_tensors="np").pixel_values
+            self.assertTrue(np.allclose(encoded_volumes, expected))
+
+            lazy_volume = load_volume(raw_file, shape=volume.shape, dtype=volume.dtype)
+            encoded_volumes = image_processing([lazy_volume, lazy_volume], size=size, return_tensors="np").pixel_values
+            self.assertEqual(encoded_volumes.shape, (2, num_channels, 6, 16, 16))
+            self.assertTrue(np.allclose(encoded_volumes[1:], expected))
+
+    def test_rescale_and_normalize_volume(self):
+        volume = np.random.randint(0, 256, (2, 5, 6, 7), dtype=np.uint8)
+        expected = normalize_volume(volume * (1 / 255), mean=[0.3, 0.5], std=[0.2, 0.4])
+
+        output = rescale_and_normalize_volume(volume, scale=1 / 255, mean=[0.3, 0.5], std=[0.2, 0.4])
+        self.assertEqual(output.dtype, np.float32)
+        self.assertTrue(np.allclose(output, expected, atol=1e-5))
+
+        output = rescale_and_normalize_volume(
+            volume, scale=1 / 255, mean=[0.3, 0.5], std=[0.2, 0.4], dtype=np.float16, data_format="channels_last"
+        )
+        self.assertEqual(output.dtype, np.float16)
+        self.assertTrue(np.allclose(output.transpose(3, 0, 1, 2), expected, atol=1e-2))
+
+        # float32 channels first volumes can be processed in place
+        volume = volume.astype(np.float32)
+        output = rescale_and_normalize_volume(volume, scale=1 / 255, mean=0.5, std=0.5, inplace=True)
+        self.assertIs(output, volume)
+
+    def test_call_volumes_output_dtype(self):
+        image_processing = self.image_processing_class(**self.image_processor_dict, output_dtype="float16")
+        num_channels = self.image_processor_tester.num_channels
+        volume = np.random.rand(num_channels, 4, 20, 20).astype(np.float32)
+        original = volume.copy()
+
+        encoded_volumes = image_processing(volume, do_resize=False, return_tensors="pt").pixel_values
+        self.assertEqual(encoded_volumes.dtype, torch.float16)
+        # the input volume is left untouched
+        self.assertTrue(np.array_equal(volume, original))
+
+        # writable memory-mapped files are left untouched too
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            npy_file = os.path.join(tmpdirname, "volume.npy")
+            np.save(npy_file, volume)
+            mapped_volume = np.load(npy_file, mmap_mode="r+")
+            image_processing = self.image_processing_class(**self.image_processor_dict)
+            encoded_volumes = image_processing(
+                mapped_volume, do_resize=False, do_center_crop=False, do_rescale=False, return_tensors="np"
+            ).pixel_values
+            self.assertEqual(encoded_volumes.shape, (1, num_channels, 4, 20, 20))
+            del mapped_volume
+            self.assertTrue(np.array_equal(np.load(npy_file), original))
@@ -16,7 +16,9 @@
 
 
 import inspect
+import math
 import unittest
+from unittest import mock
 
 from transformers import Vit3dConfig
 from transformers.testing_utils import (
@@ -40,6 +42,9 @@ if is_torch_available():
 
     from transformers import Vit3dForImageClassification, Vit3dForMaskedImageModeling, Vit3dModel
     from transformers.models.vit3d.modeling_vit3d import VIT3D_PRETRAINED_MODEL_ARCHIVE_LIST
+    from transformers.pytorch_utils import is_torch_greater_or_equal_than_2_0
+else:
+    is_torch_greater_or_equal_than_2_0 = False
 
 
 if is_vision_available():
@@ -53,7 +58,7 @@ class Vit3dModelTester:
         self,
         parent,
         batch_size=13,
-        image_size=30,
+        image_size=8,
         patch_size=2,
         num_channels=3,
         is_training=True,
@@ -90,11 +95,13 @@ class Vit3dModelTester:
         self.encoder_stride = encoder_stride
 
         # in Vit3d, the seq length equals the number of patches + 1 (we add 1 for the [CLS] token)
-        num_patches = (image_size // patch_size) ** 2
+        num_patches = (image_size // patch_size) ** 3
         self.seq_length = num_patches + 1
 
     def prepare_config_and_inputs(self):
-        pixel_values = floats_tensor([self.batch_size, self.num_channels, self.image_size, self.image_size])
+        pixel_values = floats_tensor(
+            [self.batch_size, self.num_channels, self.image_size, self.image_size, self.image_size]
+        )
 
         labels = None
         if self.use_labels:
@@ -134,7 +141,8 @@ class Vit3dModelTester:
         model.eval()
         result = model(pixel_values)
         self.parent.assertEqual(
-            result.reconstruction.shape, (self.batch_size, self.num_channels, self.image_size, self.image_size)
+            result.reconstruction.shape,
+            (self.batch_size, self.num_channels, self.image_size, self.image_size, self.image_size),
         )
 
         # test greyscale images
@@ -143,9 +151,11 @@ class Vit3dModelTester:
         model.to(torch_device)
         model.eval()
 
-        pixel_values = floats_tensor([self.batch_size, 1, self.image_size, self.image_size])
+        pixel_values = floats_tensor([self.batch_size, 1, self.image_size, self.image_size, self.image_size])
         result = model(pixel_values)
-        self.parent.assertEqual(result.reconstruction.shape, (self.batch_size, 1, self.image_size, self.image_size))
+        self.parent.assertEqual(
+            result.reconstruction.shape, (self.batch_size, 1, self.image_size, self.image_size, self.image_size)
+        )
 
     def create_and_check_for_image_classification(self, config, pixel_values, labels):
         config.num_labels = self.type_sequence_label_size
@@ -161,7 +171,7 @@ class Vit3dModelTester:
         model.to(torch_device)
         model.eval()
 
-        pixel_values = floats_tensor([self.batch_size, 1, self.image_size, self.image_size])
+        pixel_values = floats_tensor([self.batch_size, 1, self.image_size, self.image_size, self.image_size])
         result = model(pixel_values)
         self.parent.assertEqual(result.logits.shape, (self.batch_size, self.type_sequence_label_size))
 
@@ -192,6 +202,11 @@ class Vit3dModelTest(ModelTesterMixin, PipelineTesterMixin, unittest.TestCase):
         if is_torch_available()
         else ()
     )
+    pipeline_model_mapping = (
+        {"volume-classification": Vit3dForImageClassification, "volume-feature-extraction": Vit3dModel}
+        if is_torch_available()
+        else {}
+    )
     fx_compatible = False
 
     test_pruning = False
@@ -202,6 +217,16 @@ class Vit3dModelTest(ModelTesterMixin, PipelineTesterMixin, unittest.TestCase):
         self.model_tester = Vit3dModelTester(self)
         self.config_tester = ConfigTester(self, config_class=Vit3dConfig, has_text_modality=False, hidden_size=37)
 
+    def _prepare_for_class(self, inputs_dict, model_class, return_labels=False):
+        inputs_dict = super()._prepare_for_class(inputs_dict, model_class, return_labels=return_labels)
+
+        if "bool_masked_pos" in inputs_dict:
+            num_patches = (self.model_tester.image_size // self.model_tester.patch_size) ** 3
+            inputs_dict["bool_masked_pos"] = torch.zeros(
+                (self.model_tester.batch_size, num_patches), dtype=torch.long, device=torch_device
+            )
+        return inputs_dict
+
     def test_config(self):
         self.config_tester.run_common_tests()
 
@@ -242,6 +267,128 @@ class Vit3dModelTest(ModelTesterMixin, PipelineTesterMixin, unittest.TestCase):
         config_and_inputs = self.model_tester.prepare_config_and_inputs()
         self.model_tester.create_and_check_for_image_classification(*config_and_inputs)
 
+    def test_interpolate_pos_encoding(self):
+        config, _ = self.model_tester.prepare_config_and_inputs_for_common()
+        model = Vit3dModel(config).to(torch_device).eval()
+        image_size, patch_size = self.model_tester.image_size, self.model_tester.patch_size
+
+        for volume_size in [(image_size, image_size, image_size), (image_size + 4, image_size, 2 * image_size)]:
+            pixel_values = floats_tensor([2, config.num_channels, *volume_size])
+            with torch.no_grad():
+                outputs = model(pixel_values, interpolate_pos_encoding=True)
+            num_patches = math.prod(size // patch_size for size in volume_size)
+            self.assertEqual(outputs.last_hidden_state.shape, (2, num_patches + 1, config.hidden_size))
+
+        # interpolating to the pretrained grid is the identity
+        embeddings = model.embeddings
+        interpolated = embeddings.interpolate_pos_encoding(embeddings.position_embeddings, *(image_size + 1,) * 3)
+        self.assertIs(interpolated, embeddings.position_embeddings)
+
+    def test_interpolate_pos_encoding_cache(self):
+        config, _ = self.model_tester.prepare_config_and_inputs_for_common()
+        config.pos_encoding_cache_size = 2
+        embeddings = Vit3dModel(config).to(torch_device).eval().embeddings
+        image_size, hidden_size = self.model_tester.image_size, config.hidden_size
+        volume_sizes = [(2 * image_size,) * 3, (image_size, image_size, 2 * image_size), (image_size // 2,) * 3]
+
+        def interpolate(volume_size):
+            num_patches = math.prod(size // self.model_tester.patch_size for size in volume_size)
+            patch_embeddings = torch.zeros(1, num_patches + 1, hidden_size, device=torch_device)
+            return embeddings.interpolate_pos_encoding(patch_embeddings, *volume_size)
+
+        with torch.no_grad(), mock.patch.object(
+            torch.nn.functional, "interpolate", wraps=torch.nn.functional.interpolate
+        ) as interpolate_fn:
+            first = interpolate(volume_sizes[0])
+            self.assertIs(interpolate(volume_sizes[0]), first)
+            interpolate(volume_sizes[1])
+            self.assertEqual(interpolate_fn.call_count, 2)
+
+            # least recently used entry is evicted
+            interpolate(volume_sizes[0])
+            interpolate(volume_sizes[2])
+            interpolate(volume_sizes[0])
+            self.assertEqual(interpolate_fn.call_count, 3)
+            interpolate(volume_sizes[1])
+            self.assertEqual(interpolate_fn.call_count, 4)
+
+            # updating the weights invalidates the cache
+            embeddings.position_embeddings.add_(1.0)
+            self.assertTrue(torch.allclose(interpolate(volume_sizes[0]), first + 1.0, atol=1e-5))
+            self.assertEqual(interpolate_fn.call_count, 5)
+            self.assertEqual(len(embeddings._pos_encoding_cache), 1)
+
+        # no caching when gradients flow to the position embeddings
+        first = interpolate(volume_sizes[0])
+        self.assertIsNot(interpolate(volume_sizes[0]), first)
+        self.assertIsNotNone(first.grad_fn)
+
+    def test_attention_types(self):
+        config, inputs_dict = self.model_tester.prepare_config_and_inputs_for_common()
+        pixel_values = inputs_dict["pixel_values"]
+        model = Vit3dModel(config).to(torch_device).eval()
+        with torch.no_grad():
+            expected = model(pixel_values, output_attentions=True)
+
+        # the chunk size does not divide the sequence length
+        config.attention_chunk_size = 3
+        for attention_type in ["sdpa", "chunked"] if is_torch_greater_or_equal_than_2_0 else ["chunked"]:
+            config.attention_type = attention_type
+            model_with_attention_type = Vit3dModel(config).to(torch_device).eval()
+            model_with_attention_type.load_state_dict(model.state_dict())
+            with torch.no_grad():
+                outputs = model_with_attention_type(pixel_values)
+                self.assertTrue(torch.allclose(outputs.last_hidden_state, expected.last_hidden_state, atol=1e-5))
+
+                # falls back to the eager attention to return the attention probabilities
+                outputs = model_with_attention_type(pixel_values, output_attentions=True)
+                self.assertTrue(torch.allclose(outputs.attentions[-1], expected.attentions[-1], atol=1e-6))
+
+        with self.assertRaises(ValueError):
+            Vit3dConfig(attention_type="flash")
+
+    def test_sliding_window_forward_single_tile(self):
+        config, inputs_dict = self.model_tester.prepare_config_and_inputs_for_common()
+        pixel_values = inputs_dict["pixel_values"]
+
+        for model_class in self.all_model_classes:
+            model = model_class(config).to(torch_device).eval()
+            with torch.no_grad():
+                expected = model(pixel_values)
+            outputs = model.sliding_window_forward(pixel_values)
+
+            for name in model._sliding_window_outputs:
+                if expected[name] is not None:
+                    self.assertTrue(torch.allclose(outputs[name], expected[name], atol=1e-5))
+
+    def test_sliding_window_forward_large_volume(self):
+        config, _ = self.model_tester.prepare_config_and_inputs_for_common()
+        batch_size, image_size, patch_size = 2, self.model_tester.image_size, self.model_tester.patch_size
+        # not a multiple of the tile size nor of the patch size along every axis
+        volume_size = (image_size, 2 * image_size + 3, image_size + patch_size)
+        pixel_values = floats_tensor([batch_size, config.num_channels, *volume_size])
+        grid_size = [-(-size // patch_size) for size in volume_size]
+
+        model = Vit3dModel(config).to(torch_device).eval()
+        outputs = model.sliding_window_forward(pixel_values, tile_overlap=0.5, tile_batch_size=3)
+        num_patches = grid_size[0] * grid_size[1] * grid_size[2]
+        self.assertEqual(outputs.last_hidden_state.shape, (batch_size, num_patches + 1, config.hidden_size))
+        self.assertEqual(outputs.pooler_output.shape, (batch_size, config.hidden_size))
+
+        # the first tile is the only one covering the corner patch
+        with torch.no_grad():
+            corner = model(pixel_values[:, :, :image_size, :image_size, :image_size]).last_hidden_state[:, 1]
+        self.assertTrue(torch.allclose(outputs.last_hidden_state[:, 1], corner, atol=1e-5))
+
+        model = Vit3dForMaskedImageModeling(config).to(torch_device).eval()
+        outputs = model.sliding_window_forward(pixel_values, tile_batch_size=1)
+        self.assertEqual(outputs.reconstruction.shape, pixel_values.shape)
+
+        config.num_labels = self.model_tester.type_sequence_label_size
+        model = Vit3dForImageClassification(config).to(torch_device).eval()
+        outputs = model.sliding_window_forward(pixel_values)
+        self.assertEqual(outputs.logits.shape, (batch_size, config.num_labels))
+
     @slow
     def test_model_from_pretrained(self):
         for model_name in VIT3D_PRETRAINED_MODEL_ARCHIVE_LIST[:1]:
@@ -36,13 +36,20 @@ if is_torch_available():
     from torch import nn
 
     from transformers import ViTMAE3DForPreTraining,ViTMAE3DForSegmentationPreTraining, ViTMAE3DModel
+    from transformers.models.vit_mae_3d.modeling_vit_mae_3d import (
+        get_1d_sincos_pos_embed_from_grid,
+        get_3d_sincos_pos_embed,
+    )
     from transformers.models.vit.modeling_vit import VIT_PRETRAINED_MODEL_ARCHIVE_LIST
+    from transformers.pytorch_utils import is_torch_greater_or_equal_than_2_0
+else:
+    is_torch_greater_or_equal_than_2_0 = False
 
 
 if is_vision_available():
     from PIL import Image
 
-    from transformers import ViTMAE3DFeatureExtractor
+    from transformers import ViTImageProcessor
 
 
 class ViTMAE3DModelTester:
@@ -50,12 +57,12 @@ class ViTMAE3DModelTester:
         self,
         parent,
         batch_size=13,
-        image_size=30,
+        image_size=8,
         patch_size=2,
         num_channels=3,
         is_training=True,
         use_labels=True,
-        hidden_size=32,
+        hidden_size=36,
         num_hidden_layers=5,
         num_attention_heads=4,
         intermediate_size=37,
@@ -66,6 +73,10 @@ class ViTMAE3DModelTester:
         initializer_range=0.02,
         num_labels=3,
         mask_ratio=0.6,
+        decoder_hidden_size=36,
+        decoder_num_hidden_layers=2,
+        decoder_num_attention_heads=4,
+        decoder_intermediate_size=37,
         scope=None,
     ):
         self.parent = parent
@@ -85,15 +96,21 @@ class ViTMAE3DModelTester:
         self.type_sequence_label_size = type_sequence_label_size
         self.initializer_range = initializer_range
         self.mask_ratio = mask_ratio
+        self.decoder_hidden_size = decoder_hidden_size
+        self.decoder_num_hidden_layers = decoder_num_hidden_layers
+        self.decoder_num_attention_heads = decoder_num_attention_heads
+        self.decoder_intermediate_size = decoder_intermediate_size
         self.scope = scope
 
         # in ViTMAE3D, the expected sequence length = (num_patches + 1) * (1 - config.mask_ratio), rounded above
         # (we add 1 for the [CLS] token)
-        num_patches = (image_size // patch_size) ** 2
+        num_patches = (image_size // patch_size) ** 3
         self.seq_length = int(math.ceil((1 - mask_ratio) * (num_patches + 1)))
 
     def prepare_config_and_inputs(self):
-        pixel_values = floats_tensor([self.batch_size, self.num_channels, self.image_size, self.image_size])
+        pixel_values = floats_tensor(
+            [self.batch_size, self.num_channels, self.image_size, self.image_size, self.image_size]
+        )
 
         labels = None
         if self.use_labels:
@@ -118,6 +135,10 @@ class ViTMAE3DModelTester:
             is_decoder=False,
             initializer_range=self.initializer_range,
             mask_ratio=self.mask_ratio,
+            decoder_hidden_size=self.decoder_hidden_size,
+            decoder_num_hidden_layers=self.decoder_num_hidden_layers,
+            decoder_num_attention_heads=self.decoder_num_attention_heads,
+            decoder_intermediate_size=self.decoder_intermediate_size,
         )
 
     def create_and_check_model(self, config, pixel_values, labels):
@@ -132,8 +153,8 @@ class ViTMAE3DModelTester:
         model.to(torch_device)
         model.eval()
         result = model(pixel_values)
-        num_patches = (self.image_size // self.patch_size) ** 2
-        expected_num_channels = self.patch_size**2 * self.num_channels
+        num_patches = (self.image_size // self.patch_size) ** 3
+        expected_num_channels = self.patch_size**3 * self.num_channels
         self.parent.assertEqual(result.logits.shape, (self.batch_size, num_patches, expected_num_channels))
 
         # test greyscale images
@@ -141,9 +162,9 @@ class ViTMAE3DModelTester:
         model = ViTMAE3DForPreTraining(config)
         model.to(torch_device)
         model.eval()
-        pixel_values = floats_tensor([self.batch_size, 1, self.image_size, self.image_size])
+        pixel_values = floats_tensor([self.batch_size, 1, self.image_size, self.image_size, self.image_size])
         result = model(pixel_values)
-        expected_num_channels = self.patch_size**2
+        expected_num_channels = self.patch_size**3
         self.parent.assertEqual(result.logits.shape, (self.batch_size, num_patches, expected_num_channels))
 
     def prepare_config_and_inputs_for_common(self):
@@ -161,6 +182,7 @@ class ViTMAE3DModelTest(ModelTesterMixin, PipelineTesterMixin, unittest.TestCase
     """
 
     all_model_classes = (ViTMAE3DModel, ViTMAE3DForPreTraining, ViTMAE3DForSegmentationPreTraining) if is_torch_available() else ()
+    pipeline_model_mapping = {"feature-extraction": ViTMAE3DModel} if is_torch_available() else {}
     test_pruning = False
     test_torchscript = False
     test_resize_embeddings = False
@@ -170,6 +192,14 @@ class ViTMAE3DModelTest(ModelTesterMixin, PipelineTesterMixin, unittest.TestCase
         self.model_tester = ViTMAE3DModelTester(self)
         self.config_tester = ConfigTester(self, config_class=ViTMAE3DConfig, has_text_modality=False, hidden_size=37)
 
+    def _prepare_for_class(self, inputs_dict, model_class, return_labels=False):
+        inputs_dict = super()._prepare_for_class(inputs_dict, model_class, return_labels=return_labels)
+
+        if return_labels and model_class is ViTMAE3DForSegmentationPreTraining:
+            inputs_dict["labels"] = ids_tensor(inputs_dict["pixel_values"].shape, 2).float()
+
+        return inputs_dict
+
     def test_config(self):
         self.config_tester.run_common_tests()
 
@@ -206,13 +236,208 @@ class ViTMAE3DModelTest(ModelTesterMixin, PipelineTesterMixin, unittest.TestCase
         config_and_inputs = self.model_tester.prepare_config_and_inputs()
         self.model_tester.create_and_check_for_pretraining(*config_and_inputs)
 
+    def test_patch_embeddings_kept_patches(self):
+        config, inputs_dict = self.model_tester.prepare_config_and_inputs_for_common()
+        pixel_values = inputs_dict["pixel_values"]
+        embeddings = ViTMAE3DModel(config).to(torch_device).eval().embeddings
+        batch_size, num_patches = pixel_values.shape[0], embeddings.num_patches
+
+        ids_keep, mask, ids_restore = embeddings.random_masking_indices(batch_size, num_patches, device=torch_device)
+        len_keep = int(num_patches * (1 - config.mask_ratio))
+        self.assertEqual(ids_keep.shape, (batch_size, len_keep))
+        self.assertTrue(torch.equal(mask.sum(-1), torch.full((batch_size,), float(num_patches - len_keep))))
+        self.assertTrue(torch.equal(mask.gather(1, ids_keep), torch.zeros_like(ids_keep, dtype=mask.dtype)))
+        self.assertTrue(torch.equal(ids_restore.gather(1, ids_keep), torch.arange(len_keep).expand(batch_size, -1)))
+
+        with torch.no_grad():
+            all_patches = embeddings.patch_embeddings(pixel_values)
+            kept_patches = embeddings.patch_embeddings(pixel_values, ids_keep=ids_keep)
+        expected = all_patches.gather(1, ids_keep.unsqueeze(-1).expand(-1, -1, all_patches.shape[-1]))
+        self.assertTrue(torch.allclose(kept_patches, expected, atol=1e-5))
+
+    def test_random_masking_indices(self):
+        config, _ = self.model_tester.prepare_config_and_inputs_for_common()
+        embeddings = ViTMAE3DModel(config).to(torch_device).eval().embeddings
+        batch_size, num_patches = 3, embeddings.num_patches
+        len_keep = int(num_patches * (1 - config.mask_ratio))
+        noise = torch.rand(batch_size, num_patches, device=torch_device)
+
+        ids_keep, mask, ids_restore = embeddings.random_masking_indices(batch_size, num_patches, noise=noise)
+        ids_shuffle = torch.argsort(noise, dim=1)
+        self.assertTrue(torch.equal(ids_keep, ids_shuffle[:, :len_keep]))
+        self.assertTrue(torch.equal(mask, torch.ones_like(mask).scatter_(1, ids_keep, 0.0)))
+        # ids_restore inverts the kept patches followed by the removed patches in their original order
+        ids_masked = torch.arange(num_patches, device=torch_device).expand(batch_size, -1)[mask.bool()]
+        ids_shuffle = torch.cat([ids_keep, ids_masked.view(batch_size, -1)], dim=1)
+        expected = torch.arange(num_patches, device=torch_device).expand(batch_size, -1)
+        self.assertTrue(torch.equal(ids_shuffle.gather(1, ids_restore), expected))
+
+        # a seeded CPU generator makes the masks reproducible
+        masks = [
+            embeddings.random_masking_indices(
+                batch_size, num_patches, device=torch_device, generator=torch.Generator().manual_seed(0)
+            )[1]
+            for _ in range(2)
+        ]
+        self.assertTrue(torch.equal(masks[0], masks[1]))
+
+    def test_structured_masking(self):
+        config, _ = self.model_tester.prepare_config_and_inputs_for_common()
+        # 4 x 4 x 4 patches, of which 16 are kept: 4 tubes or 2 blocks
+        config.mask_ratio = 0.75
+        grid_size = (self.model_tester.image_size // self.model_tester.patch_size,) * 3
+
+        config.mask_type = "tube"
+        embeddings = ViTMAE3DModel(config).to(torch_device).eval().embeddings
+        _, mask, _ = embeddings.random_masking_indices(4, embeddings.num_patches, device=torch_device)
+        mask = mask.view(4, *grid_size)
+        self.assertTrue(torch.equal(mask, mask[:, :1].expand_as(mask)))
+        self.assertTrue(torch.equal(mask.sum((1, 2, 3)), torch.full((4,), 48.0, device=torch_device)))
+
+        config.mask_type, config.mask_block_size = "block", [2, 2, 2]
+        embeddings = ViTMAE3DModel(config).to(torch_device).eval().embeddings
+        _, mask, _ = embeddings.random_masking_indices(4, embeddings.num_patches, device=torch_device)
+        blocks = mask.view(4, 2, 2, 2, 2, 2, 2).permute(0, 1, 3, 5, 2, 4, 6).reshape(4, 8, 8)
+        self.assertTrue(torch.equal(blocks, blocks[..., :1].expand_as(blocks)))
+
+        with self.assertRaises(ValueError):
+            ViTMAE3DConfig(mask_type="grid")
+
+    def test_3d_sincos_pos_embed(self):
+        embed_dim, grid_size = 12, (2, 3, 4)
+        pos_embed = get_3d_sincos_pos_embed(embed_dim, grid_size, add_cls_token=True)
+        self.assertEqual(pos_embed.shape, (1 + 2 * 3 * 4, embed_dim))
+        self.assertTrue(torch.equal(pos_embed[0], torch.zeros(embed_dim)))
+        # memoized per arguments
+        self.assertIs(get_3d_sincos_pos_embed(embed_dim, grid_size, add_cls_token=True), pos_embed)
+
+        # patches are flattened in (depth, height, width) order, the thirds of the embedding encode height, depth, width
+        depth, height, width = torch.meshgrid(*[torch.arange(size) for size in grid_size], indexing="ij")
+        for third, coordinates in enumerate([height, depth, width]):
+            expected = get_1d_sincos_pos_embed_from_grid(embed_dim // 3, coordinates.float())
+            self.assertTrue(torch.allclose(pos_embed[1:, third * 4 : (third + 1) * 4], expected))
+
+    def test_model_non_cubic_volume(self):
+        config, _ = self.model_tester.prepare_config_and_inputs_for_common()
+        config.image_size = (4, 8, 6)
+        model = ViTMAE3DModel(config).to(torch_device).eval()
+
+        pixel_values = floats_tensor([2, config.num_channels, *config.image_size])
+        with torch.no_grad():
+            result = model(pixel_values)
+        num_patches = 2 * 4 * 3
+        expected_length = int(num_patches * (1 - config.mask_ratio)) + 1
+        self.assertEqual(result.last_hidden_state.shape, (2, expected_length, config.hidden_size))
+
+    def test_attention_types(self):
+        config, inputs_dict = self.model_tester.prepare_config_and_inputs_for_common()
+        pixel_values = inputs_dict["pixel_values"]
+        num_patches = (self.model_tester.image_size // self.model_tester.patch_size) ** 3
+        noise = torch.rand(pixel_values.shape[0], num_patches, device=torch_device)
+        model = ViTMAE3DForPreTraining(config).to(torch_device).eval()
+        with torch.no_grad():
+            expected = model(pixel_values, noise=noise)
+
+        # the chunk size does not divide the sequence length
+        config.attention_chunk_size = 5
+        for attention_type in ["sdpa", "chunked"] if is_torch_greater_or_equal_than_2_0 else ["chunked"]:
+            config.attention_type = attention_type
+            model_with_attention_type = ViTMAE3DForPreTraining(config).to(torch_device).eval()
+            model_with_attention_type.load_state_dict(model.state_dict())
+            # the decoder layers use the same attention implementation
+            decoder_attention = model_with_attention_type.decoder.decoder_layers[0].attention.attention
+            self.assertEqual(decoder_attention.attention_type, attention_type)
+            with torch.no_grad():
+                outputs = model_with_attention_type(pixel_values, noise=noise)
+            self.assertTrue(torch.allclose(outputs.logits, expected.logits, atol=1e-5))
+
+    def test_patchify_anisotropic(self):
+        config, _ = self.model_tester.prepare_config_and_inputs_for_common()
+        config.image_size, config.patch_size = (4, 8, 12), (1, 2, 4)
+        model = ViTMAE3DForPreTraining(config).to(torch_device).eval()
+        pixel_values = floats_tensor([2, config.num_channels, *config.image_size])
+
+        patches = model.patchify(pixel_values)
+        self.assertEqual(patches.shape, (2, 4 * 4 * 3, 1 * 2 * 4 * config.num_channels))
+        # second patch along the width axis, in (patch_depth, patch_height, patch_width, num_channels) order
+        expected = pixel_values[0, :, 0, 0:2, 4:8].permute(1, 2, 0).flatten()
+        self.assertTrue(torch.equal(patches[0, 1], expected))
+        self.assertTrue(torch.equal(model.unpatchify(patches), pixel_values))
+
+        with self.assertRaises(ValueError):
+            model.unpatchify(patches[:, 1:])
+
+        with torch.no_grad():
+            outputs = model(pixel_values)
+        self.assertEqual(outputs.logits.shape, patches.shape)
+
+        for norm_pix_loss in [False, True]:
+            model.config.norm_pix_loss = norm_pix_loss
+            target = patches
+            if norm_pix_loss:
+                target = (target - target.mean(-1, keepdim=True)) / (target.var(-1, keepdim=True) + 1.0e-6) ** 0.5
+            expected_loss = ((outputs.logits - target) ** 2).mean(-1)
+            expected_loss = (expected_loss * outputs.mask).sum() / outputs.mask.sum()
+            loss = model.forward_loss(pixel_values, outputs.logits, outputs.mask)
+            self.assertTrue(torch.allclose(loss, expected_loss, atol=1e-5))
+
+    def test_predict_masked_only(self):
+        config, inputs_dict = self.model_tester.prepare_config_and_inputs_for_common()
+        pixel_values = inputs_dict["pixel_values"]
+        num_patches = (self.model_tester.image_size // self.model_tester.patch_size) ** 3
+        noise = torch.rand(pixel_values.shape[0], num_patches, device=torch_device)
+
+        for norm_pix_loss in [False, True]:
+            config.norm_pix_loss = norm_pix_loss
+            config.predict_masked_only = False
+            model = ViTMAE3DForPreTraining(config).to(torch_device).eval()
+            with torch.no_grad():
+                expected = model(pixel_values, noise=noise)
+
+            model.config.predict_masked_only = True
+            with torch.no_grad():
+                outputs = model(pixel_values, noise=noise)
+
+            mask = expected.mask.bool()
+            num_masked = num_patches - int(num_patches * (1 - config.mask_ratio))
+            self.assertEqual(outputs.logits.shape, (pixel_values.shape[0], num_masked, expected.logits.shape[-1]))
+            # masked patches in increasing order
+            self.assertTrue(torch.allclose(outputs.logits, expected.logits[mask].view_as(outputs.logits), atol=1e-5))
+            self.assertTrue(torch.allclose(outputs.loss, expected.loss, atol=1e-5))
+
+    def test_for_segmentation_pretraining(self):
+        config = self.model_tester.get_config()
+        config.num_channels = 1
+        batch_size, image_size = self.model_tester.batch_size, self.model_tester.image_size
+        pixel_values = floats_tensor([batch_size, 1, image_size, image_size, image_size]).to(torch_device)
+        num_patches = (self.model_tester.image_size // self.model_tester.patch_size) ** 3
+        noise = torch.rand(batch_size, num_patches, device=torch_device)
+        labels = ids_tensor([batch_size, *pixel_values.shape[2:]], 2)
+
+        model = ViTMAE3DForSegmentationPreTraining(config).to(torch_device).eval()
+        with torch.no_grad():
+            outputs = model(pixel_values, labels=labels, noise=noise)
+            # the loss is the reconstruction loss of the label volumes
+            expected_loss = model.forward_loss(labels.unsqueeze(1).float(), outputs.logits, outputs.mask)
+            self.assertTrue(torch.allclose(outputs.loss, expected_loss, atol=1e-5))
+
+            # without labels, there is no loss
+            self.assertIsNone(model(pixel_values, noise=noise).loss)
+
+            # scan and labels packed in the channels of pixel_values
+            packed_labels = labels.unsqueeze(1).float()
+            packed = model(torch.cat([pixel_values, packed_labels], dim=1), noise=noise)
+            expected = model(pixel_values, labels=packed_labels, noise=noise)
+            self.assertTrue(torch.allclose(packed.logits, expected.logits, atol=1e-5))
+            self.assertTrue(torch.allclose(packed.loss, expected.loss, atol=1e-5))
+
     # overwrite from common since ViTMAE3DForPretraining has random masking, we need to fix the noise
     # to generate masks during test
     def check_pt_tf_models(self, tf_model, pt_model, pt_inputs_dict):
         # make masks reproducible
         np.random.seed(2)
 
-        num_patches = int((pt_model.config.image_size // pt_model.config.patch_size) ** 2)
+        num_patches = int((pt_model.config.image_size // pt_model.config.patch_size) ** 3)
         noise = np.random.uniform(size=(self.model_tester.batch_size, num_patches))
         pt_noise = torch.from_numpy(noise)
 
@@ -295,7 +520,7 @@ def prepare_img():
 class ViTMAE3DModelIntegrationTest(unittest.TestCase):
     @cached_property
     def default_feature_extractor(self):
-        return ViTMAE3DFeatureExtractor.from_pretrained("") if is_vision_available() else None
+        return ViTImageProcessor.from_pretrained("") if is_vision_available() else None
 
     @slow
     def test_inference_for_pretraining(self):
@@ -577,7 +577,7 @@ class PipelineUtilsTest(unittest.TestCase):
         model = None
         relevant_auto_classes = task_dict[framework]
 
-        if len(relevant_auto_classes) == 0:
+        if len(relevant_auto_classes) == 0 or "default" not in task_dict:
             # task has no default
             logger.debug(f"{task} in {framework} has no default")
             return
@@ -0,0 +1,97 @@
+# Copyright 2023 The HuggingFace Team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from transformers import Vit3dConfig, Vit3dImageProcessor, is_torch_available
+from transformers.pipelines import VolumeClassificationPipeline, pipeline
+from transformers.testing_utils import is_pipeline_test, nested_simplify, require_torch
+
+from .test_pipelines_common import ANY
+
+
+if is_torch_available():
+    from transformers import Vit3dForImageClassification
+
+
+@is_pipeline_test
+@require_torch
+class VolumeClassificationPipelineTests(unittest.TestCase):
+    def get_test_pipeline(self):
+        config = Vit3dConfig(
+            image_size=8,
+            patch_size=4,
+            num_channels=1,
+            hidden_size=32,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            intermediate_size=37,
+            num_labels=3,
+        )
+        model = Vit3dForImageClassification(config).eval()
+        image_processor = Vit3dImageProcessor(
+            size={"depth": 8, "height": 8, "width": 8}, image_mean=[0.5], image_std=[0.5]
+        )
+        return pipeline("volume-classification", model=model, image_processor=image_processor)
+
+    def test_small_model_pt(self):
+        classifier = self.get_test_pipeline()
+        self.assertIsInstance(classifier, VolumeClassificationPipeline)
+        volume = np.random.randint(0, 256, (1, 12, 10, 16), dtype=np.uint8)
+
+        outputs = classifier(volume, top_k=2)
+        self.assertEqual(
+            nested_simplify(outputs, decimals=4),
+            [{"score": ANY(float), "label": ANY(str)}, {"score": ANY(float), "label": ANY(str)}],
+        )
+
+        # top_k is capped by the number of labels
+        outputs = classifier(volume, top_k=5)
+        self.assertEqual(len(outputs), 3)
+        self.assertEqual({output["label"] for output in outputs}, {"LABEL_0", "LABEL_1", "LABEL_2"})
+
+        # batching gives the same results
+        batch_outputs = classifier([volume] * 3, batch_size=2)
+        self.assertEqual(nested_simplify(batch_outputs, decimals=4), [nested_simplify(outputs, decimals=4)] * 3)
+
+    def test_directory_of_volumes(self):
+        classifier = self.get_test_pipeline()
+        volumes = [np.random.randint(0, 256, (1, 8, 8, 8), dtype=np.uint8) for _ in range(3)]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for i, volume in enumerate(volumes):
+                np.save(os.path.join(tmpdir, f"scan_{i}.npy"), volume)
+            with open(os.path.join(tmpdir, "README.md"), "w") as f:
+                f.write("not a scan")
+
+            outputs = classifier(tmpdir, batch_size=2, num_workers=2)
+
+        expected_outputs = [classifier(volume) for volume in volumes]
+        self.assertEqual(nested_simplify(outputs, decimals=4), nested_simplify(expected_outputs, decimals=4))
+
+    def test_tiled_inference(self):
+        classifier = self.get_test_pipeline()
+
+        # a volume of the input size of the model is a single tile
+        volume = np.random.randint(0, 256, (1, 8, 8, 8), dtype=np.uint8)
+        outputs = classifier(volume, tiled=True)
+        self.assertEqual(nested_simplify(outputs, decimals=4), nested_simplify(classifier(volume), decimals=4))
+
+        volume = np.random.randint(0, 256, (1, 12, 20, 16), dtype=np.uint8)
+        outputs = classifier(volume, tiled=True, tile_overlap=0.5, tile_batch_size=2)
+        self.assertEqual(len(outputs), 3)
@@ -0,0 +1,135 @@
+# Copyright 2023 The HuggingFace Team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from transformers import Vit3dConfig, Vit3dImageProcessor, is_torch_available
+from transformers.pipelines import VolumeFeatureExtractionPipeline, pipeline
+from transformers.testing_utils import is_pipeline_test, require_safetensors, require_torch
+
+
+if is_torch_available():
+    import torch
+
+    from transformers import Vit3dModel
+
+
+@is_pipeline_test
+@require_torch
+class VolumeFeatureExtractionPipelineTests(unittest.TestCase):
+    def get_test_pipeline(self):
+        config = Vit3dConfig(
+            image_size=8,
+            patch_size=4,
+            num_channels=1,
+            hidden_size=32,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            intermediate_size=37,
+        )
+        model = Vit3dModel(config).eval()
+        image_processor = Vit3dImageProcessor(
+            size={"depth": 8, "height": 8, "width": 8}, image_mean=[0.5], image_std=[0.5]
+        )
+        return pipeline("volume-feature-extraction", model=model, image_processor=image_processor)
+
+    def test_small_model_pt(self):
+        extractor = self.get_test_pipeline()
+        self.assertIsInstance(extractor, VolumeFeatureExtractionPipeline)
+        volume = np.random.randint(0, 256, (1, 12, 10, 16), dtype=np.uint8)
+
+        features = extractor(volume, return_tensors=True)
+        # 2 x 2 x 2 patches and the [CLS] token
+        self.assertEqual(features.shape, torch.Size((1, 9, 32)))
+
+        outputs = extractor(volume)
+        self.assertIsInstance(outputs, list)
+        self.assertTrue(np.allclose(outputs, features.numpy(), atol=1e-6))
+
+        cls_features = extractor([volume] * 3, pooling="cls", return_tensors=True, batch_size=2)
+        self.assertEqual(len(cls_features), 3)
+        for cls_feature in cls_features:
+            self.assertTrue(torch.allclose(cls_feature, features[:, 0], atol=1e-5))
+
+        mean_features = extractor(volume, pooling="mean", return_tensors=True)
+        self.assertTrue(torch.allclose(mean_features, features.mean(dim=1), atol=1e-6))
+
+        pooled_features = extractor(volume, pooling="pooler", return_tensors=True)
+        self.assertEqual(pooled_features.shape, torch.Size((1, 32)))
+
+        with self.assertRaises(ValueError):
+            extractor(volume, pooling="max")
+
+    def test_tiled_inference(self):
+        extractor = self.get_test_pipeline()
+        volume = np.random.randint(0, 256, (1, 12, 20, 16), dtype=np.uint8)
+
+        features = extractor(volume, tiled=True, return_tensors=True)
+        # one token per patch of the (padded) volume and the [CLS] token
+        self.assertEqual(features.shape, torch.Size((1, 3 * 5 * 4 + 1, 32)))
+
+    def test_export_features(self):
+        extractor = self.get_test_pipeline()
+        volumes = [np.random.randint(0, 256, (1, 8, 8, 8), dtype=np.uint8) for _ in range(5)]
+        expected = extractor(volumes, pooling="cls", return_tensors=True)
+        expected = torch.cat(expected).numpy()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index = extractor.export_features(volumes, tmpdir, pooling="cls", shard_size=2, batch_size=2)
+            with open(os.path.join(tmpdir, "features.index.json")) as f:
+                self.assertEqual(json.load(f), index)
+            self.assertEqual(index["metadata"]["shape"], [32])
+            self.assertEqual([shard["length"] for shard in index["shards"]], [2, 2, 1])
+            features = np.concatenate(
+                [np.load(os.path.join(tmpdir, shard["file"]), mmap_mode="r") for shard in index["shards"]]
+            )
+            self.assertTrue(np.allclose(features, expected, atol=1e-5))
+
+            # resuming an interrupted export only computes the missing shards
+            last_shard = index["shards"].pop()
+            os.remove(os.path.join(tmpdir, last_shard["file"]))
+            with open(os.path.join(tmpdir, "features.index.json"), "w") as f:
+                json.dump(index, f)
+            first_shard_mtime = os.path.getmtime(os.path.join(tmpdir, index["shards"][0]["file"]))
+
+            resumed_index = extractor.export_features(volumes, tmpdir, pooling="cls", shard_size=2)
+            self.assertEqual(resumed_index["shards"][-1], last_shard)
+            self.assertEqual(os.path.getmtime(os.path.join(tmpdir, index["shards"][0]["file"])), first_shard_mtime)
+            last_features = np.load(os.path.join(tmpdir, last_shard["file"]))
+            self.assertTrue(np.allclose(last_features, expected[4:], atol=1e-5))
+
+            # the export of different inputs is not mixed with the previous one
+            with self.assertRaises(ValueError):
+                extractor.export_features(volumes[:3], tmpdir, pooling="cls", shard_size=2)
+
+    @require_safetensors
+    def test_export_features_safetensors(self):
+        from safetensors.numpy import load_file
+
+        extractor = self.get_test_pipeline()
+        volumes = [np.random.randint(0, 256, (1, 8, 8, 8), dtype=np.uint8) for _ in range(3)]
+        expected = torch.cat(extractor(volumes, return_tensors=True)).numpy()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index = extractor.export_features(volumes, tmpdir, pooling=None, shard_size=2, file_format="safetensors")
+            self.assertEqual(index["metadata"]["shape"], [9, 32])
+            features = np.concatenate(
+                [load_file(os.path.join(tmpdir, shard["file"]))["features"] for shard in index["shards"]]
+            )
+            self.assertTrue(np.allclose(features, expected, atol=1e-5))
@@ -22,6 +22,7 @@ import numpy as np
 from transformers import (
     BertTokenizer,
     DataCollatorForLanguageModeling,
+    DataCollatorForMaskedVolumeModeling,
     DataCollatorForPermutationLanguageModeling,
     DataCollatorForTokenClassification,
     DataCollatorForWholeWordMask,
@@ -359,6 +360,55 @@ class DataCollatorIntegrationTest(unittest.TestCase):
         self.assertEqual(batch["labels"].shape, torch.Size((2, 8)))
         self.assertEqual(batch["sentence_order_label"].shape, torch.Size((2,)))
 
+    def test_data_collator_for_masked_volume_modeling(self):
+        features = [{"pixel_values": np.random.rand(2, 4, 8, 8).astype(np.float32)} for _ in range(3)]
+        data_collator = DataCollatorForMaskedVolumeModeling(patch_size=(1, 2, 2))
+        batch = data_collator(features)
+
+        self.assertEqual(batch["pixel_values"].shape, torch.Size((3, 2, 4, 8, 8)))
+        self.assertTrue(torch.equal(batch["pixel_values"][1], torch.from_numpy(features[1]["pixel_values"])))
+        self.assertEqual(batch["noise"].shape, torch.Size((3, 4 * 4 * 4)))
+
+        # single channel volumes without a channel axis
+        batch = data_collator([torch.rand(4, 8, 8) for _ in range(2)])
+        self.assertEqual(batch["pixel_values"].shape, torch.Size((2, 1, 4, 8, 8)))
+
+        # label volumes are stacked into their own tensor
+        features = [
+            {
+                "pixel_values": np.random.rand(1, 4, 8, 8).astype(np.float32),
+                "labels": np.random.randint(0, 2, (4, 8, 8)),
+            }
+            for _ in range(3)
+        ]
+        batch = data_collator(features)
+        self.assertEqual(batch["pixel_values"].shape, torch.Size((3, 1, 4, 8, 8)))
+        self.assertEqual(batch["labels"].shape, torch.Size((3, 1, 4, 8, 8)))
+        self.assertTrue(batch["labels"].is_contiguous())
+        self.assertTrue(torch.equal(batch["labels"][2, 0], torch.from_numpy(features[2]["labels"])))
+
+        # tube masking shares the noise of a patch position across the depth
+        data_collator = DataCollatorForMaskedVolumeModeling(patch_size=(1, 2, 2), mask_type="tube")
+        noise = data_collator(features)["noise"].view(3, 4, 4, 4)
+        self.assertTrue(torch.equal(noise, noise[:, :1].expand_as(noise)))
+
+        # block masking shares the noise of aligned blocks of patches, also when blocks overhang the grid
+        data_collator = DataCollatorForMaskedVolumeModeling(
+            patch_size=(1, 2, 2), mask_type="block", mask_block_size=(3, 2, 2)
+        )
+        noise = data_collator(features)["noise"].view(3, 4, 4, 4)
+        self.assertTrue(torch.equal(noise[:, :3, :2, :2], noise[:, :1, :1, :1].expand(-1, 3, 2, 2)))
+        self.assertTrue(torch.equal(noise[:, 3, 2:, 2:], noise[:, 3, 2:3, 2:3].expand(-1, 2, 2)))
+
+        # a seed makes the masks reproducible
+        noises = [
+            DataCollatorForMaskedVolumeModeling(patch_size=(1, 2, 2), seed=42)(features)["noise"] for _ in range(2)
+        ]
+        self.assertTrue(torch.equal(noises[0], noises[1]))
+
+        with self.assertRaises(ValueError):
+            DataCollatorForMaskedVolumeModeling(mask_type="grid")
+
 
 @require_tf
 class TFDataCollatorIntegrationTest(unittest.TestCase):